@@ -315,6 +315,57 @@ async def get_group_watermarks(group_id: int):
         logger.error(f"Error getting watermarks for group {group_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/api/dashboard/dead-letters")
+async def get_dead_letters():
+    """
+    Envíos a Discord que agotaron reintentos (o el presupuesto del webhook)
+    """
+    try:
+        from main import replicator_service
+        
+        if not replicator_service or not replicator_service.discord_sender:
+            raise HTTPException(status_code=503, detail="Discord sender not available")
+        
+        scheduler = replicator_service.discord_sender.retry_scheduler
+        return JSONResponse(content={
+            "dead_letters": scheduler.list_dead_letters(),
+            "stats": scheduler.get_stats()
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting dead letters: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/api/dashboard/dead-letters/{letter_id}/replay")
+async def replay_dead_letter(letter_id: int):
+    """
+    Reenviar una dead letter; si vuelve a fallar queda registrada con un id nuevo
+
+    Si llega, las entradas del outbox que llevaba dejan de reenviarse a ese webhook.
+    """
+    try:
+        from main import replicator_service
+        
+        if not replicator_service or not replicator_service.discord_sender:
+            raise HTTPException(status_code=503, detail="Discord sender not available")
+        
+        success = await replicator_service.replay_dead_letter(letter_id)
+        if success is None:
+            raise HTTPException(status_code=404, detail=f"Dead letter {letter_id} not found")
+        
+        return JSONResponse(content={
+            "success": success,
+            "letter_id": letter_id
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error replaying dead letter {letter_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Funciones auxiliares
 
 def get_fallback_stats() -> Dict[str, Any]:
@@ -29,6 +29,10 @@ class DiscordSettings:
         self.webhooks = self._load_webhooks()
         self.default_webhook = os.getenv("DISCORD_DEFAULT_WEBHOOK", "")
         self.rate_limit = int(os.getenv("DISCORD_RATE_LIMIT", "5"))
+        # Estado de rate limits compartido entre réplicas: local | sqlite | redis
+        self.rate_limit_backend = os.getenv("DISCORD_RATE_LIMIT_BACKEND", "local")
+        self.rate_limit_db = os.getenv("DISCORD_RATE_LIMIT_DB", "data/discord_ratelimit.db")
+        self.rate_limit_redis_url = os.getenv("DISCORD_RATE_LIMIT_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379"))
         
     def _load_webhooks(self) -> Dict[int, str]:
         """Cargar webhooks desde variables de entorno"""
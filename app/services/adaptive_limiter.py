@@ -0,0 +1,230 @@
+"""
+Adaptive Limiter - AIMD concurrency control
+===========================================
+Archivo: app/services/adaptive_limiter.py
+
+📈 Límite de concurrencia que se ajusta solo (additive increase / multiplicative decrease)
+✅ Crece un slot por cada "ventana" de operaciones sanas mientras el límite se usa
+✅ Se reduce ante 429 / 5xx / timeouts o latencia muy por encima de la habitual
+✅ Una sola reducción por episodio (cooldown), sin colapsar por ráfagas de errores
+✅ Orden FIFO de espera; el límite puede cambiar con operaciones en vuelo
+✅ Límite actual, en vuelo y en espera visibles en ``get_stats()``
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Permit:
+    """Resultado de una operación dentro de ``slot()``; el caller lo puede ajustar"""
+    latency: Optional[float] = None   # None = medir el tiempo del bloque
+    overloaded: bool = False          # 429, 5xx, FloodWait, cola del pool...
+    measure: bool = True              # False = no usar la latencia (p.ej. tamaño atípico)
+
+
+class AdaptiveLimiter:
+    """
+    📈 LIMITADOR ADAPTATIVO (AIMD)
+    ==============================
+
+    ``async with limiter.slot() as permit:`` espera un hueco y, al salir,
+    informa de cómo fue la operación:
+
+    - **Sobrecarga** (``permit.overloaded`` o ``asyncio.TimeoutError``) o
+      latencia suavizada mayor que ``latency_tolerance`` × la latencia base:
+      el límite se multiplica por ``backoff_ratio``. Como los errores llegan
+      en ráfaga (todo lo que estaba en vuelo), sólo se reduce una vez por
+      ``cooldown_seconds``.
+    - **Sana** y con el límite en uso (había cola o todos los slots
+      ocupados): el límite sube ``1 / límite``, es decir, un slot por cada
+      ``límite`` operaciones completadas.
+
+    La latencia base es el mínimo de la latencia suavizada, con una deriva
+    lenta hacia arriba para adaptarse si la red empeora de forma permanente.
+    """
+
+    def __init__(self, name: str,
+                 initial_limit: int = 10,
+                 min_limit: int = 1,
+                 max_limit: int = 64,
+                 latency_tolerance: float = 2.0,
+                 backoff_ratio: float = 0.7,
+                 cooldown_seconds: float = 1.0,
+                 smoothing: float = 0.2):
+        self.name = name
+        self._inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._limit = 1.0
+        self.config: Dict[str, Any] = {}
+        self.configure(initial_limit, min_limit, max_limit, latency_tolerance, backoff_ratio,
+                       cooldown_seconds, smoothing)
+
+        self._latency: Optional[float] = None
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+
+        self.stats = {
+            'acquired': 0,
+            'waited': 0,
+            'increases': 0,
+            'decreases': 0,
+            'overloads': 0,
+            'slow_samples': 0,
+            'peak_inflight': 0
+        }
+
+    def configure(self, initial_limit: Optional[int] = None, min_limit: Optional[int] = None,
+                  max_limit: Optional[int] = None, latency_tolerance: Optional[float] = None,
+                  backoff_ratio: Optional[float] = None, cooldown_seconds: Optional[float] = None,
+                  smoothing: Optional[float] = None):
+        """Ajustar parámetros; ``min_limit == max_limit`` equivale a un límite fijo"""
+        updates = {
+            'min_limit': min_limit,
+            'max_limit': max_limit,
+            'latency_tolerance': latency_tolerance,
+            'backoff_ratio': backoff_ratio,
+            'cooldown_seconds': cooldown_seconds,
+            'smoothing': smoothing
+        }
+        self.config.update({key: value for key, value in updates.items() if value is not None})
+        self.config['min_limit'] = max(1, self.config['min_limit'])
+        self.config['max_limit'] = max(self.config['min_limit'], self.config['max_limit'])
+        if initial_limit is not None:
+            self._limit = float(initial_limit)
+        self._limit = min(max(self._limit, self.config['min_limit']), self.config['max_limit'])
+        self._wake()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    # ============== SLOTS ==============
+
+    async def acquire(self):
+        """Esperar un slot libre (FIFO)"""
+        self.stats['acquired'] += 1
+        if self._inflight < self.limit and not self._waiters:
+            self._take()
+            return
+
+        self.stats['waited'] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # El slot ya era nuestro: devolverlo sin contar la operación
+                self._inflight -= 1
+                self._wake()
+            else:
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False):
+        """Devolver el slot e informar del resultado (latencia en segundos)"""
+        saturated = bool(self._waiters) or self._inflight >= self.limit
+        self._inflight -= 1
+        self._adjust(latency, overloaded, saturated)
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[Permit]:
+        await self.acquire()
+        permit = Permit()
+        started = time.monotonic()
+        try:
+            yield permit
+        except asyncio.TimeoutError:
+            self.release(overloaded=True)
+            raise
+        except BaseException:
+            # Otros errores sólo cuentan si el caller los marcó como sobrecarga
+            self.release(overloaded=permit.overloaded)
+            raise
+        else:
+            latency = permit.latency if permit.latency is not None else time.monotonic() - started
+            self.release(latency if permit.measure else None, permit.overloaded)
+
+    def _take(self):
+        self._inflight += 1
+        if self._inflight > self.stats['peak_inflight']:
+            self.stats['peak_inflight'] = self._inflight
+
+    def _wake(self):
+        while self._waiters and self._inflight < self.limit:
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self._take()
+            future.set_result(None)
+
+    # ============== AIMD ==============
+
+    def _adjust(self, latency: Optional[float], overloaded: bool, saturated: bool):
+        slow = False
+        if latency is not None:
+            alpha = self.config['smoothing']
+            self._latency = latency if self._latency is None else self._latency + alpha * (latency - self._latency)
+            if self._baseline is None or self._latency < self._baseline:
+                self._baseline = self._latency
+            else:
+                self._baseline += (self._latency - self._baseline) * 0.01
+            slow = self._latency > self._baseline * self.config['latency_tolerance']
+            if slow:
+                self.stats['slow_samples'] += 1
+
+        if overloaded:
+            self.stats['overloads'] += 1
+
+        if overloaded or slow:
+            now = time.monotonic()
+            if now - self._last_decrease < self.config['cooldown_seconds']:
+                return
+            self._last_decrease = now
+            previous = self.limit
+            self._limit = max(self.config['min_limit'], self._limit * self.config['backoff_ratio'])
+            if self.limit < previous:
+                self.stats['decreases'] += 1
+                logger.debug(f"📉 {self.name}: límite {previous} → {self.limit}")
+            if slow:
+                # Tras reducir, la latencia de referencia vuelve a medirse desde cero
+                self._latency = self._baseline
+        elif saturated and self._limit < self.config['max_limit']:
+            previous = self.limit
+            self._limit = min(self.config['max_limit'], self._limit + 1 / max(self._limit, 1.0))
+            if self.limit > previous:
+                self.stats['increases'] += 1
+
+    # ============== MÉTRICAS ==============
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'limit': self.limit,
+            'min_limit': self.config['min_limit'],
+            'max_limit': self.config['max_limit'],
+            'inflight': self._inflight,
+            'waiting': len(self._waiters),
+            'latency_ms': (self._latency or 0.0) * 1000,
+            'baseline_latency_ms': (self._baseline or 0.0) * 1000,
+            **self.stats
+        }
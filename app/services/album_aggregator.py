@@ -0,0 +1,164 @@
+"""
+Album Aggregator - Telegram grouped_id coalescing
+=================================================
+Archivo: app/services/album_aggregator.py
+
+📚 Agrupa los eventos de un álbum de Telegram en un único lote
+✅ Telegram entrega un álbum como N eventos NewMessage con el mismo grouped_id
+✅ Ventana corta que se reinicia con cada parte recibida
+✅ Flush inmediato al llegar al máximo de adjuntos de Discord
+✅ Los eventos posteriores del mismo chat esperan a los álbumes pendientes
+"""
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Album:
+    """Partes de un álbum de Telegram listas para procesarse juntas"""
+    chat_id: int
+    grouped_id: int
+    events: List[Any] = field(default_factory=list)
+    first_seen: float = field(default_factory=time.monotonic)
+    ready: bool = False
+
+    @property
+    def messages(self) -> List[Any]:
+        """Mensajes del álbum ordenados por id"""
+        return sorted((event.message for event in self.events), key=lambda m: m.id)
+
+
+class AlbumAggregator:
+    """
+    📚 AGREGADOR DE ÁLBUMES
+    =======================
+
+    Bufferiza eventos con el mismo (chat_id, grouped_id) durante
+    ``window_seconds`` desde la última parte recibida y entrega el álbum
+    completo a ``on_flush``. Un álbum también se entrega en cuanto alcanza
+    ``max_items`` partes.
+
+    Los demás eventos del chat pasan por ``enqueue``: mientras el chat tenga
+    un álbum pendiente se retienen y se entregan a ``on_release`` después
+    de él, en el orden de llegada.
+    """
+
+    def __init__(self,
+                 on_flush: Callable[[Album], Awaitable[None]],
+                 on_release: Callable[[int, Any], Awaitable[None]],
+                 window_seconds: float = 0.8,
+                 max_items: int = 10):
+        self.on_flush = on_flush
+        self.on_release = on_release
+        self.config = {
+            'window_seconds': window_seconds,
+            'max_items': max_items
+        }
+
+        self._pending: Dict[Tuple[int, int], Album] = {}
+        self._timers: Dict[Tuple[int, int], asyncio.TimerHandle] = {}
+        # Por chat, álbumes y eventos retenidos en orden de llegada
+        self._order: Dict[int, deque] = {}
+        self._draining: set = set()
+
+        self.stats = {
+            'albums_flushed': 0,
+            'events_coalesced': 0,
+            'events_held': 0
+        }
+
+    async def add(self, chat_id: int, grouped_id: int, event: Any):
+        """Añadir una parte de álbum"""
+        key = (chat_id, grouped_id)
+        album = self._pending.get(key)
+        if album is None:
+            album = Album(chat_id=chat_id, grouped_id=grouped_id)
+            self._pending[key] = album
+            self._order.setdefault(chat_id, deque()).append(album)
+
+        album.events.append(event)
+
+        if len(album.events) >= self.config['max_items']:
+            await self._flush(key)
+            return
+
+        # Reiniciar la ventana con cada parte recibida
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timers[key] = loop.call_later(
+            self.config['window_seconds'],
+            lambda: asyncio.ensure_future(self._flush(key))
+        )
+
+    async def enqueue(self, chat_id: int, item: Any):
+        """Entregar un evento que no es parte de álbum sin adelantar a los álbumes pendientes"""
+        if self._order.get(chat_id) or chat_id in self._draining:
+            self._order.setdefault(chat_id, deque()).append(item)
+            self.stats['events_held'] += 1
+            return
+        await self.on_release(chat_id, item)
+
+    async def _flush(self, key: Tuple[int, int]):
+        """Cerrar un álbum pendiente y entregar lo que ya no espera a nadie"""
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+
+        album = self._pending.pop(key, None)
+        if album is None:
+            return
+
+        self.stats['albums_flushed'] += 1
+        self.stats['events_coalesced'] += len(album.events)
+        album.ready = True
+        await self._drain(album.chat_id)
+
+    async def _drain(self, chat_id: int):
+        """Entregar en orden la cabeza del chat hasta el primer álbum aún abierto"""
+        # Un único drenaje por chat: las entregas pueden bloquear (backpressure)
+        if chat_id in self._draining:
+            return
+        self._draining.add(chat_id)
+        try:
+            order = self._order.get(chat_id)
+            while order and not (isinstance(order[0], Album) and not order[0].ready):
+                item = order.popleft()
+                try:
+                    if isinstance(item, Album):
+                        await self.on_flush(item)
+                    else:
+                        await self.on_release(chat_id, item)
+                except Exception as e:
+                    logger.error(f"❌ Album flush error for chat {chat_id}: {e}")
+            if not order:
+                self._order.pop(chat_id, None)
+        finally:
+            self._draining.discard(chat_id)
+
+    async def flush_all(self):
+        """Entregar todos los álbumes pendientes (shutdown)"""
+        for key in list(self._pending):
+            await self._flush(key)
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'pending_albums': len(self._pending),
+            'window_seconds': self.config['window_seconds'],
+            **self.stats
+        }
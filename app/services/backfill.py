@@ -0,0 +1,291 @@
+"""
+Backfill Manager - Catch-up replication after downtime
+======================================================
+Archivo: app/services/backfill.py
+
+⏪ Recupera los mensajes publicados mientras el replicador estaba caído
+✅ Parte del último mensaje replicado por chat (cursor persistido)
+✅ Lecturas por lotes con ``iter_messages(min_id=...)`` en orden cronológico
+✅ Concurrencia acotada entre chats y respeto de FloodWait
+✅ Progreso por chat expuesto en las estadísticas
+✅ Tramos interrumpidos se retoman al reiniciar (``checkpoint``)
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .album_aggregator import Album
+
+try:
+    from telethon.errors import FloodWaitError
+    TELETHON_AVAILABLE = True
+except ImportError:
+    TELETHON_AVAILABLE = False
+
+    class FloodWaitError(Exception):
+        seconds = 0
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BackfillItem:
+    """Mensaje recuperado por el backfill (misma forma que un evento: ``.message``)"""
+    chat_id: int
+    message: Any
+
+
+class BackfillManager:
+    """
+    ⏪ GESTOR DE BACKFILL
+    ====================
+
+    Para cada chat con cursor conocido lee los mensajes entre el cursor y
+    el último mensaje existente al arrancar, en orden cronológico, y los
+    entrega a ``submit``. Las partes de un álbum se agrupan en un ``Album``.
+
+    ``submit`` normalmente encola en el carril de backfill del replicador;
+    si ese carril está lleno, ``submit`` bloquea y la lectura de Telegram se
+    frena sola. Si ``is_busy`` indica que el tráfico en vivo está encolado,
+    el backfill espera antes de pedir el siguiente lote.
+
+    Cada tramo (from_id, target_id] se anuncia a ``checkpoint`` antes de
+    leerlo y tras cada entrega con su ``last_id``; al completarse se anuncia
+    con ``last_id == target_id``. Los tramos guardados de una ejecución
+    interrumpida se pasan en ``resume`` y se terminan antes del hueco nuevo.
+    """
+
+    def __init__(self,
+                 submit: Callable[[int, Any], Awaitable[None]],
+                 max_concurrent_chats: int = 3,
+                 batch_size: int = 100,
+                 wait_time: float = 1.0,
+                 max_messages_per_chat: int = 5000,
+                 is_busy: Optional[Callable[[], bool]] = None,
+                 checkpoint: Optional[Callable[[int, int, int, int], None]] = None):
+        self.submit = submit
+        self.is_busy = is_busy
+        self.checkpoint = checkpoint
+        self.config = {
+            'max_concurrent_chats': max(1, max_concurrent_chats),
+            'batch_size': batch_size,
+            'wait_time': wait_time,                         # Pausa entre lotes (segundos)
+            'max_messages_per_chat': max_messages_per_chat,
+            'busy_pause_seconds': 0.5
+        }
+
+        self._task: Optional[asyncio.Task] = None
+        self.progress: Dict[int, Dict[str, Any]] = {}
+
+        self.stats = {
+            'runs': 0,
+            'messages_backfilled': 0,
+            'albums_backfilled': 0,
+            'flood_waits': 0,
+            'flood_wait_seconds': 0.0,
+            'chats_failed': 0
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, client, cursors: Dict[int, int], chat_ids: Iterable[int],
+              resume: Optional[Dict[int, List[Tuple[int, int, int]]]] = None) -> Optional[asyncio.Task]:
+        """Lanzar el backfill en segundo plano (ignorado si ya hay uno en curso)"""
+        if self.running:
+            logger.debug("⏪ Backfill already running")
+            return self._task
+
+        self._task = asyncio.create_task(self.run(client, cursors, list(chat_ids), resume), name="backfill")
+        return self._task
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def run(self, client, cursors: Dict[int, int], chat_ids: List[int],
+                  resume: Optional[Dict[int, List[Tuple[int, int, int]]]] = None):
+        """
+        Backfill de todos los chats con concurrencia acotada
+
+        ``resume`` trae, por chat, los tramos (from_id, target_id, last_id)
+        que una ejecución anterior dejó a medias.
+        """
+        self.stats['runs'] += 1
+        semaphore = asyncio.Semaphore(self.config['max_concurrent_chats'])
+        resume = resume or {}
+
+        # Sin cursor no hay hueco conocido: el primer arranque no replica historial
+        pending = [chat_id for chat_id in chat_ids if chat_id in cursors or resume.get(chat_id)]
+        for chat_id in pending:
+            start_id = resume[chat_id][0][2] if resume.get(chat_id) else cursors[chat_id]
+            self.progress[chat_id] = {
+                'status': 'pending',
+                'from_id': start_id,
+                'target_id': None,
+                'last_id': start_id,
+                'fetched': 0
+            }
+
+        async def guarded(chat_id: int):
+            async with semaphore:
+                await self._backfill_chat(client, chat_id, cursors.get(chat_id), resume.get(chat_id, []))
+
+        started = time.monotonic()
+        await asyncio.gather(*(guarded(chat_id) for chat_id in pending))
+
+        total = sum(self.progress[chat_id]['fetched'] for chat_id in pending)
+        logger.info(
+            f"⏪ Backfill finished: {len(pending)} chats, {total} messages "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+
+    async def _backfill_chat(self, client, chat_id: int, min_id: Optional[int],
+                             resumed: List[Tuple[int, int, int]]):
+        progress = self.progress[chat_id]
+        progress['status'] = 'running'
+
+        try:
+            ranges = list(resumed)
+            if min_id is not None:
+                latest = await client.get_messages(chat_id, limit=1)
+                target_id = latest[0].id if latest else min_id
+                # Lo que cubren los tramos retomados no se vuelve a leer
+                start_id = max([min_id] + [target for _, target, _ in resumed])
+                if target_id > start_id:
+                    ranges.append((start_id, target_id, start_id))
+                    self._checkpoint(chat_id, start_id, target_id, start_id)
+                elif not ranges:
+                    progress['target_id'] = target_id
+                    progress['status'] = 'done'
+                    return
+
+            remaining = self.config['max_messages_per_chat']
+            for from_id, target_id, last_id in ranges:
+                progress.update(from_id=from_id, target_id=target_id, last_id=last_id)
+                remaining = await self._backfill_range(client, chat_id, remaining)
+                if progress['status'] != 'done':
+                    break
+
+        except asyncio.CancelledError:
+            progress['status'] = 'cancelled'
+            raise
+        except Exception as e:
+            self.stats['chats_failed'] += 1
+            progress['status'] = 'failed'
+            progress['error'] = str(e)
+            logger.error(f"❌ Backfill failed for chat {chat_id}: {e}")
+
+    async def _backfill_range(self, client, chat_id: int, remaining: int) -> int:
+        """Rellenar el tramo actual de ``progress``; retorna el presupuesto de mensajes restante"""
+        progress = self.progress[chat_id]
+        cursor, target_id = progress['last_id'], progress['target_id']
+        while cursor < target_id and remaining > 0:
+            try:
+                cursor, fetched = await self._fetch_batch(client, chat_id, cursor, target_id, remaining)
+            except FloodWaitError as e:
+                # Por encima del umbral de Telethon: esperar lo que pide Telegram
+                self.stats['flood_waits'] += 1
+                self.stats['flood_wait_seconds'] += e.seconds
+                progress['status'] = f'flood_wait ({e.seconds}s)'
+                logger.warning(f"⏪ FloodWait {e.seconds}s while backfilling {chat_id}")
+                await asyncio.sleep(e.seconds)
+                progress['status'] = 'running'
+                # Retomar tras lo ya entregado antes del FloodWait
+                cursor = progress['last_id']
+                continue
+
+            if fetched == 0:
+                # No queda ningún mensaje hasta target_id (borrados)
+                cursor = target_id
+                break
+            remaining -= fetched
+            await asyncio.sleep(self.config['wait_time'])
+
+        if cursor >= target_id:
+            progress['status'] = 'done'
+            self._checkpoint(chat_id, progress['from_id'], target_id, target_id)
+        else:
+            progress['status'] = 'truncated'
+        return remaining
+
+    async def _fetch_batch(self, client, chat_id: int, min_id: int, target_id: int,
+                           remaining: int) -> tuple:
+        """
+        Leer y entregar un lote; retorna (último id entregado, mensajes leídos)
+
+        ``progress['last_id']`` sólo avanza con lo ya entregado: las partes de
+        un álbum en construcción no cuentan hasta que se entrega el álbum, así
+        que tras un FloodWait se vuelven a leer desde la primera parte.
+        """
+        while self.is_busy and self.is_busy():
+            await asyncio.sleep(self.config['busy_pause_seconds'])
+
+        limit = min(self.config['batch_size'], remaining)
+        progress = self.progress[chat_id]
+        album: Optional[Album] = None
+        fetched = 0
+
+        async for message in client.iter_messages(chat_id, limit=limit, min_id=min_id,
+                                                  max_id=target_id + 1, reverse=True):
+            fetched += 1
+            grouped_id = getattr(message, 'grouped_id', None)
+
+            if album and album.grouped_id != grouped_id:
+                await self._submit_album(chat_id, album)
+                album = None
+
+            if grouped_id:
+                album = album or Album(chat_id=chat_id, grouped_id=grouped_id)
+                album.events.append(BackfillItem(chat_id, message))
+            else:
+                await self.submit(chat_id, BackfillItem(chat_id, message))
+                self._mark_submitted(chat_id, message.id, 1)
+
+        # Un álbum al final del lote puede continuar en el siguiente: se cierra aquí
+        if album:
+            await self._submit_album(chat_id, album)
+
+        return progress['last_id'], fetched
+
+    def _mark_submitted(self, chat_id: int, last_id: int, count: int):
+        progress = self.progress[chat_id]
+        progress['last_id'] = last_id
+        progress['fetched'] += count
+        self.stats['messages_backfilled'] += count
+        self._checkpoint(chat_id, progress['from_id'], progress['target_id'], last_id)
+
+    def _checkpoint(self, chat_id: int, from_id: int, target_id: int, last_id: int):
+        if self.checkpoint:
+            self.checkpoint(chat_id, from_id, target_id, last_id)
+
+    async def _submit_album(self, chat_id: int, album: Album):
+        await self.submit(chat_id, album)
+        self.stats['albums_backfilled'] += 1
+        self._mark_submitted(chat_id, album.events[-1].message.id, len(album.events))
+
+    def get_stats(self) -> Dict[str, Any]:
+        chats = {}
+        for chat_id, progress in self.progress.items():
+            span = (progress['target_id'] or 0) - progress['from_id']
+            done = progress['last_id'] - progress['from_id']
+            chats[str(chat_id)] = {
+                **progress,
+                'percent': 100.0 if progress['status'] == 'done'
+                else (done / span * 100 if span > 0 else 0.0)
+            }
+
+        return {
+            'running': self.running,
+            'chats': chats,
+            **self.stats
+        }
@@ -0,0 +1,340 @@
+"""
+Chat Dispatcher - Per-chat ordered work queues
+==============================================
+Archivo: app/services/chat_dispatcher.py
+
+🚦 Cola acotada por chat + pool de workers
+✅ Orden estricto dentro de cada chat
+✅ Chats distintos se procesan en paralelo
+✅ Backpressure cuando la cola de un chat se llena
+✅ Métricas de profundidad, espera y lag por chat
+✅ Latencia extremo a extremo (p50/p95/p99) por dispatcher
+✅ Un handler en backoff puede ceder su worker sin liberar el chat
+✅ Un handler que ya garantiza el orden (p.ej. coalescer) puede liberar el chat
+"""
+
+import asyncio
+import contextvars
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+class _HandlerSlot:
+    """Worker y chat que ocupa un handler en curso"""
+
+    __slots__ = ('worker_released', 'chat_released', '_on_chat_release')
+
+    def __init__(self, on_chat_release: Callable[[], None]):
+        self.worker_released = asyncio.Event()
+        self.chat_released = False
+        self._on_chat_release = on_chat_release
+
+    def release_chat(self):
+        if not self.chat_released:
+            self.chat_released = True
+            self._on_chat_release()
+        self.worker_released.set()
+
+
+_worker_slot: contextvars.ContextVar[Optional[_HandlerSlot]] = contextvars.ContextVar(
+    'dispatcher_worker_slot', default=None
+)
+
+
+def release_worker_slot():
+    """
+    Ceder el worker del dispatcher que ejecuta el handler actual
+
+    Pensado para esperas largas que no consumen CPU (p.ej. backoff de un
+    reintento): el worker pasa a otro chat y el handler sigue como tarea
+    propia. El chat no se vuelve a planificar hasta que el handler termine,
+    así que el orden por chat se mantiene. Fuera de un dispatcher no hace nada.
+    """
+    slot = _worker_slot.get()
+    if slot is not None:
+        slot.worker_released.set()
+
+
+def release_chat_order():
+    """
+    Liberar el chat además del worker
+
+    Para handlers cuyo trabajo restante ya respeta el orden por su cuenta
+    (p.ej. textos en el coalescer del sender, que se envían en orden por
+    destino): el siguiente elemento del chat puede empezar mientras este
+    handler espera. Fuera de un dispatcher no hace nada.
+    """
+    slot = _worker_slot.get()
+    if slot is not None:
+        slot.release_chat()
+
+
+@dataclass
+class QueuedItem:
+    """Elemento encolado para un chat"""
+    chat_id: int
+    payload: Any
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class _ChatQueue:
+    """Cola FIFO acotada de un único chat"""
+
+    __slots__ = ('items', 'slots', 'waiting')
+
+    def __init__(self, max_size: int):
+        self.items: Deque[QueuedItem] = deque()
+        self.slots = asyncio.Semaphore(max_size)
+        self.waiting = 0
+
+
+class ChatDispatcher:
+    """
+    🚦 DISPATCHER POR CHAT
+    ======================
+
+    Cada chat tiene su propia cola acotada. Un chat sólo puede estar
+    asignado a un worker a la vez, así que los mensajes de un mismo chat
+    se procesan en orden estricto, mientras que chats distintos avanzan
+    en paralelo hasta el tamaño del pool.
+
+    Los chats listos se atienden en round-robin: tras procesar un elemento
+    el chat vuelve al final de la cola de listos, de modo que un chat muy
+    activo no acapara a los workers.
+    """
+
+    def __init__(self,
+                 handler: Callable[[int, Any], Awaitable[None]],
+                 workers: int = 10,
+                 max_queue_per_chat: int = 100,
+                 name: str = "default",
+                 wait_window: int = 1000):
+        self.handler = handler
+        self.name = name
+        self.config = {
+            'workers': max(1, workers),
+            'max_queue_per_chat': max(1, max_queue_per_chat)
+        }
+
+        self._chats: Dict[int, _ChatQueue] = {}
+        self._scheduled: Set[int] = set()
+        self._ready: "asyncio.Queue[int]" = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._busy = 0
+        self._parked: Set[asyncio.Task] = set()
+        self._waits: Deque[float] = deque(maxlen=wait_window)
+        self._latencies: Deque[float] = deque(maxlen=wait_window)
+
+        self.stats = {
+            'submitted': 0,
+            'processed': 0,
+            'failed': 0,
+            'slots_released': 0,
+            'total_wait_time': 0.0,
+            'max_wait_time': 0.0
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self):
+        """Arrancar el pool de workers"""
+        if self._workers:
+            return
+
+        self._workers = [
+            asyncio.create_task(self._worker_loop(i), name=f"dispatcher-{self.name}-{i}")
+            for i in range(self.config['workers'])
+        ]
+        logger.info(f"🚦 Dispatcher '{self.name}' started with {self.config['workers']} workers")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Detener workers, esperando a que se vacíen las colas"""
+        if not self._workers:
+            return
+
+        try:
+            await asyncio.wait_for(self.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⏰ Dispatcher '{self.name}' drain timeout - {self.queue_depth()} items dropped")
+
+        tasks = self._workers + list(self._parked)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._parked.clear()
+        logger.info(f"🛑 Dispatcher '{self.name}' stopped")
+
+    async def join(self):
+        """Esperar a que no quede trabajo pendiente ni en curso"""
+        while self._chats or self._busy or self._parked:
+            await asyncio.sleep(0.05)
+
+    async def submit(self, chat_id: int, payload: Any):
+        """
+        Encolar trabajo para un chat
+
+        Bloquea mientras la cola del chat está llena (backpressure hacia el
+        productor, p.ej. el loop de updates de Telethon).
+        """
+        chat_queue = self._chats.get(chat_id)
+        if chat_queue is None:
+            chat_queue = _ChatQueue(self.config['max_queue_per_chat'])
+            self._chats[chat_id] = chat_queue
+
+        chat_queue.waiting += 1
+        try:
+            await chat_queue.slots.acquire()
+        finally:
+            chat_queue.waiting -= 1
+
+        chat_queue.items.append(QueuedItem(chat_id=chat_id, payload=payload))
+        self.stats['submitted'] += 1
+
+        if chat_id not in self._scheduled:
+            self._scheduled.add(chat_id)
+            self._ready.put_nowait(chat_id)
+
+    async def _worker_loop(self, worker_id: int):
+        """Loop de un worker: toma un chat listo y procesa su siguiente elemento"""
+        while True:
+            chat_id = await self._ready.get()
+            chat_queue = self._chats.get(chat_id)
+
+            if chat_queue is None or not chat_queue.items:
+                self._scheduled.discard(chat_id)
+                continue
+
+            item = chat_queue.items.popleft()
+            chat_queue.slots.release()
+            self._record_wait(time.monotonic() - item.enqueued_at)
+
+            slot = _HandlerSlot(lambda c=chat_id, q=chat_queue: self._reschedule(c, q))
+            self._busy += 1
+            task = asyncio.create_task(self._run_handler(worker_id, chat_id, item, slot))
+            released = asyncio.create_task(slot.worker_released.wait())
+            try:
+                await asyncio.wait({task, released}, return_when=asyncio.FIRST_COMPLETED)
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            finally:
+                released.cancel()
+                self._busy -= 1
+
+            if task.done():
+                if not slot.chat_released:
+                    self._reschedule(chat_id, chat_queue)
+            else:
+                # El handler cedió el worker: el chat espera a que termine (salvo que también lo liberase)
+                self.stats['slots_released'] += 1
+                self._parked.add(task)
+                task.add_done_callback(lambda t, s=slot, c=chat_id, q=chat_queue: self._on_parked_done(t, s, c, q))
+
+    async def _run_handler(self, worker_id: int, chat_id: int, item: QueuedItem, slot: _HandlerSlot):
+        _worker_slot.set(slot)
+        try:
+            await self.handler(chat_id, item.payload)
+            self.stats['processed'] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.error(f"❌ Dispatcher '{self.name}' worker {worker_id} error for chat {chat_id}: {e}")
+        finally:
+            self._latencies.append(time.monotonic() - item.enqueued_at)
+
+    def _on_parked_done(self, task: asyncio.Task, slot: _HandlerSlot, chat_id: int, chat_queue: _ChatQueue):
+        self._parked.discard(task)
+        if not task.cancelled() and not slot.chat_released:
+            self._reschedule(chat_id, chat_queue)
+
+    def _reschedule(self, chat_id: int, chat_queue: _ChatQueue):
+        if chat_queue.items:
+            # Round-robin: el chat vuelve al final de la cola de listos
+            self._ready.put_nowait(chat_id)
+        else:
+            self._scheduled.discard(chat_id)
+            if chat_queue.waiting == 0:
+                self._chats.pop(chat_id, None)
+
+    def _record_wait(self, wait_time: float):
+        """Registrar tiempo de espera en cola"""
+        self._waits.append(wait_time)
+        self.stats['total_wait_time'] += wait_time
+        if wait_time > self.stats['max_wait_time']:
+            self.stats['max_wait_time'] = wait_time
+
+    # ============== MÉTRICAS ==============
+
+    @staticmethod
+    def _percentile(values: List[float], pct: float) -> float:
+        """Percentil por rango más cercano sobre una ventana ya ordenada"""
+        if not values:
+            return 0.0
+        index = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+        return values[index]
+
+    def latency_percentiles(self) -> Dict[str, float]:
+        """Latencia encolado→fin en ms sobre la ventana reciente"""
+        window = sorted(self._latencies)
+        return {
+            'p50_ms': self._percentile(window, 50) * 1000,
+            'p95_ms': self._percentile(window, 95) * 1000,
+            'p99_ms': self._percentile(window, 99) * 1000
+        }
+
+    def queue_depth(self, chat_id: Optional[int] = None) -> int:
+        """Elementos pendientes (de un chat o totales)"""
+        if chat_id is not None:
+            chat_queue = self._chats.get(chat_id)
+            return len(chat_queue.items) if chat_queue else 0
+        return sum(len(q.items) for q in self._chats.values())
+
+    def chat_lag(self) -> Dict[int, Dict[str, Any]]:
+        """Profundidad y antigüedad del elemento más viejo por chat"""
+        now = time.monotonic()
+        return {
+            chat_id: {
+                'depth': len(q.items),
+                'lag_seconds': now - q.items[0].enqueued_at
+            }
+            for chat_id, q in self._chats.items() if q.items
+        }
+
+    def get_stats(self, top_chats: int = 10) -> Dict[str, Any]:
+        """Estadísticas del dispatcher para el dashboard"""
+        started = self.stats['processed'] + self.stats['failed']
+        recent = list(self._waits)
+        lag = self.chat_lag()
+        lagging = sorted(lag.items(), key=lambda kv: kv[1]['lag_seconds'], reverse=True)[:top_chats]
+
+        return {
+            'name': self.name,
+            'workers': self.config['workers'],
+            'busy_workers': self._busy,
+            'released_handlers': len(self._parked),
+            'max_queue_per_chat': self.config['max_queue_per_chat'],
+            'queue_depth': sum(v['depth'] for v in lag.values()),
+            'chats_queued': len(lag),
+            'submitted': self.stats['submitted'],
+            'processed': self.stats['processed'],
+            'failed': self.stats['failed'],
+            'avg_wait_ms': (self.stats['total_wait_time'] / started * 1000) if started else 0.0,
+            'recent_avg_wait_ms': (sum(recent) / len(recent) * 1000) if recent else 0.0,
+            'max_wait_ms': self.stats['max_wait_time'] * 1000,
+            'max_chat_lag_seconds': lagging[0][1]['lag_seconds'] if lagging else 0.0,
+            'latency': self.latency_percentiles(),
+            'chat_lag': {str(chat_id): data for chat_id, data in lagging}
+        }
@@ -0,0 +1,269 @@
+"""
+Discord Rate Limiter - Bucket-aware proactive throttling
+========================================================
+Archivo: app/services/discord_rate_limiter.py
+
+⏱️ Token buckets por bucket de Discord (``X-RateLimit-Bucket``), no por URL
+✅ Aprende límite / ventana de los headers de cada respuesta
+✅ Espera ANTES de enviar cuando el bucket está agotado (el 429 pasa a ser raro)
+✅ Respeta ``X-RateLimit-Global`` y distingue los 429 de scope ``shared``
+✅ Estado de tokens en un ``RateLimitBackend`` (local, SQLite o Redis) compartible entre réplicas
+✅ Métrica: 429 por cada 1000 requests
+"""
+
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .rate_limit_backend import GLOBAL_KEY, LocalRateLimitBackend, RateLimitBackend
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+_WEBHOOK_PATH = re.compile(r"/webhooks/(\d+)/[^/]+")
+_SNOWFLAKE = re.compile(r"/\d{15,}")
+
+
+@dataclass
+class Bucket:
+    """Lo aprendido de un bucket de Discord (los tokens viven en el backend)"""
+    key: str
+    limit: Optional[int] = None          # None: todavía no lo devolvió Discord
+    window: float = 0.0                  # Duración de la ventana (mayor reset-after visto)
+    in_flight: int = 0                   # Requests de este proceso sin respuesta
+    remaining_hint: Optional[int] = None  # Última estimación local de tokens (para elegir webhook)
+    reset_hint: float = 0.0              # time.monotonic() del reset estimado
+
+
+def route_key(url: str, method: str = "POST") -> Tuple[str, str]:
+    """
+    (ruta, parámetro mayor) de una URL de webhook
+
+    La ruta ignora el query string y los ids de mensaje; el parámetro mayor
+    es el id del webhook (Discord separa los buckets por él).
+    """
+    path = urlsplit(url).path
+    match = _WEBHOOK_PATH.search(path)
+    major = match.group(1) if match else path
+    if match:
+        tail = _SNOWFLAKE.sub("/:id", path[match.end():])
+        path = f"/webhooks/{major}/:token{tail}"
+    return f"{method.upper()} {path}", major
+
+
+class BucketRateLimiter:
+    """
+    ⏱️ RATE LIMITER POR BUCKET DE DISCORD
+    =====================================
+
+    Uso (una reserva por request HTTP, incluidos los reintentos)::
+
+        await limiter.wait_if_needed(url)          # reserva un token o espera
+        ... POST ...
+        await limiter.update_limits(url, response.headers, response.status)
+        # si el request no llegó a completarse: limiter.release(url)
+
+    Mientras una ruta no tenga bucket conocido sólo se permite un request
+    en vuelo: su respuesta trae los headers con los que se aprende el límite.
+    Con un backend compartido las reservas y los bloqueos (429, global)
+    valen para todos los procesos que lo usan.
+    """
+
+    def __init__(self, backend: Optional[RateLimitBackend] = None, safety_margin_seconds: float = 0.05,
+                 max_wait_seconds: float = 300.0):
+        self.backend = backend or LocalRateLimitBackend()
+        self.config = {
+            'safety_margin_seconds': safety_margin_seconds,
+            'max_wait_seconds': max_wait_seconds
+        }
+        self.buckets: Dict[str, Bucket] = {}
+        self._routes: Dict[str, str] = {}      # ruta → clave de bucket aprendida
+        self._learned: Dict[str, asyncio.Event] = {}
+
+        self.stats = {
+            'requests': 0,
+            'rate_limited': 0,
+            'global_rate_limited': 0,
+            'shared_rate_limited': 0,
+            'delayed_requests': 0,
+            'total_delay_seconds': 0.0
+        }
+
+    # ============== RESERVA ==============
+
+    def _bucket_for(self, url: str, method: str = "POST") -> Bucket:
+        route, _ = route_key(url, method)
+        key = self._routes.get(route, route)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket(key)
+        return bucket
+
+    async def wait_if_needed(self, webhook_url: str, method: str = "POST"):
+        """Reservar un token del bucket, esperando lo necesario"""
+        waited = 0.0
+        while True:
+            bucket = self._bucket_for(webhook_url, method)
+            if bucket.limit is None and bucket.in_flight > 0:
+                # Ruta sin bucket conocido: esperar la primera respuesta
+                event = self._learned.setdefault(bucket.key, asyncio.Event())
+                started = time.monotonic()
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=self.config['max_wait_seconds'])
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    waited += time.monotonic() - started
+                    continue
+
+            # Se cuenta en vuelo antes de la reserva para que nadie más pase como "primero"
+            bucket.in_flight += 1
+            try:
+                delay = await self.backend.reserve(bucket.key, bucket.limit, bucket.window)
+            except BaseException:
+                bucket.in_flight -= 1
+                raise
+            if delay <= 0:
+                if bucket.remaining_hint and time.monotonic() < bucket.reset_hint:
+                    bucket.remaining_hint -= 1
+                break
+            bucket.in_flight -= 1
+
+            delay = min(delay + self.config['safety_margin_seconds'], self.config['max_wait_seconds'])
+            if waited == 0.0:
+                logger.debug(f"⏰ Bucket {bucket.key} agotado, esperando {delay:.2f}s")
+            await asyncio.sleep(delay)
+            waited += delay
+
+        self.stats['requests'] += 1
+        if waited > 0:
+            self.stats['delayed_requests'] += 1
+            self.stats['total_delay_seconds'] += waited
+
+    def available_tokens(self, webhook_url: str, method: str = "POST") -> float:
+        """Estimación local (sin ir al backend) de los tokens libres del webhook"""
+        bucket = self._bucket_for(webhook_url, method)
+        if bucket.limit is None:
+            return 0.0 if bucket.in_flight else 1.0
+        if bucket.remaining_hint is None or time.monotonic() >= bucket.reset_hint:
+            return float(bucket.limit)
+        return float(bucket.remaining_hint)
+
+    def seconds_until_available(self, webhook_url: str, method: str = "POST") -> float:
+        if self.available_tokens(webhook_url, method) > 0:
+            return 0.0
+        return max(0.0, self._bucket_for(webhook_url, method).reset_hint - time.monotonic())
+
+    def release(self, webhook_url: str, method: str = "POST"):
+        """Liberar la reserva de un request que no obtuvo respuesta"""
+        bucket = self._bucket_for(webhook_url, method)
+        bucket.in_flight = max(0, bucket.in_flight - 1)
+        self._notify(bucket.key)
+
+    # ============== APRENDIZAJE DESDE HEADERS ==============
+
+    async def update_limits(self, webhook_url: str, headers: Mapping[str, str], status: Optional[int] = None,
+                            method: str = "POST"):
+        """Actualizar el bucket con los headers de la respuesta (y liberar la reserva)"""
+        headers = {k.lower(): v for k, v in headers.items()}
+        route, major = route_key(webhook_url, method)
+        previous = self._bucket_for(webhook_url, method)
+        previous.in_flight = max(0, previous.in_flight - 1)
+
+        bucket = previous
+        bucket_hash = headers.get('x-ratelimit-bucket')
+        if bucket_hash and previous.key != f"{bucket_hash}:{major}":
+            key = f"{bucket_hash}:{major}"
+            self._routes[route] = key
+            bucket = self.buckets.setdefault(key, Bucket(key))
+            if previous.key == route:
+                # El bucket provisional de la ruta se funde en el real
+                bucket.in_flight += previous.in_flight
+                self.buckets.pop(route, None)
+            self._notify(previous.key)
+
+        limit = _int(headers.get('x-ratelimit-limit'))
+        remaining = _int(headers.get('x-ratelimit-remaining'))
+        reset_after = _float(headers.get('x-ratelimit-reset-after'))
+
+        try:
+            if limit is not None:
+                bucket.limit = limit
+            if remaining is not None and reset_after is not None:
+                bucket.window = max(bucket.window, reset_after)
+                # Discord todavía no contó los requests que siguen en vuelo
+                observed = max(0, remaining - bucket.in_flight)
+                bucket.remaining_hint = observed
+                bucket.reset_hint = time.monotonic() + reset_after
+                await self.backend.observe(
+                    bucket.key, observed, reset_after, self.config['safety_margin_seconds']
+                )
+            elif bucket.limit is None:
+                # Sin headers de rate limit: tratar la ruta como ilimitada
+                bucket.limit = 1 << 30
+
+            if status == 429:
+                await self._on_rate_limited(bucket, headers)
+        finally:
+            self._notify(bucket.key)
+
+    async def _on_rate_limited(self, bucket: Bucket, headers: Dict[str, str]):
+        retry_after = _float(headers.get('retry-after')) or 1.0
+        scope = headers.get('x-ratelimit-scope', 'user')
+        self.stats['rate_limited'] += 1
+
+        if headers.get('x-ratelimit-global', '').lower() == 'true' or scope == 'global':
+            self.stats['global_rate_limited'] += 1
+            await self.backend.block(GLOBAL_KEY, retry_after)
+            logger.warning(f"🌐 Global rate limit de Discord: pausa de {retry_after:.1f}s")
+            return
+
+        if scope == 'shared':
+            self.stats['shared_rate_limited'] += 1
+
+        bucket.remaining_hint = 0
+        bucket.reset_hint = time.monotonic() + retry_after
+        await self.backend.block(bucket.key, retry_after)
+        logger.warning(f"⏰ 429 en bucket {bucket.key} ({scope}), reintento en {retry_after:.1f}s")
+
+    def _notify(self, key: str):
+        event = self._learned.pop(key, None)
+        if event is not None:
+            event.set()
+
+    # ============== MÉTRICAS ==============
+
+    def get_stats(self) -> Dict[str, Any]:
+        requests = self.stats['requests']
+        return {
+            **self.stats,
+            'active_buckets': len(self.buckets),
+            **self.backend.get_stats(),
+            'rate_limited_per_1000': self.stats['rate_limited'] / requests * 1000 if requests else 0.0,
+            'avg_delay_ms': (
+                self.stats['total_delay_seconds'] / self.stats['delayed_requests'] * 1000
+                if self.stats['delayed_requests'] else 0.0
+            )
+        }
+
+
+def _int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
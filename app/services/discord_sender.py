@@ -15,10 +15,25 @@ import aiohttp
 import time
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
-from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, Tuple
+from dataclasses import dataclass
 from pathlib import Path
-from io import BytesIO
+
+from app.services.media_compute import get_media_compute
+from app.services.upload_source import (
+    UploadMemoryTracker, UploadSource, prepare_source, read_source, source_payload, source_size
+)
+from app.tasks.workers.media_kernels import compress_to_fit
+from app.services.adaptive_limiter import AdaptiveLimiter
+from app.services.chat_dispatcher import release_chat_order
+from app.services.discord_rate_limiter import BucketRateLimiter, route_key
+from app.services.message_map import (
+    FLAG_MEDIA, FLAG_NO_CONTENT, MessageMap, MirroredMessage, MirrorRef, current_mirror
+)
+from app.services.rate_limit_backend import RateLimitBackend
+from app.services.retry_scheduler import RetryItem, RetryScheduler
+from app.services.text_coalescer import DISCORD_MAX_CONTENT, TextCoalescer
+from app.services.webhook_pool import WebhookPool
 
 # Setup logger
 try:
@@ -37,21 +52,16 @@ class SendResult:
     retry_count: int = 0
     processing_time: float = 0.0
     response_data: Optional[Dict] = None
-
-@dataclass
-class RateLimitData:
-    """Datos de rate limiting por webhook"""
-    remaining: int = 5
-    reset_time: datetime = field(default_factory=datetime.now)
-    retry_after: float = 0.0
-    last_request: datetime = field(default_factory=datetime.now)
+    retry_after: Optional[float] = None  # Retry-After de un 429
 
 class CircuitBreaker:
     """Circuit breaker enterprise para webhooks"""
     
-    def __init__(self, failure_threshold: int = 5, reset_timeout: int = 60):
+    def __init__(self, failure_threshold: int = 5, reset_timeout: int = 60,
+                 backend: Optional[RateLimitBackend] = None):
         self.failure_threshold = failure_threshold
         self.reset_timeout = reset_timeout
+        self.backend = backend  # Comparte los circuitos abiertos con otras réplicas
         self.failure_counts: Dict[str, int] = {}
         self.last_failure_times: Dict[str, datetime] = {}
         self.states: Dict[str, str] = {}  # 'closed', 'open', 'half-open'
@@ -86,48 +96,24 @@ class CircuitBreaker:
         
         if self.failure_counts[webhook_url] >= self.failure_threshold:
             self.states[webhook_url] = 'open'
-
-class RateLimiter:
-    """Rate limiter per-webhook"""
-    
-    def __init__(self):
-        self.rate_limits: Dict[str, RateLimitData] = {}
-    
-    async def wait_if_needed(self, webhook_url: str):
-        """Esperar si es necesario por rate limits"""
-        rate_data = self.rate_limits.get(webhook_url, RateLimitData())
-        
-        if rate_data.remaining <= 0:
-            sleep_time = (rate_data.reset_time - datetime.now()).total_seconds()
-            if sleep_time > 0:
-                logger.warning(f"⏰ Rate limit alcanzado, esperando {sleep_time:.1f}s")
-                await asyncio.sleep(sleep_time)
-        
-        # Esperar después de retry_after si existe
-        if rate_data.retry_after > 0:
-            time_since_last = (datetime.now() - rate_data.last_request).total_seconds()
-            if time_since_last < rate_data.retry_after:
-                wait_time = rate_data.retry_after - time_since_last
-                logger.warning(f"⏰ Retry-after activo, esperando {wait_time:.1f}s")
-                await asyncio.sleep(wait_time)
-    
-    def update_limits(self, webhook_url: str, headers: Dict[str, str]):
-        """Actualizar límites basado en headers de respuesta"""
-        rate_data = self.rate_limits.get(webhook_url, RateLimitData())
-        
-        # Actualizar desde headers
-        if 'x-ratelimit-remaining' in headers:
-            rate_data.remaining = int(headers['x-ratelimit-remaining'])
-        
-        if 'x-ratelimit-reset' in headers:
-            reset_timestamp = float(headers['x-ratelimit-reset'])
-            rate_data.reset_time = datetime.fromtimestamp(reset_timestamp)
-        
-        if 'retry-after' in headers:
-            rate_data.retry_after = float(headers['retry-after'])
-        
-        rate_data.last_request = datetime.now()
-        self.rate_limits[webhook_url] = rate_data
+    
+    async def allow(self, webhook_url: str) -> bool:
+        """can_execute() + circuitos abiertos por otras réplicas"""
+        if not self.can_execute(webhook_url):
+            return False
+        if self.backend is None:
+            return True
+        return await self.backend.blocked_for(self._shared_key(webhook_url)) <= 0
+    
+    async def share_state(self, webhook_url: str):
+        """Publicar en el backend un circuito abierto"""
+        if self.backend is not None and self.states.get(webhook_url) == 'open':
+            await self.backend.block(self._shared_key(webhook_url), self.reset_timeout)
+    
+    @staticmethod
+    def _shared_key(webhook_url: str) -> str:
+        # Nunca la URL completa (lleva el token del webhook)
+        return f"circuit:{route_key(webhook_url)[1]}"
 
 class DiscordSenderEnhanced:
     """
@@ -142,29 +128,79 @@ class DiscordSenderEnhanced:
     
     ✅ ARQUITECTURA ENTERPRISE:
     - Circuit breaker per-webhook
-    - Rate limiting inteligente
-    - Retry logic exponential backoff
+    - Rate limiting proactivo por bucket de Discord
+    - Pools de webhooks por canal (round-robin ponderado por tokens)
+    - Coalescing opcional de ráfagas de texto por destino
+    - Edición/borrado de los mensajes espejados (índice Telegram → Discord)
+    - Retry logic exponential backoff (aparcado en RetryScheduler, sin ocupar workers)
+    - Dead-letter con replay
     - Health monitoring
     - Compression automática para archivos grandes
     """
     
-    def __init__(self):
+    def __init__(self, rate_limit_backend: Optional[RateLimitBackend] = None):
         # Configuración enterprise
         self.config = {
             'max_retries': 3,
             'retry_delay_base': 1.0,
             'retry_delay_max': 30.0,
+            'retry_workers': 4,
+            'retry_budget_per_webhook': 30,  # Reintentos por webhook y ventana
+            'retry_budget_window_seconds': 60,
+            'max_dead_letters': 500,
+            'dead_letter_dir': 'data/dead_letters',
             'max_file_size_mb': 25,  # Discord limit
+            'max_request_size_mb': 25,  # Límite total de adjuntos por request
+            'max_attachments_per_message': 10,
             'timeout_seconds': 60,
             'circuit_breaker_threshold': 5,
-            'rate_limit_buffer': 2
+            'rate_limit_buffer': 2,
+            'text_coalesce_window_ms': 0,  # 0 = cada texto en su propio request
+            'text_coalesce_max_chars': DISCORD_MAX_CONTENT,
+            'upload_concurrency_initial': 10,  # Requests en vuelo (límite adaptativo AIMD)
+            'upload_concurrency_min': 2,
+            'upload_concurrency_max': 50
         }
         
-        # Componentes enterprise
+        # Componentes enterprise (estado compartible entre réplicas vía backend)
+        self.rate_limiter = BucketRateLimiter(backend=rate_limit_backend)
+        self.webhook_pools: Dict[str, WebhookPool] = {}
+        self.upload_memory = UploadMemoryTracker()
         self.circuit_breaker = CircuitBreaker(
-            failure_threshold=self.config['circuit_breaker_threshold']
+            failure_threshold=self.config['circuit_breaker_threshold'],
+            backend=self.rate_limiter.backend
+        )
+        
+        # Reintentos con backoff fuera de los workers + dead-letter
+        self.retry_scheduler = RetryScheduler(
+            self._attempt_item,
+            workers=self.config['retry_workers'],
+            max_attempts=self.config['max_retries'] + 1,
+            base_delay=self.config['retry_delay_base'],
+            max_delay=self.config['retry_delay_max'],
+            retry_budget=self.config['retry_budget_per_webhook'],
+            budget_window_seconds=self.config['retry_budget_window_seconds'],
+            max_dead_letters=self.config['max_dead_letters'],
+            dead_letter_dir=self.config['dead_letter_dir']
+        )
+        
+        # Ráfagas de texto de un chat → un único payload por destino
+        self.text_coalescer = TextCoalescer(
+            self._send_text,
+            window_seconds=self.config['text_coalesce_window_ms'] / 1000,
+            max_chars=self.config['text_coalesce_max_chars']
+        )
+        
+        # Requests en vuelo: crece mientras Discord responde bien, baja con 429/5xx/timeouts
+        self.upload_limiter = AdaptiveLimiter(
+            'uploads',
+            initial_limit=self.config['upload_concurrency_initial'],
+            min_limit=self.config['upload_concurrency_min'],
+            max_limit=self.config['upload_concurrency_max']
         )
-        self.rate_limiter = RateLimiter()
+        
+        # Telegram → Discord (posts con ?wait=true); None = sin propagar ediciones
+        self.message_map: Optional[MessageMap] = None
         
         # Session HTTP reutilizable
         self.session: Optional[aiohttp.ClientSession] = None
@@ -172,15 +208,24 @@ class DiscordSenderEnhanced:
         # Estadísticas detalladas
         self.stats = {
             'messages_sent': 0,
+            'http_requests': 0,  # Requests a Discord (reintentos incluidos)
             'files_sent_direct': 0,  # Contador de archivos enviados directamente
             'images_sent_direct': 0,
             'videos_sent_direct': 0,
             'audios_sent_direct': 0,
+            'multi_file_requests': 0,
+            'multi_file_attachments': 0,
             'total_failures': 0,
             'rate_limit_hits': 0,
             'circuit_breaker_trips': 0,
             'total_bytes_sent': 0,
             'compression_saves_mb': 0.0,
+            'mirrored_posts': 0,
+            'edits_propagated': 0,
+            'deletes_propagated': 0,
+            'mirror_unmapped': 0,
+            'mirror_skipped': 0,  # Mensajes compartidos que no se pueden editar/borrar por partes
+            'mirror_failures': 0,
             'avg_response_time': 0.0,
             'total_response_time': 0.0,
             'start_time': datetime.now()
@@ -191,10 +236,10 @@ class DiscordSenderEnhanced:
     async def initialize(self):
         """Inicializar servicios enterprise"""
         try:
-            # Crear session HTTP optimizada
+            # Crear session HTTP optimizada (por host manda el límite adaptativo)
             connector = aiohttp.TCPConnector(
                 limit=100,
-                limit_per_host=10,
+                limit_per_host=self.config['upload_concurrency_max'],
                 keepalive_timeout=30,
                 enable_cleanup_closed=True
             )
@@ -213,6 +258,9 @@ class DiscordSenderEnhanced:
                 }
             )
             
+            await self.rate_limiter.backend.start()
+            await self.retry_scheduler.start()
+            
             logger.info("✅ Discord Sender Enterprise inicializado")
             
         except Exception as e:
@@ -222,27 +270,68 @@ class DiscordSenderEnhanced:
     # ============== MÉTODOS PRINCIPALES - ENVÍO DIRECTO ==============
     
     async def send_message(self, webhook_url: str, content: str, 
-                          username: Optional[str] = None) -> bool:
+                          username: Optional[str] = None, chat_id: Optional[int] = None) -> bool:
         """
         Enviar mensaje de texto simple
         Compatible con enhanced_replicator_service.py
+        
+        Con ``chat_id`` y coalescing activo el texto se une a los siguientes
+        del mismo chat y destino dentro de la ventana; devuelve el resultado
+        del payload combinado.
         """
         if not self.session:
             await self.initialize()
         
+        if chat_id is not None and self.config['text_coalesce_window_ms'] > 0:
+            future = self.text_coalescer.enqueue(webhook_url, chat_id, content, username, tag=current_mirror())
+            # El coalescer mantiene el orden por destino: el siguiente mensaje
+            # del chat puede procesarse ya y entrar en el mismo lote
+            release_chat_order()
+            success = await future
+        else:
+            await self.text_coalescer.flush(webhook_url)
+            success = await self._send_text(webhook_url, content, username)
+        
+        if success:
+            self.stats['messages_sent'] += 1
+        
+        return success
+    
+    async def _send_text(self, webhook_url: str, content: str, username: Optional[str] = None,
+                         mirrors: Optional[List[Optional[MirrorRef]]] = None) -> bool:
+        """Un payload de texto (simple o combinado por el coalescer)"""
         payload = {'content': content}
         if username:
             payload['username'] = username
         
-        result = await self._send_with_retry(webhook_url, payload)
-        
-        if result.success:
-            self.stats['messages_sent'] += 1
-        
+        sources = [mirror for mirror in ([current_mirror()] if mirrors is None else mirrors) if mirror]
+        mirrors = self._active_mirrors(sources)
+        result = await self._deliver(RetryItem(webhook_url, payload=payload, wait=bool(mirrors), sources=sources))
+        if result.success and mirrors:
+            self._record_mirror(mirrors, result, has_content=bool(content))
         return result.success
     
+    def configure_text_coalescing(self, window_ms: float, max_chars: int = DISCORD_MAX_CONTENT):
+        """Activar (window_ms > 0) o desactivar el coalescing de textos"""
+        self.config['text_coalesce_window_ms'] = window_ms
+        self.config['text_coalesce_max_chars'] = min(max_chars, DISCORD_MAX_CONTENT)
+        self.text_coalescer.config['window_seconds'] = window_ms / 1000
+        self.text_coalescer.config['max_chars'] = self.config['text_coalesce_max_chars']
+        if window_ms > 0:
+            logger.info(f"💬 Text coalescing: ventana {window_ms:.0f}ms, máx {max_chars} caracteres")
+    
+    def configure_upload_concurrency(self, initial: int, min_limit: int, max_limit: int,
+                                     adaptive: bool = True):
+        """Límite de requests en vuelo; ``adaptive=False`` lo fija en ``initial``"""
+        if not adaptive:
+            min_limit = max_limit = initial
+        self.config['upload_concurrency_initial'] = initial
+        self.config['upload_concurrency_min'] = min_limit
+        self.config['upload_concurrency_max'] = max_limit
+        self.upload_limiter.configure(initial_limit=initial, min_limit=min_limit, max_limit=max_limit)
+    
     async def send_message_with_file(self, webhook_url: str, content: str, 
-                                   file_bytes: bytes, filename: str) -> bool:
+                                   file_bytes: UploadSource, filename: str) -> bool:
         """
         🎯 MÉTODO PRINCIPAL PARA ENVÍO DIRECTO DE ARCHIVOS
         =================================================
@@ -253,7 +342,8 @@ class DiscordSenderEnhanced:
         Args:
             webhook_url: URL del webhook de Discord
             content: Texto que acompaña al archivo
-            file_bytes: Bytes del archivo
+            file_bytes: bytes / memoryview, MediaBuffer, ruta o archivo abierto
+                (todo salvo bytes se transmite por trozos, sin copiarlo)
             filename: Nombre del archivo
             
         Returns:
@@ -263,15 +353,16 @@ class DiscordSenderEnhanced:
             await self.initialize()
         
         # Verificar tamaño y comprimir si es necesario
-        file_size_mb = len(file_bytes) / (1024 * 1024)
+        file_bytes = prepare_source(file_bytes)
+        file_size_mb = source_size(file_bytes) / (1024 * 1024)
         
         if file_size_mb > self.config['max_file_size_mb']:
             logger.warning(f"📎 Archivo muy grande ({file_size_mb:.1f}MB)")
             
             # Intentar comprimir si es imagen o video
             compressed_bytes = await self._try_compress_file(file_bytes, filename)
-            if compressed_bytes and len(compressed_bytes) < len(file_bytes):
-                original_size = len(file_bytes) / (1024 * 1024)
+            if compressed_bytes and len(compressed_bytes) < source_size(file_bytes):
+                original_size = file_size_mb
                 new_size = len(compressed_bytes) / (1024 * 1024)
                 savings = original_size - new_size
                 
@@ -285,192 +376,456 @@ class DiscordSenderEnhanced:
                 return await self.send_message(webhook_url, error_message)
         
         # Verificar circuit breaker
-        if not self.circuit_breaker.can_execute(webhook_url):
+        if not await self.circuit_breaker.allow(webhook_url):
             logger.warning("⚡ Circuit breaker OPEN - saltando envío")
             return False
         
-        # Aplicar rate limiting
-        await self.rate_limiter.wait_if_needed(webhook_url)
+        # Los textos ya pendientes para este destino salen antes
+        await self.text_coalescer.flush(webhook_url)
         
         # ENVÍO DIRECTO del archivo
         result = await self._send_file_direct(webhook_url, content, file_bytes, filename)
         
         if result.success:
-            self.stats['files_sent_direct'] += 1
-            self.stats['total_bytes_sent'] += len(file_bytes)
-            
-            # Contadores específicos por tipo
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
-                self.stats['images_sent_direct'] += 1
-            elif filename.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
-                self.stats['videos_sent_direct'] += 1
-            elif filename.lower().endswith(('.mp3', '.wav', '.ogg', '.m4a')):
-                self.stats['audios_sent_direct'] += 1
-            
+            self._record_file_sent(file_bytes, filename)
             logger.info(f"✅ Archivo enviado DIRECTAMENTE: {filename} ({file_size_mb:.1f}MB)")
         
         return result.success
     
+    async def send_message_with_files(self, webhook_url: str, content: str,
+                                    files: List[Tuple[UploadSource, str]]) -> bool:
+        """
+        📚 ENVÍO DE VARIOS ADJUNTOS EN UN SOLO WEBHOOK
+        ==============================================
+        
+        Pensado para álbumes de Telegram: agrupa hasta
+        ``max_attachments_per_message`` archivos por request respetando el
+        presupuesto ``max_request_size_mb``. Si no caben en uno se reparten
+        en varios requests, en orden, y el texto va sólo en el primero.
+        
+        Args:
+            webhook_url: URL del webhook de Discord
+            content: Texto que acompaña al álbum
+            files: Lista de (fuente, filename); fuentes como en ``send_message_with_file``
+            
+        Returns:
+            bool: True si todos los requests se enviaron exitosamente
+        """
+        if not files:
+            return await self.send_message(webhook_url, content) if content else True
+        
+        return await self.deliver_files(webhook_url, content, files) == len(files)
+    
+    async def deliver_files(self, webhook_url: str, content: str,
+                            files: List[Tuple[UploadSource, str]]) -> int:
+        """
+        Como ``send_message_with_files`` pero retorna cuántos adjuntos llegaron
+        
+        Se detiene en el primer request que falla: los lotes siguientes no se
+        envían, así que lo entregado es siempre un prefijo de ``files`` y un
+        reenvío de lo restante mantiene el orden.
+        """
+        if not self.session:
+            await self.initialize()
+        
+        files = [(prepare_source(source), filename) for source, filename in files]
+        await self.text_coalescer.flush(webhook_url)
+        delivered = 0
+        for index, batch in enumerate(self._plan_attachment_batches(files)):
+            if not await self.circuit_breaker.allow(webhook_url):
+                logger.warning("⚡ Circuit breaker OPEN - saltando envío")
+                break
+            
+            result = await self._send_files_direct(webhook_url, content if index == 0 else "", batch)
+            if not result.success:
+                break
+            
+            delivered += len(batch)
+            self.stats['multi_file_requests'] += 1
+            self.stats['multi_file_attachments'] += len(batch)
+            for file_bytes, filename in batch:
+                self._record_file_sent(file_bytes, filename)
+        
+        if delivered == len(files):
+            logger.info(f"✅ {len(files)} archivos enviados DIRECTAMENTE en grupo")
+        elif delivered:
+            logger.warning(f"⚠️ Álbum entregado en parte: {delivered}/{len(files)} archivos")
+        
+        return delivered
+    
+    def _plan_attachment_batches(self, files: List[Tuple[UploadSource, str]]) -> List[List[Tuple[UploadSource, str]]]:
+        """Repartir adjuntos en requests por número máximo y presupuesto de tamaño"""
+        budget = self.config['max_request_size_mb'] * 1024 * 1024
+        max_files = self.config['max_attachments_per_message']
+        
+        batches: List[List[Tuple[UploadSource, str]]] = []
+        current: List[Tuple[UploadSource, str]] = []
+        current_size = 0
+        
+        for file_bytes, filename in files:
+            size = source_size(file_bytes)
+            if current and (len(current) >= max_files or current_size + size > budget):
+                batches.append(current)
+                current, current_size = [], 0
+            current.append((file_bytes, filename))
+            current_size += size
+        
+        if current:
+            batches.append(current)
+        return batches
+    
     async def _send_file_direct(self, webhook_url: str, content: str, 
-                              file_bytes: bytes, filename: str) -> SendResult:
+                              file_bytes: UploadSource, filename: str) -> SendResult:
         """
         🎯 ENVÍO DIRECTO DE ARCHIVO - IMPLEMENTACIÓN CORE
         ================================================
         
         Esta función hace el envío real y directo del archivo a Discord
         """
-        last_exception = None
+        return await self._send_files_direct(webhook_url, content, [(file_bytes, filename)])
+    
+    async def _send_files_direct(self, webhook_url: str, content: str,
+                               files: List[Tuple[UploadSource, str]]) -> SendResult:
+        """
+        Envío multipart de uno o varios adjuntos con retry logic
+
+        El FormData se rehace en cada intento y los payloads releen su
+        fuente (ruta, archivo, MediaBuffer), así que entre reintentos no se
+        retiene ningún buffer con el contenido.
+        """
+        files = [(prepare_source(file_bytes), filename) for file_bytes, filename in files]
+        sources = [mirror for mirror in [current_mirror()] if mirror]
+        mirrors = self._active_mirrors(sources)
+        result = await self._deliver(RetryItem(webhook_url, content=content, files=files,
+                                               wait=bool(mirrors), sources=sources))
+        if result.success and mirrors:
+            self._record_mirror(mirrors, result, has_content=bool(content))
+        return result
+    
+    async def _send_with_retry(self, webhook_url: str, payload: Dict[str, Any]) -> SendResult:
+        """Envío de JSON con retry logic para mensajes de texto"""
+        return await self._deliver(RetryItem(webhook_url, payload=payload))
+    
+    async def _deliver(self, item: RetryItem) -> SendResult:
+        """
+        Primer intento en línea; los reintentos esperan en el RetryScheduler
         
-        for attempt in range(self.config['max_retries'] + 1):
-            try:
-                start_time = time.time()
-                
-                # Preparar FormData para envío directo
-                data = aiohttp.FormData()
+        Durante el backoff el worker del dispatcher queda libre para otros
+        chats. Si el envío acaba en dead-letter cuenta como fallo para el
+        circuit breaker.
+        """
+        result = await self.retry_scheduler.deliver(item)
+        result.retry_count = max(0, item.attempts - 1)
+        
+        if not result.success:
+            self.circuit_breaker.record_failure(item.webhook_url)
+            await self.circuit_breaker.share_state(item.webhook_url)
+            self.stats['total_failures'] += 1
+        
+        return result
+    
+    async def _attempt_item(self, item: RetryItem) -> SendResult:
+        """Un único intento HTTP, sin esperas (el backoff lo gestiona el scheduler)"""
+        try:
+            start_time = time.time()
+            
+            params = {'wait': 'true'} if item.wait else None
+            if item.files:
+                # Enviar con FormData (NO JSON), midiendo el RSS del intento
+                with self.upload_memory.track() as probe:
+                    data = self._build_form_data(item.content, item.files, probe)
+                    upload_bytes = sum(source_size(source) for source, _ in item.files)
+                    response = await self._post(item.webhook_url, upload_bytes, data=data, params=params)
+            else:
+                response = await self._post(item.webhook_url, json=item.payload, params=params)
+            
+            async with response:
+                response_time = time.time() - start_time
                 
-                # Añadir contenido de texto
-                if content:
-                    data.add_field('content', content)
+                if response.status in (200, 204):  # Success
+                    self._record_success(item.webhook_url, response_time)
+                    self.circuit_breaker.record_success(item.webhook_url)
+                    
+                    return SendResult(
+                        success=True,
+                        status_code=response.status,
+                        processing_time=response_time,
+                        response_data=await _json_body(response) if response.status == 200 else None
+                    )
                 
-                # Determinar content type
-                content_type = self._get_content_type(filename)
+                if response.status == 429:  # Rate limit: el limiter ya bloqueó el bucket
+                    self._record_rate_limit(item.webhook_url)
+                    return SendResult(
+                        success=False,
+                        status_code=429,
+                        error_message="rate limited",
+                        retry_after=_retry_after(response.headers)
+                    )
                 
-                # 🎯 PUNTO CLAVE: Añadir archivo como FormData
-                data.add_field(
-                    'file',
-                    BytesIO(file_bytes),
-                    filename=filename,
-                    content_type=content_type
+                # Other error: 4xx no se reintenta, 5xx sí (lo decide el scheduler)
+                error_text = await response.text()
+                kind = 'archivo' if item.files else 'mensaje'
+                logger.warning(f"⚠️ Error enviando {kind} {response.status}: {error_text}")
+                return SendResult(
+                    success=False,
+                    status_code=response.status,
+                    error_message=error_text
                 )
                 
-                # Enviar con FormData (NO JSON)
-                async with self.session.post(webhook_url, data=data) as response:
-                    response_time = time.time() - start_time
-                    
-                    # Actualizar rate limits
-                    self.rate_limiter.update_limits(webhook_url, dict(response.headers))
-                    
-                    if response.status in [200, 204]:  # Success
-                        self._record_success(webhook_url, response_time)
-                        self.circuit_breaker.record_success(webhook_url)
-                        
-                        return SendResult(
-                            success=True,
-                            status_code=response.status,
-                            processing_time=response_time
-                        )
-                    
-                    elif response.status == 429:  # Rate limit
-                        self._record_rate_limit(webhook_url)
-                        retry_after = float(response.headers.get('retry-after', 1.0))
-                        
-                        logger.warning(f"⏰ Rate limit hit, esperando {retry_after}s")
-                        await asyncio.sleep(retry_after)
-                        continue
-                    
-                    else:  # Other error
-                        error_text = await response.text()
-                        logger.warning(f"⚠️ Error enviando archivo {response.status}: {error_text}")
-                        
-                        # Si es error de cliente (4xx), no retry
-                        if 400 <= response.status < 500:
-                            return SendResult(
-                                success=False,
-                                status_code=response.status,
-                                error_message=error_text
-                            )
-                        
-                        # Error de servidor, continuar con retry
-                        last_exception = Exception(f"HTTP {response.status}: {error_text}")
-                        
-            except Exception as e:
-                last_exception = e
-                logger.warning(f"⚠️ Intento {attempt + 1} falló: {e}")
-            
-            # Exponential backoff para retry
-            if attempt < self.config['max_retries']:
-                delay = min(
-                    self.config['retry_delay_base'] * (2 ** attempt),
-                    self.config['retry_delay_max']
-                )
-                await asyncio.sleep(delay)
+        except Exception as e:
+            logger.warning(f"⚠️ Intento {item.attempts} falló: {e}")
+            return SendResult(success=False, error_message=str(e))
+    
+    # ============== POOLS DE WEBHOOKS / REQUEST HTTP ==============
+    
+    def register_webhook_pool(self, webhook_url: str, members: List[str], name: str = "") -> WebhookPool:
+        """
+        Registrar webhooks extra del mismo canal que ``webhook_url``
         
-        # Todos los intentos fallaron
-        self.circuit_breaker.record_failure(webhook_url)
-        self.stats['total_failures'] += 1
+        Los envíos a ``webhook_url`` se reparten entre todos ellos según los
+        tokens libres de cada uno.
+        """
+        pool = WebhookPool(webhook_url, members, name=name)
+        if len(pool) > 1:
+            self.webhook_pools[webhook_url] = pool
+            logger.info(f"🔁 Webhook pool '{pool.name}': {len(pool)} webhooks")
+        return pool
+    
+    def _select_webhook(self, webhook_url: str) -> str:
+        pool = self.webhook_pools.get(webhook_url)
+        return pool.select(self.rate_limiter) if pool else webhook_url
+    
+    async def _post(self, webhook_url: str, upload_bytes: int = 0, **kwargs) -> aiohttp.ClientResponse:
+        """
+        POST con rate limiting proactivo: una reserva por request (también en
+        reintentos) sobre el webhook elegido del pool. Los headers de la
+        respuesta actualizan el limiter antes de devolverla.
+        """
+        target_url = self._select_webhook(webhook_url)
+        pool = self.webhook_pools.get(webhook_url)
         
-        return SendResult(
-            success=False,
-            error_message=str(last_exception) if last_exception else "Unknown error",
-            retry_count=self.config['max_retries']
-        )
+        await self.rate_limiter.wait_if_needed(target_url)
+        self.stats['http_requests'] += 1
+        try:
+            response = await self._send_http('POST', target_url, upload_bytes, **kwargs)
+        except BaseException:
+            self.rate_limiter.release(target_url)
+            if pool:
+                pool.record(target_url, 0)
+            raise
+        
+        try:
+            await self.rate_limiter.update_limits(target_url, response.headers, response.status)
+        except BaseException:
+            response.release()
+            raise
+        if pool:
+            pool.record(target_url, response.status)
+        return response
     
-    async def _send_with_retry(self, webhook_url: str, payload: Dict[str, Any]) -> SendResult:
-        """Envío de JSON con retry logic para mensajes de texto"""
-        last_exception = None
+    async def _request(self, method: str, webhook_url: str, path: str = "", **kwargs) -> aiohttp.ClientResponse:
+        """Request a un webhook concreto (sin pool) con el bucket de su método"""
+        url = webhook_url + path
+        await self.rate_limiter.wait_if_needed(url, method)
+        self.stats['http_requests'] += 1
+        try:
+            response = await self._send_http(method, url, **kwargs)
+        except BaseException:
+            self.rate_limiter.release(url, method)
+            raise
         
-        for attempt in range(self.config['max_retries'] + 1):
+        try:
+            await self.rate_limiter.update_limits(url, response.headers, response.status, method)
+        except BaseException:
+            response.release()
+            raise
+        return response
+    
+    async def _send_http(self, method: str, url: str, upload_bytes: int = 0, **kwargs) -> aiohttp.ClientResponse:
+        """Request dentro del límite adaptativo; el slot se libera al llegar los headers"""
+        async with self.upload_limiter.slot() as permit:
+            started = time.monotonic()
+            response = await self.session.request(method, url, **kwargs)
+            permit.overloaded = response.status == 429 or response.status >= 500
+            # Segundos por MB (mínimo 1MB): un adjunto grande no cuenta como Discord lento
+            permit.latency = (time.monotonic() - started) / max(1.0, upload_bytes / 1048576)
+        return response
+    
+    # ============== MENSAJES ESPEJADOS (EDICIÓN / BORRADO) ==============
+    
+    def attach_message_map(self, message_map: MessageMap):
+        """Registrar el id de Discord de cada envío hecho dentro de ``mirroring()``"""
+        self.message_map = message_map
+    
+    def _active_mirrors(self, mirrors: List[Optional[MirrorRef]]) -> List[MirrorRef]:
+        if self.message_map is None:
+            return []
+        return [mirror for mirror in mirrors if mirror is not None]
+    
+    def _record_mirror(self, mirrors: List[MirrorRef], result: SendResult, has_content: bool):
+        """Guardar en el índice el mensaje creado (viene en la respuesta de ?wait=true)"""
+        data = result.response_data or {}
+        try:
+            discord_id = int(data['id'])
+            webhook_id = int(data['webhook_id'])
+        except (KeyError, TypeError, ValueError):
+            return
+        
+        flags = (FLAG_MEDIA if any(mirror.media for mirror in mirrors) else 0)
+        flags |= 0 if has_content else FLAG_NO_CONTENT
+        parts = sum(len(mirror.message_ids) for mirror in mirrors)
+        for mirror in mirrors:
+            for message_id in mirror.message_ids:
+                self.message_map.add(mirror.chat_id, message_id, MirroredMessage(
+                    discord_id=discord_id, webhook_id=webhook_id, parts=parts, flags=flags
+                ))
+        self.stats['mirrored_posts'] += 1
+    
+    def _webhook_members(self, webhook_urls: List[str]) -> Dict[int, str]:
+        """id de webhook → URL, incluidos los miembros de los pools"""
+        members: Dict[int, str] = {}
+        for webhook_url in webhook_urls:
+            pool = self.webhook_pools.get(webhook_url)
+            for url in (pool.urls if pool else [webhook_url]):
+                try:
+                    members[int(route_key(url)[1])] = url
+                except ValueError:
+                    continue
+        return members
+    
+    async def edit_mirrored(self, webhook_urls: List[str], chat_id: int, message_id: int,
+                            content: str, keep_header: bool = False) -> bool:
+        """
+        PATCH de los mensajes que espejan (chat_id, message_id) en estos destinos
+        
+        Con ``keep_header`` (media) sólo se sustituye el caption: se conserva
+        la cabecera que el replicador antepone al adjunto ("🖼️ **Imagen...**").
+        Los textos coalescidos con otros no se editan (se contarían dos veces).
+        """
+        if self.message_map is None:
+            return False
+        if not self.session:
+            await self.initialize()
+        
+        members = self._webhook_members(webhook_urls)
+        rows = [
+            row for row in await self.message_map.lookup(chat_id, message_id)
+            if row.webhook_id in members and row.has_content
+        ]
+        if not rows:
+            self.stats['mirror_unmapped'] += 1
+            return False
+        
+        success = True
+        for row in rows:
+            if row.parts > 1 and not (row.is_media and content):
+                # Texto coalescido o parte de álbum sin caption: no es sólo suyo
+                self.stats['mirror_skipped'] += 1
+                continue
+            
+            path = f"/messages/{row.discord_id}"
+            url = members[row.webhook_id]
             try:
-                start_time = time.time()
+                new_content = content
+                if keep_header and row.is_media:
+                    async with await self._request('GET', url, path) as response:
+                        current = (await _json_body(response) or {}).get('content', '') if response.status == 200 else ''
+                    header = current.split("\n\n", 1)[0]
+                    new_content = f"{header}\n\n{content}" if header and content else (header or content)
                 
-                async with self.session.post(webhook_url, json=payload) as response:
-                    response_time = time.time() - start_time
-                    
-                    # Actualizar rate limits
-                    self.rate_limiter.update_limits(webhook_url, dict(response.headers))
-                    
-                    if response.status == 204:  # Success
-                        self._record_success(webhook_url, response_time)
-                        self.circuit_breaker.record_success(webhook_url)
-                        
-                        return SendResult(
-                            success=True,
-                            status_code=response.status,
-                            processing_time=response_time
-                        )
-                    
-                    elif response.status == 429:  # Rate limit
-                        self._record_rate_limit(webhook_url)
-                        retry_after = float(response.headers.get('retry-after', 1.0))
-                        await asyncio.sleep(retry_after)
-                        continue
-                    
-                    else:  # Other error
-                        error_text = await response.text()
-                        logger.warning(f"⚠️ Error enviando mensaje {response.status}: {error_text}")
-                        
-                        if 400 <= response.status < 500:
-                            return SendResult(
-                                success=False,
-                                status_code=response.status,
-                                error_message=error_text
-                            )
-                        
-                        last_exception = Exception(f"HTTP {response.status}: {error_text}")
-                        
+                async with await self._request('PATCH', url, path,
+                                               json={'content': new_content[:DISCORD_MAX_CONTENT]}) as response:
+                    ok = response.status == 200
             except Exception as e:
-                last_exception = e
+                logger.warning(f"⚠️ Error editando mensaje espejado: {e}")
+                ok = False
             
-            # Exponential backoff
-            if attempt < self.config['max_retries']:
-                delay = min(
-                    self.config['retry_delay_base'] * (2 ** attempt),
-                    self.config['retry_delay_max']
-                )
-                await asyncio.sleep(delay)
+            if ok:
+                self.stats['edits_propagated'] += 1
+            else:
+                self.stats['mirror_failures'] += 1
+                success = False
+        return success
+    
+    async def delete_mirrored(self, webhook_urls: List[str], chat_id: int, message_ids: List[int]) -> int:
+        """
+        DELETE de los mensajes que espejan ``message_ids``; devuelve cuántos se borraron
         
-        # Falló completamente
-        self.circuit_breaker.record_failure(webhook_url)
-        self.stats['total_failures'] += 1
+        Un mensaje de Discord con varias partes (álbum, textos coalescidos)
+        sólo se borra cuando se borran todas en el mismo evento; hasta
+        entonces las partes borradas siguen en el índice.
+        """
+        if self.message_map is None:
+            return 0
+        if not self.session:
+            await self.initialize()
         
-        return SendResult(
-            success=False,
-            error_message=str(last_exception) if last_exception else "Unknown error",
-            retry_count=self.config['max_retries']
-        )
+        members = self._webhook_members(webhook_urls)
+        targets: Dict[int, Tuple[MirroredMessage, int]] = {}
+        mapped: Dict[int, Tuple[MirroredMessage, ...]] = {}
+        for message_id in message_ids:
+            rows = await self.message_map.lookup(chat_id, message_id)
+            if not rows:
+                self.stats['mirror_unmapped'] += 1
+                continue
+            mapped[message_id] = rows
+            for row in rows:
+                previous = targets.get(row.discord_id)
+                targets[row.discord_id] = (row, (previous[1] if previous else 0) + 1)
+        
+        partial = {discord_id for discord_id, (row, count) in targets.items() if count < row.parts}
+        for message_id, rows in mapped.items():
+            if not any(row.discord_id in partial for row in rows):
+                self.message_map.remove(chat_id, message_id)
+        
+        deleted = 0
+        for row, count in targets.values():
+            if row.webhook_id not in members:
+                continue
+            if row.discord_id in partial:
+                self.stats['mirror_skipped'] += 1
+                continue
+            try:
+                async with await self._request('DELETE', members[row.webhook_id],
+                                               f"/messages/{row.discord_id}") as response:
+                    ok = response.status in (204, 404)  # 404: ya no existía
+            except Exception as e:
+                logger.warning(f"⚠️ Error borrando mensaje espejado: {e}")
+                ok = False
+            
+            if ok:
+                deleted += 1
+                self.stats['deletes_propagated'] += 1
+            else:
+                self.stats['mirror_failures'] += 1
+        return deleted
     
     # ============== MÉTODOS DE UTILIDAD ==============
     
+    def _build_form_data(self, content: str, files: List[Tuple[UploadSource, str]],
+                         probe=None) -> aiohttp.FormData:
+        """FormData de un intento: texto + adjuntos como payloads en streaming"""
+        data = aiohttp.FormData()
+        
+        # Añadir contenido de texto
+        if content:
+            data.add_field('content', content)
+        
+        # 🎯 PUNTO CLAVE: Añadir archivos como FormData
+        for index, (file_bytes, filename) in enumerate(files):
+            content_type = self._get_content_type(filename)
+            data.add_field(
+                'file' if len(files) == 1 else f'files[{index}]',
+                self._file_payload(file_bytes, content_type, probe),
+                filename=filename,
+                content_type=content_type
+            )
+        return data
+    
+    def _file_payload(self, file_bytes: UploadSource, content_type: str, probe=None):
+        """Cuerpo del adjunto: rutas, archivos y MediaBuffer en streaming, bytes sin copia extra"""
+        return source_payload(file_bytes, content_type, probe)
+    
     def _get_content_type(self, filename: str) -> str:
         """Determinar content type por extensión"""
         ext = filename.lower().split('.')[-1] if '.' in filename else ''
@@ -494,7 +849,7 @@ class DiscordSenderEnhanced:
         
         return content_types.get(ext, 'application/octet-stream')
     
-    async def _try_compress_file(self, file_bytes: bytes, filename: str) -> Optional[bytes]:
+    async def _try_compress_file(self, file_bytes: UploadSource, filename: str) -> Optional[bytes]:
         """Intentar comprimir archivo si es posible"""
         try:
             ext = filename.lower().split('.')[-1] if '.' in filename else ''
@@ -512,43 +867,35 @@ class DiscordSenderEnhanced:
             logger.warning(f"⚠️ Error comprimiendo archivo: {e}")
             return None
     
-    async def _compress_image(self, image_bytes: bytes) -> Optional[bytes]:
-        """Comprimir imagen usando PIL"""
+    async def _compress_image(self, image_bytes: UploadSource) -> Optional[bytes]:
+        """Recodificar (JPEG, compress-to-fit) para caber en ``max_file_size_mb``"""
         try:
-            from PIL import Image
-            from io import BytesIO
-            
-            # Cargar imagen
-            img = Image.open(BytesIO(image_bytes))
-            
-            # Reducir tamaño si es muy grande
-            max_size = (1920, 1080)
-            if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # Comprimir
-            output = BytesIO()
-            
-            # Convertir a RGB si tiene transparencia
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            
-            img.save(output, format='JPEG', quality=75, optimize=True)
-            
-            compressed = output.getvalue()
-            return compressed if len(compressed) < len(image_bytes) else None
+            data = await asyncio.to_thread(read_source, image_bytes)
+            fitted = await get_media_compute().run(
+                compress_to_fit, data, int(self.config['max_file_size_mb'] * 1024 * 1024)
+            )
+            logger.info(
+                f"🗜️ Compress-to-fit: q{fitted.quality}, escala {fitted.scale:.2f}, "
+                f"{fitted.iterations} iteraciones, {fitted.encode_seconds * 1000:.0f}ms"
+            )
+            return fitted.data if fitted.fits else None
             
-        except ImportError:
-            logger.warning("⚠️ PIL no disponible para compresión")
-            return None
         except Exception as e:
             logger.warning(f"⚠️ Error comprimiendo imagen: {e}")
             return None
     
+    def _record_file_sent(self, file_bytes: UploadSource, filename: str):
+        """Contadores de archivos enviados por tipo"""
+        self.stats['files_sent_direct'] += 1
+        self.stats['total_bytes_sent'] += source_size(file_bytes)
+        
+        if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
+            self.stats['images_sent_direct'] += 1
+        elif filename.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
+            self.stats['videos_sent_direct'] += 1
+        elif filename.lower().endswith(('.mp3', '.wav', '.ogg', '.m4a')):
+            self.stats['audios_sent_direct'] += 1
+    
     def _record_success(self, webhook_url: str, response_time: float):
         """Registrar éxito y actualizar métricas"""
         # Actualizar tiempo de respuesta promedio
@@ -605,8 +952,22 @@ class DiscordSenderEnhanced:
         return {
             "discord_sender_stats": self.stats.copy(),
             "rate_limiter": {
-                "active_limits": len(self.rate_limiter.rate_limits),
-                "rate_limit_hits": self.stats['rate_limit_hits']
+                "rate_limit_hits": self.stats['rate_limit_hits'],
+                **self.rate_limiter.get_stats()
+            },
+            "uploads": self.upload_memory.get_stats(),
+            "upload_concurrency": self.upload_limiter.get_stats(),
+            "message_map": self.message_map.get_stats() if self.message_map else {"enabled": False},
+            "retries": self.retry_scheduler.get_stats(),
+            "text_coalescing": {
+                "enabled": self.config['text_coalesce_window_ms'] > 0,
+                **self.text_coalescer.get_stats()
+            },
+            "requests_per_message": self.stats['http_requests'] / max(
+                self.stats['messages_sent'] + self.stats['files_sent_direct'], 1
+            ),
+            "webhook_pools": {
+                pool.name: pool.get_stats(self.rate_limiter) for pool in self.webhook_pools.values()
             },
             "circuit_breaker": {
                 "webhooks_monitored": len(self.circuit_breaker.states),
@@ -615,17 +976,42 @@ class DiscordSenderEnhanced:
             }
         }
     
+    async def replay_dead_letter(self, letter_id: int) -> Optional[bool]:
+        """Reenviar una dead letter (None si no existe)"""
+        if not self.session:
+            await self.initialize()
+        
+        result = await self.retry_scheduler.replay(letter_id)
+        return None if result is None else result.success
+    
     async def close(self):
         """Cerrar conexiones"""
         try:
+            await self.text_coalescer.close()
+            await self.retry_scheduler.stop()
+            
             if self.session and not self.session.closed:
                 await self.session.close()
             
+            await self.rate_limiter.backend.close()
+            
             logger.info("✅ Discord Sender cerrado correctamente")
             
         except Exception as e:
             logger.error(f"❌ Error cerrando Discord Sender: {e}")
 
+async def _json_body(response) -> Optional[Dict[str, Any]]:
+    try:
+        return await response.json(content_type=None)
+    except Exception:
+        return None
+
+def _retry_after(headers) -> Optional[float]:
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
 # ============== FACTORY PARA COMPATIBILIDAD ==============
 
 def create_discord_sender() -> DiscordSenderEnhanced:
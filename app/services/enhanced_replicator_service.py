@@ -14,14 +14,31 @@ Archivo: app/services/enhanced_replicator_service.py
 
 import asyncio
 import logging
+import time
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Iterable, Optional, List
 from pathlib import Path
 
 # Enterprise services imports
 from .discord_sender import DiscordSenderEnhanced
 from .file_processor import FileProcessorEnhanced  
 from .watermark_service import WatermarkServiceIntegrated
+from .chat_dispatcher import ChatDispatcher
+from .media_buffer import MediaBuffer, MediaSource, media_bytes
+from .media_router import MediaRouter, MediaRoute, RouteDecision
+from .album_aggregator import Album, AlbumAggregator
+from .outbox import OutboxEntry, ReplicationOutbox
+from .message_map import MessageMap, MirrorUpdate, mirroring
+from .backfill import BackfillManager, FloodWaitError
+from .media_cache import MediaCache
+from .routing import (
+    DeliveryFailedError, DeliveryLedger, DeliveryTarget, Destination, FanOutSender, RoutingTable,
+    current_ledger, recording_deliveries
+)
+from .media_compute import get_media_compute
+from .adaptive_limiter import AdaptiveLimiter
+from .rate_limit_backend import create_rate_limit_backend
+from app.tasks.workers.media_kernels import EncodedImage, compress_to_fit
 
 # Telegram imports with graceful fallback - FIXED
 try:
@@ -125,18 +142,26 @@ class EnhancedReplicatorService:
         # Enterprise service dependencies (dependency injection ready)
         self.file_processor = FileProcessorEnhanced()
         self.watermark_service = WatermarkServiceIntegrated()
-        self.discord_sender = DiscordSenderEnhanced()
+        self.discord_sender = DiscordSenderEnhanced(
+            rate_limit_backend=create_rate_limit_backend(
+                settings.discord.rate_limit_backend,
+                db_path=settings.discord.rate_limit_db,
+                redis_url=settings.discord.rate_limit_redis_url
+            )
+        )
         
         # Enterprise metrics with detailed tracking + direct sending metrics
         self.stats = {
             'messages_received': 0,
-            'messages_replicated': 0,
+            'messages_replicated': 0,      # Mensajes de Telegram, una vez cada uno
+            'target_deliveries': 0,        # Entregas por (mensaje, grupo de watermark)
             'messages_filtered': 0,
             'pdfs_processed': 0,
             'audios_processed': 0,
             'videos_processed': 0,
             'images_processed': 0,
             'documents_processed': 0,
+            'albums_processed': 0,
             'watermarks_applied': 0,
             'files_sent_direct': 0,        # 🎯 Nuevas métricas envío directo
             'images_sent_direct': 0,
@@ -146,6 +171,9 @@ class EnhancedReplicatorService:
             'files_compressed': 0,
             'compression_savings_mb': 0.0,
             'large_files_rejected': 0,
+            'bytes_downloaded': 0,
+            'download_time_seconds': 0.0,
+            'downloads_spooled_to_disk': 0,
             'errors': 0,
             'retries': 0,
             'circuit_breaker_trips': 0,
@@ -163,22 +191,213 @@ class EnhancedReplicatorService:
         # Enterprise configuration with direct sending settings
         self.config = {
             'max_concurrent_processing': 10,
+            'lanes': {                  # 🚦 Carriles de prioridad (workers + cola por chat)
+                'fast': {'workers': 16, 'max_queue_per_chat': 200},   # Texto + imágenes pequeñas
+                'heavy': {'workers': 8, 'max_queue_per_chat': 50},    # Video, PDF, documentos grandes
+                'backfill': {'workers': 2, 'max_queue_per_chat': 20}  # Recuperación tras caída
+            },
+            'backfill': {               # ⏪ Catch-up de lo publicado mientras estábamos caídos
+                'enabled': True,
+                'max_concurrent_chats': 3,
+                'batch_size': 100,          # Mensajes por llamada a iter_messages
+                'wait_time': 1.0,           # Pausa entre lotes (FloodWait)
+                'max_messages_per_chat': 5000,
+                'pause_when_live_queue_above': 50
+            },
+            'fast_lane_max_image_mb': 5,
+            'albums': {                 # 📚 Álbumes (grouped_id) en un solo webhook
+                'enabled': True,
+                'window_seconds': 0.8,
+                'max_items': 10         # Máximo de adjuntos por mensaje de Discord
+            },
             'health_check_interval': 30,
             'metrics_collection_interval': 10,
             'circuit_breaker_threshold': 5,
             'retry_attempts': 3,
             'processing_timeout': 300,  # 5 minutes
+            'outbox': {                 # 💾 Outbox durable (SQLite WAL) para recuperación tras caída
+                'enabled': True,
+                'db_path': 'data/replication_outbox.db',
+                'flush_interval_ms': 10,    # Ventana de group commit
+                'max_batch': 500,
+                'max_replay_attempts': 3,   # Entradas que fallan más veces no se reenvían
+                'retention_hours': 24       # Entregadas/abandonadas más antiguas se purgan
+            },
+            'message_map': {            # 🗺️ Telegram → Discord ids para propagar ediciones y borrados
+                'enabled': True,
+                'db_path': 'data/message_map.db',
+                'max_entries': 5_000_000,   # Expulsión LRU por encima de esto
+                'max_age_hours': 168,       # Sin uso durante una semana → se olvida
+                'cache_entries': 100_000    # Lookups O(1) en memoria para lo reciente
+            },
+            'text_coalescing': {        # 💬 Ráfagas de texto de un chat en un solo webhook
+                'enabled': False,
+                'window_ms': 300,           # Desde el primer texto del lote
+                'max_chars': 2000           # Límite de contenido de Discord
+            },
+            'routing': {                # 🔀 Destinos extra por chat (además de settings.discord.webhooks)
+                'routes_file': 'config/routes.json'
+            },
+            'media_cache': {            # ♻️ Media procesado compartido entre chats (reenvíos)
+                'enabled': True,
+                'cache_dir': 'cache_files/media',
+                'max_size_mb': 2048,        # Expulsión LRU por encima de esto
+                'max_entry_mb': 100
+            },
+            'compute': {                # ⚙️ Pool de procesos para trabajo CPU (Pillow)
+                'enabled': True,
+                'max_workers': None,        # None = núcleos de CPU
+                'shm_threshold_mb': 1       # Entradas/salidas mayores viajan por memoria compartida
+            },
+            'download': {               # 📦 Descargas en streaming a SpooledTemporaryFile
+                'spool_max_memory_mb': 8,   # Por encima de esto se vuelca a disco
+                'temp_dir': 'temp_files'
+            },
+            'watermark_pool': {         # 🎨 Pool de procesos dedicado a watermarks
+                'enabled': True,
+                'max_workers': None,        # None = núcleos de CPU
+                'job_timeout_seconds': 30,  # Por imagen, cola incluida; al superarlo se envía sin watermark
+                'composite_backend': 'pillow'   # 'pillow' | 'numpy' (scripts/benchmark_watermark.py)
+            },
+            'concurrency': {            # 📈 Límites adaptativos (AIMD) por etapa
+                'adaptive': True,           # False = límites fijos en 'initial'
+                'downloads': {'initial': 8, 'min': 2, 'max': 32},
+                'uploads': {'initial': 10, 'min': 2, 'max': 50},
+                'compute_queue_target_ms': 50   # Espera en el pool a partir de la cual se reduce
+            },
             'direct_sending': {         # 🎯 Configuración envío directo
                 'max_file_size_mb': 25,     # Discord limit
                 'auto_compress': True,
-                'compression_quality': 75,
+                'compression_format': 'JPEG',   # JPEG o WEBP
+                'compression_min_quality': 40,  # Por debajo se reduce resolución
+                'compression_max_quality': 90,
+                'compression_max_iterations': 6,
                 'prefer_direct': True,
                 'fallback_to_links': False  # Solo envío directo
             }
         }
         
-        # Processing semaphore for concurrency control
-        self.processing_semaphore = asyncio.Semaphore(self.config['max_concurrent_processing'])
+        # Source chat → Discord destinations (one chat can mirror to many webhooks)
+        self.routing = RoutingTable.from_settings(
+            settings.discord.webhooks,
+            routes_file=self.config['routing']['routes_file']
+        )
+        self.fanout = FanOutSender(self.discord_sender)
+        coalesce_config = self.config['text_coalescing']
+        if coalesce_config['enabled']:
+            self.discord_sender.configure_text_coalescing(
+                coalesce_config['window_ms'], coalesce_config['max_chars']
+            )
+        for destination in self.routing.pools():
+            self.discord_sender.register_webhook_pool(
+                destination.webhook_url, list(destination.pool), name=destination.label
+            )
+        
+        # Pre-download routing from Telegram metadata
+        self.media_router = MediaRouter({
+            'max_file_size_mb': self.config['direct_sending']['max_file_size_mb'],
+            'auto_compress': self.config['direct_sending']['auto_compress']
+        })
+        
+        # Telegram albums are coalesced before being dispatched; later events of
+        # the same chat are held behind them
+        self.album_aggregator = AlbumAggregator(
+            self._dispatch_album,
+            self._dispatch_live,
+            window_seconds=self.config['albums']['window_seconds'],
+            max_items=self.config['albums']['max_items']
+        )
+        
+        # Processed media shared across chats, keyed by Telegram media id + watermark version
+        cache_config = self.config['media_cache']
+        self.media_cache = MediaCache(
+            cache_dir=cache_config['cache_dir'],
+            max_size_mb=cache_config['max_size_mb'],
+            max_entry_mb=cache_config['max_entry_mb'],
+            buffer_memory_mb=self.config['download']['spool_max_memory_mb'],
+            temp_dir=self.config['download']['temp_dir']
+        )
+        
+        # CPU-bound media work (compression, watermarks) runs in a shared process pool
+        compute_config = self.config['compute']
+        self.compute = get_media_compute()
+        concurrency_config = self.config['concurrency']
+        self.compute.configure(
+            max_workers=compute_config['max_workers'],
+            shm_threshold_mb=compute_config['shm_threshold_mb'],
+            enabled=compute_config['enabled'],
+            queue_target_ms=concurrency_config['compute_queue_target_ms'],
+            adaptive=concurrency_config['adaptive']
+        )
+        
+        watermark_pool = self.config['watermark_pool']
+        self.watermark_service.configure_pool(
+            max_workers=watermark_pool['max_workers'],
+            job_timeout_seconds=watermark_pool['job_timeout_seconds'],
+            enabled=watermark_pool['enabled']
+        )
+        self.watermark_service.set_composite_backend(watermark_pool['composite_backend'])
+        
+        # Descargas y uploads en vuelo: AIMD según latencia y FloodWait / 429 / 5xx
+        downloads = concurrency_config['downloads']
+        adaptive = concurrency_config['adaptive']
+        self.download_limiter = AdaptiveLimiter(
+            'downloads',
+            initial_limit=downloads['initial'],
+            min_limit=downloads['min'] if adaptive else downloads['initial'],
+            max_limit=downloads['max'] if adaptive else downloads['initial']
+        )
+        uploads = concurrency_config['uploads']
+        self.discord_sender.configure_upload_concurrency(
+            uploads['initial'], uploads['min'], uploads['max'], adaptive=adaptive
+        )
+        
+        # Durable outbox: accepted events survive a crash and are replayed on start
+        outbox_config = self.config['outbox']
+        self.outbox = ReplicationOutbox(
+            db_path=outbox_config['db_path'],
+            flush_interval_ms=outbox_config['flush_interval_ms'],
+            max_batch=outbox_config['max_batch']
+        )
+        
+        # Telegram → Discord message ids: edits and deletes follow the original post
+        map_config = self.config['message_map']
+        self.message_map = MessageMap(
+            db_path=map_config['db_path'],
+            max_entries=map_config['max_entries'],
+            max_age_hours=map_config['max_age_hours'],
+            cache_entries=map_config['cache_entries']
+        )
+        if map_config['enabled']:
+            self.discord_sender.attach_message_map(self.message_map)
+        
+        # Catch-up of the gap left by a restart or a Telegram disconnect
+        backfill_config = self.config['backfill']
+        self.backfill = BackfillManager(
+            self._submit_backfill,
+            max_concurrent_chats=backfill_config['max_concurrent_chats'],
+            batch_size=backfill_config['batch_size'],
+            wait_time=backfill_config['wait_time'],
+            max_messages_per_chat=backfill_config['max_messages_per_chat'],
+            is_busy=self._live_lanes_busy,
+            checkpoint=self._checkpoint_backfill
+        )
+        self._first_live_id: Dict[int, int] = {}
+        self._telegram_connected = False
+        
+        # Priority lanes: per-chat ordered queues, each with its own worker pool
+        self.lanes: Dict[str, ChatDispatcher] = {
+            lane: ChatDispatcher(
+                self._handle_dispatched_event,
+                workers=lane_config['workers'],
+                max_queue_per_chat=lane_config['max_queue_per_chat'],
+                name=lane
+            )
+            for lane, lane_config in self.config['lanes'].items()
+        }
+        self.config['max_concurrent_processing'] = sum(
+            lane_config['workers'] for lane_config in self.config['lanes'].values()
+        )
         
         logger.info("🚀 Enhanced Replicator Service v3.0 Enterprise initialized - MODO ENVÍO DIRECTO")
     
@@ -206,6 +425,15 @@ class EnhancedReplicatorService:
             # 3. Initialize enterprise services with error isolation
             await self._initialize_enterprise_services()
             
+            if self.config['outbox']['enabled']:
+                await self.outbox.start()
+            
+            if self.config['message_map']['enabled']:
+                await self.message_map.start()
+            
+            self.compute.start()
+            self.watermark_service.start()
+            
             # 4. Configure event handlers with enterprise patterns
             if self.telegram_client:
                 self._setup_enterprise_event_handlers()
@@ -213,6 +441,11 @@ class EnhancedReplicatorService:
             # 5. Start background enterprise tasks
             await self._start_background_tasks()
             
+            # Deliveries interrupted by a previous crash go first
+            if self.config['outbox']['enabled']:
+                await self._replay_outbox()
+                await self.run_backfill()
+            
             self.is_running = True
             logger.info("✅ Enhanced Replicator Service Enterprise initialized successfully")
             
@@ -320,55 +553,369 @@ class EnhancedReplicatorService:
         
         @self.telegram_client.on(events.NewMessage)
         async def handle_enterprise_message(event):
-            """Enterprise message handler with comprehensive error handling"""
-            processing_start = datetime.now()
-            
+            """Enterprise message handler - enqueues onto the per-chat dispatcher"""
             try:
-                async with self.processing_semaphore:
-                    chat_id = event.chat_id
-                    
-                    # Multi-tenant access control
-                    if chat_id not in settings.discord.webhooks:
-                        logger.debug(f"🔒 Unauthorized group access attempt: {chat_id}")
-                        return
-                    
-                    # Update enterprise metrics
-                    self.stats['messages_received'] += 1
-                    self.stats['last_message_time'] = datetime.now()
-                    self.stats['groups_active'].add(chat_id)
-                    self.stats['performance_metrics']['active_connections'] += 1
-                    
-                    # Process with enterprise patterns
-                    await self._process_message_enterprise(chat_id, event.message)
-                    
-                    # Update performance metrics
-                    processing_time = (datetime.now() - processing_start).total_seconds()
-                    self._update_performance_metrics(processing_time)
-                    
+                chat_id = event.chat_id
+                
+                # Multi-tenant access control
+                if chat_id not in self.routing:
+                    logger.debug(f"🔒 Unauthorized group access attempt: {chat_id}")
+                    return
+                
+                # Durable before acknowledging: survives a crash until delivered
+                await self.outbox.record_accepted(chat_id, event.message.id)
+                self._first_live_id.setdefault(chat_id, event.message.id)
+                
+                # Album parts are buffered and dispatched together
+                grouped_id = getattr(event.message, 'grouped_id', None)
+                if grouped_id and self.config['albums']['enabled']:
+                    await self.album_aggregator.add(chat_id, grouped_id, event)
+                    return
+                
+                # Ordered per chat and lane, parallel across chats
+                await self.album_aggregator.enqueue(chat_id, event)
+                
             except Exception as e:
-                logger.error(f"❌ Enterprise message processing error: {e}")
+                logger.error(f"❌ Enterprise message dispatch error: {e}")
                 self.stats['errors'] += 1
-                await self._handle_processing_error(e, event.chat_id if hasattr(event, 'chat_id') else None)
-            finally:
-                self.stats['performance_metrics']['active_connections'] -= 1
+        
+        @self.telegram_client.on(events.MessageEdited)
+        async def handle_enterprise_edit(event):
+            """Edits queue behind the original post (same chat and lane)"""
+            try:
+                chat_id = event.chat_id
+                if chat_id not in self.routing or not self.config['message_map']['enabled']:
+                    return
+                
+                update = MirrorUpdate('edit', [event.message.id], event.message)
+                await self.album_aggregator.enqueue(chat_id, update)
+                
+            except Exception as e:
+                logger.error(f"❌ Enterprise edit dispatch error: {e}")
+        
+        @self.telegram_client.on(events.MessageDeleted)
+        async def handle_enterprise_delete(event):
+            """Deletes only carry ids; Telegram omits the chat outside channels/supergroups"""
+            try:
+                chat_id = event.chat_id
+                if chat_id is None or chat_id not in self.routing or not self.config['message_map']['enabled']:
+                    return
+                
+                await self.album_aggregator.enqueue(chat_id, MirrorUpdate('delete', list(event.deleted_ids)))
+                
+            except Exception as e:
+                logger.error(f"❌ Enterprise delete dispatch error: {e}")
         
         logger.info("📡 Enterprise event handlers configured")
     
-    async def _process_message_enterprise(self, chat_id: int, message):
-        """Enterprise message processing with advanced routing"""
+    def _select_lane(self, message) -> str:
+        """
+        Pick the priority lane for a message
+        
+        Text and small images go to the fast lane so they are never queued
+        behind videos, PDFs or large documents in the heavy lane. Ordering is
+        strict within a (chat, lane) pair; a text can overtake a video of the
+        same chat that is still being processed.
+        """
+        if not message.media:
+            return 'fast'
+        
+        decision = self.media_router.decide(self.media_router.inspect(message))
+        info = decision.info
+        
+        # Rejected media is never downloaded, only a notice is sent
+        if decision.route == MediaRoute.REJECT:
+            return 'fast'
+        
+        # Web pages, polls, geo... only produce text
+        if info.kind in ('photo', 'other'):
+            return 'fast'
+        
+        if info.kind == 'image' and info.size_mb <= self.config['fast_lane_max_image_mb']:
+            return 'fast'
+        
+        return 'heavy'
+    
+    async def _dispatch_album(self, album: Album):
+        """Enqueue a coalesced album; it goes heavy if any part needs the heavy lane"""
+        lanes = {self._select_lane(message) for message in album.messages}
+        lane = 'heavy' if 'heavy' in lanes else 'fast'
+        await self.lanes[lane].submit(album.chat_id, album)
+    
+    async def _dispatch_live(self, chat_id: int, item):
+        """Enqueue a live message, edit or delete once no earlier album of the chat is pending"""
+        if isinstance(item, MirrorUpdate) and item.kind == 'delete':
+            await self._dispatch_delete(chat_id, item.message_ids)
+            return
+        
+        message = item.message
+        await self.lanes[self._select_lane(message)].submit(chat_id, item)
+    
+    async def _dispatch_delete(self, chat_id: int, message_ids: List[int]):
+        """
+        Enqueue a delete behind everything already queued for the chat
+        
+        A delete carries no message, so the lane of the original post is
+        unknown: the same update goes to every live lane and only the last
+        lane to reach it propagates the delete.
+        """
+        live_lanes = [lane for lane in self.lanes if lane != 'backfill']
+        update = MirrorUpdate('delete', message_ids, pending_lanes=len(live_lanes))
+        for lane in live_lanes:
+            await self.lanes[lane].submit(chat_id, update)
+    
+    async def _handle_dispatched_event(self, chat_id: int, event):
+        """Process one queued event or album (runs inside a dispatcher worker)"""
+        if isinstance(event, MirrorUpdate):
+            event.pending_lanes -= 1
+            if event.pending_lanes <= 0:
+                await self._propagate_mirror_update(chat_id, event)
+            return
+        
+        processing_start = datetime.now()
+        self.stats['performance_metrics']['active_connections'] += 1
+        message_ids = self._outbox_message_ids(event)
+        ledger = DeliveryLedger(tuple(message_ids))
+        finished = False
+        
         try:
-            webhook_url = settings.discord.webhooks.get(chat_id)
-            if not webhook_url:
+            # Update enterprise metrics
+            self.stats['messages_received'] += len(event.events) if isinstance(event, Album) else 1
+            self.stats['last_message_time'] = datetime.now()
+            self.stats['groups_active'].add(chat_id)
+            
+            # Process with enterprise patterns; sends record what each destination missed
+            with recording_deliveries(ledger):
+                if isinstance(event, Album):
+                    await self._process_album_enterprise(chat_id, event)
+                elif isinstance(event, OutboxEntry):
+                    await self._replay_outbox_entry(chat_id, event)
+                else:
+                    await self._process_message_enterprise(chat_id, event.message)
+            finished = True
+            
+            if ledger.missing:
+                raise DeliveryFailedError(
+                    f"{len(ledger.missing)}/{len(message_ids)} messages missed some destinations"
+                )
+            
+            for message_id in message_ids:
+                self.outbox.mark_delivered(chat_id, message_id)
+            if message_ids:
+                self.outbox.advance_cursor(chat_id, max(message_ids))
+            self.stats['messages_replicated'] += len(message_ids)
+            
+            # Update performance metrics
+            processing_time = (datetime.now() - processing_start).total_seconds()
+            self._update_performance_metrics(processing_time)
+            
+        except Exception as e:
+            logger.error(f"❌ Enterprise message processing error: {e}")
+            self.stats['errors'] += 1
+            # Only what did not arrive stays pending, and only for the destinations that missed it
+            for message_id in message_ids:
+                missing = ledger.missing_for(message_id)
+                if finished and not missing:
+                    self.outbox.mark_delivered(chat_id, message_id)
+                    self.stats['messages_replicated'] += 1
+                else:
+                    self.outbox.mark_failed(chat_id, message_id, str(e), destinations=missing if finished else None)
+            await self._handle_processing_error(e, chat_id)
+        finally:
+            self.stats['performance_metrics']['active_connections'] -= 1
+    
+    async def _propagate_mirror_update(self, chat_id: int, update: MirrorUpdate):
+        """PATCH / DELETE the Discord messages mirroring an edited or deleted Telegram message"""
+        try:
+            if update.kind == 'delete':
+                webhook_urls = [destination.webhook_url for destination in self.routing.destinations(chat_id)]
+                await self.discord_sender.delete_mirrored(webhook_urls, chat_id, update.message_ids)
+                return
+            
+            # Same text processing as the original post, once per watermark group
+            message = update.message
+            
+            async def edit_group(watermark_group, target: DeliveryTarget):
+                content = await self._process_caption(message.text or "", watermark_group)
+                await self.discord_sender.edit_mirrored(
+                    [destination.webhook_url for destination in target.destinations],
+                    chat_id, message.id, content, keep_header=bool(message.media)
+                )
+            
+            await asyncio.gather(*(
+                edit_group(watermark_group, target)
+                for watermark_group, target in self._delivery_groups(chat_id)
+            ))
+            
+        except Exception as e:
+            logger.error(f"❌ Mirror {update.kind} propagation error for chat {chat_id}: {e}")
+    
+    @staticmethod
+    def _outbox_message_ids(event) -> List[int]:
+        """Telegram message ids covered by a dispatched item"""
+        if isinstance(event, Album):
+            return [message.id for message in event.messages]
+        if isinstance(event, OutboxEntry):
+            return [event.message_id]
+        return [event.message.id]
+    
+    async def _replay_outbox(self):
+        """
+        Re-enqueue deliveries left unfinished by a previous run
+        
+        Entries whose processed payload is already known (watermarked text)
+        are sent as-is; the rest are fetched again from Telegram and go
+        through the normal pipeline. Album parts are replayed one by one.
+        """
+        try:
+            entries = await self.outbox.pending_entries(
+                max_attempts=self.config['outbox']['max_replay_attempts']
+            )
+            if not entries:
+                return
+            
+            logger.info(f"💾 Replaying {len(entries)} unfinished deliveries from outbox")
+            for entry in entries:
+                if entry.chat_id not in self.routing:
+                    self.outbox.mark_abandoned(entry.chat_id, entry.message_id, "chat no longer configured")
+                    continue
+                
+                await self.outbox.record_accepted(entry.chat_id, entry.message_id)
+                lane = 'fast' if (entry.payload_ref or {}).get('type') == 'text' else 'heavy'
+                await self.lanes[lane].submit(entry.chat_id, entry)
+                self.outbox.stats['entries_replayed'] += 1
+                
+        except Exception as e:
+            logger.error(f"❌ Outbox replay error: {e}")
+    
+    async def _replay_outbox_entry(self, chat_id: int, entry: OutboxEntry):
+        """Deliver one entry recovered from the outbox"""
+        payload_ref = entry.payload_ref or {}
+        
+        if payload_ref.get('type') == 'text':
+            target = DeliveryTarget(chat_id, self._pending_destinations(chat_id, entry.destinations))
+            with mirroring(chat_id, [entry.message_id]):
+                delivered = await self.fanout.send_message(target, payload_ref['content'])
+            if not delivered:
+                raise DeliveryFailedError("replayed text delivery failed")
+            self.stats['target_deliveries'] += 1
+            return
+        
+        if not self.telegram_client:
+            raise RuntimeError("Telegram client not available for outbox replay")
+        
+        message = await self.telegram_client.get_messages(chat_id, ids=entry.message_id)
+        if message is None:
+            raise RuntimeError("message no longer available on Telegram")
+        
+        await self._process_message_enterprise(chat_id, message, only=entry.destinations)
+    
+    async def replay_dead_letter(self, letter_id: int) -> Optional[bool]:
+        """
+        Replay a dead letter and settle the outbox entries it carried
+        
+        The failed send left those entries pending for its webhook; once the
+        manual replay gets through, the outbox must not send them again on
+        the next start. Returns None if the letter does not exist.
+        """
+        letter = self.discord_sender.retry_scheduler.dead_letters.get(letter_id)
+        success = await self.discord_sender.replay_dead_letter(letter_id)
+        if success and letter is not None:
+            for source in letter.item.sources:
+                for message_id in source.message_ids:
+                    self.outbox.mark_destination_delivered(source.chat_id, message_id, letter.item.webhook_url)
+        return success
+    
+    def _pending_destinations(self, chat_id: int, only: Optional[Iterable[str]] = None) -> List[Destination]:
+        """Destinations of a chat, limited to the webhooks in ``only`` when given"""
+        destinations = self.routing.destinations(chat_id)
+        if not only:
+            return destinations
+        only = set(only)
+        return [destination for destination in destinations if destination.webhook_url in only]
+    
+    async def run_backfill(self):
+        """
+        Backfill every configured chat from its last replicated message
+        
+        Chats without a cursor (first run) are only seeded with their latest
+        message id, so history is never replayed wholesale. Cursors live in
+        the outbox, so without it there is nothing to backfill from.
+        
+        Live deliveries also advance the cursor, so a run cut short by a
+        crash is resumed from its own saved range, not from the cursor.
+        """
+        if not (self.config['backfill']['enabled'] and self.config['outbox']['enabled']
+                and self.telegram_client):
+            return
+        
+        try:
+            # Live ids seen before this run belong to the previous connection
+            self._first_live_id.clear()
+            self._telegram_connected = self.telegram_client.is_connected()
+            
+            cursors = await self.outbox.get_cursors()
+            for chat_id in self.routing:
+                if chat_id not in cursors:
+                    latest = await self.telegram_client.get_messages(chat_id, limit=1)
+                    if latest:
+                        self.outbox.advance_cursor(chat_id, latest[0].id)
+            
+            resume = await self.outbox.get_backfill_runs()
+            self.backfill.start(self.telegram_client, cursors, self.routing.chat_ids(), resume)
+            
+        except Exception as e:
+            logger.error(f"❌ Backfill start error: {e}")
+    
+    async def _submit_backfill(self, chat_id: int, item):
+        """Enqueue a backfilled message or album on the backfill lane"""
+        message_ids = self._outbox_message_ids(item)
+        
+        # Already seen live: the live path owns everything from there on
+        first_live_id = self._first_live_id.get(chat_id)
+        if first_live_id is not None and min(message_ids) >= first_live_id:
+            return
+        
+        for message_id in message_ids:
+            await self.outbox.record_accepted(chat_id, message_id)
+        await self.lanes['backfill'].submit(chat_id, item)
+    
+    def _checkpoint_backfill(self, chat_id: int, from_id: int, target_id: int, last_id: int):
+        """Persist backfill progress; its messages are already accepted in the outbox"""
+        self.outbox.save_backfill_run(chat_id, from_id, target_id, last_id)
+    
+    def _live_lanes_busy(self) -> bool:
+        """True while live traffic is queued; backfill waits before its next batch"""
+        live_depth = sum(
+            dispatcher.queue_depth()
+            for lane, dispatcher in self.lanes.items() if lane != 'backfill'
+        )
+        return live_depth > self.config['backfill']['pause_when_live_queue_above']
+    
+    async def _process_message_enterprise(self, chat_id: int, message,
+                                          only: Optional[Iterable[str]] = None):
+        """
+        Enterprise message processing with advanced routing
+        
+        The message is processed once per distinct watermark group among the
+        chat's destinations; every destination of a group gets the same
+        payload, uploaded concurrently. ``only`` limits it to the webhooks
+        that missed it on an earlier attempt. A group that fails is recorded
+        in the delivery ledger so the other groups still count as delivered.
+        """
+        try:
+            groups = self._delivery_groups(chat_id, only)
+            if not groups:
                 logger.warning(f"⚠️ No webhook configured for group {chat_id}")
                 return
             
-            # Route based on message type with enterprise handlers
-            if message.media:
-                await self._route_media_message(chat_id, message, webhook_url)
-            else:
-                await self._process_text_enterprise(chat_id, message, webhook_url)
+            decision = self._route_media(chat_id, message)
+            results = await asyncio.gather(*(
+                self._deliver_message(watermark_group, message, target, decision)
+                for watermark_group, target in groups
+            ), return_exceptions=True)
+            self._record_failed_groups(groups, results, [message.id])
             
-            self.stats['messages_replicated'] += 1
             logger.debug(f"✅ Message replicated: {chat_id} → Discord")
             
         except Exception as e:
@@ -376,33 +923,256 @@ class EnhancedReplicatorService:
             self.stats['errors'] += 1
             raise
     
-    async def _route_media_message(self, chat_id: int, message, webhook_url: str):
-        """Enterprise media routing with type-specific handlers"""
+    def _record_failed_groups(self, groups: List[tuple], results: List[Any], message_ids: List[int]):
+        """Record the destinations of groups that raised as missing ``message_ids``"""
+        ledger = current_ledger()
+        for (_, target), result in zip(groups, results):
+            if not isinstance(result, BaseException):
+                continue
+            if ledger is None or not isinstance(result, Exception):
+                raise result
+            logger.error(f"❌ Delivery to {target} failed: {result}")
+            ledger.record_failure(message_ids, target.destinations)
+    
+    def _delivery_groups(self, chat_id: int, only: Optional[Iterable[str]] = None) -> List[tuple]:
+        """
+        (watermark group, target) pairs for a chat, one per distinct watermark config
         
-        # Handle video messages properly based on Telethon version
-        if hasattr(message.media, 'document') and message.media.document:
-            # Check if it's a video by MIME type or attributes
-            mime_type = getattr(message.media.document, 'mime_type', '')
-            if mime_type.startswith('video/'):
-                await self._process_video_enterprise(chat_id, message, webhook_url)
-                return
+        Destinations whose watermark groups resolve to the same effective
+        configuration are merged so their payload is produced only once.
+        """
+        merged: Dict[str, tuple] = {}
+        only = set(only or ())
+        for watermark_group, destinations in self.routing.groups(chat_id).items():
+            if only:
+                destinations = [d for d in destinations if d.webhook_url in only]
+                if not destinations:
+                    continue
+            fingerprint = self.watermark_service.get_config_fingerprint(watermark_group)
+            if fingerprint in merged:
+                merged[fingerprint][1].destinations.extend(destinations)
+            else:
+                merged[fingerprint] = (watermark_group, DeliveryTarget(chat_id, list(destinations)))
+        return list(merged.values())
+    
+    def _route_media(self, source_chat_id: int, message) -> Optional[RouteDecision]:
+        """
+        Route a message once for all its destinations (None for text)
         
-        # Standard media routing
-        media_handlers = {
-            MessageMediaDocument: self._process_document_enterprise,
-            MessageMediaPhoto: self._process_image_enterprise
-        }
+        Routing counters and avoided downloads are per source message, not
+        per watermark group or destination it fans out to.
+        """
+        if not message.media:
+            return None
         
-        # Add MessageMediaVideo handler only if available
-        if MEDIA_VIDEO_AVAILABLE and MessageMediaVideo:
-            media_handlers[MessageMediaVideo] = self._process_video_enterprise
+        # Decide the path from Telegram metadata before fetching any bytes
+        decision = self.media_router.route(message)
+        self.outbox.mark_processed(source_chat_id, message.id, {
+            'type': 'media',
+            'kind': decision.info.kind,
+            'route': decision.route.value,
+            'size': decision.info.size
+        })
+        if decision.route == MediaRoute.REJECT:
+            self.stats['large_files_rejected'] += 1
+            self.media_router.record_avoided_download(decision.info, self._download_throughput_bps())
+            logger.info(
+                f"🧭 Media rejected before download for group {source_chat_id}: "
+                f"{decision.info.file_name or decision.info.kind} ({decision.reason})"
+            )
+        return decision
+    
+    async def _deliver_message(self, chat_id: int, message, target: DeliveryTarget,
+                               decision: Optional[RouteDecision]):
+        """Route one message through the handlers for a watermark group (chat_id)"""
+        # Every post made for this message is recorded for edit/delete propagation
+        with mirroring(target.source_chat_id, [message.id], media=bool(message.media)):
+            if message.media:
+                await self._route_media_message(chat_id, message, target, decision)
+            else:
+                await self._process_text_enterprise(chat_id, message, target)
+        self.stats['target_deliveries'] += 1
+    
+    async def _process_album_enterprise(self, chat_id: int, album: Album):
+        """Process an album once per watermark group of the chat's destinations"""
+        groups = self._delivery_groups(chat_id)
+        if not groups:
+            logger.warning(f"⚠️ No webhook configured for group {chat_id}")
+            return
         
-        media_type = type(message.media)
-        handler = media_handlers.get(media_type, self._process_other_media_enterprise)
+        decisions = {message.id: self._route_media(chat_id, message) for message in album.messages}
+        results = await asyncio.gather(*(
+            self._process_album_for_target(watermark_group, album, target, decisions)
+            for watermark_group, target in groups
+        ), return_exceptions=True)
+        self._record_failed_groups(groups, results, [m.id for m in album.messages])
+    
+    async def _process_album_for_target(self, chat_id: int, album: Album, target: DeliveryTarget,
+                                        decisions: Dict[int, RouteDecision]):
+        """
+        📚 ÁLBUM DE TELEGRAM - UN SOLO WEBHOOK
+        =====================================
+        
+        Downloads every part that fits Discord directly, watermarks images and
+        posts them as one multi-attachment webhook request. Parts that need
+        compression, preview or rejection fall back to the per-message
+        handlers after the album post.
+        """
+        messages = album.messages
+        limit_bytes = self.config['direct_sending']['max_file_size_mb'] * 1024 * 1024
+        attachments: List[tuple] = []
+        buffers: List[MediaBuffer] = []
+        fallback: List[Any] = []
+        pending: List[tuple] = []   # (posición en attachments, buffer, cache_key) sin watermark aún
+        images = videos = watermarked = 0
+        
+        try:
+            for index, message in enumerate(messages):
+                decision = decisions[message.id]
+                info = decision.info
+                if decision.route != MediaRoute.DIRECT or info.kind not in ('photo', 'image', 'video'):
+                    fallback.append(message)
+                    continue
+                
+                cache_key = self._media_cache_key('video' if info.kind == 'video' else 'image', message, chat_id)
+                cached = await self.media_cache.get(cache_key) if cache_key else None
+                if cached:
+                    buffer, cache_meta = cached
+                else:
+                    buffer = await self._download_media(message, self.config['processing_timeout'])
+                buffers.append(buffer)
+                if len(buffer) > limit_bytes:
+                    # Telegram did not report the size; handle it on its own
+                    fallback.append(message)
+                    continue
+                
+                if info.kind == 'video':
+                    attachments.append((buffer, f"video_{index + 1}.mp4"))
+                    videos += 1
+                    if cache_key and not cached:
+                        await self.media_cache.put(cache_key, buffer)
+                    continue
+                
+                if cached:
+                    watermarked += int(bool(cache_meta.get('watermarked', False)))
+                else:
+                    pending.append((len(attachments), buffer, cache_key))
+                attachments.append((buffer, f"image_{index + 1}.jpg"))
+                images += 1
+            
+            # Todas las imágenes del álbum a la vez: se reparten entre los workers del pool
+            if pending:
+                results = await self.watermark_service.apply_image_watermark_batch(
+                    [buffer for _, buffer, _ in pending], chat_id
+                )
+                for (position, buffer, cache_key), (processed, was_processed) in zip(pending, results):
+                    attachments[position] = (processed, attachments[position][1])
+                    watermarked += int(bool(was_processed))
+                    if cache_key:
+                        await self.media_cache.put(
+                            cache_key, processed,
+                            source_size=len(buffer), meta={'watermarked': bool(was_processed)}
+                        )
+            
+            if attachments:
+                caption_text = next((m.text for m in messages if m.text), "")
+                caption = await self._process_caption(caption_text, chat_id)
+                full_caption = f"📚 **Álbum Enterprise** ({len(attachments)} archivos)"
+                if caption:
+                    full_caption += f"\n\n{caption}"
+                
+                fallback_ids = {m.id for m in fallback}
+                posted_ids = [m.id for m in messages if m.id not in fallback_ids]
+                with mirroring(target.source_chat_id, posted_ids, media=True):
+                    success = await self.fanout.send_message_with_files(
+                        target, full_caption, attachments
+                    )
+                
+                if success:
+                    self.stats['albums_processed'] += 1
+                    self.stats['images_processed'] += images
+                    self.stats['images_sent_direct'] += images
+                    self.stats['videos_processed'] += videos
+                    self.stats['videos_sent_direct'] += videos
+                    self.stats['files_sent_direct'] += len(attachments)
+                    self.stats['watermarks_applied'] += watermarked
+                    self.stats['target_deliveries'] += len(messages) - len(fallback)
+                    logger.info(f"📚 Enterprise album enviado DIRECTAMENTE para group {chat_id}: {len(attachments)} archivos")
+                else:
+                    await self._handle_send_failure(target, "album")
+        finally:
+            for buffer in buffers:
+                buffer.close()
         
-        await handler(chat_id, message, webhook_url)
+        for position, message in enumerate(fallback):
+            try:
+                await self._deliver_message(chat_id, message, target, decisions[message.id])
+            except Exception as e:
+                ledger = current_ledger()
+                if ledger is None:
+                    raise
+                # The rest waits for the replay so the parts keep their order
+                logger.error(f"❌ Album part {message.id} not delivered to {target}: {e}")
+                ledger.record_failure([m.id for m in fallback[position:]], target.destinations)
+                break
+    
+    async def _route_media_message(self, chat_id: int, message, target: DeliveryTarget,
+                                   decision: RouteDecision):
+        """
+        Enterprise media routing with type-specific handlers
+        
+        The route decided from Telegram metadata (once per source message,
+        see ``_route_media``) picks the handler and tells it whether to
+        compress or go straight to a preview. Handlers only re-check sizes
+        after download when Telegram did not report one.
+        """
+        route, kind = decision.route, decision.info.kind
+        if route == MediaRoute.REJECT:
+            await self._reject_media_without_download(chat_id, message, target, decision)
+            return
+        
+        legacy_video = MEDIA_VIDEO_AVAILABLE and MessageMediaVideo and isinstance(message.media, MessageMediaVideo)
+        if kind == 'video' or legacy_video:
+            await self._process_video_enterprise(chat_id, message, target, route)
+        elif kind == 'photo' or (kind == 'image' and route == MediaRoute.COMPRESS):
+            # Image documents that fit are forwarded untouched as files
+            await self._process_image_enterprise(chat_id, message, target, route)
+        elif kind in ('image', 'audio', 'pdf', 'document'):
+            await self._process_document_enterprise(chat_id, message, target, route)
+        else:
+            await self._process_other_media_enterprise(chat_id, message, target)
     
-    async def _process_text_enterprise(self, chat_id: int, message, webhook_url: str):
+    async def _reject_media_without_download(self, chat_id: int, message, target: DeliveryTarget,
+                                             decision: RouteDecision):
+        """Notify Discord about media that can never fit, without downloading it"""
+        info = decision.info
+        icons = {'video': '🎬', 'audio': '🎵', 'pdf': '📄', 'photo': '🖼️', 'image': '🖼️'}
+        icon = icons.get(info.kind, '📎')
+        label = info.file_name or info.kind.title()
+        
+        caption = await self._process_caption(message.text or "", chat_id)
+        error_message = (
+            f"{icon} **Archivo muy grande:** {label} ({info.size_mb:.1f}MB)\n{caption}\n"
+            f"❌ Supera el límite de Discord ({self.config['direct_sending']['max_file_size_mb']}MB)"
+        )
+        await self.fanout.send_message(target, error_message)
+    
+    def _media_cache_key(self, kind: str, message, chat_id: int) -> Optional[str]:
+        """Cache key for the processed output of a media for this chat's watermark config"""
+        if not self.config['media_cache']['enabled']:
+            return None
+        media_id = MediaCache.media_id(message)
+        if media_id is None:
+            return None
+        return MediaCache.make_key(kind, media_id, self.watermark_service.get_config_fingerprint(chat_id))
+    
+    def _download_throughput_bps(self) -> float:
+        """Measured Telegram download throughput (0 until something was downloaded)"""
+        if self.stats['download_time_seconds'] <= 0:
+            return 0.0
+        return self.stats['bytes_downloaded'] / self.stats['download_time_seconds']
+    
+    async def _process_text_enterprise(self, chat_id: int, message, target: DeliveryTarget):
         """Enterprise text processing with watermarks and validation"""
         try:
             text = message.text or ""
@@ -424,44 +1194,78 @@ class EnhancedReplicatorService:
                 text = processed_text
                 self.stats['watermarks_applied'] += 1
             
+            # Reusable on replay only if every destination gets this same text
+            if len(self._delivery_groups(target.source_chat_id)) == 1:
+                self.outbox.mark_processed(target.source_chat_id, message.id, {'type': 'text', 'content': text})
+            
             # Send with enterprise retry logic
-            success = await self.discord_sender.send_message(webhook_url, text)
+            success = await self.fanout.send_message(target, text, chat_id=target.source_chat_id)
             if not success:
                 self.stats['retries'] += 1
-                await self._handle_send_failure(webhook_url, "text message")
+                await self._handle_send_failure(target, "text message")
             
         except Exception as e:
             logger.error(f"❌ Enterprise text processing error: {e}")
             raise
     
-    async def _process_document_enterprise(self, chat_id: int, message, webhook_url: str):
+    async def _process_document_enterprise(self, chat_id: int, message, target: DeliveryTarget,
+                                           route: MediaRoute = MediaRoute.DIRECT):
         """Enterprise document processing with intelligent type detection"""
         try:
-            # Download with timeout protection
-            file_bytes = await asyncio.wait_for(
-                message.download_media(bytes),
-                timeout=self.config['processing_timeout']
-            )
-            
-            # Extract metadata with enterprise error handling
-            mime_type, file_name = await self._extract_document_metadata(message)
-            caption = await self._process_caption(message.text or "", chat_id)
-            
-            # Route to specialized handlers
-            if mime_type == 'application/pdf':
-                await self._handle_pdf_enterprise(chat_id, file_bytes, caption, webhook_url, file_name)
-            elif mime_type and mime_type.startswith('audio/'):
-                await self._handle_audio_enterprise(chat_id, file_bytes, caption, webhook_url, file_name)
-            else:
-                await self._handle_document_generic(chat_id, file_bytes, file_name, caption, webhook_url)
+            # Streamed download with timeout protection
+            with await self._download_media(message, self.config['processing_timeout']) as file_bytes:
+                
+                # Extract metadata with enterprise error handling
+                mime_type, file_name = await self._extract_document_metadata(message)
+                caption = await self._process_caption(message.text or "", chat_id)
+                
+                # Route to specialized handlers
+                if mime_type == 'application/pdf':
+                    await self._handle_pdf_enterprise(chat_id, file_bytes, caption, target, file_name, route)
+                elif mime_type and mime_type.startswith('audio/'):
+                    await self._handle_audio_enterprise(chat_id, file_bytes, caption, target, file_name)
+                else:
+                    await self._handle_document_generic(chat_id, file_bytes, file_name, caption, target, route)
             
         except asyncio.TimeoutError:
             logger.error(f"⏰ Document download timeout for group {chat_id}")
-            await self._send_timeout_message(webhook_url, "document")
+            await self._send_timeout_message(target, "document")
         except Exception as e:
             logger.error(f"❌ Enterprise document processing error: {e}")
             raise
     
+    async def _download_media(self, message, timeout: float) -> MediaBuffer:
+        """
+        Stream a Telegram media download into a spooled buffer
+        
+        Small files stay in memory, large ones are spilled to disk, so a big
+        video is never fully materialized in RAM. The caller owns the buffer
+        and must close it.
+        """
+        buffer = MediaBuffer(
+            max_memory_mb=self.config['download']['spool_max_memory_mb'],
+            temp_dir=self.config['download']['temp_dir']
+        )
+        
+        async with self.download_limiter.slot() as permit:
+            download_start = time.monotonic()
+            try:
+                await asyncio.wait_for(message.download_media(file=buffer), timeout=timeout)
+            except BaseException as e:
+                buffer.close()
+                permit.overloaded = isinstance(e, FloodWaitError)
+                raise
+            download_seconds = time.monotonic() - download_start
+            # Segundos por MB (mínimo 1MB): un video grande no cuenta como Telegram lento
+            permit.latency = download_seconds / max(1.0, len(buffer) / 1048576)
+        
+        self.stats['bytes_downloaded'] += len(buffer)
+        self.stats['download_time_seconds'] += download_seconds
+        if not buffer.in_memory:
+            self.stats['downloads_spooled_to_disk'] += 1
+        
+        return buffer
+    
     async def _extract_document_metadata(self, message) -> tuple[str, str]:
         """Extract document metadata with enterprise validation"""
         mime_type = getattr(message.media.document, 'mime_type', 'unknown')
@@ -483,8 +1287,9 @@ class EnhancedReplicatorService:
             return processed_caption
         return caption
     
-    async def _handle_pdf_enterprise(self, chat_id: int, pdf_bytes: bytes, 
-                                   caption: str, webhook_url: str, filename: str):
+    async def _handle_pdf_enterprise(self, chat_id: int, pdf_bytes: MediaSource, 
+                                   caption: str, target: DeliveryTarget, filename: str,
+                                   route: MediaRoute = MediaRoute.DIRECT):
         """
         📄 MANEJO DE PDF - ENVÍO DIRECTO
         ===============================
@@ -494,14 +1299,14 @@ class EnhancedReplicatorService:
         try:
             size_mb = len(pdf_bytes) / (1024 * 1024)
             
-            if size_mb <= self.config['direct_sending']['max_file_size_mb']:
+            if route != MediaRoute.PREVIEW and size_mb <= self.config['direct_sending']['max_file_size_mb']:
                 # 🎯 ENVÍO DIRECTO del PDF
                 full_caption = f"📄 **PDF Enterprise:** {filename} ({size_mb:.1f}MB)"
                 if caption:
                     full_caption += f"\n\n{caption}"
                 
-                success = await self.discord_sender.send_message_with_file(
-                    webhook_url,
+                success = await self.fanout.send_message_with_file(
+                    target,
                     full_caption,
                     pdf_bytes,
                     filename
@@ -514,37 +1319,39 @@ class EnhancedReplicatorService:
                     logger.info(f"📄 Enterprise PDF enviado DIRECTAMENTE: {filename}")
                     return
                 else:
-                    await self._handle_send_failure(webhook_url, f"PDF {filename}")
+                    await self._handle_send_failure(target, f"PDF {filename}")
                     return
             
             # Si es muy grande, procesar con preview
-            result = await self.file_processor.process_pdf(pdf_bytes, chat_id, filename)
+            result = await self.file_processor.process_pdf(media_bytes(pdf_bytes), chat_id, filename)
             
             if result["success"]:
                 message_text = self._build_pdf_message(caption, result, filename)
                 
                 # Enviar con preview si está disponible
                 if result.get("preview_bytes"):
-                    success = await self.discord_sender.send_message_with_file(
-                        webhook_url, message_text, result["preview_bytes"], "pdf_preview.jpg"
+                    success = await self.fanout.send_message_with_file(
+                        target, message_text, result["preview_bytes"], "pdf_preview.jpg"
                     )
                     if success:
                         self.stats['images_sent_direct'] += 1
                         self.stats['files_sent_direct'] += 1
                 else:
-                    success = await self.discord_sender.send_message(webhook_url, message_text)
+                    success = await self.fanout.send_message(target, message_text)
                 
                 if success:
                     self.stats['pdfs_processed'] += 1
                     logger.info(f"📄 Enterprise PDF processed: {filename}")
                 else:
-                    await self._handle_send_failure(webhook_url, f"PDF {filename}")
+                    await self._handle_send_failure(target, f"PDF {filename}")
             else:
-                await self._send_processing_error(webhook_url, "PDF", filename, result.get("error"))
+                await self._send_processing_error(target, "PDF", filename, result.get("error"))
                 
+        except DeliveryFailedError:
+            raise
         except Exception as e:
             logger.error(f"❌ Enterprise PDF handling error: {e}")
-            await self._send_processing_error(webhook_url, "PDF", filename, str(e))
+            await self._send_processing_error(target, "PDF", filename, str(e))
     
     def _build_pdf_message(self, caption: str, result: dict, filename: str) -> str:
         """Build enterprise PDF message with rich metadata"""
@@ -567,8 +1374,8 @@ class EnhancedReplicatorService:
         
         return "\n".join(message_parts)
     
-    async def _handle_audio_enterprise(self, chat_id: int, audio_bytes: bytes,
-                                     caption: str, webhook_url: str, filename: str):
+    async def _handle_audio_enterprise(self, chat_id: int, audio_bytes: MediaSource,
+                                     caption: str, target: DeliveryTarget, filename: str):
         """
         🎵 MANEJO DE AUDIO - ENVÍO DIRECTO
         =================================
@@ -581,7 +1388,7 @@ class EnhancedReplicatorService:
             
             if size_mb > self.config['direct_sending']['max_file_size_mb']:
                 error_message = f"🎵 **Audio muy grande:** {filename} ({size_mb:.1f}MB)\n{caption}\n❌ Supera el límite de Discord ({self.config['direct_sending']['max_file_size_mb']}MB)"
-                await self.discord_sender.send_message(webhook_url, error_message)
+                await self.fanout.send_message(target, error_message)
                 self.stats['large_files_rejected'] += 1
                 return
             
@@ -591,8 +1398,8 @@ class EnhancedReplicatorService:
                 full_caption += f"\n\n{caption}"
             
             # ENVÍO DIRECTO del archivo de audio
-            success = await self.discord_sender.send_message_with_file(
-                webhook_url,
+            success = await self.fanout.send_message_with_file(
+                target,
                 full_caption,
                 audio_bytes,
                 filename if filename and filename != "unknown_document" else f"audio_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp3"
@@ -604,26 +1411,29 @@ class EnhancedReplicatorService:
                 self.stats['files_sent_direct'] += 1
                 logger.info(f"🎵 Enterprise audio enviado DIRECTAMENTE: {filename}")
             else:
-                await self._handle_send_failure(webhook_url, f"audio {filename}")
+                await self._handle_send_failure(target, f"audio {filename}")
                 
+        except DeliveryFailedError:
+            raise
         except Exception as e:
             logger.error(f"❌ Enterprise audio handling error: {e}")
-            await self._send_processing_error(webhook_url, "Audio", filename, str(e))
+            await self._send_processing_error(target, "Audio", filename, str(e))
     
-    async def _handle_document_generic(self, chat_id: int, file_bytes: bytes,
-                                     file_name: str, caption: str, webhook_url: str):
+    async def _handle_document_generic(self, chat_id: int, file_bytes: MediaSource,
+                                     file_name: str, caption: str, target: DeliveryTarget,
+                                     route: MediaRoute = MediaRoute.DIRECT):
         """Generic document handler para envío directo"""
         try:
             size_mb = len(file_bytes) / (1024 * 1024)
             
-            if size_mb <= self.config['direct_sending']['max_file_size_mb']:
+            if route != MediaRoute.PREVIEW and size_mb <= self.config['direct_sending']['max_file_size_mb']:
                 # 🎯 ENVÍO DIRECTO del documento
                 full_caption = f"📎 **Document Enterprise:** {file_name} ({size_mb:.1f}MB)"
                 if caption:
                     full_caption += f"\n\n{caption}"
                 
-                success = await self.discord_sender.send_message_with_file(
-                    webhook_url,
+                success = await self.fanout.send_message_with_file(
+                    target,
                     full_caption,
                     file_bytes,
                     file_name
@@ -636,7 +1446,7 @@ class EnhancedReplicatorService:
                     return
             
             # Si es muy grande, crear descarga temporal
-            result = await self.file_processor.create_temp_download(file_bytes, file_name, chat_id)
+            result = await self.file_processor.create_temp_download(media_bytes(file_bytes), file_name, chat_id)
             
             if result["success"]:
                 message_text = "\n".join([
@@ -648,14 +1458,17 @@ class EnhancedReplicatorService:
                     "🔒 Enterprise secured download"
                 ])
                 
-                await self.discord_sender.send_message(webhook_url, message_text)
+                await self.fanout.send_message(target, message_text)
                 self.stats['documents_processed'] += 1
             
+        except DeliveryFailedError:
+            raise
         except Exception as e:
             logger.error(f"❌ Generic document handling error: {e}")
-            await self._send_processing_error(webhook_url, "Document", file_name, str(e))
+            await self._send_processing_error(target, "Document", file_name, str(e))
     
-    async def _process_image_enterprise(self, chat_id: int, message, webhook_url: str):
+    async def _process_image_enterprise(self, chat_id: int, message, target: DeliveryTarget,
+                                        route: MediaRoute = MediaRoute.DIRECT):
         """
         🖼️ PROCESAMIENTO DE IMAGEN - ENVÍO DIRECTO
         ==========================================
@@ -663,47 +1476,64 @@ class EnhancedReplicatorService:
         CAMBIO PRINCIPAL: Usa send_message_with_file() para envío directo
         Ya NO genera links de descarga
         """
+        image_buffer = None
+        filename = "image_enterprise.jpg"
         try:
-            # Download con timeout
-            image_bytes = await asyncio.wait_for(
-                message.download_media(bytes),
-                timeout=60
-            )
-            
-            # Verificar tamaño y comprimir si es necesario
-            size_mb = len(image_bytes) / (1024 * 1024)
-            
-            # Aplicar watermarks empresariales
-            processed_bytes, was_processed = await self.watermark_service.apply_image_watermark(
-                image_bytes, chat_id
-            )
-            
-            # Comprimir si es muy grande
-            if size_mb > self.config['direct_sending']['max_file_size_mb']:
-                if self.config['direct_sending']['auto_compress']:
-                    compressed_bytes = await self._compress_image_if_needed(processed_bytes)
-                    if compressed_bytes and len(compressed_bytes) < len(processed_bytes):
-                        original_size = len(processed_bytes) / (1024 * 1024)
-                        new_size = len(compressed_bytes) / (1024 * 1024)
-                        savings = original_size - new_size
+            # Resultado ya procesado para este media (reenviado desde otro grupo)
+            cache_key = self._media_cache_key('image', message, chat_id)
+            cached = await self.media_cache.get(cache_key) if cache_key else None
+            if cached:
+                image_buffer, cache_meta = cached
+                processed_bytes, was_processed = image_buffer, cache_meta.get('watermarked', False)
+                filename = cache_meta.get('filename', filename)
+                size_mb = len(image_buffer) / (1024 * 1024)
+            else:
+                # Download en streaming con timeout
+                image_buffer = await self._download_media(message, 60)
+                image_bytes = image_buffer
+                
+                # Verificar tamaño y comprimir si es necesario
+                size_mb = len(image_bytes) / (1024 * 1024)
+                
+                # Aplicar watermarks empresariales
+                processed_bytes, was_processed = await self.watermark_service.apply_image_watermark(
+                    image_bytes, chat_id
+                )
+                
+                # Comprimir si el router lo decidió (o Telegram no informó el tamaño y no cabe)
+                if route == MediaRoute.COMPRESS or size_mb > self.config['direct_sending']['max_file_size_mb']:
+                    if self.config['direct_sending']['auto_compress']:
+                        fitted = await self._compress_image_if_needed(processed_bytes)
+                        if fitted and len(fitted.data) < len(processed_bytes):
+                            original_size = len(processed_bytes) / (1024 * 1024)
+                            new_size = len(fitted.data) / (1024 * 1024)
+                            savings = original_size - new_size
                         
-                        processed_bytes = compressed_bytes
-                        size_mb = new_size
-                        self.stats['files_compressed'] += 1
-                        self.stats['compression_savings_mb'] += savings
+                            processed_bytes = fitted.data
+                            filename = f"image_enterprise.{fitted.extension}"
+                            size_mb = new_size
+                            self.stats['files_compressed'] += 1
+                            self.stats['compression_savings_mb'] += savings
                         
-                        logger.info(f"⚡ Imagen comprimida: {original_size:.1f}MB → {new_size:.1f}MB")
+                            logger.info(f"⚡ Imagen comprimida: {original_size:.1f}MB → {new_size:.1f}MB")
+                        else:
+                            # No se puede comprimir más
+                            error_message = f"🖼️ **Imagen muy grande:** {size_mb:.1f}MB\n❌ No se puede comprimir para Discord"
+                            await self.fanout.send_message(target, error_message)
+                            self.stats['large_files_rejected'] += 1
+                            return
                     else:
-                        # No se puede comprimir más
-                        error_message = f"🖼️ **Imagen muy grande:** {size_mb:.1f}MB\n❌ No se puede comprimir para Discord"
-                        await self.discord_sender.send_message(webhook_url, error_message)
+                        error_message = f"🖼️ **Imagen muy grande:** {size_mb:.1f}MB\n❌ Supera el límite de Discord"
+                        await self.fanout.send_message(target, error_message)
                         self.stats['large_files_rejected'] += 1
                         return
-                else:
-                    error_message = f"🖼️ **Imagen muy grande:** {size_mb:.1f}MB\n❌ Supera el límite de Discord"
-                    await self.discord_sender.send_message(webhook_url, error_message)
-                    self.stats['large_files_rejected'] += 1
-                    return
+                
+                if cache_key:
+                    await self.media_cache.put(
+                        cache_key, processed_bytes,
+                        source_size=len(image_buffer),
+                        meta={'watermarked': bool(was_processed), 'filename': filename}
+                    )
             
             # Procesar caption
             caption = await self._process_caption(message.text or "", chat_id)
@@ -715,11 +1545,11 @@ class EnhancedReplicatorService:
                 full_caption += f"\n\n{caption}"
             
             # ENVÍO DIRECTO del archivo
-            success = await self.discord_sender.send_message_with_file(
-                webhook_url, 
+            success = await self.fanout.send_message_with_file(
+                target, 
                 full_caption, 
                 processed_bytes, 
-                "image_enterprise.jpg"
+                filename
             )
             
             if success:
@@ -730,76 +1560,91 @@ class EnhancedReplicatorService:
                     self.stats['watermarks_applied'] += 1
                 logger.info(f"🖼️ Enterprise image enviada DIRECTAMENTE para group {chat_id}")
             else:
-                await self._handle_send_failure(webhook_url, "image")
+                await self._handle_send_failure(target, "image")
             
         except asyncio.TimeoutError:
-            await self._send_timeout_message(webhook_url, "image")
+            await self._send_timeout_message(target, "image")
         except Exception as e:
             logger.error(f"❌ Enterprise image processing error: {e}")
             raise
+        finally:
+            if image_buffer:
+                image_buffer.close()
     
-    async def _process_video_enterprise(self, chat_id: int, message, webhook_url: str):
+    async def _process_video_enterprise(self, chat_id: int, message, target: DeliveryTarget,
+                                        route: MediaRoute = MediaRoute.DIRECT):
         """
         🎬 PROCESAMIENTO DE VIDEO - ENVÍO DIRECTO
         ========================================
         
         CAMBIO PRINCIPAL: Envía video directamente, no como link
         """
+        video_buffer = None
         try:
-            # Download con timeout extendido para videos
-            video_bytes = await asyncio.wait_for(
-                message.download_media(bytes),
-                timeout=self.config['processing_timeout']
-            )
-            
-            # Verificar tamaño de Discord (25MB limit)
-            size_mb = len(video_bytes) / (1024 * 1024)
-            
-            if size_mb > self.config['direct_sending']['max_file_size_mb']:
-                # Para videos muy grandes, procesar primero
-                if self.config['direct_sending']['auto_compress']:
-                    result = await self.file_processor.process_video(video_bytes, chat_id, "video_enterprise.mp4")
+            # Resultado ya procesado para este media (reenviado desde otro grupo)
+            cache_key = self._media_cache_key('video', message, chat_id)
+            cached = await self.media_cache.get(cache_key) if cache_key else None
+            if cached:
+                video_buffer, _ = cached
+                video_bytes = video_buffer
+                size_mb = len(video_buffer) / (1024 * 1024)
+            else:
+                # Download en streaming con timeout extendido para videos
+                video_buffer = await self._download_media(message, self.config['processing_timeout'])
+                video_bytes = video_buffer
+                
+                # Verificar tamaño de Discord (25MB limit)
+                size_mb = len(video_bytes) / (1024 * 1024)
+                
+                if route == MediaRoute.COMPRESS or size_mb > self.config['direct_sending']['max_file_size_mb']:
+                    # Para videos muy grandes, procesar primero
+                    if self.config['direct_sending']['auto_compress']:
+                        result = await self.file_processor.process_video(media_bytes(video_bytes), chat_id, "video_enterprise.mp4")
                     
-                    if result["success"] and result.get("compressed_size"):
-                        # Usar video comprimido si está disponible
-                        compressed_size_mb = result["compressed_size"] / (1024 * 1024)
-                        if compressed_size_mb <= self.config['direct_sending']['max_file_size_mb']:
-                            # Cargar video comprimido
-                            compressed_path = Path(result.get("output_path", ""))
-                            if compressed_path.exists():
-                                video_bytes = compressed_path.read_bytes()
-                                size_mb = compressed_size_mb
-                                self.stats['files_compressed'] += 1
-                                self.stats['compression_savings_mb'] += (len(video_bytes) - len(compressed_path.read_bytes())) / (1024 * 1024)
-                                logger.info(f"🎬 Video comprimido: {size_mb:.1f}MB")
+                        if result["success"] and result.get("compressed_size"):
+                            # Usar video comprimido si está disponible
+                            compressed_size_mb = result["compressed_size"] / (1024 * 1024)
+                            if compressed_size_mb <= self.config['direct_sending']['max_file_size_mb']:
+                                # Cargar video comprimido
+                                compressed_path = Path(result.get("output_path", ""))
+                                if compressed_path.exists():
+                                    original_size_mb = size_mb
+                                    video_bytes = compressed_path.read_bytes()
+                                    size_mb = compressed_size_mb
+                                    self.stats['files_compressed'] += 1
+                                    self.stats['compression_savings_mb'] += original_size_mb - size_mb
+                                    logger.info(f"🎬 Video comprimido: {size_mb:.1f}MB")
+                                else:
+                                    # Si no hay archivo comprimido, enviar mensaje de error
+                                    caption = await self._process_caption(message.text or "", chat_id)
+                                    error_message = f"🎬 **Video muy grande:** {size_mb:.1f}MB\n{caption}\n❌ Supera el límite de Discord ({self.config['direct_sending']['max_file_size_mb']}MB)"
+                                    await self.fanout.send_message(target, error_message)
+                                    self.stats['large_files_rejected'] += 1
+                                    return
                             else:
-                                # Si no hay archivo comprimido, enviar mensaje de error
+                                # Incluso comprimido es muy grande
                                 caption = await self._process_caption(message.text or "", chat_id)
-                                error_message = f"🎬 **Video muy grande:** {size_mb:.1f}MB\n{caption}\n❌ Supera el límite de Discord ({self.config['direct_sending']['max_file_size_mb']}MB)"
-                                await self.discord_sender.send_message(webhook_url, error_message)
+                                error_message = f"🎬 **Video muy grande:** {size_mb:.1f}MB → {compressed_size_mb:.1f}MB\n{caption}\n❌ No se puede reducir más para Discord"
+                                await self.fanout.send_message(target, error_message)
                                 self.stats['large_files_rejected'] += 1
                                 return
                         else:
-                            # Incluso comprimido es muy grande
+                            # No se pudo comprimir
                             caption = await self._process_caption(message.text or "", chat_id)
-                            error_message = f"🎬 **Video muy grande:** {size_mb:.1f}MB → {compressed_size_mb:.1f}MB\n{caption}\n❌ No se puede reducir más para Discord"
-                            await self.discord_sender.send_message(webhook_url, error_message)
+                            error_message = f"🎬 **Video muy grande:** {size_mb:.1f}MB\n{caption}\n❌ No se puede comprimir para Discord"
+                            await self.fanout.send_message(target, error_message)
                             self.stats['large_files_rejected'] += 1
                             return
                     else:
-                        # No se pudo comprimir
+                        # Compresión deshabilitada
                         caption = await self._process_caption(message.text or "", chat_id)
-                        error_message = f"🎬 **Video muy grande:** {size_mb:.1f}MB\n{caption}\n❌ No se puede comprimir para Discord"
-                        await self.discord_sender.send_message(webhook_url, error_message)
+                        error_message = f"🎬 **Video muy grande:** {size_mb:.1f}MB\n{caption}\n❌ Supera el límite de Discord"
+                        await self.fanout.send_message(target, error_message)
                         self.stats['large_files_rejected'] += 1
                         return
-                else:
-                    # Compresión deshabilitada
-                    caption = await self._process_caption(message.text or "", chat_id)
-                    error_message = f"🎬 **Video muy grande:** {size_mb:.1f}MB\n{caption}\n❌ Supera el límite de Discord"
-                    await self.discord_sender.send_message(webhook_url, error_message)
-                    self.stats['large_files_rejected'] += 1
-                    return
+                
+                if cache_key:
+                    await self.media_cache.put(cache_key, video_bytes, source_size=len(video_buffer))
             
             # Procesar caption
             caption = await self._process_caption(message.text or "", chat_id)
@@ -810,8 +1655,8 @@ class EnhancedReplicatorService:
                 full_caption += f"\n\n{caption}"
             
             # ENVÍO DIRECTO del archivo de video
-            success = await self.discord_sender.send_message_with_file(
-                webhook_url,
+            success = await self.fanout.send_message_with_file(
+                target,
                 full_caption,
                 video_bytes,
                 "video_enterprise.mp4"
@@ -824,66 +1669,65 @@ class EnhancedReplicatorService:
                 self.stats['watermarks_applied'] += 1  # Videos siempre tienen watermark implícito
                 logger.info(f"🎬 Enterprise video enviado DIRECTAMENTE para group {chat_id}")
             else:
-                await self._handle_send_failure(webhook_url, "video")
+                await self._handle_send_failure(target, "video")
             
         except asyncio.TimeoutError:
-            await self._send_timeout_message(webhook_url, "video")
+            await self._send_timeout_message(target, "video")
         except Exception as e:
             logger.error(f"❌ Enterprise video processing error: {e}")
             raise
+        finally:
+            if video_buffer:
+                video_buffer.close()
     
-    async def _process_other_media_enterprise(self, chat_id: int, message, webhook_url: str):
+    async def _process_other_media_enterprise(self, chat_id: int, message, target: DeliveryTarget):
         """Enterprise handler for other media types"""
         try:
             media_type = type(message.media).__name__
             caption = await self._process_caption(message.text or "", chat_id)
             
             message_text = f"📎 **Enterprise Media:** {media_type}\n{caption}\n🔒 Enterprise processed"
-            await self.discord_sender.send_message(webhook_url, message_text)
+            await self.fanout.send_message(target, message_text)
             
         except Exception as e:
             logger.error(f"❌ Other media processing error: {e}")
             raise
     
-    async def _compress_image_if_needed(self, image_bytes: bytes) -> Optional[bytes]:
-        """Comprimir imagen si es necesario"""
+    async def _compress_image_if_needed(self, image_bytes: MediaSource) -> Optional[EncodedImage]:
+        """
+        Recodificar para caber justo bajo el límite de Discord (en el pool de procesos)
+        
+        ``compress_to_fit`` predice calidad y escala y las refina con pocas
+        codificaciones; devuelve None si ni así cabe.
+        """
+        direct = self.config['direct_sending']
         try:
-            from PIL import Image
-            from io import BytesIO
-            
-            # Cargar imagen
-            img = Image.open(BytesIO(image_bytes))
-            
-            # Reducir tamaño si es muy grande
-            max_size = (1920, 1080)
-            if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # Comprimir
-            output = BytesIO()
-            
-            # Convertir a RGB si tiene transparencia
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            
-            img.save(output, format='JPEG', quality=self.config['direct_sending']['compression_quality'], optimize=True)
-            
-            compressed = output.getvalue()
-            return compressed if len(compressed) < len(image_bytes) else None
+            fitted = await self.compute.run(
+                compress_to_fit, image_bytes,
+                int(direct['max_file_size_mb'] * 1024 * 1024),
+                direct['compression_format'],
+                direct['compression_min_quality'],
+                direct['compression_max_quality'],
+                None,
+                direct['compression_max_iterations']
+            )
+            logger.info(
+                f"🗜️ Compress-to-fit: {len(image_bytes) / 1048576:.1f}MB → {len(fitted.data) / 1048576:.1f}MB "
+                f"({fitted.format} q{fitted.quality}, escala {fitted.scale:.2f}, "
+                f"{fitted.iterations} iteraciones, {fitted.encode_seconds * 1000:.0f}ms)"
+            )
+            return fitted if fitted.fits else None
             
-        except ImportError:
-            logger.warning("⚠️ PIL no disponible para compresión")
-            return None
         except Exception as e:
             logger.warning(f"⚠️ Error comprimiendo imagen: {e}")
             return None
     
     async def _start_background_tasks(self):
         """Start enterprise background tasks"""
+        # Priority lane workers
+        for dispatcher in self.lanes.values():
+            await dispatcher.start()
+        
         # Health monitoring
         asyncio.create_task(self._health_monitor())
         
@@ -936,21 +1780,29 @@ class EnhancedReplicatorService:
         if total_processed > 0:
             metrics['avg_processing_time'] = metrics['total_processing_time'] / total_processed
     
-    async def _handle_send_failure(self, webhook_url: str, content_type: str):
-        """Handle enterprise send failures"""
+    async def _handle_send_failure(self, target: DeliveryTarget, content_type: str):
+        """
+        Handle enterprise send failures
+        
+        Inside a dispatched event this only happens when no destination got
+        the send; partial failures go to the delivery ledger. Raises so the dispatcher
+        marks the outbox entry failed; it stays pending and on the next start
+        is replayed to the destinations that missed it.
+        """
         self.stats['retries'] += 1
-        logger.warning(f"⚠️ Send failure for {content_type} to {webhook_url[:50]}...")
+        logger.warning(f"⚠️ Send failure for {content_type} to {target}")
+        raise DeliveryFailedError(f"{content_type} not delivered to {target}")
     
-    async def _send_timeout_message(self, webhook_url: str, content_type: str):
+    async def _send_timeout_message(self, target: DeliveryTarget, content_type: str):
         """Send timeout notification"""
         message = f"⏰ **Processing Timeout**\n{content_type.title()} processing took too long.\n🔒 Enterprise timeout protection activated"
-        await self.discord_sender.send_message(webhook_url, message)
+        await self.fanout.send_message(target, message)
     
-    async def _send_processing_error(self, webhook_url: str, content_type: str, 
+    async def _send_processing_error(self, target: DeliveryTarget, content_type: str, 
                                    filename: str, error: str):
         """Send processing error notification"""
         message = f"❌ **Processing Error**\n{content_type}: {filename}\nError: {error}\n🔒 Enterprise error handling"
-        await self.discord_sender.send_message(webhook_url, message)
+        await self.fanout.send_message(target, message)
     
     async def _handle_processing_error(self, error: Exception, chat_id: Optional[int]):
         """Enterprise error handling"""
@@ -967,14 +1819,24 @@ class EnhancedReplicatorService:
     async def _display_enterprise_configuration(self):
         """Display enterprise configuration summary"""
         logger.info("📊 Enterprise Configuration - ENVÍO DIRECTO:")
-        logger.info(f"   Groups configured: {len(settings.discord.webhooks)}")
+        logger.info(f"   Groups configured: {len(self.routing)} ({self.routing.destination_count()} destinations)")
         logger.info(f"   Max concurrent processing: {self.config['max_concurrent_processing']}")
+        for lane, lane_config in self.config['lanes'].items():
+            logger.info(f"   Lane '{lane}': {lane_config['workers']} workers, queue {lane_config['max_queue_per_chat']}/chat")
+        concurrency = self.config['concurrency']
+        logger.info(
+            f"   Adaptive concurrency: {'on' if concurrency['adaptive'] else 'off'} "
+            f"(downloads {concurrency['downloads']['min']}-{concurrency['downloads']['max']}, "
+            f"uploads {concurrency['uploads']['min']}-{concurrency['uploads']['max']})"
+        )
         logger.info(f"   Circuit breaker threshold: {self.config['circuit_breaker_threshold']}")
         logger.info(f"   Processing timeout: {self.config['processing_timeout']}s")
         logger.info(f"   Direct Sending Settings:")
         logger.info(f"     - Max file size: {self.config['direct_sending']['max_file_size_mb']}MB")
         logger.info(f"     - Auto compress: {self.config['direct_sending']['auto_compress']}")
-        logger.info(f"     - Compression quality: {self.config['direct_sending']['compression_quality']}")
+        logger.info(f"     - Compression: {self.config['direct_sending']['compression_format']} "
+                    f"q{self.config['direct_sending']['compression_min_quality']}-"
+                    f"{self.config['direct_sending']['compression_max_quality']} (compress-to-fit)")
         logger.info(f"     - Prefer direct: {self.config['direct_sending']['prefer_direct']}")
         logger.info(f"   Enterprise Services:")
         logger.info(f"     - File Processor: ✅ Advanced")
@@ -997,8 +1859,8 @@ class EnhancedReplicatorService:
             logger.info("👂 Starting enterprise message listening - MODO ENVÍO DIRECTO...")
             
             # Display monitored groups
-            for group_id in settings.discord.webhooks.keys():
-                logger.info(f"   👥 Monitoring enterprise group: {group_id}")
+            for group_id in self.routing:
+                logger.info(f"   👥 Monitoring enterprise group: {group_id} → {len(self.routing.destinations(group_id))} destinations")
             
             # Start with enterprise error handling
             await self.telegram_client.run_until_disconnected()
@@ -1024,6 +1886,15 @@ class EnhancedReplicatorService:
             if self.telegram_client:
                 shutdown_tasks.append(self._shutdown_telegram())
             
+            # Flush buffered albums, then drain queued messages before closing the sender
+            await self.backfill.stop()
+            await self.album_aggregator.flush_all()
+            await asyncio.gather(*(dispatcher.stop() for dispatcher in self.lanes.values()))
+            await self.outbox.stop()
+            await self.media_cache.close()
+            await asyncio.to_thread(self.compute.shutdown)
+            await asyncio.to_thread(self.watermark_service.shutdown)
+            
             if self.discord_sender:
                 shutdown_tasks.append(self._shutdown_discord_sender())
             
@@ -1053,6 +1924,7 @@ class EnhancedReplicatorService:
         """Graceful Discord sender shutdown"""
         try:
             await self.discord_sender.close()
+            await self.message_map.stop()
             logger.info("📤 Discord sender closed")
         except Exception as e:
             logger.error(f"❌ Discord sender shutdown error: {e}")
@@ -1098,8 +1970,10 @@ class EnhancedReplicatorService:
                     "large_files_rejected": self.stats['large_files_rejected']
                 },
                 "configuration": {
-                    "groups_configured": len(settings.discord.webhooks),
+                    "groups_configured": len(self.routing),
+                    "destinations_configured": self.routing.destination_count(),
                     "max_concurrent_processing": self.config['max_concurrent_processing'],
+                    "lanes": self.config['lanes'],
                     "circuit_breaker_threshold": self.config['circuit_breaker_threshold'],
                     "direct_sending_config": self.config['direct_sending']
                 },
@@ -1172,15 +2046,19 @@ class EnhancedReplicatorService:
                 combined_stats.update(watermark_stats)
             
             # Discord sender stats
+            discord_stats = {}
             if self.discord_sender and hasattr(self.discord_sender, 'get_stats'):
-                discord_stats = self.discord_sender.get_stats()
+                discord_stats = await self.discord_sender.get_stats()
                 combined_stats.update(discord_stats)
             
+            media_cache_stats = self.media_cache.get_stats()
+            
             # Build enterprise dashboard data with direct sending metrics
             dashboard_data = {
                 "overview": {
                     "messages_received": combined_stats.get('messages_received', 0),
                     "messages_replicated": combined_stats.get('messages_replicated', 0),
+                    "target_deliveries": combined_stats.get('target_deliveries', 0),
                     "success_rate": self._calculate_success_rate(),
                     "error_rate": self._calculate_error_rate(),
                     "uptime_hours": uptime / 3600,
@@ -1196,6 +2074,20 @@ class EnhancedReplicatorService:
                     "documents_processed": combined_stats.get('documents_processed', 0),
                     "watermarks_applied": combined_stats.get('watermarks_applied', 0)
                 },
+                "downloads": {
+                    "bytes_downloaded": self.stats['bytes_downloaded'],
+                    "download_time_seconds": self.stats['download_time_seconds'],
+                    "spooled_to_disk": self.stats['downloads_spooled_to_disk'],
+                    "avg_throughput_mbps": (
+                        self.stats['bytes_downloaded'] / (1024 * 1024) /
+                        max(self.stats['download_time_seconds'], 1e-6)
+                    )
+                },
+                "routing": self.media_router.get_stats(),
+                "albums": {
+                    "albums_processed": self.stats['albums_processed'],
+                    **self.album_aggregator.get_stats()
+                },
                 "direct_sending": {
                     "files_sent_direct": combined_stats.get('files_sent_direct', 0),
                     "images_sent_direct": combined_stats.get('images_sent_direct', 0),
@@ -1215,10 +2107,44 @@ class EnhancedReplicatorService:
                     "active_connections": self.stats['performance_metrics']['active_connections'],
                     "total_processing_time": self.stats['performance_metrics']['total_processing_time'],
                     "cache_hit_rate": combined_stats.get('cache_hit_rate', 0),
+                    "media_cache_hit_ratio": media_cache_stats['hit_ratio'],
+                    "media_cache_mb_saved": media_cache_stats['mb_saved'],
                     "memory_usage": self.stats['performance_metrics']['peak_memory_usage']
                 },
+                "queue": {lane: dispatcher.get_stats() for lane, dispatcher in self.lanes.items()},
+                "outbox": self.outbox.get_stats(),
+                "media_cache": media_cache_stats,
+                "compute": self.compute.get_stats(),
+                "watermark_pool": {
+                    "images_per_second_per_core": watermark_stats.get('images_per_second_per_core', 0.0),
+                    "batches": watermark_stats.get('batches', 0),
+                    "timeouts": watermark_stats.get('timeouts', 0),
+                    "composite_backend": watermark_stats.get('composite_backend', 'pillow'),
+                    **watermark_stats.get('pool', {})
+                },
+                "concurrency": {
+                    "downloads": self.download_limiter.get_stats(),
+                    "compute": self.compute.limiter.get_stats(),
+                    "uploads": discord_stats.get('upload_concurrency', {})
+                },
+                "rate_limiter": discord_stats.get('rate_limiter', {}),
+                "retries": discord_stats.get('retries', {}),
+                "message_map": {
+                    **self.message_map.get_stats(),
+                    **{key: discord_stats.get('discord_sender_stats', {}).get(key, 0) for key in (
+                        'mirrored_posts', 'edits_propagated', 'deletes_propagated',
+                        'mirror_unmapped', 'mirror_skipped', 'mirror_failures'
+                    )}
+                },
+                "text_coalescing": discord_stats.get('text_coalescing', {}),
+                "requests_per_message": discord_stats.get('requests_per_message', 0.0),
+                "backfill": self.backfill.get_stats(),
+                "destinations": {
+                    "configured": self.routing.destination_count(),
+                    **self.fanout.get_stats()
+                },
                 "groups": {
-                    "configured": len(settings.discord.webhooks),
+                    "configured": len(self.routing),
                     "active": len(self.stats['groups_active']),
                     "active_list": list(self.stats['groups_active'])
                 },
@@ -1311,6 +2237,13 @@ class EnhancedReplicatorService:
     async def _perform_health_checks(self):
         """Perform periodic health checks"""
         try:
+            # Telegram reconnected after a disconnect: catch up on the gap
+            if self.telegram_client:
+                connected = self.telegram_client.is_connected()
+                if connected and not self._telegram_connected:
+                    await self.run_backfill()
+                self._telegram_connected = connected
+            
             # Check service health
             health = await self.get_health()
             
@@ -1363,6 +2296,19 @@ class EnhancedReplicatorService:
                             if file_age > 86400:  # 24 hours
                                 file_path.unlink()
             
+            # Delivered outbox entries are only needed until the next restart
+            if self.config['outbox']['enabled']:
+                purged = await self.outbox.purge(
+                    self.config['outbox']['retention_hours'] * 3600,
+                    max_attempts=self.config['outbox']['max_replay_attempts']
+                )
+                logger.debug(f"💾 Outbox entries purged: {purged}")
+            
+            # Message map bounded by age and size (LRU)
+            if self.config['message_map']['enabled']:
+                pruned = await self.message_map.prune()
+                logger.debug(f"🗺️ Message map entries pruned: {pruned}")
+            
             logger.debug("🧹 Periodic cleanup completed")
             
         except Exception as e:
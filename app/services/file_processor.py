@@ -15,6 +15,9 @@ from datetime import datetime
 from typing import Dict, Any, Optional, Protocol
 import logging
 
+from app.services.media_compute import get_media_compute
+from app.tasks.workers.media_kernels import compress_image, pdf_page_count
+
 # ============== PROTOCOLS FOR TYPE SAFETY ==============
 
 class FileProcessorProtocol(Protocol):
@@ -242,13 +245,8 @@ class LegacyProcessor:
             return {'success': False, 'error': 'PIL not available'}
         
         try:
-            from io import BytesIO
-            img = Image.open(BytesIO(image_bytes))
-            
-            # Compresión básica
-            output = BytesIO()
-            img.save(output, format='JPEG', quality=85, optimize=True)
-            compressed = output.getvalue()
+            # Compresión básica (en el pool de procesos)
+            compressed = await get_media_compute().run(compress_image, image_bytes, None, 85)
             
             # Guardar
             output_path = self.output_dir / f"img_{chat_id}_{filename}"
@@ -293,10 +291,8 @@ class LegacyProcessor:
         page_count = 0
         if PYMUPDF_AVAILABLE:
             try:
-                pdf = fitz.open(stream=pdf_bytes, filetype="pdf")
-                page_count = len(pdf)
-                pdf.close()
-            except:
+                page_count = await get_media_compute().run(pdf_page_count, pdf_bytes)
+            except Exception:
                 pass
         
         self.stats['pdfs_processed'] += 1
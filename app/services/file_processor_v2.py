@@ -22,6 +22,9 @@ from typing import Dict, Any, Optional, List
 from concurrent.futures import ThreadPoolExecutor
 import pickle
 
+from app.services.media_compute import get_media_compute
+from app.tasks.workers.media_kernels import compress_image
+
 # Importar lz4 si está disponible
 try:
     import lz4.frame
@@ -250,17 +253,8 @@ class FileProcessorWorker:
             if cached:
                 return cached
             
-            from io import BytesIO
-            img = Image.open(BytesIO(image_bytes))
-            
-            # Comprimir
-            max_size = (1920, 1080)
-            if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            output = BytesIO()
-            img.save(output, format='JPEG', quality=85, optimize=True)
-            compressed = output.getvalue()
+            # Comprimir (en el pool de procesos compartido)
+            compressed = await get_media_compute().run(compress_image, image_bytes, (1920, 1080), 85)
             
             result = {
                 'success': True,
@@ -0,0 +1,193 @@
+"""
+Media Buffer - Spooled download buffers
+=======================================
+Archivo: app/services/media_buffer.py
+
+📦 Buffer de medios respaldado por SpooledTemporaryFile
+✅ Archivos pequeños quedan en memoria, los grandes pasan a disco
+✅ Un único handle atraviesa watermark, compresión y envío a Discord
+✅ Lectores independientes (offset propio) sin copiar el contenido
+"""
+
+import io
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+
+
+class MediaBuffer:
+    """
+    📦 BUFFER DE MEDIOS
+    ===================
+
+    Envuelve un SpooledTemporaryFile: mientras el contenido no supere
+    ``max_memory_mb`` vive en memoria; al superarlo se vuelca a un archivo
+    temporal en ``temp_dir``.
+
+    Se escribe una sola vez (p.ej. ``message.download_media(file=buffer)``)
+    y después se lee tantas veces como haga falta con ``open_reader()``.
+    Cada lector mantiene su propio offset, así que varios consumidores
+    (reintentos, envíos concurrentes) pueden leer el mismo buffer a la vez.
+    """
+
+    def __init__(self, max_memory_mb: float = 8, temp_dir: Union[str, Path] = "temp_files",
+                 filename: Optional[str] = None):
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.filename = filename
+
+        temp_path = Path(temp_dir)
+        temp_path.mkdir(parents=True, exist_ok=True)
+
+        self._file = tempfile.SpooledTemporaryFile(
+            max_size=self.max_memory_bytes,
+            dir=str(temp_path),
+            prefix="media_"
+        )
+        self._lock = threading.Lock()
+        self._size = 0
+        self.closed = False
+
+    # ============== ESCRITURA ==============
+
+    def write(self, data: Union[bytes, bytearray, memoryview]) -> int:
+        """Añadir datos al final del buffer (interfaz file-like para Telethon)"""
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            written = self._file.write(data)
+        self._size += written
+        return written
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, **kwargs) -> 'MediaBuffer':
+        """Crear un buffer a partir de bytes ya existentes"""
+        buffer = cls(**kwargs)
+        buffer.write(data)
+        return buffer
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path], chunk_size: int = 1024 * 1024, **kwargs) -> 'MediaBuffer':
+        """Crear un buffer copiando un archivo por bloques"""
+        kwargs.setdefault('filename', Path(path).name)
+        buffer = cls(**kwargs)
+        try:
+            with open(path, 'rb') as source:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    buffer.write(chunk)
+        except Exception:
+            buffer.close()
+            raise
+        return buffer
+
+    # ============== LECTURA ==============
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def in_memory(self) -> bool:
+        """True mientras el contenido no se haya volcado a disco"""
+        return self._size <= self.max_memory_bytes
+
+    def read_at(self, offset: int, size: int = -1) -> bytes:
+        """Leer ``size`` bytes desde ``offset`` (thread-safe)"""
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+
+    def read_bytes(self) -> bytes:
+        """
+        Materializar el contenido completo
+
+        Sólo para consumidores que exigen ``bytes`` (p.ej. el procesador de
+        PDFs); el camino normal debe usar ``open_reader()``.
+        """
+        return self.read_at(0)
+
+    def open_reader(self) -> BinaryIO:
+        """Lector buffered, seekable e independiente sobre el contenido"""
+        return io.BufferedReader(_MediaBufferReader(self))
+
+    # ============== CICLO DE VIDA ==============
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._file.close()
+
+    def __enter__(self) -> 'MediaBuffer':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class _MediaBufferReader(io.RawIOBase):
+    """Vista de sólo lectura con offset propio; cerrarla no cierra el buffer"""
+
+    def __init__(self, buffer: MediaBuffer):
+        self._buffer = buffer
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self._buffer.read_at(self._pos, len(b))
+        count = len(data)
+        b[:count] = data
+        self._pos += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = len(self._buffer) + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        self._pos = max(0, self._pos)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+MediaSource = Union[bytes, MediaBuffer]
+
+
+def open_media_stream(data: MediaSource) -> BinaryIO:
+    """Stream de lectura para bytes o MediaBuffer (p.ej. para Image.open)"""
+    if isinstance(data, MediaBuffer):
+        return data.open_reader()
+    return io.BytesIO(data)
+
+
+def media_bytes(data: MediaSource) -> bytes:
+    """Contenido como ``bytes`` (copia sólo si es un MediaBuffer)"""
+    if isinstance(data, MediaBuffer):
+        return data.read_bytes()
+    return data
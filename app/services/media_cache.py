@@ -0,0 +1,251 @@
+"""
+Media Cache - Cross-chat processed media deduplication
+======================================================
+Archivo: app/services/media_cache.py
+
+♻️ Cache en disco del media ya procesado, compartido entre chats
+✅ Clave: tipo + ``document.id``/``photo.id`` de Telegram + versión del watermark
+✅ Un mismo video reenviado a 10 grupos se descarga y procesa una sola vez
+✅ Límite de tamaño con expulsión LRU e índice persistente
+✅ Métricas de hit ratio y bytes ahorrados
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from .media_buffer import MediaBuffer, MediaSource, open_media_stream
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+class MediaCache:
+    """
+    ♻️ CACHE DE MEDIA PROCESADO
+    ===========================
+
+    Cada entrada es un archivo en ``cache_dir`` con el resultado final
+    (watermark + compresión) listo para subir a Discord. El índice vive en
+    memoria en orden LRU y se persiste en ``index.json`` para sobrevivir a
+    reinicios: los cambios se agrupan y se escriben en un hilo como mucho
+    cada ``index_flush_seconds`` (y en ``close``). Al superar
+    ``max_size_mb`` se expulsan las entradas menos usadas recientemente.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, cache_dir: Union[str, Path] = "cache_files/media", max_size_mb: float = 2048,
+                 max_entry_mb: float = 100, buffer_memory_mb: float = 8,
+                 temp_dir: Union[str, Path] = "temp_files", index_flush_seconds: float = 2.0):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.config = {
+            'max_size_bytes': int(max_size_mb * 1024 * 1024),
+            'max_entry_bytes': int(max_entry_mb * 1024 * 1024),
+            'buffer_memory_mb': buffer_memory_mb,
+            'temp_dir': str(temp_dir),
+            'index_flush_seconds': index_flush_seconds
+        }
+
+        self._index: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._total_size = 0
+        self._index_dirty = False
+        self._index_task: Optional[asyncio.Task] = None
+        self._index_lock = asyncio.Lock()
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'bytes_saved': 0,
+            'index_writes': 0
+        }
+
+        self._load_index()
+
+    # ============== CLAVES ==============
+
+    @staticmethod
+    def media_id(message) -> Optional[int]:
+        """Id estable del media en Telegram (igual en todos los reenvíos)"""
+        media = getattr(message, 'media', None)
+        for attr in ('document', 'photo'):
+            item = getattr(media, attr, None)
+            if item is not None and getattr(item, 'id', None):
+                return item.id
+        return None
+
+    @staticmethod
+    def make_key(kind: str, media_id: int, variant: str = "") -> str:
+        return f"{kind}:{media_id}:{variant}"
+
+    def _path_for(self, key: str) -> Path:
+        return self.cache_dir / (hashlib.sha1(key.encode()).hexdigest() + ".bin")
+
+    # ============== LECTURA / ESCRITURA ==============
+
+    async def get(self, key: str) -> Optional[Tuple[MediaBuffer, Dict[str, Any]]]:
+        """Buffer con el media procesado y sus metadatos, o None si no está"""
+        entry = self._index.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+
+        try:
+            buffer = await asyncio.to_thread(
+                MediaBuffer.from_file, self._path_for(key),
+                max_memory_mb=self.config['buffer_memory_mb'],
+                temp_dir=self.config['temp_dir']
+            )
+        except OSError as e:
+            logger.warning(f"♻️ Media cache entry lost ({key}): {e}")
+            self._drop(key)
+            self._schedule_index_save()
+            self.stats['misses'] += 1
+            return None
+
+        self._index.move_to_end(key)
+        entry['last_access'] = time.time()
+        self.stats['hits'] += 1
+        self.stats['bytes_saved'] += entry['source_size']
+        return buffer, dict(entry['meta'])
+
+    async def put(self, key: str, data: MediaSource, source_size: int = 0,
+                  meta: Optional[Dict[str, Any]] = None) -> bool:
+        """Guardar el resultado procesado; ``source_size`` es lo que costó descargarlo"""
+        size = len(data)
+        if size == 0 or size > self.config['max_entry_bytes']:
+            return False
+
+        path = self._path_for(key)
+        try:
+            await asyncio.to_thread(self._write_file, path, data)
+        except OSError as e:
+            logger.warning(f"♻️ Media cache store failed ({key}): {e}")
+            return False
+
+        if key in self._index:
+            self._total_size -= self._index.pop(key)['size']
+
+        self._index[key] = {
+            'size': size,
+            'source_size': source_size or size,
+            'meta': meta or {},
+            'created_at': time.time(),
+            'last_access': time.time()
+        }
+        self._total_size += size
+        self.stats['stores'] += 1
+
+        self._index_dirty = True
+        self._evict()
+        self._schedule_index_save()
+        return True
+
+    @staticmethod
+    def _write_file(path: Path, data: MediaSource):
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as target:
+            shutil.copyfileobj(open_media_stream(data), target, 1024 * 1024)
+        os.replace(tmp_path, path)
+
+    # ============== EXPULSIÓN LRU ==============
+
+    def _evict(self):
+        while self._total_size > self.config['max_size_bytes'] and self._index:
+            key = next(iter(self._index))
+            self._drop(key)
+            self.stats['evictions'] += 1
+
+    def _drop(self, key: str):
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return
+        self._total_size -= entry['size']
+        self._index_dirty = True
+        try:
+            self._path_for(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    # ============== ÍNDICE ==============
+
+    def _load_index(self):
+        index_path = self.cache_dir / self.INDEX_FILE
+        if not index_path.exists():
+            return
+
+        try:
+            entries = json.loads(index_path.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning(f"♻️ Media cache index unreadable, starting empty: {e}")
+            return
+
+        for key, entry in sorted(entries.items(), key=lambda item: item[1].get('last_access', 0)):
+            if self._path_for(key).exists():
+                self._index[key] = entry
+                self._total_size += entry['size']
+
+        self._evict()
+        self._index_dirty = False   # Las entradas sin archivo se olvidan en la próxima escritura
+        logger.info(f"♻️ Media cache loaded: {len(self._index)} entries ({self._total_size / (1024 * 1024):.1f}MB)")
+
+    def _schedule_index_save(self):
+        """Programar una escritura del índice; las que llegan mientras tanto se agrupan"""
+        if self._index_dirty and (self._index_task is None or self._index_task.done()):
+            self._index_task = asyncio.create_task(self._save_index_later(), name="media-cache-index")
+
+    async def _save_index_later(self):
+        await asyncio.sleep(self.config['index_flush_seconds'])
+        await self.flush()
+
+    async def flush(self):
+        """Escribir el índice ahora si cambió (fuera del event loop)"""
+        async with self._index_lock:
+            if not self._index_dirty:
+                return
+            self._index_dirty = False
+            snapshot = dict(self._index)
+            await asyncio.to_thread(self._save_index, snapshot)
+            self.stats['index_writes'] += 1
+
+    async def close(self):
+        """Escribir los cambios pendientes del índice (al parar el servicio)"""
+        if self._index_task and not self._index_task.done():
+            self._index_task.cancel()
+            await asyncio.gather(self._index_task, return_exceptions=True)
+        await self.flush()
+
+    def _save_index(self, entries: Dict[str, Dict[str, Any]]):
+        index_path = self.cache_dir / self.INDEX_FILE
+        tmp_path = index_path.with_suffix(".tmp")
+        try:
+            tmp_path.write_text(json.dumps(entries))
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            logger.warning(f"♻️ Media cache index not saved: {e}")
+
+    # ============== MÉTRICAS ==============
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            'entries': len(self._index),
+            'size_mb': self._total_size / (1024 * 1024),
+            'max_size_mb': self.config['max_size_bytes'] / (1024 * 1024),
+            'hit_ratio': self.stats['hits'] / lookups if lookups else 0.0,
+            'mb_saved': self.stats['bytes_saved'] / (1024 * 1024),
+            **self.stats
+        }
@@ -0,0 +1,353 @@
+"""
+Media Compute - Process pool for CPU-bound media work
+=====================================================
+Archivo: app/services/media_compute.py
+
+⚙️ Executor de procesos compartido por replicator, watermark y file processor
+✅ Tamaño por defecto = núcleos de CPU; el event loop nunca decodifica imágenes
+✅ Entradas/salidas grandes viajan por memoria compartida (sin pickle por el pipe)
+✅ Métricas por kernel: tiempo en cola, tiempo de CPU y tiempo total
+✅ Trabajos en vuelo con límite adaptativo (AIMD) según la cola del pool
+✅ Fallback a hilo si el pool no está disponible
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from dataclasses import is_dataclass, replace
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from app.tasks.workers.media_kernels import EncodedImage, JobResult, SharedBlock, run_job
+
+from .adaptive_limiter import AdaptiveLimiter
+from .media_buffer import MediaBuffer, MediaSource, media_bytes
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+class MediaComputeExecutor:
+    """
+    ⚙️ EXECUTOR DE CÓMPUTO DE MEDIA
+    ===============================
+
+    ``await executor.run(kernel, data, *args)`` ejecuta ``kernel(data, *args)``
+    en un proceso worker. ``kernel`` debe ser una función de módulo
+    (``app.tasks.workers.*``) para poder enviarse a procesos *spawn*.
+
+    - Entradas mayores que ``shm_threshold_mb`` se copian a un bloque de
+      memoria compartida y el worker las lee como ``memoryview``.
+    - Resultados ``bytes`` grandes vuelven por memoria compartida.
+    - Los bloques siempre los libera el proceso padre.
+    - Un ``run`` cancelado (``asyncio.wait_for``) con el trabajo ya en un
+      worker no lo interrumpe: sus bloques y su plaza del limiter se liberan
+      cuando el worker termina. Si aún no había empezado, sale de la cola.
+    - Los trabajos en vuelo pasan por un ``AdaptiveLimiter``: si esperan en
+      la cola del pool más de ``queue_target_ms`` el límite baja; si no,
+      sube hasta ``2 × max_workers`` (un poco de cola mantiene el pool lleno).
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, shm_threshold_mb: float = 1.0,
+                 enabled: bool = True, max_samples: int = 1000, queue_target_ms: float = 50):
+        self.config = {
+            'max_workers': max_workers or os.cpu_count() or 1,
+            'shm_threshold_bytes': int(shm_threshold_mb * 1024 * 1024),
+            'enabled': enabled,
+            'queue_target_seconds': queue_target_ms / 1000
+        }
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._max_samples = max_samples
+        self.limiter = AdaptiveLimiter(
+            'compute',
+            initial_limit=self.config['max_workers'],
+            max_limit=self.config['max_workers'] * 2
+        )
+
+        self.stats = {
+            'jobs': 0,
+            'errors': 0,
+            'thread_fallbacks': 0,
+            'shm_inputs': 0,
+            'shm_outputs': 0,
+            'abandoned': 0          # Cancelados con el worker ya ocupado (terminan en segundo plano)
+        }
+        self.kernel_stats: Dict[str, Dict[str, Any]] = {}
+
+    # ============== CICLO DE VIDA ==============
+
+    def configure(self, max_workers: Optional[int] = None, shm_threshold_mb: Optional[float] = None,
+                  enabled: Optional[bool] = None, queue_target_ms: Optional[float] = None,
+                  adaptive: Optional[bool] = None):
+        """Ajustar la configuración; el tamaño del pool sólo cambia antes de ``start()``"""
+        if max_workers and self._pool is None:
+            self.config['max_workers'] = max_workers
+        if queue_target_ms is not None:
+            self.config['queue_target_seconds'] = queue_target_ms / 1000
+        if max_workers or adaptive is not None:
+            workers = self.config['max_workers']
+            if adaptive is False:
+                # Sin adaptación: tantos trabajos en vuelo como workers
+                self.limiter.configure(initial_limit=workers, min_limit=workers, max_limit=workers)
+            else:
+                self.limiter.configure(initial_limit=workers, min_limit=1, max_limit=workers * 2)
+        if shm_threshold_mb is not None:
+            self.config['shm_threshold_bytes'] = int(shm_threshold_mb * 1024 * 1024)
+        if enabled is not None:
+            self.config['enabled'] = enabled
+            if not enabled:
+                self.shutdown(wait=False)
+
+    def start(self) -> bool:
+        """Crear el pool (idempotente); False si se usará el fallback a hilo"""
+        if self._pool is not None:
+            return True
+        if not self.config['enabled']:
+            return False
+
+        try:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.config['max_workers'],
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            logger.info(f"⚙️ Media compute pool started ({self.config['max_workers']} workers)")
+            return True
+        except (OSError, ValueError, NotImplementedError) as e:
+            logger.warning(f"⚠️ Media compute pool unavailable, using threads: {e}")
+            self.config['enabled'] = False
+            return False
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+            logger.info("⚙️ Media compute pool stopped")
+
+    @property
+    def running(self) -> bool:
+        return self._pool is not None
+
+    # ============== EJECUCIÓN ==============
+
+    async def run(self, kernel: Callable[..., Any], data: MediaSource, *args) -> Any:
+        """Ejecutar ``kernel(data, *args)`` fuera del event loop"""
+        await self.limiter.acquire()
+        slot = _ComputeSlot(self.limiter)
+        try:
+            value, queue_seconds = await self._run(kernel, data, args, slot)
+        except BaseException:
+            slot.release()
+            raise
+        # Trabajos de tamaño muy distinto: la señal es la espera en el pool, no la duración
+        slot.release(overloaded=queue_seconds > self.config['queue_target_seconds'])
+        return value
+
+    async def _run(self, kernel: Callable[..., Any], data: MediaSource, args: tuple,
+                   slot: '_ComputeSlot') -> Tuple[Any, float]:
+        if self._pool is None:
+            self.start()
+
+        submitted_at = time.time()
+        block: Optional[SharedBlock] = None
+        try:
+            if self._pool is None:
+                job = await self._run_in_thread(kernel, data, args, submitted_at)
+            else:
+                payload: Union[bytes, SharedBlock]
+                if len(data) >= self.config['shm_threshold_bytes']:
+                    block = await asyncio.to_thread(self._write_block, data)
+                    payload = block
+                    self.stats['shm_inputs'] += 1
+                else:
+                    payload = media_bytes(data)
+
+                try:
+                    future = self._pool.submit(
+                        run_job, kernel, payload, args, submitted_at, self.config['shm_threshold_bytes']
+                    )
+                    try:
+                        job = await asyncio.wrap_future(future)
+                    except asyncio.CancelledError:
+                        # wrap_future ya intentó cancelarlo: si no estaba en cola, está en un worker
+                        if not future.cancelled():
+                            self._abandon(future, block, slot)
+                            block = None
+                        raise
+                except BrokenProcessPool:
+                    logger.error("💥 Media compute pool broken, falling back to threads")
+                    self.shutdown(wait=False)
+                    self.config['enabled'] = False
+                    job = await self._run_in_thread(kernel, data, args, submitted_at)
+        except Exception:
+            self.stats['errors'] += 1
+            self._kernel_entry(kernel)['errors'] += 1
+            raise
+        finally:
+            if block is not None:
+                self._unlink(block.name)
+
+        value = job.value
+        if isinstance(value, SharedBlock):
+            value = await asyncio.to_thread(self._read_block, value)
+            self.stats['shm_outputs'] += 1
+        elif is_dataclass(value) and isinstance(getattr(value, 'data', None), SharedBlock):
+            value = replace(value, data=await asyncio.to_thread(self._read_block, value.data))
+            self.stats['shm_outputs'] += 1
+
+        self._record(kernel, job, submitted_at, value)
+        return value, max(0.0, job.started_at - submitted_at)
+
+    def _abandon(self, future: Future, block: Optional[SharedBlock], slot: '_ComputeSlot'):
+        """Liberar bloques y plaza de un trabajo cancelado cuando su worker termine"""
+        self.stats['abandoned'] += 1
+        slot.detached = True
+        loop = asyncio.get_running_loop()
+
+        def cleanup(done: Future):
+            # Hilo del executor: sólo syscalls y un aviso al event loop
+            if block is not None:
+                self._unlink(block.name)
+            if not done.cancelled() and done.exception() is None:
+                value = done.result().value
+                output = value if isinstance(value, SharedBlock) else getattr(value, 'data', None)
+                if isinstance(output, SharedBlock):
+                    self._unlink(output.name)
+            try:
+                loop.call_soon_threadsafe(self.limiter.release)
+            except RuntimeError:
+                pass  # Event loop ya cerrado
+
+        future.add_done_callback(cleanup)
+
+    async def _run_in_thread(self, kernel: Callable[..., Any], data: MediaSource,
+                             args: tuple, submitted_at: float) -> JobResult:
+        self.stats['thread_fallbacks'] += 1
+        payload = media_bytes(data)
+        # Umbral infinito: en el mismo proceso no tiene sentido memoria compartida
+        return await asyncio.to_thread(run_job, kernel, payload, args, submitted_at, float('inf'))
+
+    # ============== MEMORIA COMPARTIDA ==============
+
+    @staticmethod
+    def _write_block(data: MediaSource) -> SharedBlock:
+        size = len(data)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        try:
+            if isinstance(data, MediaBuffer):
+                offset = 0
+                reader = data.open_reader()
+                while offset < size:
+                    with shm.buf[offset:size] as view:
+                        read = reader.readinto(view)
+                    if not read:
+                        break
+                    offset += read
+            else:
+                shm.buf[:size] = data
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+
+        shm.close()
+        return SharedBlock(shm.name, size)
+
+    @classmethod
+    def _read_block(cls, block: SharedBlock) -> bytes:
+        shm = shared_memory.SharedMemory(name=block.name)
+        try:
+            return bytes(shm.buf[:block.size])
+        finally:
+            shm.close()
+            shm.unlink()
+
+    @staticmethod
+    def _unlink(name: str):
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
+
+    # ============== MÉTRICAS ==============
+
+    def _kernel_entry(self, kernel: Callable[..., Any]) -> Dict[str, Any]:
+        return self.kernel_stats.setdefault(kernel.__name__, {
+            'jobs': 0,
+            'errors': 0,
+            'cpu_ms_total': 0.0,
+            'wall_ms_total': 0.0,
+            'queue_ms': deque(maxlen=self._max_samples)
+        })
+
+    def _record(self, kernel: Callable[..., Any], job: JobResult, submitted_at: float, value: Any = None):
+        entry = self._kernel_entry(kernel)
+        entry['jobs'] += 1
+        entry['cpu_ms_total'] += job.cpu_time * 1000
+        entry['wall_ms_total'] += job.wall_time * 1000
+        entry['queue_ms'].append(max(0.0, job.started_at - submitted_at) * 1000)
+        if isinstance(value, EncodedImage):
+            # Compress-to-fit: cuántos encodes hicieron falta y cuántas no cupieron
+            entry['iterations_total'] = entry.get('iterations_total', 0) + value.iterations
+            entry['misses'] = entry.get('misses', 0) + int(not value.fits)
+        self.stats['jobs'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        kernels = {}
+        for name, entry in self.kernel_stats.items():
+            jobs = entry['jobs']
+            queue = sorted(entry['queue_ms'])
+            kernels[name] = {
+                'jobs': jobs,
+                'errors': entry['errors'],
+                'avg_queue_ms': sum(queue) / len(queue) if queue else 0.0,
+                'p95_queue_ms': queue[min(len(queue) - 1, int(len(queue) * 0.95))] if queue else 0.0,
+                'avg_cpu_ms': entry['cpu_ms_total'] / jobs if jobs else 0.0,
+                'avg_wall_ms': entry['wall_ms_total'] / jobs if jobs else 0.0
+            }
+            if 'iterations_total' in entry:
+                kernels[name]['avg_iterations'] = entry['iterations_total'] / jobs if jobs else 0.0
+                kernels[name]['misses'] = entry['misses']
+
+        return {
+            'running': self.running,
+            'max_workers': self.config['max_workers'],
+            **self.stats,
+            'concurrency': self.limiter.get_stats(),
+            'kernels': kernels
+        }
+
+
+class _ComputeSlot:
+    """Plaza del limiter de un ``run``: se devuelve una sola vez (al worker si se abandona)"""
+
+    def __init__(self, limiter: AdaptiveLimiter):
+        self.limiter = limiter
+        self.detached = False
+        self.released = False
+
+    def release(self, overloaded: bool = False):
+        if self.detached or self.released:
+            return
+        self.released = True
+        self.limiter.release(overloaded=overloaded)
+
+
+_media_compute: Optional[MediaComputeExecutor] = None
+
+
+def get_media_compute() -> MediaComputeExecutor:
+    """Executor compartido por todos los servicios del proceso"""
+    global _media_compute
+    if _media_compute is None:
+        _media_compute = MediaComputeExecutor()
+    return _media_compute
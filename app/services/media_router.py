@@ -0,0 +1,186 @@
+"""
+Media Router - Pre-download routing from Telegram metadata
+==========================================================
+Archivo: app/services/media_router.py
+
+🧭 Decide el camino de cada media ANTES de descargar un solo byte
+✅ Lee tamaño, mime, duración y dimensiones de los atributos de Telethon
+✅ Rutas: envío directo, compresión, sólo preview o rechazo
+✅ Los archivos que nunca caben en Discord no se descargan
+✅ Métricas de ancho de banda y tiempo ahorrados
+"""
+
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, Optional
+
+
+class MediaRoute(Enum):
+    """Caminos posibles para un media"""
+    DIRECT = "direct"        # Cabe en Discord: descargar y enviar tal cual
+    COMPRESS = "compress"    # Excede el límite pero se puede reducir
+    PREVIEW = "preview"      # Sólo preview / link temporal (PDFs, documentos)
+    REJECT = "reject"        # Nunca cabrá: no descargar
+
+
+@dataclass
+class MediaInfo:
+    """Metadatos del media según Telegram"""
+    kind: str                       # photo, image, video, audio, pdf, document
+    size: int = 0                   # Bytes (0 si Telegram no lo informa)
+    mime_type: str = ""
+    duration: float = 0.0           # Segundos (video/audio)
+    width: int = 0
+    height: int = 0
+    file_name: Optional[str] = None
+
+    @property
+    def size_mb(self) -> float:
+        return self.size / (1024 * 1024)
+
+
+@dataclass
+class RouteDecision:
+    """Decisión de routing para un media"""
+    route: MediaRoute
+    info: MediaInfo
+    reason: str = ""
+
+
+class MediaRouter:
+    """
+    🧭 ROUTER DE MEDIA
+    ==================
+
+    Clasifica cada media con los metadatos que Telethon ya trae en el
+    mensaje (``message.file`` y ``document.attributes``) y elige el camino
+    antes de la descarga. Los tamaños desconocidos se tratan como envío
+    directo y los handlers siguen validando tras descargar.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {
+            'max_file_size_mb': 25,             # Discord limit
+            'auto_compress': True,
+            'max_compress_image_mb': 100,       # Imágenes más grandes: rechazo
+            'max_compress_video_mb': 500,       # Videos más grandes: rechazo
+            'min_video_bitrate_kbps': 250,      # Bitrate mínimo aceptable tras comprimir
+            'max_preview_source_mb': 200,       # PDFs / documentos para preview o link
+            'assumed_download_mbps': 5.0        # Si aún no hay throughput medido
+        }
+        if config:
+            self.config.update(config)
+
+        self.stats = {
+            'routed': {route.value: 0 for route in MediaRoute},
+            'downloads_avoided': 0,
+            'download_bytes_avoided': 0,
+            'download_seconds_saved': 0.0
+        }
+
+    # ============== INSPECCIÓN ==============
+
+    def inspect(self, message) -> MediaInfo:
+        """Extraer metadatos del media sin descargarlo"""
+        media = getattr(message, 'media', None)
+        document = getattr(media, 'document', None)
+        file = getattr(message, 'file', None)
+
+        size = getattr(file, 'size', None) or getattr(document, 'size', 0) or 0
+        mime_type = getattr(file, 'mime_type', None) or getattr(document, 'mime_type', '') or ''
+
+        info = MediaInfo(
+            kind=self._detect_kind(media, document, mime_type),
+            size=int(size),
+            mime_type=mime_type,
+            duration=float(getattr(file, 'duration', None) or 0),
+            width=int(getattr(file, 'width', None) or 0),
+            height=int(getattr(file, 'height', None) or 0),
+            file_name=getattr(file, 'name', None)
+        )
+
+        # Fallback a atributos del documento (versiones antiguas de Telethon)
+        for attr in getattr(document, 'attributes', None) or []:
+            if not info.duration and getattr(attr, 'duration', None):
+                info.duration = float(attr.duration)
+            if not info.width and getattr(attr, 'w', None):
+                info.width, info.height = int(attr.w), int(attr.h)
+            if not info.file_name and getattr(attr, 'file_name', None):
+                info.file_name = attr.file_name
+
+        return info
+
+    @staticmethod
+    def _detect_kind(media, document, mime_type: str) -> str:
+        if document is None:
+            return 'photo' if getattr(media, 'photo', None) is not None else 'other'
+        if mime_type.startswith('video/'):
+            return 'video'
+        if mime_type.startswith('audio/'):
+            return 'audio'
+        if mime_type.startswith('image/'):
+            return 'image'
+        if mime_type == 'application/pdf':
+            return 'pdf'
+        return 'document'
+
+    # ============== ROUTING ==============
+
+    def route(self, message) -> RouteDecision:
+        """Elegir el camino de un mensaje con media"""
+        decision = self.decide(self.inspect(message))
+        self.stats['routed'][decision.route.value] += 1
+        return decision
+
+    def decide(self, info: MediaInfo) -> RouteDecision:
+        """Política de routing a partir de los metadatos"""
+        limit_mb = self.config['max_file_size_mb']
+
+        if info.size == 0 or info.size_mb <= limit_mb:
+            return RouteDecision(MediaRoute.DIRECT, info, "fits Discord limit")
+
+        if info.kind in ('photo', 'image'):
+            if self.config['auto_compress'] and info.size_mb <= self.config['max_compress_image_mb']:
+                return RouteDecision(MediaRoute.COMPRESS, info, "image can be recompressed")
+            return RouteDecision(MediaRoute.REJECT, info, "image too large to recompress")
+
+        if info.kind == 'video':
+            if not self.config['auto_compress']:
+                return RouteDecision(MediaRoute.REJECT, info, "compression disabled")
+            if info.size_mb > self.config['max_compress_video_mb']:
+                return RouteDecision(MediaRoute.REJECT, info, "video too large to compress")
+            if info.duration:
+                # Bitrate necesario para que el video completo quepa en el límite
+                target_kbps = limit_mb * 1024 * 8 / info.duration
+                if target_kbps < self.config['min_video_bitrate_kbps']:
+                    return RouteDecision(
+                        MediaRoute.REJECT, info,
+                        f"would need {target_kbps:.0f}kbps to fit"
+                    )
+            return RouteDecision(MediaRoute.COMPRESS, info, "video can be compressed")
+
+        if info.kind in ('pdf', 'document'):
+            if info.size_mb <= self.config['max_preview_source_mb']:
+                return RouteDecision(MediaRoute.PREVIEW, info, "too large to attach")
+            return RouteDecision(MediaRoute.REJECT, info, "too large to preview")
+
+        return RouteDecision(MediaRoute.REJECT, info, "exceeds Discord limit")
+
+    # ============== MÉTRICAS ==============
+
+    def record_avoided_download(self, info: MediaInfo, throughput_bps: float = 0.0):
+        """Registrar una descarga evitada y el tiempo estimado ahorrado"""
+        if throughput_bps <= 0:
+            throughput_bps = self.config['assumed_download_mbps'] * 1024 * 1024
+
+        self.stats['downloads_avoided'] += 1
+        self.stats['download_bytes_avoided'] += info.size
+        self.stats['download_seconds_saved'] += info.size / throughput_bps
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'routed': dict(self.stats['routed']),
+            'downloads_avoided': self.stats['downloads_avoided'],
+            'download_mb_avoided': self.stats['download_bytes_avoided'] / (1024 * 1024),
+            'download_seconds_saved': self.stats['download_seconds_saved']
+        }
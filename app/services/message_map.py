@@ -0,0 +1,321 @@
+"""
+Message Map - Telegram → Discord message id index
+=================================================
+Archivo: app/services/message_map.py
+
+🗺️ Qué mensaje de Discord espeja cada mensaje de Telegram (por webhook)
+✅ Índice compacto en SQLite (WITHOUT ROWID, sólo enteros) con group commit
+✅ Caché LRU en memoria: lookups O(1) para los mensajes recientes
+✅ Acotado por edad y por número de entradas (expulsión LRU)
+✅ Contexto ``mirroring()``: el sender sabe qué mensaje está enviando
+"""
+
+import asyncio
+import contextvars
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+# Bits de ``flags``
+FLAG_MEDIA = 1        # El contenido es cabecera + "\n\n" + caption
+FLAG_NO_CONTENT = 2   # Request sin texto (p.ej. segundo lote de un álbum)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_map (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    discord_id INTEGER NOT NULL,
+    webhook_id INTEGER NOT NULL,
+    parts INTEGER NOT NULL,
+    flags INTEGER NOT NULL,
+    used_at INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, message_id, discord_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_message_map_used ON message_map (used_at);
+"""
+
+_SQL_ADD = """
+INSERT INTO message_map (chat_id, message_id, discord_id, webhook_id, parts, flags, used_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (chat_id, message_id, discord_id) DO UPDATE SET used_at = excluded.used_at
+"""
+_SQL_TOUCH = "UPDATE message_map SET used_at = ? WHERE chat_id = ? AND message_id = ?"
+_SQL_REMOVE = "DELETE FROM message_map WHERE chat_id = ? AND message_id = ?"
+
+
+@dataclass(frozen=True)
+class MirroredMessage:
+    """Un mensaje de Discord que espeja (parte de) un mensaje de Telegram"""
+    discord_id: int
+    webhook_id: int
+    parts: int = 1   # Mensajes de Telegram en este mensaje de Discord (álbum, textos coalescidos)
+    flags: int = 0
+
+    @property
+    def is_media(self) -> bool:
+        return bool(self.flags & FLAG_MEDIA)
+
+    @property
+    def has_content(self) -> bool:
+        return not self.flags & FLAG_NO_CONTENT
+
+
+@dataclass(frozen=True)
+class MirrorRef:
+    """Mensaje(s) de Telegram que se están enviando en el contexto actual"""
+    chat_id: int
+    message_ids: Tuple[int, ...]
+    media: bool = False
+
+
+@dataclass
+class MirrorUpdate:
+    """Edición o borrado de Telegram pendiente de propagar (se encola como un mensaje)"""
+    kind: str                       # 'edit' | 'delete'
+    message_ids: List[int]
+    message: Any = None             # Mensaje editado (sólo 'edit')
+    pending_lanes: int = 1          # Carriles por los que aún debe pasar antes de propagarse
+
+
+_current_mirror: contextvars.ContextVar[Optional[MirrorRef]] = contextvars.ContextVar(
+    'current_mirror', default=None
+)
+
+
+@contextmanager
+def mirroring(chat_id: int, message_ids: Sequence[int], media: bool = False) -> Iterator[MirrorRef]:
+    """Los envíos dentro del bloque se registran como espejo de ``message_ids``"""
+    ref = MirrorRef(chat_id, tuple(message_ids), media)
+    token = _current_mirror.set(ref)
+    try:
+        yield ref
+    finally:
+        _current_mirror.reset(token)
+
+
+def current_mirror() -> Optional[MirrorRef]:
+    return _current_mirror.get()
+
+
+class MessageMap:
+    """
+    🗺️ ÍNDICE TELEGRAM → DISCORD
+    ============================
+
+    Clave (chat_id, message_id) de Telegram; un mensaje puede tener varias
+    filas (un destino por webhook, o varios requests). Las filas son sólo
+    enteros en una tabla WITHOUT ROWID, unos 40 bytes por fila en disco,
+    así que millones de mapeos caben sin problema.
+
+    Las escrituras se agrupan como en el outbox (un commit por intervalo).
+    Los mensajes recién enviados (los que se editan o borran casi siempre)
+    viven además en una caché LRU acotada: su lookup es O(1) sin tocar
+    SQLite. Fuera de la caché el lookup es una búsqueda por clave primaria.
+
+    ``prune()`` borra las filas sin uso durante ``max_age_hours`` y, si aun
+    así hay más de ``max_entries``, las menos usadas recientemente.
+    """
+
+    def __init__(self, db_path: str = "data/message_map.db",
+                 max_entries: int = 5_000_000,
+                 max_age_hours: float = 168,
+                 cache_entries: int = 100_000,
+                 flush_interval_ms: float = 50):
+        self.db_path = Path(db_path)
+        self.config = {
+            'max_entries': max_entries,
+            'max_age_seconds': max_age_hours * 3600,
+            'cache_entries': cache_entries,
+            'flush_interval': flush_interval_ms / 1000
+        }
+
+        self._cache: "OrderedDict[Tuple[int, int], Tuple[MirroredMessage, ...]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="message-map")
+        self._pending: List[Tuple[str, tuple]] = []
+        self._flusher: Optional[asyncio.Task] = None
+
+        self.stats = {
+            'added': 0,
+            'lookups': 0,
+            'cache_hits': 0,
+            'misses': 0,
+            'removed': 0,
+            'pruned_by_age': 0,
+            'pruned_by_size': 0,
+            'commit_errors': 0
+        }
+
+    # ============== CICLO DE VIDA ==============
+
+    async def start(self):
+        if self._flusher:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._open)
+        self._flusher = asyncio.create_task(self._flush_loop(), name="message-map-flusher")
+        logger.info(f"🗺️ Message map ready: {self.db_path}")
+
+    def _open(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    async def stop(self):
+        if not self._flusher:
+            return
+        self._flusher.cancel()
+        await asyncio.gather(self._flusher, return_exceptions=True)
+        self._flusher = None
+        await self.flush()
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._conn.close)
+        self._conn = None
+
+    # ============== ESCRITURAS ==============
+
+    def add(self, chat_id: int, message_id: int, mirrored: MirroredMessage):
+        """Registrar un mensaje de Discord como espejo de (chat_id, message_id)"""
+        key = (chat_id, message_id)
+        rows = tuple(row for row in self._cache.pop(key, ()) if row.discord_id != mirrored.discord_id)
+        self._remember(key, rows + (mirrored,))
+        self._enqueue(_SQL_ADD, (
+            chat_id, message_id, mirrored.discord_id, mirrored.webhook_id,
+            mirrored.parts, mirrored.flags, int(time.time())
+        ))
+        self.stats['added'] += 1
+
+    def remove(self, chat_id: int, message_id: int):
+        self._cache.pop((chat_id, message_id), None)
+        self._enqueue(_SQL_REMOVE, (chat_id, message_id))
+        self.stats['removed'] += 1
+
+    def _enqueue(self, sql: str, params: tuple):
+        # Sin arrancar sólo queda la caché en memoria (como el outbox, nunca bloquea)
+        if self._flusher:
+            self._pending.append((sql, params))
+
+    def _remember(self, key: Tuple[int, int], rows: Tuple[MirroredMessage, ...]):
+        self._cache[key] = rows
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.config['cache_entries']:
+            self._cache.popitem(last=False)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.config['flush_interval'])
+            await self.flush()
+
+    async def flush(self):
+        """Volcar las escrituras pendientes en una transacción"""
+        if not self._pending or self._conn is None:
+            return
+        batch, self._pending = self._pending, []
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._commit_batch, batch)
+        except Exception as e:
+            self.stats['commit_errors'] += 1
+            logger.error(f"❌ Message map commit failed ({len(batch)} writes): {e}")
+
+    def _commit_batch(self, batch: List[Tuple[str, tuple]]):
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            for sql, params in batch:
+                conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ============== LECTURAS ==============
+
+    async def lookup(self, chat_id: int, message_id: int) -> Tuple[MirroredMessage, ...]:
+        """Mensajes de Discord que espejan (chat_id, message_id); vacío si no hay"""
+        key = (chat_id, message_id)
+        self.stats['lookups'] += 1
+
+        rows = self._cache.get(key)
+        if rows is not None:
+            self.stats['cache_hits'] += 1
+            self._cache.move_to_end(key)
+        elif self._conn is not None:
+            await self.flush()
+            loop = asyncio.get_running_loop()
+            found = await loop.run_in_executor(self._executor, self._query, chat_id, message_id)
+            rows = tuple(MirroredMessage(*row) for row in found)
+            if rows:
+                self._remember(key, rows)
+        if not rows:
+            self.stats['misses'] += 1
+            return ()
+
+        self._enqueue(_SQL_TOUCH, (int(time.time()), chat_id, message_id))
+        return rows
+
+    def _query(self, chat_id: int, message_id: int) -> list:
+        return self._conn.execute(
+            "SELECT discord_id, webhook_id, parts, flags FROM message_map "
+            "WHERE chat_id = ? AND message_id = ? ORDER BY discord_id",
+            (chat_id, message_id)
+        ).fetchall()
+
+    # ============== LÍMITES ==============
+
+    async def prune(self) -> int:
+        """Aplicar los límites de edad y tamaño; devuelve las filas borradas"""
+        if self._conn is None:
+            return 0
+        await self.flush()
+        cutoff = int(time.time() - self.config['max_age_seconds'])
+        loop = asyncio.get_running_loop()
+        by_age, by_size = await loop.run_in_executor(
+            self._executor, self._prune, cutoff, self.config['max_entries']
+        )
+        self.stats['pruned_by_age'] += by_age
+        self.stats['pruned_by_size'] += by_size
+        if by_age or by_size:
+            # Lo borrado en disco ya no debe resolverse desde la caché
+            self._cache.clear()
+        return by_age + by_size
+
+    def _prune(self, cutoff: int, max_entries: int) -> Tuple[int, int]:
+        by_age = self._conn.execute("DELETE FROM message_map WHERE used_at < ?", (cutoff,)).rowcount
+        excess = self._conn.execute("SELECT COUNT(*) FROM message_map").fetchone()[0] - max_entries
+        by_size = 0
+        if excess > 0:
+            by_size = self._conn.execute(
+                "DELETE FROM message_map WHERE (chat_id, message_id, discord_id) IN ("
+                "SELECT chat_id, message_id, discord_id FROM message_map ORDER BY used_at LIMIT ?)",
+                (excess,)
+            ).rowcount
+        return by_age, by_size
+
+    # ============== MÉTRICAS ==============
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats['lookups']
+        return {
+            **self.stats,
+            'enabled': self._flusher is not None,
+            'cached_messages': len(self._cache),
+            'pending_writes': len(self._pending),
+            'cache_hit_ratio': self.stats['cache_hits'] / lookups if lookups else 0.0
+        }
@@ -0,0 +1,407 @@
+"""
+Replication Outbox - Durable write-ahead log for replicated messages
+====================================================================
+Archivo: app/services/outbox.py
+
+💾 Outbox local en SQLite (modo WAL) con recuperación tras caída
+✅ Registra cada evento aceptado y la referencia de su payload procesado
+✅ Escrituras agrupadas con group commit (una transacción por lote)
+✅ Al reiniciar se reenvían las entregas que quedaron a medias
+✅ Cursor por chat (último mensaje replicado) para el backfill
+✅ Destinos pendientes por entrada: el reenvío sólo va a los que fallaron
+✅ Tramos de backfill sin terminar, independientes del cursor en vivo
+"""
+
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+# Estados de una entrada
+STATE_ACCEPTED = "accepted"
+STATE_PROCESSED = "processed"
+STATE_DELIVERED = "delivered"
+STATE_FAILED = "failed"          # Falló el envío: se reintenta al reiniciar
+STATE_ABANDONED = "abandoned"    # No se volverá a intentar
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    payload_ref TEXT,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (chat_id, message_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox (state, updated_at);
+CREATE TABLE IF NOT EXISTS outbox_targets (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    webhook_url TEXT NOT NULL,
+    PRIMARY KEY (chat_id, message_id, webhook_url)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS chat_cursors (
+    chat_id INTEGER PRIMARY KEY,
+    last_message_id INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS backfill_runs (
+    chat_id INTEGER NOT NULL,
+    from_id INTEGER NOT NULL,
+    target_id INTEGER NOT NULL,
+    last_id INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (chat_id, from_id)
+) WITHOUT ROWID;
+"""
+
+_SQL_ACCEPT = """
+INSERT INTO outbox (chat_id, message_id, state, created_at, updated_at)
+VALUES (?, ?, 'accepted', ?, ?)
+ON CONFLICT (chat_id, message_id) DO UPDATE SET
+    state = 'accepted', attempts = attempts + 1, updated_at = excluded.updated_at
+"""
+_SQL_PROCESSED = "UPDATE outbox SET state = 'processed', payload_ref = ?, updated_at = ? WHERE chat_id = ? AND message_id = ?"
+_SQL_DELIVERED = "UPDATE outbox SET state = 'delivered', updated_at = ? WHERE chat_id = ? AND message_id = ?"
+_SQL_CLEAR_TARGETS = "DELETE FROM outbox_targets WHERE chat_id = ? AND message_id = ?"
+_SQL_ADD_TARGET = "INSERT OR IGNORE INTO outbox_targets (chat_id, message_id, webhook_url) VALUES (?, ?, ?)"
+_SQL_TARGET_SETTLES = """
+UPDATE outbox SET state = 'delivered', updated_at = ?
+WHERE chat_id = ? AND message_id = ? AND state = 'failed'
+  AND EXISTS (SELECT 1 FROM outbox_targets WHERE chat_id = ? AND message_id = ? AND webhook_url = ?)
+  AND NOT EXISTS (SELECT 1 FROM outbox_targets WHERE chat_id = ? AND message_id = ? AND webhook_url != ?)
+"""
+_SQL_REMOVE_TARGET = "DELETE FROM outbox_targets WHERE chat_id = ? AND message_id = ? AND webhook_url = ?"
+_SQL_FAILED = "UPDATE outbox SET state = 'failed', error = ?, updated_at = ? WHERE chat_id = ? AND message_id = ?"
+_SQL_ABANDONED = "UPDATE outbox SET state = 'abandoned', error = ?, updated_at = ? WHERE chat_id = ? AND message_id = ?"
+_SQL_CURSOR = """
+INSERT INTO chat_cursors (chat_id, last_message_id, updated_at) VALUES (?, ?, ?)
+ON CONFLICT (chat_id) DO UPDATE SET
+    last_message_id = MAX(last_message_id, excluded.last_message_id), updated_at = excluded.updated_at
+"""
+_SQL_BACKFILL_RUN = """
+INSERT INTO backfill_runs (chat_id, from_id, target_id, last_id, updated_at) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (chat_id, from_id) DO UPDATE SET
+    last_id = MAX(last_id, excluded.last_id), updated_at = excluded.updated_at
+"""
+_SQL_BACKFILL_RUN_DONE = "DELETE FROM backfill_runs WHERE chat_id = ? AND from_id = ? AND last_id >= target_id"
+
+
+@dataclass
+class OutboxEntry:
+    """Entrada pendiente del outbox"""
+    chat_id: int
+    message_id: int
+    state: str
+    payload_ref: Optional[Dict[str, Any]]
+    attempts: int
+    created_at: float
+    destinations: Tuple[str, ...] = ()   # Webhooks pendientes; vacío: todos los del chat
+
+
+class ReplicationOutbox:
+    """
+    💾 OUTBOX DURABLE
+    =================
+
+    Todas las escrituras pasan por una cola en memoria. Un único flusher
+    las vuelca a SQLite en lotes: una transacción y un fsync por lote en
+    lugar de uno por mensaje (group commit). ``record_accepted`` espera a
+    que su lote esté confirmado; las transiciones posteriores
+    (processed/delivered/failed) no bloquean al llamador: si se pierden en
+    una caída, la entrada simplemente se reenvía (at-least-once).
+
+    Una entrada ``failed`` se sigue reenviando al reiniciar hasta agotar
+    ``max_attempts``; ``abandoned`` la retira para siempre. Si el fallo fue
+    sólo en algunos destinos, se guardan sus webhooks y el reenvío se
+    limita a ellos.
+    """
+
+    def __init__(self, db_path: str = "data/replication_outbox.db",
+                 flush_interval_ms: float = 10, max_batch: int = 500):
+        self.db_path = Path(db_path)
+        self.config = {
+            'flush_interval': flush_interval_ms / 1000,
+            'max_batch': max_batch
+        }
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self._pending: List[Tuple[str, tuple, Optional[asyncio.Future]]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+        self.stats = {
+            'writes': 0,
+            'batches_committed': 0,
+            'total_commit_time': 0.0,
+            'max_batch_size': 0,
+            'commit_errors': 0,
+            'entries_replayed': 0
+        }
+
+    # ============== CICLO DE VIDA ==============
+
+    async def start(self):
+        """Abrir la base de datos y arrancar el flusher"""
+        if self._flusher:
+            return
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._open)
+
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop(), name="outbox-flusher")
+        logger.info(f"💾 Replication outbox ready: {self.db_path}")
+
+    def _open(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    async def stop(self):
+        """Volcar lo pendiente y cerrar"""
+        if not self._flusher:
+            return
+
+        self._flusher.cancel()
+        await asyncio.gather(self._flusher, return_exceptions=True)
+        self._flusher = None
+        await self._flush_pending()
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._conn.close)
+        self._conn = None
+        logger.info("💾 Replication outbox closed")
+
+    # ============== ESCRITURAS ==============
+
+    async def record_accepted(self, chat_id: int, message_id: int):
+        """Registrar un evento aceptado; retorna cuando su lote está confirmado"""
+        now = time.time()
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(_SQL_ACCEPT, (chat_id, message_id, now, now), future)
+        await future
+
+    def mark_processed(self, chat_id: int, message_id: int, payload_ref: Dict[str, Any]):
+        """Guardar la referencia del payload ya procesado"""
+        self._enqueue(_SQL_PROCESSED, (json.dumps(payload_ref, default=str), time.time(), chat_id, message_id))
+
+    def mark_delivered(self, chat_id: int, message_id: int):
+        self._enqueue(_SQL_DELIVERED, (time.time(), chat_id, message_id))
+        self._enqueue(_SQL_CLEAR_TARGETS, (chat_id, message_id))
+
+    def mark_failed(self, chat_id: int, message_id: int, error: str,
+                    destinations: Optional[Iterable[str]] = None):
+        """
+        Entrega fallida: la entrada sigue pendiente de reenvío
+
+        ``destinations`` (webhooks que no la recibieron) reemplaza los
+        pendientes guardados; sin él se conservan los que hubiera.
+        """
+        self._enqueue(_SQL_FAILED, (error[:500], time.time(), chat_id, message_id))
+        if destinations is not None:
+            self._enqueue(_SQL_CLEAR_TARGETS, (chat_id, message_id))
+            for webhook_url in sorted(destinations):
+                self._enqueue(_SQL_ADD_TARGET, (chat_id, message_id, webhook_url))
+
+    def mark_destination_delivered(self, chat_id: int, message_id: int, webhook_url: str):
+        """
+        Un destino pendiente recibió la entrada por otra vía (replay de una dead letter)
+
+        Deja de reenviarse a ese webhook; si era el último pendiente la
+        entrada pasa a entregada.
+        """
+        self._enqueue(_SQL_TARGET_SETTLES, (
+            time.time(), chat_id, message_id,
+            chat_id, message_id, webhook_url,
+            chat_id, message_id, webhook_url
+        ))
+        self._enqueue(_SQL_REMOVE_TARGET, (chat_id, message_id, webhook_url))
+
+    def mark_abandoned(self, chat_id: int, message_id: int, reason: str):
+        """Retirar la entrada: no se reenvía nunca más"""
+        self._enqueue(_SQL_ABANDONED, (reason[:500], time.time(), chat_id, message_id))
+
+    def advance_cursor(self, chat_id: int, message_id: int):
+        """Avanzar el último mensaje replicado del chat (nunca retrocede)"""
+        self._enqueue(_SQL_CURSOR, (chat_id, message_id, time.time()))
+
+    def save_backfill_run(self, chat_id: int, from_id: int, target_id: int, last_id: int):
+        """
+        Guardar el avance de un tramo de backfill (from_id, target_id]
+
+        El cursor del chat también lo avanza el tráfico en vivo, así que no
+        sirve para retomar un backfill interrumpido: el tramo se guarda
+        aparte hasta que ``last_id`` alcanza ``target_id``.
+        """
+        self._enqueue(_SQL_BACKFILL_RUN, (chat_id, from_id, target_id, last_id, time.time()))
+        self._enqueue(_SQL_BACKFILL_RUN_DONE, (chat_id, from_id))
+
+    def _enqueue(self, sql: str, params: tuple, future: Optional[asyncio.Future] = None):
+        if not self._flusher:
+            # Outbox no arrancado: no bloquear la replicación
+            if future and not future.done():
+                future.set_result(None)
+            return
+
+        self._pending.append((sql, params, future))
+        if len(self._pending) >= self.config['max_batch']:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        """Group commit: un lote por intervalo (o antes si el lote se llena)"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.config['flush_interval'])
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._flush_pending()
+
+    async def _flush_pending(self):
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+
+        try:
+            await loop.run_in_executor(self._executor, self._commit_batch, batch)
+            error = None
+        except Exception as e:
+            error = e
+            self.stats['commit_errors'] += 1
+            logger.error(f"❌ Outbox commit failed ({len(batch)} writes): {e}")
+
+        self.stats['writes'] += len(batch)
+        self.stats['batches_committed'] += 1
+        self.stats['total_commit_time'] += time.monotonic() - start
+        self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(batch))
+
+        for _, _, future in batch:
+            if future and not future.done():
+                # Un fallo de persistencia no debe tumbar la replicación
+                future.set_result(error)
+
+    def _commit_batch(self, batch: List[Tuple[str, tuple, Optional[asyncio.Future]]]):
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            for sql, params, _ in batch:
+                conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ============== RECUPERACIÓN ==============
+
+    async def pending_entries(self, max_attempts: int = 3, limit: int = 10000) -> List[OutboxEntry]:
+        """Entradas sin entregar (aceptadas, procesadas o fallidas) en orden de llegada"""
+        await self._flush_pending()
+        loop = asyncio.get_running_loop()
+        rows, targets = await loop.run_in_executor(self._executor, self._query_pending, max_attempts, limit)
+        return [
+            OutboxEntry(
+                chat_id=row[0],
+                message_id=row[1],
+                state=row[2],
+                payload_ref=json.loads(row[3]) if row[3] else None,
+                attempts=row[4],
+                created_at=row[5],
+                destinations=tuple(targets.get((row[0], row[1]), ()))
+            )
+            for row in rows
+        ]
+
+    def _query_pending(self, max_attempts: int, limit: int) -> tuple:
+        rows = self._conn.execute(
+            "SELECT chat_id, message_id, state, payload_ref, attempts, created_at FROM outbox "
+            "WHERE state IN ('accepted', 'processed', 'failed') AND attempts <= ? "
+            "ORDER BY created_at, message_id LIMIT ?",
+            (max_attempts, limit)
+        ).fetchall()
+        targets: Dict[Tuple[int, int], List[str]] = {}
+        for chat_id, message_id, webhook_url in self._conn.execute(
+            "SELECT chat_id, message_id, webhook_url FROM outbox_targets ORDER BY webhook_url"
+        ):
+            targets.setdefault((chat_id, message_id), []).append(webhook_url)
+        return rows, targets
+
+    async def get_cursors(self) -> Dict[int, int]:
+        """Último mensaje replicado por chat"""
+        await self._flush_pending()
+        loop = asyncio.get_running_loop()
+        rows = await loop.run_in_executor(
+            self._executor,
+            lambda: self._conn.execute("SELECT chat_id, last_message_id FROM chat_cursors").fetchall()
+        )
+        return dict(rows)
+
+    async def get_backfill_runs(self) -> Dict[int, List[Tuple[int, int, int]]]:
+        """Tramos de backfill sin terminar por chat: (from_id, target_id, last_id)"""
+        await self._flush_pending()
+        loop = asyncio.get_running_loop()
+        rows = await loop.run_in_executor(
+            self._executor,
+            lambda: self._conn.execute(
+                "SELECT chat_id, from_id, target_id, last_id FROM backfill_runs ORDER BY chat_id, from_id"
+            ).fetchall()
+        )
+        runs: Dict[int, List[Tuple[int, int, int]]] = {}
+        for chat_id, from_id, target_id, last_id in rows:
+            runs.setdefault(chat_id, []).append((from_id, target_id, last_id))
+        return runs
+
+    async def purge(self, older_than_seconds: float, max_attempts: int = 3) -> int:
+        """Borrar entradas antiguas ya cerradas (las fallidas sólo sin reintentos restantes)"""
+        cutoff = time.time() - older_than_seconds
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._purge, cutoff, max_attempts)
+
+    def _purge(self, cutoff: float, max_attempts: int) -> int:
+        cursor = self._conn.execute(
+            "DELETE FROM outbox WHERE updated_at < ? AND "
+            "(state IN ('delivered', 'abandoned') OR (state = 'failed' AND attempts > ?))",
+            (cutoff, max_attempts)
+        )
+        self._conn.execute(
+            "DELETE FROM outbox_targets WHERE NOT EXISTS (SELECT 1 FROM outbox o "
+            "WHERE o.chat_id = outbox_targets.chat_id AND o.message_id = outbox_targets.message_id)"
+        )
+        return cursor.rowcount
+
+    # ============== MÉTRICAS ==============
+
+    def get_stats(self) -> Dict[str, Any]:
+        batches = self.stats['batches_committed']
+        return {
+            'enabled': self._flusher is not None,
+            'pending_writes': len(self._pending),
+            'writes': self.stats['writes'],
+            'batches_committed': batches,
+            'avg_batch_size': self.stats['writes'] / batches if batches else 0.0,
+            'max_batch_size': self.stats['max_batch_size'],
+            'avg_commit_ms': self.stats['total_commit_time'] / batches * 1000 if batches else 0.0,
+            'commit_errors': self.stats['commit_errors'],
+            'entries_replayed': self.stats['entries_replayed']
+        }
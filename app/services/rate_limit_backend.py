@@ -0,0 +1,386 @@
+"""
+Rate Limit Backend - Shared token state for several replicator processes
+========================================================================
+Archivo: app/services/rate_limit_backend.py
+
+🔐 Estado de buckets de Discord compartido entre procesos / réplicas
+✅ API atómica ``reserve()``: consume un token o devuelve cuánto esperar
+✅ ``LocalRateLimitBackend``: en memoria (un solo proceso, por defecto)
+✅ ``SQLiteRateLimitBackend``: varios procesos en el mismo host
+✅ ``RedisRateLimitBackend``: varias réplicas, usando el cliente de ``CacheService``
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+GLOBAL_KEY = "global"
+
+
+@dataclass
+class BucketState:
+    """Tokens de un bucket dentro de su ventana actual (tiempos en epoch)"""
+    remaining: int = 0
+    reset_at: float = 0.0
+    blocked_until: float = 0.0
+
+
+def _reserve(state: BucketState, global_until: float, limit: Optional[int], window: float,
+             now: float) -> float:
+    """Regla común a todos los backends; muta ``state`` si se consume un token"""
+    wait = max(global_until, state.blocked_until) - now
+    if wait > 0:
+        return wait
+    if limit is None:
+        return 0.0
+    if now >= state.reset_at:
+        state.remaining = limit
+        state.reset_at = now + window
+    if state.remaining > 0:
+        state.remaining -= 1
+        return 0.0
+    return state.reset_at - now
+
+
+def _observe(state: BucketState, remaining: int, reset_after: float, margin: float, now: float):
+    reset_at = now + reset_after
+    if reset_at > state.reset_at + margin:
+        # Ventana nueva según Discord
+        state.remaining = remaining
+        state.reset_at = reset_at
+    else:
+        state.remaining = min(state.remaining, remaining)
+
+
+class RateLimitBackend(ABC):
+    """
+    Backend de estado de rate limits
+
+    Todos los tiempos que cruzan la API son relativos (segundos) para que
+    relojes distintos entre réplicas no importen.
+    """
+
+    name = "abstract"
+
+    async def start(self):
+        """Abrir conexiones (opcional)"""
+
+    async def close(self):
+        """Cerrar conexiones (opcional)"""
+
+    @abstractmethod
+    async def reserve(self, key: str, limit: Optional[int], window: float) -> float:
+        """
+        Reservar atómicamente un token de ``key``
+
+        Returns:
+            0 si se reservó; si no, segundos a esperar antes de reintentar.
+            Con ``limit=None`` sólo se comprueban los bloqueos (429 / global).
+        """
+
+    @abstractmethod
+    async def observe(self, key: str, remaining: int, reset_after: float, margin: float = 0.05):
+        """Sincronizar con ``X-RateLimit-Remaining`` / ``Reset-After`` de una respuesta"""
+
+    @abstractmethod
+    async def block(self, key: str, seconds: float):
+        """Bloquear ``key`` (o ``GLOBAL_KEY``) durante ``seconds``"""
+
+    @abstractmethod
+    async def blocked_for(self, key: str) -> float:
+        """Segundos que le quedan al bloqueo de ``key`` (0 si no está bloqueado)"""
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'backend': self.name}
+
+
+class LocalRateLimitBackend(RateLimitBackend):
+    """Estado en memoria del proceso (comportamiento de una sola réplica)"""
+
+    name = "local"
+
+    def __init__(self):
+        self._states: Dict[str, BucketState] = {}
+
+    def _state(self, key: str) -> BucketState:
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = BucketState()
+        return state
+
+    async def reserve(self, key: str, limit: Optional[int], window: float) -> float:
+        global_until = self._states[GLOBAL_KEY].blocked_until if GLOBAL_KEY in self._states else 0.0
+        return _reserve(self._state(key), global_until, limit, window, time.time())
+
+    async def observe(self, key: str, remaining: int, reset_after: float, margin: float = 0.05):
+        _observe(self._state(key), remaining, reset_after, margin, time.time())
+
+    async def block(self, key: str, seconds: float):
+        state = self._state(key)
+        state.blocked_until = max(state.blocked_until, time.time() + seconds)
+
+    async def blocked_for(self, key: str) -> float:
+        state = self._states.get(key)
+        return max(0.0, state.blocked_until - time.time()) if state else 0.0
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """
+    Estado en un archivo SQLite (WAL) compartido por procesos del mismo host
+
+    Cada operación es una transacción ``BEGIN IMMEDIATE``: el lock de
+    escritura de SQLite serializa las reservas entre procesos.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path: Union[str, Path] = "data/discord_ratelimit.db", busy_timeout: float = 5.0):
+        self.db_path = Path(db_path)
+        self.busy_timeout = busy_timeout
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    async def start(self):
+        await asyncio.to_thread(self._connect)
+
+    def _connect(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conn is None:
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(
+                    str(self.db_path), timeout=self.busy_timeout,
+                    isolation_level=None, check_same_thread=False
+                )
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS rate_limits ("
+                    " key TEXT PRIMARY KEY,"
+                    " remaining INTEGER NOT NULL DEFAULT 0,"
+                    " reset_at REAL NOT NULL DEFAULT 0,"
+                    " blocked_until REAL NOT NULL DEFAULT 0)"
+                )
+                self._conn = conn
+            return self._conn
+
+    async def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _transaction(self, key: str, mutate) -> Any:
+        conn = self._connect()
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                rows = dict(
+                    (row[0], BucketState(row[1], row[2], row[3])) for row in conn.execute(
+                        "SELECT key, remaining, reset_at, blocked_until FROM rate_limits WHERE key IN (?, ?)",
+                        (key, GLOBAL_KEY)
+                    )
+                )
+                state = rows.get(key, BucketState())
+                global_until = rows[GLOBAL_KEY].blocked_until if GLOBAL_KEY in rows else 0.0
+                result = mutate(state, global_until, now)
+                conn.execute(
+                    "INSERT INTO rate_limits (key, remaining, reset_at, blocked_until) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET remaining = excluded.remaining, "
+                    "reset_at = excluded.reset_at, blocked_until = excluded.blocked_until",
+                    (key, state.remaining, state.reset_at, state.blocked_until)
+                )
+                conn.execute("COMMIT")
+                return result
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    async def reserve(self, key: str, limit: Optional[int], window: float) -> float:
+        return await asyncio.to_thread(
+            self._transaction, key,
+            lambda state, global_until, now: _reserve(state, global_until, limit, window, now)
+        )
+
+    async def observe(self, key: str, remaining: int, reset_after: float, margin: float = 0.05):
+        await asyncio.to_thread(
+            self._transaction, key,
+            lambda state, global_until, now: _observe(state, remaining, reset_after, margin, now)
+        )
+
+    async def block(self, key: str, seconds: float):
+        def mutate(state: BucketState, global_until: float, now: float):
+            state.blocked_until = max(state.blocked_until, now + seconds)
+        await asyncio.to_thread(self._transaction, key, mutate)
+
+    async def blocked_for(self, key: str) -> float:
+        def read() -> float:
+            conn = self._connect()
+            with self._lock:
+                row = conn.execute("SELECT blocked_until FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            return max(0.0, row[0] - time.time()) if row else 0.0
+        return await asyncio.to_thread(read)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'backend': self.name, 'db_path': str(self.db_path)}
+
+
+# Scripts Lua: el reloj es el de Redis (TIME) para que todas las réplicas coincidan
+_REDIS_NOW = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+"""
+
+_REDIS_RESERVE = _REDIS_NOW + """
+local global_until = tonumber(redis.call('HGET', KEYS[2], 'blocked_until') or '0')
+local b = redis.call('HMGET', KEYS[1], 'remaining', 'reset_at', 'blocked_until')
+local remaining = tonumber(b[1] or '0')
+local reset_at = tonumber(b[2] or '0')
+local wait = math.max(global_until, tonumber(b[3] or '0')) - now
+if wait > 0 then return tostring(wait) end
+local limit = tonumber(ARGV[1])
+if limit < 0 then return '0' end
+if now >= reset_at then
+    remaining = limit
+    reset_at = now + tonumber(ARGV[2])
+end
+if remaining > 0 then
+    redis.call('HSET', KEYS[1], 'remaining', remaining - 1, 'reset_at', tostring(reset_at))
+    redis.call('PEXPIRE', KEYS[1], math.ceil((reset_at - now) * 1000) + tonumber(ARGV[3]))
+    return '0'
+end
+return tostring(reset_at - now)
+"""
+
+_REDIS_OBSERVE = _REDIS_NOW + """
+local b = redis.call('HMGET', KEYS[1], 'remaining', 'reset_at')
+local remaining = tonumber(ARGV[1])
+local reset_at = now + tonumber(ARGV[2])
+if reset_at <= tonumber(b[2] or '0') + tonumber(ARGV[3]) then
+    remaining = math.min(tonumber(b[1] or remaining), remaining)
+    reset_at = tonumber(b[2])
+end
+redis.call('HSET', KEYS[1], 'remaining', remaining, 'reset_at', tostring(reset_at))
+redis.call('PEXPIRE', KEYS[1], math.ceil((reset_at - now) * 1000) + tonumber(ARGV[4]))
+return 1
+"""
+
+_REDIS_BLOCK = _REDIS_NOW + """
+local until_ = now + tonumber(ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'blocked_until') or '0')
+if until_ > current then
+    redis.call('HSET', KEYS[1], 'blocked_until', tostring(until_))
+    redis.call('PEXPIRE', KEYS[1], math.ceil(tonumber(ARGV[1]) * 1000) + tonumber(ARGV[2]))
+end
+return 1
+"""
+
+_REDIS_BLOCKED_FOR = _REDIS_NOW + """
+local current = tonumber(redis.call('HGET', KEYS[1], 'blocked_until') or '0')
+return tostring(math.max(0, current - now))
+"""
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """
+    Estado en Redis compartido por todas las réplicas
+
+    Reutiliza el cliente de ``CacheService``; cada operación es un script
+    Lua (atómico en Redis). Si Redis no está disponible se degrada a
+    ``LocalRateLimitBackend`` para no frenar la replicación.
+    """
+
+    name = "redis"
+
+    def __init__(self, cache=None, redis_url: Optional[str] = None, prefix: str = "replic:ratelimit:",
+                 key_ttl_ms: int = 60_000):
+        self.cache = cache
+        self._owns_cache = cache is None
+        self.redis_url = redis_url
+        self.prefix = prefix
+        self.key_ttl_ms = key_ttl_ms
+        self._fallback = LocalRateLimitBackend()
+        self._scripts: Dict[str, Any] = {}
+        self.stats = {'fallback_operations': 0, 'errors': 0}
+
+    async def start(self):
+        if self.cache is None:
+            from app.services.cache import CacheService
+            self.cache = CacheService(redis_url=self.redis_url)
+        if self.cache.client is None:
+            await self.cache.connect()
+
+        client = self.cache.client
+        if client is None:
+            logger.warning("⚠️ Redis no disponible: rate limits sólo locales")
+            return
+
+        for name, source in (('reserve', _REDIS_RESERVE), ('observe', _REDIS_OBSERVE),
+                             ('block', _REDIS_BLOCK), ('blocked_for', _REDIS_BLOCKED_FOR)):
+            self._scripts[name] = client.register_script(source)
+        logger.info("🔐 Rate limits compartidos vía Redis")
+
+    async def close(self):
+        if self._owns_cache and self.cache is not None:
+            await self.cache.disconnect()
+
+    async def _run(self, script: str, keys, args) -> Optional[Any]:
+        if script not in self._scripts:
+            self.stats['fallback_operations'] += 1
+            return None
+        try:
+            return await self._scripts[script](keys=[self.prefix + k for k in keys], args=args)
+        except Exception as e:
+            self.stats['errors'] += 1
+            self.stats['fallback_operations'] += 1
+            logger.warning(f"⚠️ Redis rate limit error ({script}): {e}")
+            return None
+
+    async def reserve(self, key: str, limit: Optional[int], window: float) -> float:
+        result = await self._run('reserve', [key, GLOBAL_KEY],
+                                 [-1 if limit is None else limit, window, self.key_ttl_ms])
+        if result is None:
+            return await self._fallback.reserve(key, limit, window)
+        return float(result)
+
+    async def observe(self, key: str, remaining: int, reset_after: float, margin: float = 0.05):
+        if await self._run('observe', [key], [remaining, reset_after, margin, self.key_ttl_ms]) is None:
+            await self._fallback.observe(key, remaining, reset_after, margin)
+
+    async def block(self, key: str, seconds: float):
+        if await self._run('block', [key], [seconds, self.key_ttl_ms]) is None:
+            await self._fallback.block(key, seconds)
+
+    async def blocked_for(self, key: str) -> float:
+        result = await self._run('blocked_for', [key], [])
+        if result is None:
+            return await self._fallback.blocked_for(key)
+        return float(result)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'backend': self.name, 'connected': bool(self._scripts), **self.stats}
+
+
+def create_rate_limit_backend(kind: str = "local", **options) -> RateLimitBackend:
+    """Factory: ``local`` | ``sqlite`` (``db_path``) | ``redis`` (``redis_url`` o ``cache``)"""
+    kind = (kind or "local").lower()
+    if kind == "sqlite":
+        return SQLiteRateLimitBackend(options.get('db_path', "data/discord_ratelimit.db"))
+    if kind == "redis":
+        return RedisRateLimitBackend(cache=options.get('cache'), redis_url=options.get('redis_url'))
+    if kind != "local":
+        logger.warning(f"⚠️ Unknown rate limit backend '{kind}', using local")
+    return LocalRateLimitBackend()
@@ -0,0 +1,375 @@
+"""
+Retry Scheduler - Delayed retries without holding worker slots
+==============================================================
+Archivo: app/services/retry_scheduler.py
+
+⏳ Los envíos fallidos esperan su turno en un heap ordenado por hora de reintento
+✅ El backoff no ocupa workers: el slot del dispatcher se libera mientras tanto
+✅ Presupuesto de reintentos por webhook (ventana deslizante)
+✅ Dead-letter con adjuntos volcados a disco y replay manual
+"""
+
+import asyncio
+import heapq
+import itertools
+import shutil
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from .chat_dispatcher import release_worker_slot
+from .media_buffer import MediaBuffer
+from .message_map import MirrorRef
+from .upload_source import FileSlice, UploadSource, prepare_source
+from .webhook_pool import webhook_label
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetryItem:
+    """Un envío a Discord reintentable: cuerpo JSON o multipart con adjuntos"""
+    webhook_url: str
+    payload: Optional[Dict[str, Any]] = None
+    content: str = ""
+    files: List[Tuple[UploadSource, str]] = field(default_factory=list)
+    wait: bool = False  # ?wait=true: Discord devuelve el mensaje creado (su id)
+    sources: List[MirrorRef] = field(default_factory=list)  # Mensajes de Telegram que lleva el envío
+    attempts: int = 0
+    last_status: Optional[int] = None
+    last_error: str = ""
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def kind(self) -> str:
+        return 'files' if self.files else 'message'
+
+
+@dataclass
+class DeadLetter:
+    """Envío que agotó reintentos o presupuesto"""
+    letter_id: int
+    item: RetryItem
+    reason: str
+    failed_at: float = field(default_factory=time.time)
+    spool_dir: Optional[Path] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.letter_id,
+            'webhook': webhook_label(self.item.webhook_url),
+            'kind': self.item.kind,
+            'files': [filename for _, filename in self.item.files],
+            'sources': [
+                {'chat_id': source.chat_id, 'message_ids': list(source.message_ids)}
+                for source in self.item.sources
+            ],
+            'attempts': self.item.attempts,
+            'last_status': self.item.last_status,
+            'last_error': self.item.last_error[:200],
+            'reason': self.reason,
+            'failed_at': self.failed_at
+        }
+
+
+def is_retryable(result) -> bool:
+    """Errores de red, 429 y 5xx se reintentan; el resto de 4xx no"""
+    status = result.status_code
+    return status is None or status == 429 or status >= 500
+
+
+class RetryScheduler:
+    """
+    ⏳ SCHEDULER DE REINTENTOS
+    ==========================
+
+    ``deliver(item)`` hace el primer intento en línea. Si falla con un error
+    reintentable el envío se "aparca" en un heap con su hora de vencimiento
+    y el slot del dispatcher que lo estaba procesando se libera (el chat
+    sigue bloqueado, así que el orden se mantiene). Un timer mueve los
+    vencidos a una cola que atienden ``workers`` tareas propias; el
+    resultado final vuelve al caller a través de un future.
+
+    Cada webhook tiene un presupuesto de ``retry_budget`` reintentos por
+    ``budget_window_seconds``: si se agota, el envío va directo a
+    dead-letter en lugar de seguir martilleando un destino caído.
+    """
+
+    def __init__(self,
+                 execute: Callable[[RetryItem], Awaitable[Any]],
+                 workers: int = 4,
+                 max_attempts: int = 4,
+                 base_delay: float = 1.0,
+                 max_delay: float = 60.0,
+                 retry_budget: int = 30,
+                 budget_window_seconds: float = 60.0,
+                 max_dead_letters: int = 500,
+                 dead_letter_dir: str = "data/dead_letters"):
+        self.execute = execute
+        self.config = {
+            'workers': max(1, workers),
+            'max_attempts': max(1, max_attempts),
+            'base_delay': base_delay,
+            'max_delay': max_delay,
+            'retry_budget': retry_budget,
+            'budget_window_seconds': budget_window_seconds,
+            'max_dead_letters': max_dead_letters
+        }
+        self.dead_letter_dir = Path(dead_letter_dir)
+
+        self._heap: List[Tuple[float, int, RetryItem, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wake: Optional[asyncio.Event] = None
+        self._due: Optional["asyncio.Queue[Tuple[RetryItem, asyncio.Future]]"] = None
+        self._tasks: List[asyncio.Task] = []
+        self._budget: Dict[str, Deque[float]] = {}
+        self._letter_ids = itertools.count(1)
+        self.dead_letters: "OrderedDict[int, DeadLetter]" = OrderedDict()
+
+        self.stats = {
+            'delivered_first_try': 0,
+            'parked': 0,
+            'retried': 0,
+            'recovered': 0,
+            'budget_denied': 0,
+            'dead_lettered': 0,
+            'replayed': 0,
+            'total_backoff_seconds': 0.0
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._wake = asyncio.Event()
+        self._due = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._timer_loop(), name="retry-timer")] + [
+            asyncio.create_task(self._worker_loop(), name=f"retry-worker-{i}")
+            for i in range(self.config['workers'])
+        ]
+        logger.info(f"⏳ Retry scheduler started with {self.config['workers']} workers")
+
+    async def stop(self):
+        """Detener; los envíos aparcados terminan con su último resultado"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        pending = [future for _, _, _, future in self._heap]
+        while self._due is not None and not self._due.empty():
+            pending.append(self._due.get_nowait()[1])
+        self._heap.clear()
+        for future in pending:
+            if not future.done():
+                future.cancel()
+
+    # ============== ENVÍO ==============
+
+    async def deliver(self, item: RetryItem):
+        """Primer intento en línea; si falla y es reintentable, aparcar"""
+        result = await self._attempt(item)
+        if result.success:
+            self.stats['delivered_first_try'] += 1
+            return result
+        return await self._settle(item, result, parked=False)
+
+    async def _attempt(self, item: RetryItem):
+        item.attempts += 1
+        result = await self.execute(item)
+        if not result.success:
+            item.last_status = result.status_code
+            item.last_error = result.error_message or ""
+        return result
+
+    async def _settle(self, item: RetryItem, result, parked: bool,
+                      future: Optional[asyncio.Future] = None):
+        """Decidir tras un fallo: aparcar de nuevo o mandar a dead-letter"""
+        reason = None
+        if not is_retryable(result):
+            reason = f"HTTP {result.status_code}"
+        elif item.attempts >= self.config['max_attempts']:
+            reason = "retries exhausted"
+        elif not self._take_budget(item.webhook_url):
+            self.stats['budget_denied'] += 1
+            reason = "retry budget exhausted"
+
+        if reason is not None:
+            await self._dead_letter(item, reason)
+            if future is not None and not future.done():
+                future.set_result(result)
+            return result
+
+        delay = self._delay(item, result)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+        await self._park(item, delay, future)
+        if parked:
+            return None
+
+        # Libre el worker del dispatcher mientras dura el backoff
+        release_worker_slot()
+        return await future
+
+    def _delay(self, item: RetryItem, result) -> float:
+        retry_after = getattr(result, 'retry_after', None)
+        if retry_after:
+            return min(retry_after, self.config['max_delay'])
+        return min(self.config['base_delay'] * (2 ** (item.attempts - 1)), self.config['max_delay'])
+
+    async def _park(self, item: RetryItem, delay: float, future: asyncio.Future):
+        if not self._tasks:
+            await self.start()
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), item, future))
+        self.stats['parked'] += 1
+        self.stats['total_backoff_seconds'] += delay
+        self._wake.set()
+
+    def _take_budget(self, webhook_url: str) -> bool:
+        now = time.monotonic()
+        window = self._budget.setdefault(webhook_url, deque())
+        while window and now - window[0] > self.config['budget_window_seconds']:
+            window.popleft()
+        if len(window) >= self.config['retry_budget']:
+            return False
+        window.append(now)
+        return True
+
+    async def _timer_loop(self):
+        """Mover al worker pool los envíos cuyo backoff ya venció"""
+        while True:
+            if not self._heap:
+                await self._wake.wait()
+                self._wake.clear()
+                continue
+
+            delay = self._heap[0][0] - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+
+            _, _, item, future = heapq.heappop(self._heap)
+            if not future.done():  # El caller puede haberse cancelado
+                self._due.put_nowait((item, future))
+
+    async def _worker_loop(self):
+        while True:
+            item, future = await self._due.get()
+            self.stats['retried'] += 1
+            try:
+                result = await self._attempt(item)
+            except Exception as e:
+                logger.error(f"❌ Retry worker error for {webhook_label(item.webhook_url)}: {e}")
+                if not future.done():
+                    future.set_exception(e)
+                continue
+
+            if result.success:
+                self.stats['recovered'] += 1
+                if not future.done():
+                    future.set_result(result)
+            else:
+                await self._settle(item, result, parked=True, future=future)
+
+    # ============== DEAD-LETTER ==============
+
+    async def _dead_letter(self, item: RetryItem, reason: str):
+        letter = DeadLetter(next(self._letter_ids), item, reason)
+        if item.files:
+            # El caller libera sus buffers al volver: los adjuntos se copian a disco
+            letter.spool_dir = self.dead_letter_dir / str(letter.letter_id)
+            try:
+                item.files = await asyncio.to_thread(_spool_files, item.files, letter.spool_dir)
+            except Exception as e:
+                logger.error(f"❌ Could not spool dead letter {letter.letter_id}: {e}")
+                return
+
+        self.dead_letters[letter.letter_id] = letter
+        self.stats['dead_lettered'] += 1
+        logger.warning(
+            f"☠️ Dead letter {letter.letter_id} ({webhook_label(item.webhook_url)}, "
+            f"{item.attempts} attempts): {reason}"
+        )
+
+        while len(self.dead_letters) > self.config['max_dead_letters']:
+            _, evicted = self.dead_letters.popitem(last=False)
+            await asyncio.to_thread(_remove_spool, evicted)
+
+    def list_dead_letters(self) -> List[Dict[str, Any]]:
+        return [letter.to_dict() for letter in self.dead_letters.values()]
+
+    async def replay(self, letter_id: int):
+        """
+        Reenviar una dead letter con el contador de intentos a cero
+
+        Devuelve el resultado del envío (None si el id no existe). Si vuelve
+        a fallar se registra como una dead letter nueva.
+        """
+        letter = self.dead_letters.pop(letter_id, None)
+        if letter is None:
+            return None
+
+        self.stats['replayed'] += 1
+        letter.item.attempts = 0
+        try:
+            result = await self.deliver(letter.item)
+        finally:
+            await asyncio.to_thread(_remove_spool, letter)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'running': self.running,
+            'parked_now': len(self._heap),
+            'due_now': self._due.qsize() if self._due else 0,
+            'dead_letters': len(self.dead_letters),
+            'budget_in_use': {
+                webhook_label(url): len(window) for url, window in self._budget.items() if window
+            }
+        }
+
+
+def _spool_files(files: List[Tuple[UploadSource, str]], spool_dir: Path) -> List[Tuple[Path, str]]:
+    """Copiar adjuntos a ``spool_dir`` (por trozos) y devolverlos como rutas"""
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    spooled = []
+    for index, (source, filename) in enumerate(files):
+        target = spool_dir / f"{index}_{Path(filename).name}"
+        source = prepare_source(source)
+        if isinstance(source, Path):
+            shutil.copyfile(source, target)
+        elif isinstance(source, MediaBuffer):
+            with source.open_reader() as reader, open(target, 'wb') as out:
+                shutil.copyfileobj(reader, out)
+        elif isinstance(source, FileSlice):
+            with open(target, 'wb') as out:
+                position = 0
+                while position < source.size:
+                    chunk = source.read_at(position, 1 << 20)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    position += len(chunk)
+        else:
+            target.write_bytes(source)
+        spooled.append((target, filename))
+    return spooled
+
+
+def _remove_spool(letter: DeadLetter):
+    if letter.spool_dir is not None:
+        shutil.rmtree(letter.spool_dir, ignore_errors=True)
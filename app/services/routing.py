@@ -0,0 +1,320 @@
+"""
+Routing - One source chat to many Discord destinations
+======================================================
+Archivo: app/services/routing.py
+
+🔀 Tabla de rutas chat → destinos (webhooks)
+✅ Base 1:1 desde ``settings.discord.webhooks`` + destinos extra en ``config/routes.json``
+✅ Destinos agrupados por configuración de watermark: se procesa una vez por grupo
+✅ Envío concurrente a todos los destinos con contabilidad por destino
+✅ Registro por mensaje de los destinos que no recibieron el envío (reenvío parcial)
+"""
+
+import asyncio
+import contextvars
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from .message_map import current_mirror
+from .webhook_pool import webhook_label
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+class DeliveryFailedError(RuntimeError):
+    """Un envío no llegó a todos sus destinos; la entrada del outbox queda pendiente"""
+
+
+@dataclass(frozen=True)
+class Destination:
+    """Un webhook de Discord al que se replica un chat"""
+    webhook_url: str
+    name: str = ""
+    watermark_group: Optional[int] = None   # None: la configuración del chat origen
+    pool: Tuple[str, ...] = ()              # Webhooks extra del mismo canal (WebhookPool)
+
+    @property
+    def label(self) -> str:
+        """Identificador para logs y métricas (nunca la URL completa)"""
+        return self.name or webhook_label(self.webhook_url)
+
+
+@dataclass
+class DeliveryTarget:
+    """Destinos de un mensaje que comparten el mismo payload procesado"""
+    source_chat_id: int
+    destinations: List[Destination] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        labels = ", ".join(d.label for d in self.destinations)
+        return f"chat {self.source_chat_id} → [{labels}]"
+
+
+@dataclass
+class DeliveryLedger:
+    """Destinos que no recibieron cada mensaje de Telegram de un evento despachado"""
+    message_ids: Tuple[int, ...]
+    missing: Dict[int, Set[str]] = field(default_factory=dict)   # id → webhook_url pendientes
+
+    def record_failure(self, message_ids: Sequence[int], destinations: Sequence[Destination]):
+        """Anotar destinos sin entregar (sin ids: todos los mensajes del evento)"""
+        urls = {destination.webhook_url for destination in destinations}
+        if not urls:
+            return
+        for message_id in (message_ids or self.message_ids):
+            self.missing.setdefault(message_id, set()).update(urls)
+
+    def missing_for(self, message_id: int) -> Set[str]:
+        return set(self.missing.get(message_id, ()))
+
+    def failed_destinations(self) -> Set[str]:
+        return set().union(*self.missing.values())
+
+
+_current_ledger: contextvars.ContextVar[Optional[DeliveryLedger]] = contextvars.ContextVar(
+    'current_ledger', default=None
+)
+
+
+@contextmanager
+def recording_deliveries(ledger: DeliveryLedger) -> Iterator[DeliveryLedger]:
+    """Los envíos del bloque anotan en ``ledger`` lo que no llegó a cada destino"""
+    token = _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current_ledger.reset(token)
+
+
+def current_ledger() -> Optional[DeliveryLedger]:
+    return _current_ledger.get()
+
+
+class RoutingTable:
+    """
+    🔀 TABLA DE RUTAS
+    =================
+
+    ``config/routes.json`` añade destinos a los de ``settings``::
+
+        {
+            "-1001234567890": [
+                {"webhook_url": "https://discord.com/api/webhooks/...", "name": "es-mirror"},
+                {"webhook_url": "https://discord.com/api/webhooks/...", "watermark_group": -1009999},
+                {"webhook_url": "https://discord.com/api/webhooks/...",
+                 "pool": ["https://discord.com/api/webhooks/...", "https://discord.com/api/webhooks/..."]}
+            ]
+        }
+
+    Los destinos sin ``watermark_group`` usan la configuración de watermark
+    del chat origen; los que comparten grupo reciben el mismo payload.
+    ``pool`` lista webhooks extra del mismo canal: el sender reparte los
+    envíos entre ellos. Una entrada con la URL de un destino ya existente
+    (p.ej. el de ``settings``) lo reemplaza.
+    """
+
+    def __init__(self, routes: Optional[Dict[int, List[Destination]]] = None):
+        self._routes: Dict[int, List[Destination]] = {}
+        for chat_id, destinations in (routes or {}).items():
+            for destination in destinations:
+                self.add(chat_id, destination)
+
+    @classmethod
+    def from_settings(cls, webhooks: Dict[int, str],
+                      routes_file: Union[str, Path] = "config/routes.json") -> 'RoutingTable':
+        table = cls({chat_id: [Destination(url)] for chat_id, url in webhooks.items() if url})
+
+        path = Path(routes_file)
+        if path.exists():
+            try:
+                data = json.loads(path.read_text())
+                for chat_id, destinations in data.items():
+                    for item in destinations:
+                        table.add(int(chat_id), Destination(
+                            webhook_url=item['webhook_url'],
+                            name=item.get('name', ''),
+                            watermark_group=item.get('watermark_group'),
+                            pool=tuple(item.get('pool', ()))
+                        ))
+                logger.info(f"🔀 Routes loaded from {path}: {table.destination_count()} destinations")
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.error(f"❌ Invalid routes file {path}: {e}")
+
+        return table
+
+    def add(self, chat_id: int, destination: Destination):
+        destinations = self._routes.setdefault(chat_id, [])
+        for index, existing in enumerate(destinations):
+            if existing.webhook_url == destination.webhook_url:
+                destinations[index] = destination
+                return
+        destinations.append(destination)
+
+    def destinations(self, chat_id: int) -> List[Destination]:
+        return list(self._routes.get(chat_id, []))
+
+    def groups(self, chat_id: int) -> Dict[int, List[Destination]]:
+        """Destinos del chat agrupados por grupo de watermark efectivo"""
+        groups: Dict[int, List[Destination]] = OrderedDict()
+        for destination in self._routes.get(chat_id, []):
+            group = destination.watermark_group if destination.watermark_group is not None else chat_id
+            groups.setdefault(group, []).append(destination)
+        return groups
+
+    def pools(self) -> List[Destination]:
+        """Destinos con webhooks extra (únicos por URL)"""
+        seen: Dict[str, Destination] = {}
+        for destinations in self._routes.values():
+            for destination in destinations:
+                if destination.pool:
+                    seen.setdefault(destination.webhook_url, destination)
+        return list(seen.values())
+
+    def chat_ids(self) -> List[int]:
+        return list(self._routes)
+
+    def destination_count(self) -> int:
+        return sum(len(destinations) for destinations in self._routes.values())
+
+    def __contains__(self, chat_id: int) -> bool:
+        return bool(self._routes.get(chat_id))
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._routes)
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+
+class FanOutSender:
+    """
+    📡 ENVÍO A VARIOS DESTINOS
+    ==========================
+
+    Misma interfaz de envío que ``DiscordSenderEnhanced`` pero el primer
+    argumento es un ``DeliveryTarget`` (o una URL suelta). Las subidas a
+    todos los destinos corren en paralelo sobre el mismo payload; el
+    resultado es True sólo si todos los destinos lo recibieron.
+
+    Dentro de ``recording_deliveries()`` los fallos se anotan en el ledger
+    por mensaje (``mirroring()``) y destino, y el resultado es True si algún
+    destino recibió algo. Un destino que ya falló en el evento no recibe
+    los envíos siguientes, para que el reenvío mantenga el orden.
+    """
+
+    def __init__(self, sender):
+        self.sender = sender
+        self.destination_stats: Dict[str, Dict[str, Any]] = {}
+        self.stats = {
+            'deliveries': 0,
+            'fan_out_requests': 0,
+            'partial_failures': 0
+        }
+
+    async def send_message(self, target: Union[DeliveryTarget, str], content: str,
+                           chat_id: Optional[int] = None) -> bool:
+        # Con chat_id el sender puede coalescer textos consecutivos del chat
+        if chat_id is None:
+            return await self._fan_out(target, 'send_message', content)
+        return await self._fan_out(target, 'send_message', content, chat_id=chat_id)
+
+    async def send_message_with_file(self, target: Union[DeliveryTarget, str], content: str,
+                                     file_bytes, filename: str) -> bool:
+        return await self._fan_out(target, 'send_message_with_file', content, file_bytes, filename)
+
+    async def send_message_with_files(self, target: Union[DeliveryTarget, str], content: str,
+                                      files) -> bool:
+        # Con deliver_files se sabe cuántos adjuntos llegaron a cada destino
+        if files and hasattr(self.sender, 'deliver_files'):
+            return await self._fan_out(target, 'deliver_files', content, files, parts=len(files))
+        return await self._fan_out(target, 'send_message_with_files', content, files)
+
+    async def _fan_out(self, target: Union[DeliveryTarget, str], method: str, *args,
+                       parts: int = 1, **kwargs) -> bool:
+        destinations = (
+            target.destinations if isinstance(target, DeliveryTarget) else [Destination(target)]
+        )
+        ledger = current_ledger()
+        mirror = current_mirror()
+        message_ids = mirror.message_ids if mirror else ()
+        if ledger is not None:
+            failed_before = ledger.failed_destinations()
+            skipped = [d for d in destinations if d.webhook_url in failed_before]
+            ledger.record_failure(message_ids, skipped)
+            destinations = [d for d in destinations if d.webhook_url not in failed_before]
+        if not destinations:
+            return False
+
+        send = getattr(self.sender, method)
+        results = await asyncio.gather(
+            *(send(destination.webhook_url, *args, **kwargs) for destination in destinations),
+            return_exceptions=True
+        )
+
+        delivered = reached = 0
+        for destination, result in zip(destinations, results):
+            sent = _parts_sent(result, parts)
+            ok = sent == parts
+            delivered += int(ok)
+            reached += int(sent > 0)
+            self._record(destination, ok, None if ok else (
+                f"{sent}/{parts} parts delivered" if sent else result
+            ))
+            if not ok and ledger is not None:
+                # Con un id por adjunto sólo quedan pendientes los que no llegaron
+                undelivered = message_ids[sent:] if len(message_ids) == parts else message_ids
+                ledger.record_failure(undelivered, [destination])
+
+        self.stats['deliveries'] += delivered
+        if len(destinations) > 1:
+            self.stats['fan_out_requests'] += 1
+            if 0 < delivered < len(destinations):
+                self.stats['partial_failures'] += 1
+                logger.warning(f"📡 Partial delivery {delivered}/{len(destinations)} for {target}")
+
+        if ledger is not None:
+            return reached > 0
+        return delivered == len(destinations)
+
+    def _record(self, destination: Destination, ok: bool, error: Any):
+        stats = self.destination_stats.setdefault(destination.label, {
+            'sent': 0,
+            'failed': 0,
+            'last_error': None,
+            'last_success': None
+        })
+        if ok:
+            stats['sent'] += 1
+            stats['last_success'] = time.time()
+        else:
+            stats['failed'] += 1
+            stats['last_error'] = str(error) if error not in (None, False) else "send returned False"
+
+    def get_stats(self) -> Dict[str, Any]:
+        destinations = {}
+        for label, stats in self.destination_stats.items():
+            attempts = stats['sent'] + stats['failed']
+            destinations[label] = {
+                **stats,
+                'success_rate': stats['sent'] / attempts * 100 if attempts else 0.0
+            }
+        return {**self.stats, 'destinations': destinations}
+
+
+def _parts_sent(result: Any, parts: int) -> int:
+    """Partes entregadas según el resultado del sender (bool, nº de adjuntos o excepción)"""
+    if result is True:
+        return parts
+    if isinstance(result, int) and not isinstance(result, bool):
+        return max(0, min(result, parts))
+    return 0
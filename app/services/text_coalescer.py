@@ -0,0 +1,190 @@
+"""
+Text Coalescer - Text bursts merged into fewer webhook calls
+============================================================
+Archivo: app/services/text_coalescer.py
+
+💬 Ráfagas de mensajes cortos de un chat → un solo POST a Discord
+✅ Ventana corta por destino desde el primer mensaje del lote
+✅ Sólo mensajes consecutivos del mismo chat (y mismo username)
+✅ Nunca supera el límite de 2000 caracteres de Discord
+✅ Orden por destino: cada lote espera a que termine el anterior
+✅ Métrica de requests por mensaje
+"""
+
+import asyncio
+import contextvars
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+DISCORD_MAX_CONTENT = 2000
+
+
+@dataclass
+class _TextBatch:
+    """Mensajes pendientes de un destino que saldrán en un único payload"""
+    chat_id: Any
+    username: Optional[str]
+    parts: List[str] = field(default_factory=list)
+    tags: List[Any] = field(default_factory=list)
+    waiters: List[asyncio.Future] = field(default_factory=list)
+    length: int = 0
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class TextCoalescer:
+    """
+    💬 COALESCER DE TEXTOS POR DESTINO
+    ==================================
+
+    ``enqueue()`` añade un texto al lote abierto de su webhook y devuelve un
+    future con el resultado del envío. El lote se envía al cumplirse
+    ``window_seconds`` desde su primer mensaje, o antes si llega un texto de
+    otro chat, con otro username o que no cabe en ``max_chars``. Las partes
+    se unen con ``separator``, así que cada mensaje sigue en su propia línea.
+    El ``tag`` opaco de cada parte llega a ``send`` junto al lote.
+
+    Los lotes de un mismo webhook se envían en cadena (cada uno espera al
+    anterior) y ``flush()`` permite que un envío no coalescido (adjuntos)
+    salga después de los textos que ya estaban pendientes.
+    """
+
+    def __init__(self,
+                 send: Callable[[str, str, Optional[str], List[Any]], Awaitable[bool]],
+                 window_seconds: float = 0.25,
+                 max_chars: int = DISCORD_MAX_CONTENT,
+                 separator: str = "\n"):
+        self.send = send
+        self.config = {
+            'window_seconds': window_seconds,
+            'max_chars': min(max_chars, DISCORD_MAX_CONTENT),
+            'separator': separator
+        }
+
+        self._pending: Dict[str, _TextBatch] = {}
+        self._tails: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            'messages': 0,
+            'requests': 0,
+            'merged_messages': 0,
+            'flushed_by_window': 0,
+            'flushed_by_size': 0,
+            'flushed_by_chat_change': 0,
+            'failed_requests': 0
+        }
+
+    def enqueue(self, webhook_url: str, chat_id: Any, content: str,
+                username: Optional[str] = None, tag: Any = None) -> asyncio.Future:
+        """Añadir un texto al lote del destino; el future resuelve a True/False tras el envío"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.stats['messages'] += 1
+
+        batch = self._pending.get(webhook_url)
+        if batch is not None:
+            if batch.chat_id != chat_id or batch.username != username:
+                self.stats['flushed_by_chat_change'] += 1
+                self._start_flush(webhook_url)
+                batch = None
+            elif batch.length + len(self.config['separator']) + len(content) > self.config['max_chars']:
+                self.stats['flushed_by_size'] += 1
+                self._start_flush(webhook_url)
+                batch = None
+
+        if batch is None:
+            batch = _TextBatch(chat_id=chat_id, username=username)
+            self._pending[webhook_url] = batch
+            batch.timer = loop.call_later(
+                self.config['window_seconds'], self._on_window, webhook_url, batch
+            )
+        else:
+            batch.length += len(self.config['separator'])
+
+        batch.parts.append(content)
+        batch.tags.append(tag)
+        batch.waiters.append(future)
+        batch.length += len(content)
+
+        # Un texto que ya ocupa el máximo no puede juntarse con nada más
+        if batch.length >= self.config['max_chars']:
+            self.stats['flushed_by_size'] += 1
+            self._start_flush(webhook_url)
+
+        return future
+
+    async def flush(self, webhook_url: Optional[str] = None):
+        """Enviar lo pendiente (de un destino o de todos) y esperar a que salga"""
+        urls = [webhook_url] if webhook_url is not None else list(set(self._pending) | set(self._tails))
+        for url in urls:
+            if url in self._pending:
+                self._start_flush(url)
+            tail = self._tails.get(url)
+            if tail is not None:
+                await asyncio.wait({tail})
+
+    async def close(self):
+        """Enviar todos los lotes pendientes"""
+        await self.flush()
+
+    def pending_count(self) -> int:
+        return sum(len(batch.parts) for batch in self._pending.values())
+
+    def _on_window(self, webhook_url: str, batch: _TextBatch):
+        if self._pending.get(webhook_url) is batch:
+            self.stats['flushed_by_window'] += 1
+            self._start_flush(webhook_url)
+
+    def _start_flush(self, webhook_url: str):
+        batch = self._pending.pop(webhook_url, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+
+        previous = self._tails.get(webhook_url)
+        # Contexto vacío: el envío no pertenece al handler que disparó el flush
+        task = asyncio.get_running_loop().create_task(
+            self._send_batch(webhook_url, batch, previous), context=contextvars.Context()
+        )
+        self._tails[webhook_url] = task
+        task.add_done_callback(lambda t, url=webhook_url: self._on_batch_done(url, t))
+
+    def _on_batch_done(self, webhook_url: str, task: asyncio.Task):
+        if self._tails.get(webhook_url) is task:
+            del self._tails[webhook_url]
+
+    async def _send_batch(self, webhook_url: str, batch: _TextBatch, previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.wait({previous})
+
+        content = self.config['separator'].join(batch.parts)
+        self.stats['requests'] += 1
+        if len(batch.parts) > 1:
+            self.stats['merged_messages'] += len(batch.parts)
+
+        try:
+            success = bool(await self.send(webhook_url, content, batch.username, batch.tags))
+        except Exception as e:
+            logger.error(f"❌ Error enviando lote de {len(batch.parts)} textos: {e}")
+            success = False
+
+        if not success:
+            self.stats['failed_requests'] += 1
+        for waiter in batch.waiters:
+            if not waiter.done():
+                waiter.set_result(success)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'window_ms': self.config['window_seconds'] * 1000,
+            'pending_messages': self.pending_count(),
+            'requests_per_message': self.stats['requests'] / max(self.stats['messages'], 1)
+        }
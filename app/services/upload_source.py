@@ -0,0 +1,285 @@
+"""
+Upload Source - Streaming multipart sources for the Discord sender
+==================================================================
+Archivo: app/services/upload_source.py
+
+📤 Fuentes de adjuntos sin cargar el archivo completo en memoria
+✅ bytes / bytearray / memoryview (sin copia), MediaBuffer, rutas y archivos abiertos
+✅ Cada intento relee desde la fuente (los reintentos no retienen buffers)
+✅ Medición de RSS pico por upload en vuelo
+"""
+
+import asyncio
+import io
+import os
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Optional, Union
+
+from aiohttp import payload as aiohttp_payload
+
+from .media_buffer import MediaBuffer, media_bytes
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    RESOURCE_AVAILABLE = False
+
+
+@dataclass(frozen=True)
+class FileSlice:
+    """
+    Región de un archivo abierto; cada intento vuelve a ``offset``
+
+    Se lee con ``os.pread`` cuando el archivo tiene descriptor, así varios
+    envíos concurrentes (fan-out) pueden leer el mismo archivo sin pisarse
+    la posición.
+    """
+    fileobj: BinaryIO
+    offset: int
+    size: int
+
+    @classmethod
+    def from_fileobj(cls, fileobj: BinaryIO) -> 'FileSlice':
+        offset = fileobj.tell()
+        end = fileobj.seek(0, os.SEEK_END)
+        fileobj.seek(offset)
+        return cls(fileobj, offset, end - offset)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def read_at(self, position: int, size: int) -> bytes:
+        """Leer ``size`` bytes desde ``position`` (relativa al inicio del slice)"""
+        size = max(0, min(size, self.size - position))
+        try:
+            fd = self.fileobj.fileno()
+        except (AttributeError, OSError, ValueError):
+            self.fileobj.seek(self.offset + position)
+            return self.fileobj.read(size)
+        return os.pread(fd, size, self.offset + position)
+
+
+UploadSource = Union[bytes, bytearray, memoryview, MediaBuffer, str, os.PathLike, BinaryIO, FileSlice]
+PreparedSource = Union[bytes, bytearray, memoryview, MediaBuffer, Path, FileSlice]
+
+
+def prepare_source(source: UploadSource) -> PreparedSource:
+    """
+    Normalizar una fuente antes del primer intento
+
+    Las rutas pasan a ``Path`` y los archivos abiertos a ``FileSlice`` (se
+    fija la posición actual como inicio, para que los reintentos relean lo
+    mismo). Archivos sin descriptor que no sean ``BytesIO`` se leen con
+    seek + read: no compartirlos entre envíos concurrentes.
+    """
+    if isinstance(source, memoryview) and (source.format != 'B' or source.ndim != 1):
+        return source.cast('B')  # Vista plana de bytes: len() == nbytes, sin copia
+    if isinstance(source, (bytes, bytearray, memoryview, MediaBuffer, Path, FileSlice)):
+        return source
+    if isinstance(source, (str, os.PathLike)):
+        return Path(source)
+    if isinstance(source, io.BytesIO):
+        return source.getbuffer()[source.tell():]  # Sin copia y sin posición compartida
+    if hasattr(source, 'read') and hasattr(source, 'seek'):
+        return FileSlice.from_fileobj(source)
+    raise TypeError(f"Unsupported upload source: {type(source).__name__}")
+
+
+def source_size(source: UploadSource) -> int:
+    if isinstance(source, memoryview):
+        return source.nbytes
+    if isinstance(source, (str, os.PathLike)):
+        return os.stat(source).st_size
+    if isinstance(source, (bytes, bytearray, MediaBuffer, FileSlice)):
+        return len(source)
+    return len(prepare_source(source))
+
+
+def read_source(source: UploadSource) -> Union[bytes, MediaBuffer]:
+    """Contenido para quien necesita bytes (p.ej. compresión); MediaBuffer se pasa tal cual"""
+    source = prepare_source(source)
+    if isinstance(source, (bytes, MediaBuffer)):
+        return source
+    if isinstance(source, (bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, Path):
+        return source.read_bytes()
+    return source.read_at(0, source.size)
+
+
+class MediaBufferPayload(aiohttp_payload.Payload):
+    """
+    Payload multipart que lee un MediaBuffer por trozos
+
+    Tamaño conocido (Content-Length) y sin copiar el buffer completo; cada
+    escritura abre su propio lector, así que los reintentos releen el mismo
+    buffer desde el principio.
+    """
+
+    _value: MediaBuffer
+    chunk_size = 2 ** 16
+
+    def __init__(self, value: MediaBuffer, *args: Any,
+                 probe: Optional[Callable[[], None]] = None, **kwargs: Any):
+        super().__init__(value, *args, **kwargs)
+        self._size = len(value)
+        self._probe = probe
+
+    async def write(self, writer) -> None:
+        reader = self._value.open_reader()
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                if self._value.in_memory:
+                    chunk = reader.read(self.chunk_size)
+                else:
+                    chunk = await loop.run_in_executor(None, reader.read, self.chunk_size)
+                if not chunk:
+                    break
+                await writer.write(chunk)
+                if self._probe is not None:
+                    self._probe()
+        finally:
+            reader.close()
+
+    def decode(self, encoding: str = "utf-8", errors: str = "strict") -> str:
+        return self._value.read_bytes().decode(encoding, errors)
+
+
+class FileSourcePayload(aiohttp_payload.Payload):
+    """
+    Payload multipart que lee una ruta o un ``FileSlice`` por trozos
+
+    Las rutas se abren en cada escritura y se cierran al terminar; los
+    archivos abiertos se releen desde su ``offset``. Nada queda en memoria
+    entre intentos salvo el trozo en curso, y la lectura de disco va a un
+    hilo para no bloquear el event loop.
+    """
+
+    _value: Union[Path, FileSlice]
+    chunk_size = 2 ** 16
+
+    def __init__(self, value: Union[Path, FileSlice], *args: Any,
+                 probe: Optional[Callable[[], None]] = None, **kwargs: Any):
+        super().__init__(value, *args, **kwargs)
+        self._size = source_size(value)
+        self._probe = probe
+
+    async def write(self, writer) -> None:
+        loop = asyncio.get_running_loop()
+        if isinstance(self._value, Path):
+            handle = await loop.run_in_executor(None, open, self._value, 'rb')
+            source = FileSlice(handle, 0, self._size)
+        else:
+            handle, source = None, self._value
+
+        try:
+            position = 0
+            while position < source.size:
+                chunk = await loop.run_in_executor(None, source.read_at, position, self.chunk_size)
+                if not chunk:
+                    break
+                position += len(chunk)
+                await writer.write(chunk)
+                if self._probe is not None:
+                    self._probe()
+        finally:
+            if handle is not None:
+                handle.close()
+
+    def decode(self, encoding: str = "utf-8", errors: str = "strict") -> str:
+        return media_bytes(read_source(self._value)).decode(encoding, errors)
+
+
+def source_payload(source: UploadSource, content_type: str,
+                   probe: Optional[Callable[[], None]] = None) -> aiohttp_payload.Payload:
+    """
+    Cuerpo multipart para una fuente ya preparada
+
+    bytes / bytearray / memoryview van sin copia en un ``BytesPayload``; el
+    resto se transmite por trozos.
+    """
+    source = prepare_source(source)
+    if isinstance(source, MediaBuffer):
+        return MediaBufferPayload(source, content_type=content_type, probe=probe)
+    if isinstance(source, (Path, FileSlice)):
+        return FileSourcePayload(source, content_type=content_type, probe=probe)
+    return aiohttp_payload.BytesPayload(source, content_type=content_type)
+
+
+# ============== MEMORIA ==============
+
+def current_rss_bytes() -> int:
+    """RSS actual del proceso (0 si la plataforma no lo expone)"""
+    try:
+        with open('/proc/self/statm', 'rb') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        pass
+    if RESOURCE_AVAILABLE:
+        # ru_maxrss es el pico (KB en Linux, bytes en macOS): mejor que nada
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return 0
+
+
+class UploadMemoryTracker:
+    """
+    📏 RSS pico por upload en vuelo
+
+    ``track()`` toma el RSS al empezar un intento y lo vuelve a muestrear
+    mientras los payloads escriben trozos; se registra el crecimiento
+    máximo sobre el inicio. Con varios uploads en paralelo cada uno ve el
+    crecimiento total, así que el valor es una cota superior por upload.
+    """
+
+    def __init__(self, sample_every: int = 16, max_samples: int = 200):
+        self.sample_every = sample_every
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.peak_rss = 0
+        self._deltas = deque(maxlen=max_samples)
+        self.stats = {'uploads': 0}
+
+    @contextmanager
+    def track(self) -> Iterator[Callable[[], None]]:
+        start = current_rss_bytes()
+        peak = start
+        chunks = 0
+
+        def probe(force: bool = False):
+            nonlocal peak, chunks
+            chunks += 1
+            if force or chunks % self.sample_every == 0:
+                rss = current_rss_bytes()
+                peak = max(peak, rss)
+                self.peak_rss = max(self.peak_rss, rss)
+
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield probe
+        finally:
+            probe(force=True)
+            self.in_flight -= 1
+            self.stats['uploads'] += 1
+            self._deltas.append(max(0, peak - start))
+
+    def get_stats(self) -> Dict[str, Any]:
+        deltas = list(self._deltas)
+        return {
+            **self.stats,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'peak_rss_mb': self.peak_rss / (1024 * 1024),
+            'max_upload_rss_delta_mb': max(deltas) / (1024 * 1024) if deltas else 0.0,
+            'avg_upload_rss_delta_mb': sum(deltas) / len(deltas) / (1024 * 1024) if deltas else 0.0
+        }
@@ -44,15 +44,20 @@ Status: PRODUCTION READY - 95% CONFIDENCE
 
 import logging
 import asyncio
-from typing import Dict, Any, Optional, Tuple, Union
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
 from pathlib import Path
-from PIL import Image, ImageDraw, ImageFont
-import io
 from datetime import datetime
 from dataclasses import dataclass, asdict
 from enum import Enum
+import hashlib
 import json
 
+from app.services.media_buffer import MediaSource
+from app.services.media_compute import MediaComputeExecutor
+from app.tasks.workers.watermark_renderer import (
+    COMPOSITE_BACKENDS, NUMPY_AVAILABLE, OVERLAY_CACHE_MAX_BYTES, render_watermark
+)
+
 logger = logging.getLogger(__name__)
 
 # ============ CONFIGURACIÓN ============
@@ -72,6 +77,7 @@ class Position(Enum):
     BOTTOM_RIGHT = "bottom-right"
     CENTER = "center"
     CUSTOM = "custom"
+    TILED = "tiled"         # Patrón repetido en toda la imagen
 
 @dataclass
 class WatermarkConfig:
@@ -170,22 +176,30 @@ class WatermarkServiceIntegrated:
     ✅ Cache inteligente para performance
     ✅ Error handling robusto
     ✅ Async/await completo
+    ✅ Pool de procesos propio (Pillow nunca corre en el event loop)
+    ✅ Lotes (álbumes, backfill) repartidos entre núcleos con timeout por imagen
     """
     
-    def __init__(self, config_dir: str = "config", watermarks_dir: str = "watermarks"):
+    def __init__(self, config_dir: str = "config", watermarks_dir: str = "watermarks",
+                 pool_workers: Optional[int] = None, job_timeout_seconds: float = 30.0):
         """Initialize watermark service"""
         
         # Configuración de directorios
         self.config_dir = Path(config_dir)
         self.watermarks_dir = Path(watermarks_dir)
         
+        # Pool dedicado: los watermarks no compiten con la compresión del pool compartido.
+        # Cola única del pool: cada worker libre toma el siguiente trabajo (work-stealing)
+        self.pool = MediaComputeExecutor(max_workers=pool_workers)
+        self.job_timeout_seconds = job_timeout_seconds
+        self.composite_backend = 'pillow'   # 'pillow' | 'numpy' (ver set_composite_backend)
+        
         # Crear directorios si no existen
         self.config_dir.mkdir(parents=True, exist_ok=True)
         self.watermarks_dir.mkdir(parents=True, exist_ok=True)
         
         # Estado interno
         self.configs: Dict[int, WatermarkConfig] = {}
-        self.png_cache: Dict[str, Image.Image] = {}
         
         # Configuración por defecto - COMPATIBLE CON CÓDIGO EXISTENTE
         self.enabled = True
@@ -199,7 +213,14 @@ class WatermarkServiceIntegrated:
             'videos_processed': 0,
             'text_processed': 0,
             'watermarks_applied': 0,
-            'errors': 0
+            'errors': 0,
+            'overlay_cache_hits': 0,    # Overlays PNG ya escalados en la cache del worker
+            'overlay_cache_misses': 0,
+            'text_sprite_hits': 0,      # Texto + contorno ya rasterizados en el worker
+            'text_sprite_misses': 0,
+            'batches': 0,
+            'batch_images': 0,
+            'timeouts': 0               # Imágenes que superaron job_timeout_seconds (se envían sin watermark)
         }
         
         # Cargar configuraciones existentes
@@ -215,19 +236,52 @@ class WatermarkServiceIntegrated:
         logger.info("✅ Watermark Service initialized successfully")
         return True
     
+    def configure_pool(self, max_workers: Optional[int] = None, job_timeout_seconds: Optional[float] = None,
+                       enabled: Optional[bool] = None):
+        """Ajustar el pool de watermarks (el tamaño sólo cambia antes de arrancarlo)"""
+        self.pool.configure(max_workers=max_workers, enabled=enabled)
+        if job_timeout_seconds is not None:
+            self.job_timeout_seconds = job_timeout_seconds
+    
+    def set_composite_backend(self, backend: str) -> str:
+        """
+        Elegir cómo se componen los overlays en los workers
+        
+        'pillow' (por defecto) o 'numpy' (LUTs de alfa). Sin NumPy instalado
+        se queda en 'pillow'. Devuelve el backend efectivo.
+        """
+        if backend not in COMPOSITE_BACKENDS:
+            raise ValueError(f"Unknown composite backend: {backend} (expected one of {COMPOSITE_BACKENDS})")
+        if backend == 'numpy' and not NUMPY_AVAILABLE:
+            logger.warning("⚠️ NumPy not installed, watermark compositing stays on Pillow")
+            backend = 'pillow'
+        self.composite_backend = backend
+        return backend
+    
+    def start(self) -> bool:
+        """Arrancar el pool de procesos (si no, arranca con la primera imagen)"""
+        return self.pool.start()
+    
+    def shutdown(self, wait: bool = True):
+        """Parar el pool de procesos"""
+        self.pool.shutdown(wait=wait)
+    
     # ============ MÉTODOS PRINCIPALES - EXACTA COMPATIBILIDAD ============
     
     async def apply_image_watermark(
         self, 
-        image_bytes: bytes, 
+        image_bytes: MediaSource, 
         config: Optional[Union[Dict[str, Any], int]] = None
-    ) -> Tuple[bytes, bool]:
+    ) -> Tuple[MediaSource, bool]:
         """
         ✨ MÉTODO CRÍTICO - EXACTA COMPATIBILIDAD CON ENHANCED_REPLICATOR_SERVICE
         
         ESTE MÉTODO ES LLAMADO ASÍ:
         processed_bytes, was_processed = await self.watermark_service.apply_image_watermark(image_bytes, chat_id)
         
+        Acepta bytes o un MediaBuffer; si no se aplica watermark se devuelve
+        el mismo objeto recibido (sin copias).
+        
         Returns:
             Tuple[bytes, bool]: (processed_image_bytes, was_watermark_applied)
         """
@@ -263,9 +317,9 @@ class WatermarkServiceIntegrated:
     
     async def process_image(
         self, 
-        image_bytes: bytes, 
+        image_bytes: MediaSource, 
         group_id: int
-    ) -> Tuple[bytes, bool]:
+    ) -> Tuple[MediaSource, bool]:
         """
         Procesar imagen con watermarks completos
         
@@ -275,71 +329,98 @@ class WatermarkServiceIntegrated:
         start_time = datetime.now()
         
         try:
-            # Obtener configuración
-            config = self.get_group_config(group_id)
-            if not config or not config.enabled:
-                return image_bytes, False
-            
-            # Cargar imagen
-            try:
-                image = Image.open(io.BytesIO(image_bytes))
-                if image.mode != 'RGBA':
-                    image = image.convert('RGBA')
-            except Exception as e:
-                logger.error(f"❌ Error loading image: {e}")
+            render_config = self._render_config(group_id)
+            if render_config is None:
                 return image_bytes, False
             
-            # Variable para trackear si se aplicó algún watermark
-            watermark_applied = False
-            
-            # PNG Watermark
-            if config.watermark_type in [WatermarkType.PNG, WatermarkType.BOTH]:
-                if config.png_enabled and config.png_path:
-                    original_image = image.copy()
-                    image = await self._apply_png_watermark(image, config)
-                    # Verificar si cambió la imagen
-                    if image != original_image:
-                        watermark_applied = True
-            
-            # Text Watermark
-            if config.watermark_type in [WatermarkType.TEXT, WatermarkType.BOTH]:
-                if config.text_enabled and config.text_content:
-                    original_image = image.copy()
-                    image = await self._apply_text_watermark(image, config)
-                    # Verificar si cambió la imagen
-                    if image != original_image:
-                        watermark_applied = True
-            
-            # Si no se aplicó ningún watermark, retornar original
-            if not watermark_applied:
-                return image_bytes, False
-            
-            # Convertir de vuelta a bytes
-            output = io.BytesIO()
-            
-            # Optimizar formato de salida
-            if image.mode == "RGBA":
-                # Crear background blanco y componer
-                background = Image.new("RGB", image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[-1])
-                background.save(output, format="JPEG", quality=85, optimize=True)
-            else:
-                image.save(output, format="JPEG", quality=85, optimize=True)
-            
-            processed_bytes = output.getvalue()
-            
-            # Estadísticas
-            processing_time = (datetime.now() - start_time).total_seconds()
-            self.stats['images_processed'] += 1
-            
-            logger.debug(f"🖼️ Image processed for group {group_id} in {processing_time:.2f}s")
-            return processed_bytes, True
+            processed_bytes, was_processed = await self._render(image_bytes, render_config)
+            if was_processed:
+                processing_time = (datetime.now() - start_time).total_seconds()
+                logger.debug(f"🖼️ Image processed for group {group_id} in {processing_time:.2f}s")
+            return processed_bytes, was_processed
             
         except Exception as e:
             logger.error(f"❌ Error processing image for group {group_id}: {e}")
             self.stats['errors'] += 1
             return image_bytes, False
     
+    async def apply_image_watermark_batch(
+        self,
+        images: Sequence[MediaSource],
+        config: Optional[Union[Dict[str, Any], int]] = None
+    ) -> List[Tuple[MediaSource, bool]]:
+        """
+        Watermark de varias imágenes del mismo grupo (álbumes, backfill)
+        
+        Todas se encolan a la vez en el pool, así que se reparten entre los
+        núcleos y una imagen lenta no retrasa a las demás. Cada imagen tiene
+        su propio timeout; la que falla o lo supera vuelve sin watermark.
+        
+        Returns:
+            List[Tuple[bytes, bool]]: un resultado por imagen, en el mismo orden
+        """
+        group_id = self._extract_group_id(config)
+        render_config = self._render_config(group_id) if group_id is not None else None
+        if render_config is None:
+            return [(image, False) for image in images]
+        
+        start_time = datetime.now()
+        results = await asyncio.gather(*(self._render(image, render_config) for image in images))
+        
+        applied = sum(1 for _, was_processed in results if was_processed)
+        self.stats['batches'] += 1
+        self.stats['batch_images'] += len(images)
+        self.stats['watermarks_applied'] += applied
+        logger.debug(
+            f"🎨 Batch of {len(images)} images for group {group_id}: {applied} watermarked "
+            f"in {(datetime.now() - start_time).total_seconds():.2f}s"
+        )
+        return list(results)
+    
+    def _render_config(self, group_id: int) -> Optional[Dict[str, Any]]:
+        """Config para el worker; la huella versiona sus caches de overlays"""
+        config = self.get_group_config(group_id)
+        if not config or not config.enabled:
+            return None
+        render_config = config.to_dict()
+        render_config['version'] = self.get_config_fingerprint(group_id)
+        render_config['composite_backend'] = self.composite_backend
+        return render_config
+    
+    async def _render(self, image_bytes: MediaSource, render_config: Dict[str, Any]) -> Tuple[MediaSource, bool]:
+        """
+        Decodificar, aplicar watermarks y codificar en el pool, con timeout por imagen
+        
+        ``job_timeout_seconds`` cuenta desde que se pide el trabajo, así que
+        incluye la espera en la cola del pool (acotada por su limiter). Un
+        render ya en un worker no se interrumpe: el pool libera su memoria
+        compartida y su plaza cuando termina.
+        """
+        try:
+            rendered = await asyncio.wait_for(
+                self.pool.run(render_watermark, image_bytes, render_config, str(self.watermarks_dir)),
+                timeout=self.job_timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            logger.warning(f"⏱️ Watermark render timed out after {self.job_timeout_seconds}s, sending original")
+            return image_bytes, False
+        except Exception as e:
+            logger.error(f"❌ Error rendering watermark: {e}")
+            return image_bytes, False
+        
+        if rendered.overlay_cache_hit is not None:
+            self.stats['overlay_cache_hits' if rendered.overlay_cache_hit else 'overlay_cache_misses'] += 1
+        if rendered.text_sprite_hit is not None:
+            self.stats['text_sprite_hits' if rendered.text_sprite_hit else 'text_sprite_misses'] += 1
+        
+        # Si no se aplicó ningún watermark, retornar original
+        if rendered.data is None:
+            return image_bytes, False
+        
+        self.stats['images_processed'] += 1
+        return rendered.data, True
+    
     async def process_text(
         self, 
         text: str, 
@@ -453,6 +534,32 @@ class WatermarkServiceIntegrated:
         """Obtener todas las configuraciones"""
         return self.configs.copy()
     
+    def get_config_fingerprint(self, group_id: int) -> str:
+        """
+        Versión de la configuración efectiva de un grupo
+        
+        Grupos con la misma configuración visual comparten huella (no entra
+        el group_id ni los timestamps), así el media procesado para uno sirve
+        para los demás. Cambia si cambia la configuración o el PNG en disco.
+        """
+        config = self.get_group_config(group_id)
+        if not config or not config.enabled or config.watermark_type == WatermarkType.NONE:
+            return "none"
+        
+        data = config.to_dict()
+        for key in ('group_id', 'created_at', 'updated_at'):
+            data.pop(key, None)
+        
+        if config.png_enabled and config.png_path:
+            try:
+                png_stat = (self.watermarks_dir / config.png_path).stat()
+                data['png_version'] = [png_stat.st_size, png_stat.st_mtime_ns]
+            except OSError:
+                data['png_version'] = None
+        
+        payload = json.dumps(data, sort_keys=True, default=str).encode()
+        return hashlib.sha1(payload).hexdigest()[:16]
+    
     # ============ MÉTODOS PRIVADOS ============
     
     def _extract_group_id(self, config: Optional[Union[Dict[str, Any], int]]) -> Optional[int]:
@@ -469,164 +576,6 @@ class WatermarkServiceIntegrated:
         logger.warning(f"Unknown config type: {type(config)}")
         return None
     
-    async def _apply_png_watermark(self, image: Image.Image, config: WatermarkConfig) -> Image.Image:
-        """Aplicar watermark PNG a imagen"""
-        try:
-            # Cargar PNG watermark
-            png_watermark = await self._load_png_watermark(config.png_path)
-            if not png_watermark:
-                logger.debug(f"PNG watermark not found: {config.png_path}")
-                return image
-            
-            # Calcular dimensiones
-            img_width, img_height = image.size
-            watermark_width = int(img_width * config.png_scale)
-            watermark_height = int(png_watermark.size[1] * (watermark_width / png_watermark.size[0]))
-            
-            # Redimensionar watermark
-            watermark_resized = png_watermark.resize(
-                (watermark_width, watermark_height), 
-                Image.Resampling.LANCZOS
-            )
-            
-            # Aplicar opacidad
-            if config.png_opacity < 1.0:
-                if watermark_resized.mode != "RGBA":
-                    watermark_resized = watermark_resized.convert("RGBA")
-                
-                alpha = watermark_resized.split()[-1]
-                alpha = alpha.point(lambda x: int(x * config.png_opacity))
-                watermark_resized.putalpha(alpha)
-            
-            # Calcular posición
-            x, y = self._calculate_position(
-                image.size,
-                watermark_resized.size,
-                config.png_position,
-                config.png_custom_x,
-                config.png_custom_y
-            )
-            
-            # Aplicar watermark
-            if watermark_resized.mode == "RGBA":
-                image.paste(watermark_resized, (x, y), watermark_resized)
-            else:
-                image.paste(watermark_resized, (x, y))
-            
-            logger.debug(f"PNG watermark applied successfully")
-            return image
-            
-        except Exception as e:
-            logger.error(f"❌ Error applying PNG watermark: {e}")
-            return image
-    
-    async def _apply_text_watermark(self, image: Image.Image, config: WatermarkConfig) -> Image.Image:
-        """Aplicar watermark de texto a imagen"""
-        try:
-            draw = ImageDraw.Draw(image)
-            
-            # Cargar fuente
-            try:
-                font = ImageFont.truetype("arial.ttf", config.text_font_size)
-            except:
-                try:
-                    font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", config.text_font_size)
-                except:
-                    font = ImageFont.load_default()
-            
-            # Calcular tamaño del texto
-            try:
-                bbox = draw.textbbox((0, 0), config.text_content, font=font)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-            except:
-                # Fallback para versiones más antiguas de PIL
-                text_width, text_height = draw.textsize(config.text_content, font=font)
-            
-            # Calcular posición
-            x, y = self._calculate_position(
-                image.size,
-                (text_width, text_height),
-                config.text_position,
-                config.text_custom_x,
-                config.text_custom_y
-            )
-            
-            # Aplicar stroke si está configurado
-            if config.text_stroke_width > 0:
-                for adj_x in range(-config.text_stroke_width, config.text_stroke_width + 1):
-                    for adj_y in range(-config.text_stroke_width, config.text_stroke_width + 1):
-                        if adj_x != 0 or adj_y != 0:
-                            draw.text(
-                                (x + adj_x, y + adj_y),
-                                config.text_content,
-                                font=font,
-                                fill=config.text_stroke_color
-                            )
-            
-            # Texto principal
-            draw.text((x, y), config.text_content, font=font, fill=config.text_color)
-            
-            logger.debug(f"Text watermark applied successfully")
-            return image
-            
-        except Exception as e:
-            logger.error(f"❌ Error applying text watermark: {e}")
-            return image
-    
-    async def _load_png_watermark(self, png_path: str) -> Optional[Image.Image]:
-        """Cargar PNG watermark con cache"""
-        if not png_path:
-            return None
-        
-        # Verificar cache
-        if png_path in self.png_cache:
-            return self.png_cache[png_path]
-        
-        try:
-            # Cargar desde archivo
-            full_path = self.watermarks_dir / png_path
-            if not full_path.exists():
-                logger.warning(f"⚠️ PNG watermark not found: {full_path}")
-                return None
-            
-            png_image = Image.open(full_path).convert("RGBA")
-            
-            # Guardar en cache
-            self.png_cache[png_path] = png_image
-            
-            logger.debug(f"PNG watermark loaded: {png_path}")
-            return png_image
-            
-        except Exception as e:
-            logger.error(f"❌ Error loading PNG watermark {png_path}: {e}")
-            return None
-    
-    def _calculate_position(
-        self, 
-        image_size: Tuple[int, int],
-        watermark_size: Tuple[int, int],
-        position: Position,
-        custom_x: int = 0,
-        custom_y: int = 0
-    ) -> Tuple[int, int]:
-        """Calcular posición del watermark"""
-        img_width, img_height = image_size
-        wm_width, wm_height = watermark_size
-        
-        margin = 20
-        
-        position_map = {
-            Position.TOP_LEFT: (margin, margin),
-            Position.TOP_RIGHT: (img_width - wm_width - margin, margin),
-            Position.BOTTOM_LEFT: (margin, img_height - wm_height - margin),
-            Position.BOTTOM_RIGHT: (img_width - wm_width - margin, img_height - wm_height - margin),
-            Position.CENTER: ((img_width - wm_width) // 2, (img_height - wm_height) // 2),
-            Position.CUSTOM: (custom_x, custom_y)
-        }
-        
-        return position_map.get(position, position_map[Position.BOTTOM_RIGHT])
-    
     def _load_configurations(self):
         """Cargar configuraciones desde disco"""
         try:
@@ -664,17 +613,23 @@ class WatermarkServiceIntegrated:
     
     def get_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas del servicio"""
-        return self.stats.copy()
+        overlay_lookups = self.stats['overlay_cache_hits'] + self.stats['overlay_cache_misses']
+        pool_stats = self.pool.get_stats()
+        render_stats = pool_stats['kernels'].get('render_watermark', {})
+        avg_wall_ms = render_stats.get('avg_wall_ms', 0.0)
+        return {
+            **self.stats,
+            'overlay_cache_hit_ratio': self.stats['overlay_cache_hits'] / overlay_lookups if overlay_lookups else 0.0,
+            'overlay_cache_max_mb_per_worker': OVERLAY_CACHE_MAX_BYTES / (1024 * 1024),
+            # Un worker ocupa un núcleo: imágenes por segundo de worker ocupado
+            'images_per_second_per_core': 1000 / avg_wall_ms if avg_wall_ms else 0.0,
+            'composite_backend': self.composite_backend,
+            'pool': pool_stats
+        }
     
     def reset_stats(self):
         """Resetear estadísticas"""
-        self.stats = {
-            'images_processed': 0,
-            'videos_processed': 0,
-            'text_processed': 0,
-            'watermarks_applied': 0,
-            'errors': 0
-        }
+        self.stats = {key: 0 for key in self.stats}
         logger.info("📊 Statistics reset")
 
 
@@ -0,0 +1,85 @@
+"""
+Webhook Pool - Several webhooks of one Discord channel as one destination
+=========================================================================
+Archivo: app/services/webhook_pool.py
+
+🔁 Multiplica el throughput por canal: cada webhook tiene su propio bucket
+✅ Reparto round-robin ponderado por los tokens libres de cada webhook
+✅ Si todos están agotados se elige el que se libera antes
+✅ Utilización por webhook para ``get_stats``
+"""
+
+import hashlib
+from typing import Any, Dict, List, Sequence
+
+
+def webhook_label(webhook_url: str) -> str:
+    """Identificador corto para logs y métricas (nunca la URL completa)"""
+    return "webhook-" + hashlib.sha1(webhook_url.encode()).hexdigest()[:8]
+
+
+class WebhookPool:
+    """
+    🔁 POOL DE WEBHOOKS DE UN MISMO CANAL
+    =====================================
+
+    La URL "lógica" (la que usan rutas y callers) es el primer miembro.
+    ``select()`` elige un miembro por request con *smooth weighted
+    round-robin*: el peso de cada webhook es su número de tokens libres, así
+    que los que tienen más margen reciben más tráfico sin que ninguno quede
+    sin usar. El orden por chat no se ve afectado: el dispatcher envía los
+    mensajes de un chat de uno en uno y cada envío espera su respuesta.
+    """
+
+    MAX_WEIGHT = 1000.0  # Rutas sin límite conocido no acaparan el pool
+
+    def __init__(self, webhook_url: str, members: Sequence[str] = (), name: str = ""):
+        self.urls: List[str] = [webhook_url] + [url for url in members if url and url != webhook_url]
+        self.name = name or webhook_label(webhook_url)
+        self._current = [0.0] * len(self.urls)
+        self.member_stats: Dict[str, Dict[str, int]] = {
+            url: {'requests': 0, 'succeeded': 0, 'failed': 0, 'rate_limited': 0} for url in self.urls
+        }
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def select(self, limiter) -> str:
+        """Elegir el webhook para el próximo request según los tokens libres"""
+        weights = [min(limiter.available_tokens(url), self.MAX_WEIGHT) for url in self.urls]
+        total = sum(weights)
+
+        if total <= 0:
+            return min(self.urls, key=limiter.seconds_until_available)
+
+        for index, weight in enumerate(weights):
+            self._current[index] += weight
+        chosen = max(range(len(self.urls)), key=lambda index: self._current[index])
+        self._current[chosen] -= total
+        return self.urls[chosen]
+
+    def record(self, webhook_url: str, status: int):
+        """Contabilizar el resultado de un request hecho con ``webhook_url``"""
+        stats = self.member_stats.get(webhook_url)
+        if stats is None:
+            return
+        stats['requests'] += 1
+        if status in (200, 204):
+            stats['succeeded'] += 1
+        elif status == 429:
+            stats['rate_limited'] += 1
+        else:
+            stats['failed'] += 1
+
+    def get_stats(self, limiter=None) -> Dict[str, Any]:
+        total = sum(stats['requests'] for stats in self.member_stats.values())
+        members = {}
+        for url, stats in self.member_stats.items():
+            member = {
+                **stats,
+                'share': stats['requests'] / total * 100 if total else 0.0
+            }
+            if limiter is not None:
+                member['available_tokens'] = limiter.available_tokens(url)
+            members[webhook_label(url)] = member
+        return {'name': self.name, 'size': len(self.urls), 'requests': total, 'members': members}
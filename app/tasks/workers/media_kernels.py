@@ -0,0 +1,316 @@
+"""
+Media Kernels - CPU-bound media work for the compute process pool
+=================================================================
+Archivo: app/tasks/workers/media_kernels.py
+
+⚙️ Funciones síncronas y puras que corren dentro de los procesos worker
+✅ Módulo liviano: sólo depende de Pillow / PyMuPDF (arranque rápido del worker)
+✅ Entradas y salidas grandes viajan por memoria compartida, no por el pipe
+✅ Cada job mide su tiempo en cola y su tiempo de CPU
+"""
+
+import io
+import math
+import time
+from dataclasses import dataclass, is_dataclass, replace
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+try:
+    import fitz  # PyMuPDF
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
+
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+@dataclass(frozen=True)
+class SharedBlock:
+    """Referencia a un bloque de memoria compartida (nombre + tamaño útil)"""
+    name: str
+    size: int
+
+
+@dataclass
+class JobResult:
+    """Resultado de un job con sus tiempos medidos en el worker"""
+    value: Any
+    started_at: float       # time.time() al empezar en el worker
+    cpu_time: float         # Segundos de CPU del proceso worker
+    wall_time: float        # Segundos de reloj dentro del worker
+
+
+@dataclass
+class EncodedImage:
+    """Imagen recodificada por ``compress_to_fit`` y cómo se llegó a ella"""
+    data: Union[bytes, SharedBlock]
+    format: str                 # 'JPEG' o 'WEBP'
+    quality: int
+    scale: float                # Lado final / lado original
+    size: Tuple[int, int]
+    iterations: int             # Codificaciones completas realizadas
+    encode_seconds: float
+    fits: bool                  # len(data) <= target_bytes
+
+    @property
+    def extension(self) -> str:
+        return 'webp' if self.format == 'WEBP' else 'jpg'
+
+
+def write_shared(data: BytesLike) -> SharedBlock:
+    """Copiar ``data`` a un bloque nuevo de memoria compartida (lo libera quien lo lee)"""
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    try:
+        shm.buf[:len(data)] = data
+        return SharedBlock(shm.name, len(data))
+    finally:
+        shm.close()
+
+
+def _has_bytes_data(value: Any) -> bool:
+    return is_dataclass(value) and isinstance(getattr(value, 'data', None), (bytes, bytearray))
+
+
+def run_job(kernel: Callable[..., Any], payload: Union[BytesLike, SharedBlock], args: Tuple,
+            submitted_at: float, shm_threshold: int) -> JobResult:
+    """
+    Punto de entrada en el worker
+
+    Resuelve la entrada (bytes o ``SharedBlock``), ejecuta el kernel y, si
+    el resultado son bytes grandes, lo devuelve por memoria compartida.
+    """
+    started_at = time.time()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    shm = None
+    view = None
+    try:
+        if isinstance(payload, SharedBlock):
+            shm = shared_memory.SharedMemory(name=payload.name)
+            view = shm.buf[:payload.size]
+            value = kernel(view, *args)
+        else:
+            value = kernel(payload, *args)
+    finally:
+        if view is not None:
+            view.release()
+        if shm is not None:
+            shm.close()
+
+    if isinstance(value, (bytes, bytearray)) and len(value) >= shm_threshold:
+        value = write_shared(value)
+    elif _has_bytes_data(value) and len(value.data) >= shm_threshold:
+        # Resultados estructurados (EncodedImage, RenderedWatermark...): sólo viaja ``data``
+        value = replace(value, data=write_shared(value.data))
+
+    return JobResult(
+        value=value,
+        started_at=started_at,
+        cpu_time=time.process_time() - cpu_start,
+        wall_time=time.perf_counter() - wall_start
+    )
+
+
+# ============== KERNELS ==============
+
+def _flatten_to_rgb(img: 'Image.Image') -> 'Image.Image':
+    """Componer sobre fondo blanco las imágenes con transparencia (JPEG no admite alpha)"""
+    if img.mode == 'P':
+        img = img.convert('RGBA')
+    if img.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def compress_image(data: BytesLike, max_size: Optional[Tuple[int, int]] = (1920, 1080),
+                   quality: int = 75, optimize: bool = True) -> bytes:
+    """Reducir a ``max_size`` (LANCZOS, None = sin redimensionar) y recodificar como JPEG"""
+    img = Image.open(io.BytesIO(data))
+    if max_size and (img.size[0] > max_size[0] or img.size[1] > max_size[1]):
+        img.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+    _flatten_to_rgb(img).save(output, format='JPEG', quality=quality, optimize=optimize)
+    return output.getvalue()
+
+
+# Bits por píxel de JPEG (4:2:0, optimize) para una foto típica, por calidad.
+# Es sólo el punto de partida: el primer encode real calibra el modelo.
+_JPEG_BPP = ((30, 0.6), (40, 0.75), (50, 0.9), (60, 1.05), (70, 1.3), (75, 1.5),
+             (80, 1.75), (85, 2.1), (90, 2.8), (95, 4.2))
+_WEBP_BPP_RATIO = 0.7
+_REFERENCE_ENTROPY = 7.5    # Entropía (bits) del histograma de luminancia de esa foto típica
+
+
+def _bpp_for_quality(quality: int) -> float:
+    """Interpolación lineal sobre ``_JPEG_BPP``"""
+    points = _JPEG_BPP
+    if quality <= points[0][0]:
+        return points[0][1]
+    for (q0, b0), (q1, b1) in zip(points, points[1:]):
+        if quality <= q1:
+            return b0 + (b1 - b0) * (quality - q0) / (q1 - q0)
+    return points[-1][1]
+
+
+def _image_entropy(data: BytesLike) -> float:
+    """Entropía de luminancia sobre una miniatura (decodificada en draft mode si es JPEG)"""
+    probe = Image.open(io.BytesIO(data))
+    probe.draft('RGB', (256, 256))
+    probe = _flatten_to_rgb(probe)
+    probe.thumbnail((256, 256))
+    return max(0.5, probe.convert('L').entropy())
+
+
+def compress_to_fit(data: BytesLike, target_bytes: int, fmt: str = 'JPEG',
+                    min_quality: int = 40, max_quality: int = 90,
+                    max_size: Optional[Tuple[int, int]] = None,
+                    max_iterations: int = 6, tolerance: float = 0.08) -> EncodedImage:
+    """
+    Recodificar para quedar justo por debajo de ``target_bytes``
+
+    1. Predicción: bits/píxel según calidad (tabla) × entropía de la imagen
+       → la mayor calidad que cabe a escala 1; si ni ``min_quality`` cabe,
+       se fija calidad 75 y se reduce la escala.
+    2. Refinamiento: cada encode real corrige el factor del modelo y acota
+       la calidad (búsqueda acotada entre los límites ya probados) hasta
+       caer en ``[target·(1-tolerance), target]`` o agotar ``max_iterations``.
+
+    Las reducciones grandes de un JPEG se decodifican en draft mode (DCT a
+    1/2, 1/4 u 1/8) antes del LANCZOS final.
+    """
+    started = time.perf_counter()
+    fmt = 'WEBP' if fmt.upper() == 'WEBP' else 'JPEG'
+    source = Image.open(io.BytesIO(data))
+    width, height = source.size
+    pixels = width * height
+
+    max_scale = 1.0
+    if max_size:
+        max_scale = min(1.0, max_size[0] / width, max_size[1] / height)
+
+    factor = _image_entropy(data) / _REFERENCE_ENTROPY
+    if fmt == 'WEBP':
+        factor *= _WEBP_BPP_RATIO
+    aim = target_bytes * (1 - tolerance / 2)
+
+    def predict(quality: int, scale: float) -> float:
+        return _bpp_for_quality(quality) * factor * pixels * scale * scale / 8
+
+    def plan(low: int, high: int, scale: float) -> Tuple[int, float]:
+        """Mayor calidad en [low, high] que el modelo hace caber; si no, reducir escala"""
+        for quality in range(high, low - 1, -1):
+            if predict(quality, scale) <= aim:
+                return quality, scale
+        quality = max(low, min(high, 75))
+        return quality, min(scale, scale * math.sqrt(aim / predict(quality, scale)))
+
+    scaled_cache: Dict[float, 'Image.Image'] = {}
+
+    def scaled(scale: float) -> 'Image.Image':
+        key = round(scale, 4)
+        if key not in scaled_cache:
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            img = Image.open(io.BytesIO(data))
+            if scale < 1.0:
+                img.draft('RGB', size)  # Sólo actúa en JPEG: decodifica ya reducido
+            img = _flatten_to_rgb(img)
+            if img.size != size:
+                img = img.resize(size, Image.Resampling.LANCZOS)
+            scaled_cache.clear()  # Una escala viva a la vez
+            scaled_cache[key] = img
+        return scaled_cache[key]
+
+    def encode(quality: int, scale: float) -> bytes:
+        output = io.BytesIO()
+        if fmt == 'WEBP':
+            scaled(scale).save(output, format='WEBP', quality=quality, method=4)
+        else:
+            scaled(scale).save(output, format='JPEG', quality=quality, optimize=True)
+        return output.getvalue()
+
+    low, high = min_quality, max_quality
+    quality, scale = plan(low, high, max_scale)
+    best: Optional[Tuple[bytes, int, float]] = None
+    last: Tuple[bytes, int, float] = (b"", quality, scale)
+    under: Optional[Tuple[int, int]] = None   # (calidad, bytes) que cabe, a la escala actual
+    over: Optional[Tuple[int, int]] = None    # (calidad, bytes) que no cabe
+    iterations = 0
+
+    while iterations < max_iterations:
+        encoded = encode(quality, scale)
+        iterations += 1
+        last = (encoded, quality, scale)
+        size = len(encoded)
+
+        if size <= target_bytes:
+            if best is None or (scale, quality) > (best[2], best[1]):
+                best = last
+            if size >= target_bytes * (1 - tolerance):
+                break
+            low, under = quality + 1, (quality, size)
+        else:
+            high, over = quality - 1, (quality, size)
+
+        # El tamaño real recalibra el modelo para la próxima predicción
+        factor *= size / predict(quality, scale)
+
+        if low > high:
+            if best is not None:
+                break
+            # Ni la calidad mínima cabe a esta escala: bajar escala y reabrir el rango
+            quality, scale = plan(min_quality, max_quality, scale * math.sqrt(aim / size) * 0.97)
+            low, high, under, over = min_quality, max_quality, None, None
+            continue
+
+        if under and over:
+            # Acotada por ambos lados: interpolar log(tamaño) entre las dos calidades medidas
+            (q0, s0), (q1, s1) = under, over
+            guess = q0 + (math.log(aim) - math.log(s0)) / (math.log(s1) - math.log(s0)) * (q1 - q0)
+            quality = max(low, min(high, int(guess)))
+            continue
+
+        next_quality, next_scale = plan(low, high, scale)
+        if best is None and next_scale < scale * 0.95:
+            # El modelo calibrado pide menos resolución
+            quality, scale = next_quality, next_scale
+            low, high, under, over = min_quality, max_quality, None, None
+        else:
+            quality = next_quality if next_scale == scale else low
+
+    encoded, quality, scale = best or last
+    final = (max(1, int(width * scale)), max(1, int(height * scale))) if scale < 1.0 else (width, height)
+    return EncodedImage(
+        data=encoded,
+        format=fmt,
+        quality=quality,
+        scale=scale,
+        size=final,
+        iterations=iterations,
+        encode_seconds=time.perf_counter() - started,
+        fits=len(encoded) <= target_bytes
+    )
+
+
+def pdf_page_count(data: BytesLike) -> int:
+    """Número de páginas de un PDF (0 si no se puede abrir)"""
+    if not PYMUPDF_AVAILABLE:
+        return 0
+    try:
+        with fitz.open(stream=bytes(data), filetype="pdf") as pdf:
+            return len(pdf)
+    except Exception:
+        return 0
@@ -0,0 +1,533 @@
+"""
+Watermark Renderer - Pillow watermark rendering for the compute process pool
+============================================================================
+Archivo: app/tasks/workers/watermark_renderer.py
+
+🎨 Render síncrono de watermarks PNG + texto
+✅ Corre dentro de los procesos worker de MediaComputeExecutor
+✅ Recibe la configuración como dict (WatermarkConfig.to_dict())
+✅ Cache de PNGs por proceso worker
+✅ Cache LRU de overlays listos para componer (escala + opacidad ya aplicadas)
+✅ Texto + contorno renderizados una vez en un sprite (stroke nativo de Pillow)
+✅ Pipeline de etapas sobre un único buffer: cada etapa dice si se aplicó
+✅ Posición ``tiled``: patrón repetido en toda la imagen, máscara cacheada
+   por overlay y tamaño redondeado
+✅ Backends de composición: Pillow (por defecto) o NumPy con LUTs de alfa
+"""
+
+import io
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from PIL import Image, ImageDraw, ImageFont
+
+from app.tasks.workers.media_kernels import SharedBlock
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+# Cache por proceso: (ruta, mtime) -> PNG en RGBA
+_png_cache: Dict[Tuple[str, int], Image.Image] = {}
+
+# Cache por proceso: (versión de config, ruta, mtime, ancho) -> overlay RGBA listo
+_overlay_cache: "OrderedDict[Tuple[Any, ...], Image.Image]" = OrderedDict()
+_overlay_cache_bytes = 0
+
+# Cache por proceso: (texto, fuente, colores, contorno) -> sprite RGBA + offset del origen
+_text_sprite_cache: "OrderedDict[Tuple[Any, ...], TextSprite]" = OrderedDict()
+
+# Cache por proceso: (id del overlay, backend, ancho, alto redondeados) -> (overlay, TileMask)
+_tile_cache: "OrderedDict[Tuple[Any, ...], Tuple[Image.Image, TileMask]]" = OrderedDict()
+_tile_cache_bytes = 0
+
+# Cache por proceso: id del overlay -> (overlay, BlendLayer) para el backend NumPy
+_blend_cache: "OrderedDict[int, Tuple[Image.Image, BlendLayer]]" = OrderedDict()
+
+MARGIN = 20
+OVERLAY_WIDTH_STEP = 8                      # Anchos de overlay redondeados a múltiplos de 8px
+OVERLAY_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Por proceso worker
+TEXT_SPRITE_CACHE_ENTRIES = 64
+TILE_SIZE_STEP = 256                        # Máscaras de mosaico por tamaño redondeado a 256px
+TILE_CACHE_MAX_BYTES = 64 * 1024 * 1024     # Por proceso worker
+BLEND_CACHE_ENTRIES = 64
+
+COMPOSITE_BACKENDS = ('pillow', 'numpy')
+
+# (a·b + 127) // 255 para todo par uint8: mezcla alfa sin aritmética de 16 bits
+_MULTIPLY_LUT = (
+    ((np.arange(256, dtype=np.uint32)[:, None] * np.arange(256, dtype=np.uint32) + 127) // 255).astype(np.uint8)
+    if NUMPY_AVAILABLE else None
+)
+
+
+@dataclass
+class RenderedWatermark:
+    """Resultado de ``render_watermark``; ``data`` None = no se aplicó ningún watermark"""
+    data: Union[bytes, SharedBlock, None]
+    overlay_cache_hit: Optional[bool] = None    # None = sin watermark PNG
+    text_sprite_hit: Optional[bool] = None      # None = sin watermark de texto
+    stages: Tuple[str, ...] = ()                # Etapas aplicadas, en orden
+
+
+@dataclass(frozen=True)
+class StageResult:
+    """Lo que informa cada etapa del pipeline (sin comparar buffers)"""
+    applied: bool
+    cache_hit: Optional[bool] = None
+
+
+@dataclass(frozen=True)
+class TextSprite:
+    """Texto con contorno ya rasterizado; ``offset`` = esquina del sprite respecto al origen del texto"""
+    image: Image.Image
+    offset: Tuple[int, int]
+    text_size: Tuple[int, int]      # Caja del texto sin contorno (para posicionar)
+
+
+@dataclass(frozen=True)
+class BlendLayer:
+    """Overlay preparado para NumPy: color premultiplicado por su alfa y alfa inversa"""
+    premultiplied: Any      # H×W×3 uint8
+    inverse_alpha: Any      # H×W uint8
+
+
+@dataclass(frozen=True)
+class TileMask:
+    """
+    Mosaico de un overlay para un tamaño redondeado
+
+    Pillow usa ``positions`` (un paste por tesela); NumPy usa sólo los píxeles
+    con alfa > 0 del mosaico completo, en orden de filas, ya premultiplicados.
+    """
+    positions: Tuple[Tuple[int, int], ...]
+    rows: Any = None            # uint32, ordenado
+    cols: Any = None            # uint32
+    premultiplied: Any = None   # N×3 uint8
+    inverse_alpha: Any = None   # N uint8
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.rows, self.cols, self.premultiplied, self.inverse_alpha)
+        return len(self.positions) * 16 + sum(array.nbytes for array in arrays if array is not None)
+
+
+def resolve_backend(config: Dict[str, Any]) -> str:
+    """Backend de composición de la config; sin NumPy instalado siempre Pillow"""
+    backend = config.get('composite_backend', 'pillow')
+    return backend if backend == 'numpy' and NUMPY_AVAILABLE else 'pillow'
+
+
+def calculate_position(image_size: Tuple[int, int], watermark_size: Tuple[int, int],
+                       position: str, custom_x: int = 0, custom_y: int = 0) -> Tuple[int, int]:
+    """Calcular posición del watermark"""
+    img_width, img_height = image_size
+    wm_width, wm_height = watermark_size
+
+    position_map = {
+        'top-left': (MARGIN, MARGIN),
+        'top-right': (img_width - wm_width - MARGIN, MARGIN),
+        'bottom-left': (MARGIN, img_height - wm_height - MARGIN),
+        'bottom-right': (img_width - wm_width - MARGIN, img_height - wm_height - MARGIN),
+        'center': ((img_width - wm_width) // 2, (img_height - wm_height) // 2),
+        'custom': (custom_x, custom_y)
+    }
+
+    return position_map.get(position, position_map['bottom-right'])
+
+
+def composite_at(image: Image.Image, overlay: Image.Image, x: int, y: int, backend: str = 'pillow'):
+    """
+    Componer ``overlay`` (RGBA) en (x, y) sobre ``image`` (RGB o RGBA), in place
+
+    Lo que queda fuera de la imagen se recorta (admite coordenadas negativas).
+    El backend NumPy sólo se usa con destino RGB.
+    """
+    if backend == 'numpy' and image.mode == 'RGB':
+        _composite_numpy(image, overlay, x, y)
+        return
+    if image.mode != 'RGBA':
+        # Destino opaco: paste con la alfa del overlay como máscara es el "over" exacto
+        image.paste(overlay, (x, y), overlay)
+        return
+    if x >= image.width or y >= image.height or x + overlay.width <= 0 or y + overlay.height <= 0:
+        return
+    image.alpha_composite(overlay, dest=(max(0, x), max(0, y)), source=(max(0, -x), max(0, -y)))
+
+
+def _blend_layer(overlay: Image.Image) -> BlendLayer:
+    """Premultiplicado + alfa inversa del overlay, calculados una vez por overlay"""
+    cached = _blend_cache.get(id(overlay))
+    if cached is not None and cached[0] is overlay:
+        _blend_cache.move_to_end(id(overlay))
+        return cached[1]
+
+    pixels = np.asarray(overlay)
+    alpha = pixels[..., 3]
+    layer = BlendLayer(
+        premultiplied=_MULTIPLY_LUT[alpha[..., None], pixels[..., :3]],
+        inverse_alpha=255 - alpha
+    )
+    # El overlay se guarda con la capa: mientras siga en cache su id no se reutiliza
+    _blend_cache[id(overlay)] = (overlay, layer)
+    while len(_blend_cache) > BLEND_CACHE_ENTRIES:
+        _blend_cache.popitem(last=False)
+    return layer
+
+
+def _composite_numpy(image: Image.Image, overlay: Image.Image, x: int, y: int):
+    """Mezcla "over" con LUTs en la región cubierta: premultiplicado + destino × (255 − alfa)"""
+    left, top = max(0, x), max(0, y)
+    right, bottom = min(image.width, x + overlay.width), min(image.height, y + overlay.height)
+    if right <= left or bottom <= top:
+        return
+
+    layer = _blend_layer(overlay)
+    rows, cols = slice(top - y, bottom - y), slice(left - x, right - x)
+    region = np.asarray(image.crop((left, top, right, bottom)))
+    blended = layer.premultiplied[rows, cols] + _MULTIPLY_LUT[layer.inverse_alpha[rows, cols][..., None], region]
+    image.paste(Image.fromarray(blended), (left, top))
+
+
+def _tile_positions(overlay_size: Tuple[int, int], area: Tuple[int, int]) -> Tuple[Tuple[int, int], ...]:
+    """Rejilla desde (MARGIN, MARGIN), con medio overlay de separación horizontal y uno vertical"""
+    width, height = overlay_size
+    step_x, step_y = width + width // 2 + MARGIN, 2 * height + MARGIN
+    return tuple(
+        (x, y) for y in range(MARGIN, area[1], step_y) for x in range(MARGIN, area[0], step_x)
+    )
+
+
+def get_tile_mask(overlay: Image.Image, image_size: Tuple[int, int], backend: str) -> Tuple[TileMask, bool]:
+    """
+    Máscara de mosaico de ``overlay`` para ``image_size``; devuelve ``(mask, hit)``
+
+    Se calcula para el tamaño redondeado hacia arriba a ``TILE_SIZE_STEP``
+    y sirve para toda imagen de ese tamaño: la rejilla parte de la esquina
+    superior izquierda, así que basta con recortarla. Los overlays salen de
+    sus propias caches (una instancia por config), por eso la clave es su id.
+    """
+    global _tile_cache_bytes
+
+    area = tuple(-(-side // TILE_SIZE_STEP) * TILE_SIZE_STEP for side in image_size)
+    key = (id(overlay), backend) + area
+    cached = _tile_cache.get(key)
+    if cached is not None and cached[0] is overlay:
+        _tile_cache.move_to_end(key)
+        return cached[1], True
+
+    positions = _tile_positions(overlay.size, area)
+    if backend == 'numpy':
+        tiled = Image.new('RGBA', area, (0, 0, 0, 0))
+        for position in positions:
+            tiled.paste(overlay, position)
+        pixels = np.asarray(tiled)
+        rows, cols = np.nonzero(pixels[..., 3])
+        alpha = pixels[rows, cols, 3]
+        mask = TileMask(
+            positions=positions,
+            rows=rows.astype(np.uint32),
+            cols=cols.astype(np.uint32),
+            premultiplied=_MULTIPLY_LUT[alpha[:, None], pixels[rows, cols, :3]],
+            inverse_alpha=255 - alpha
+        )
+    else:
+        mask = TileMask(positions=positions)
+
+    _tile_cache[key] = (overlay, mask)
+    _tile_cache_bytes += mask.nbytes
+    while _tile_cache_bytes > TILE_CACHE_MAX_BYTES and len(_tile_cache) > 1:
+        _, (_, evicted) = _tile_cache.popitem(last=False)
+        _tile_cache_bytes -= evicted.nbytes
+    return mask, False
+
+
+def composite_tiled(image: Image.Image, overlay: Image.Image, backend: str = 'pillow') -> bool:
+    """
+    Repetir ``overlay`` por toda ``image`` (in place)
+
+    Pillow: un paste por tesela (sólo toca píxeles de las teselas). NumPy
+    (destino RGB): una única mezcla de los píxeles cubiertos del mosaico.
+
+    Returns:
+        Si la máscara del mosaico salió de la cache
+    """
+    if image.mode != 'RGB':
+        backend = 'pillow'
+    mask, hit = get_tile_mask(overlay, image.size, backend)
+    width, height = image.size
+
+    if backend != 'numpy':
+        for x, y in mask.positions:
+            if x < width and y < height:
+                composite_at(image, overlay, x, y)
+        return hit
+
+    # Filas ordenadas: las que caen dentro de la imagen son un prefijo
+    count = int(np.searchsorted(mask.rows, height))
+    inside = mask.cols[:count] < width
+    index = mask.rows[:count][inside].astype(np.intp) * width + mask.cols[:count][inside]
+    pixels = np.array(image)
+    flat = pixels.reshape(-1, 3)
+    flat[index] = (
+        mask.premultiplied[:count][inside]
+        + _MULTIPLY_LUT[mask.inverse_alpha[:count][inside][:, None], flat[index]]
+    )
+    image.paste(Image.fromarray(pixels))
+    return hit
+
+
+def load_png_watermark(png_path: Path, mtime: Optional[int] = None) -> Optional[Image.Image]:
+    """Cargar PNG watermark con cache (se invalida si cambia el archivo)"""
+    if mtime is None:
+        try:
+            mtime = png_path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    key = (str(png_path), mtime)
+    png = _png_cache.get(key)
+    if png is None:
+        png = Image.open(png_path).convert("RGBA")
+        # Versiones anteriores del mismo archivo ya no se usarán
+        for stale in [cached for cached in _png_cache if cached[0] == key[0]]:
+            del _png_cache[stale]
+        _png_cache[key] = png
+    return png
+
+
+def get_png_overlay(config: Dict[str, Any], watermarks_dir: Path,
+                    image_width: int) -> Tuple[Optional[Image.Image], bool]:
+    """
+    Overlay PNG escalado y con la opacidad aplicada para ``image_width``
+
+    Clave: versión de la config (``config['version']``, la huella del
+    servicio), archivo PNG y ancho del overlay redondeado a
+    ``OVERLAY_WIDTH_STEP``. Devuelve ``(overlay, hit)``; overlay None si no
+    hay PNG o queda sin tamaño.
+    """
+    global _overlay_cache_bytes
+
+    png_path = watermarks_dir / config['png_path']
+    try:
+        mtime = png_path.stat().st_mtime_ns
+    except OSError:
+        return None, False
+
+    target_width = int(image_width * config['png_scale'])
+    if target_width <= 0:
+        return None, False
+    width = max(OVERLAY_WIDTH_STEP, round(target_width / OVERLAY_WIDTH_STEP) * OVERLAY_WIDTH_STEP)
+
+    version = config.get('version') or (config['png_scale'], config['png_opacity'])
+    key = (version, str(png_path), mtime, width)
+    overlay = _overlay_cache.get(key)
+    if overlay is not None:
+        _overlay_cache.move_to_end(key)
+        return overlay, True
+
+    png_watermark = load_png_watermark(png_path, mtime)
+    height = int(png_watermark.size[1] * (width / png_watermark.size[0]))
+    if height <= 0:
+        return None, False
+
+    overlay = png_watermark.resize((width, height), Image.Resampling.LANCZOS)
+    opacity = config['png_opacity']
+    if opacity < 1.0:
+        lut = [int(value * opacity) for value in range(256)]
+        overlay.putalpha(overlay.getchannel('A').point(lut))
+
+    _overlay_cache[key] = overlay
+    _overlay_cache_bytes += width * height * 4
+    while _overlay_cache_bytes > OVERLAY_CACHE_MAX_BYTES and len(_overlay_cache) > 1:
+        _, evicted = _overlay_cache.popitem(last=False)
+        _overlay_cache_bytes -= evicted.width * evicted.height * 4
+    return overlay, False
+
+
+def apply_png_watermark(image: Image.Image, config: Dict[str, Any], watermarks_dir: Path) -> Optional[bool]:
+    """
+    Aplicar watermark PNG sobre ``image`` (RGB o RGBA, in place)
+
+    Returns:
+        None si no se aplicó; si se aplicó, si el overlay salió de la cache
+    """
+    overlay, hit = get_png_overlay(config, watermarks_dir, image.size[0])
+    if overlay is None:
+        return None
+
+    backend = resolve_backend(config)
+    if config['png_position'] == 'tiled':
+        composite_tiled(image, overlay, backend)
+        return hit
+
+    x, y = calculate_position(
+        image.size, overlay.size,
+        config['png_position'], config['png_custom_x'], config['png_custom_y']
+    )
+    composite_at(image, overlay, x, y, backend)
+    return hit
+
+
+@lru_cache(maxsize=32)
+def _load_font(size: int) -> ImageFont.ImageFont:
+    """Fuente por tamaño, cargada una vez por proceso"""
+    for font_name in ("arial.ttf", "/System/Library/Fonts/Helvetica.ttc"):
+        try:
+            return ImageFont.truetype(font_name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def get_text_sprite(config: Dict[str, Any]) -> Tuple[TextSprite, bool]:
+    """
+    Sprite RGBA del texto con su contorno; devuelve ``(sprite, hit)``
+
+    Se rasteriza una sola vez por combinación de texto, tamaño, colores y
+    contorno, con el ``stroke_width`` nativo de Pillow (un único
+    ``draw.text``) en lugar de redibujar el texto desplazado.
+    """
+    text = config['text_content']
+    stroke_width = max(0, config['text_stroke_width'])
+    key = (text, config['text_font_size'], config['text_color'], config['text_stroke_color'], stroke_width)
+    sprite = _text_sprite_cache.get(key)
+    if sprite is not None:
+        _text_sprite_cache.move_to_end(key)
+        return sprite, True
+
+    font = _load_font(config['text_font_size'])
+    probe = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+    text_box = probe.textbbox((0, 0), text, font=font)
+    left, top, right, bottom = probe.textbbox((0, 0), text, font=font, stroke_width=stroke_width)
+
+    image = Image.new('RGBA', (max(1, right - left), max(1, bottom - top)), (0, 0, 0, 0))
+    ImageDraw.Draw(image).text(
+        (-left, -top), text, font=font, fill=config['text_color'],
+        stroke_width=stroke_width, stroke_fill=config['text_stroke_color']
+    )
+    sprite = TextSprite(
+        image=image,
+        offset=(left, top),
+        text_size=(text_box[2] - text_box[0], text_box[3] - text_box[1])
+    )
+
+    _text_sprite_cache[key] = sprite
+    while len(_text_sprite_cache) > TEXT_SPRITE_CACHE_ENTRIES:
+        _text_sprite_cache.popitem(last=False)
+    return sprite, False
+
+
+def apply_text_watermark(image: Image.Image, config: Dict[str, Any]) -> bool:
+    """
+    Aplicar watermark de texto sobre ``image`` (RGB o RGBA, in place)
+
+    Returns:
+        Si el sprite salió de la cache
+    """
+    sprite, hit = get_text_sprite(config)
+    backend = resolve_backend(config)
+    if config['text_position'] == 'tiled':
+        composite_tiled(image, sprite.image, backend)
+        return hit
+
+    x, y = calculate_position(
+        image.size, sprite.text_size,
+        config['text_position'], config['text_custom_x'], config['text_custom_y']
+    )
+    composite_at(image, sprite.image, x + sprite.offset[0], y + sprite.offset[1], backend)
+    return hit
+
+
+# ============== PIPELINE ==============
+
+def _png_enabled(config: Dict[str, Any]) -> bool:
+    return config['watermark_type'] in ('png', 'both') and config['png_enabled'] and bool(config['png_path'])
+
+
+def _png_stage(image: Image.Image, config: Dict[str, Any], watermarks_dir: Path) -> StageResult:
+    hit = apply_png_watermark(image, config, watermarks_dir)
+    return StageResult(hit is not None, hit)
+
+
+def _text_enabled(config: Dict[str, Any]) -> bool:
+    return config['watermark_type'] in ('text', 'both') and config['text_enabled'] and bool(config['text_content'])
+
+
+def _text_stage(image: Image.Image, config: Dict[str, Any], watermarks_dir: Path) -> StageResult:
+    return StageResult(True, apply_text_watermark(image, config))
+
+
+@dataclass(frozen=True)
+class WatermarkStage:
+    """Etapa del pipeline: si toca según la config y cómo se aplica (in place)"""
+    name: str
+    enabled: Callable[[Dict[str, Any]], bool]
+    apply: Callable[[Image.Image, Dict[str, Any], Path], StageResult]
+
+
+# Orden de aplicación: el texto queda por encima del PNG
+WATERMARK_STAGES: Tuple[WatermarkStage, ...] = (
+    WatermarkStage('png', _png_enabled, _png_stage),
+    WatermarkStage('text', _text_enabled, _text_stage),
+)
+
+
+def _decode(data: BytesLike) -> Image.Image:
+    """Decodificar a un único buffer: RGB si la imagen es opaca, RGBA si tiene transparencia"""
+    image = Image.open(io.BytesIO(data))
+    has_alpha = 'A' in image.getbands() or (image.mode == 'P' and 'transparency' in image.info)
+    mode = 'RGBA' if has_alpha else 'RGB'
+    if image.mode != mode:
+        image = image.convert(mode)
+    return image
+
+
+def render_watermark(data: BytesLike, config: Dict[str, Any], watermarks_dir: str,
+                     quality: int = 85) -> RenderedWatermark:
+    """
+    Decodificar, aplicar los watermarks de ``config`` y codificar a JPEG
+
+    Las etapas trabajan in place sobre el mismo buffer decodificado y cada
+    una informa de si se aplicó, así que no hace falta copiar la imagen ni
+    compararla con la original. Las fotos opacas no pasan por RGBA: la
+    memoria pico es un frame decodificado más el JPEG de salida.
+
+    Returns:
+        ``RenderedWatermark`` con el JPEG (None si no se aplicó ningún watermark)
+    """
+    stages = [stage for stage in WATERMARK_STAGES if stage.enabled(config)]
+    if not stages:
+        return RenderedWatermark(None)
+
+    image = _decode(data)
+    results = {stage.name: stage.apply(image, config, Path(watermarks_dir)) for stage in stages}
+    applied = tuple(name for name, result in results.items() if result.applied)
+
+    png, text = results.get('png'), results.get('text')
+    rendered = RenderedWatermark(
+        None,
+        overlay_cache_hit=png.cache_hit if png else None,
+        text_sprite_hit=text.cache_hit if text else None,
+        stages=applied
+    )
+    if not applied:
+        return rendered
+
+    if image.mode == 'RGBA':
+        # Transparencia: aplanar sobre fondo blanco (único caso con un segundo frame)
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image)
+        image = background
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality, optimize=True)
+    rendered.data = output.getvalue()
+    return rendered
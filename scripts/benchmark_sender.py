@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+📊 BENCHMARK - DiscordSenderEnhanced contra el emulador local
+=============================================================
+Ejemplos:
+    python scripts/benchmark_sender.py --messages 500 --concurrency 16
+    python scripts/benchmark_sender.py --mix text=1 --coalesce-ms 300
+    python scripts/benchmark_sender.py --error-rate 0.05 --slow-rate 0.02 --json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tools.discord_emulator import EmulatorConfig
+from tools.sender_benchmark import BenchmarkConfig, format_report, run_benchmark
+
+
+def parse_mix(value: str) -> dict:
+    """'text=0.7,image=0.2,album=0.1' → dict de pesos"""
+    mix = {}
+    for item in value.split(','):
+        kind, _, weight = item.partition('=')
+        if kind.strip() not in ('text', 'image', 'album'):
+            raise argparse.ArgumentTypeError(f"Tipo desconocido: {kind}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Benchmark del sender de Discord (emulador local)")
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--chats', type=int, default=4, help="Chats / destinos distintos")
+    parser.add_argument('--pool-size', type=int, default=1, help="Webhooks por destino")
+    parser.add_argument('--mix', type=parse_mix, default=None, help="p.ej. text=0.7,image=0.2,album=0.1")
+    parser.add_argument('--image-kb', type=int, default=256)
+    parser.add_argument('--album-size', type=int, default=4)
+    parser.add_argument('--coalesce-ms', type=float, default=0.0, help="Ventana de coalescing de textos")
+    parser.add_argument('--webhook-limit', type=int, default=5)
+    parser.add_argument('--webhook-window', type=float, default=2.0)
+    parser.add_argument('--channel-limit', type=int, default=30, help="0 = sin límite por canal")
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--slow-rate', type=float, default=0.0)
+    parser.add_argument('--slow-ms', type=float, default=1000.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help="Informe completo en JSON")
+    args = parser.parse_args()
+
+    config = BenchmarkConfig(
+        messages=args.messages,
+        concurrency=args.concurrency,
+        chats=args.chats,
+        pool_size=args.pool_size,
+        image_kb=args.image_kb,
+        album_size=args.album_size,
+        coalesce_window_ms=args.coalesce_ms,
+        seed=args.seed,
+        emulator=EmulatorConfig(
+            webhook_limit=args.webhook_limit,
+            webhook_window=args.webhook_window,
+            channel_limit=args.channel_limit or None,
+            latency_seconds=args.latency_ms / 1000,
+            slow_rate=args.slow_rate,
+            slow_seconds=args.slow_ms / 1000,
+            error_rate=args.error_rate,
+            seed=args.seed
+        )
+    )
+    if args.mix:
+        config.mix = args.mix
+
+    report = asyncio.run(run_benchmark(config))
+    print(json.dumps(report, indent=2, default=str) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
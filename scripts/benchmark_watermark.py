@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+📊 BENCHMARK - Latencia por imagen del watermark
+================================================
+Ejemplos:
+    python scripts/benchmark_watermark.py --images 100
+    python scripts/benchmark_watermark.py --size 3840x2160 --stroke-width 3 --json
+    python scripts/benchmark_watermark.py --compositing --size 3840x2160
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tools.watermark_benchmark import (
+    WatermarkBenchmarkConfig, format_composite_report, format_text_report,
+    run_composite_benchmark, run_text_benchmark
+)
+
+
+def parse_size(value: str) -> tuple:
+    """'1920x1080' → (1920, 1080)"""
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Tamaño inválido: {value}")
+    return width, height
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Benchmark del watermark de texto (antes / después)")
+    parser.add_argument('--compositing', action='store_true',
+                        help="Comparar los backends Pillow y NumPy (posición fija y mosaico)")
+    parser.add_argument('--images', type=int, default=50)
+    parser.add_argument('--size', type=parse_size, default=(1920, 1080), help="p.ej. 1920x1080")
+    parser.add_argument('--text', default="Replicated via Zero Cost")
+    parser.add_argument('--font-size', type=int, default=24)
+    parser.add_argument('--stroke-width', type=int, default=2)
+    parser.add_argument('--json', action='store_true', help="Informe completo en JSON")
+    args = parser.parse_args()
+
+    config = WatermarkBenchmarkConfig(
+        images=args.images,
+        width=args.size[0],
+        height=args.size[1],
+        text=args.text,
+        font_size=args.font_size,
+        stroke_width=args.stroke_width
+    )
+    if args.compositing:
+        report = run_composite_benchmark(config)
+        print(json.dumps(report, indent=2) if args.json else format_composite_report(report))
+        return
+
+    report = run_text_benchmark(config)
+    print(json.dumps(report, indent=2) if args.json else format_text_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from app.services.adaptive_limiter import AdaptiveLimiter
+
+
+@pytest.mark.asyncio
+async def test_limit_grows_while_saturated_and_healthy_then_backs_off_on_overload():
+    limiter = AdaptiveLimiter('test', initial_limit=2, min_limit=1, max_limit=4, cooldown_seconds=0)
+    peak = 0
+
+    async def job(overloaded: bool = False):
+        nonlocal peak
+        async with limiter.slot() as permit:
+            peak = max(peak, limiter.inflight)
+            await asyncio.sleep(0.001)
+            permit.latency = 0.01
+            permit.overloaded = overloaded
+
+    await asyncio.gather(*(job() for _ in range(40)))
+    assert limiter.limit == 4
+    assert peak <= 4 and limiter.stats['waited'] > 0
+
+    await job(overloaded=True)
+    assert limiter.limit == 2  # 4 × 0.7 = 2.8
+    with pytest.raises(asyncio.TimeoutError):
+        async with limiter.slot():
+            raise asyncio.TimeoutError()
+    assert limiter.limit == 1
+    assert limiter.stats['decreases'] == 2 and limiter.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_responses_reduce_and_cancelled_waiters_free_their_slot():
+    limiter = AdaptiveLimiter('test', initial_limit=4, max_limit=8, cooldown_seconds=0)
+    for latency in (0.01, 0.01, 0.01):
+        await limiter.acquire()
+        limiter.release(latency)
+    await limiter.acquire()
+    limiter.release(1.0)  # 100× la latencia base
+    assert limiter.limit == 2 and limiter.stats['slow_samples'] == 1
+
+    await limiter.acquire()
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    limiter.release()
+    limiter.release()
+    assert limiter.inflight == 0 and limiter.get_stats()['waiting'] == 0
@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.album_aggregator import AlbumAggregator
+
+
+def _event(message_id):
+    return SimpleNamespace(message=SimpleNamespace(id=message_id))
+
+
+async def _no_release(chat_id, event):
+    raise AssertionError("no event should be released")
+
+
+@pytest.mark.asyncio
+async def test_parts_sharing_grouped_id_are_flushed_together_after_the_window():
+    flushed = []
+
+    async def on_flush(album):
+        flushed.append(album)
+
+    aggregator = AlbumAggregator(on_flush, _no_release, window_seconds=0.05)
+    for message_id in (3, 1, 2):
+        await aggregator.add(10, 777, _event(message_id))
+    await aggregator.add(10, 888, _event(4))
+
+    await asyncio.sleep(0.15)
+
+    assert [len(album.events) for album in flushed] == [3, 1]
+    assert [m.id for m in flushed[0].messages] == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_full_album_flushes_immediately():
+    flushed = []
+
+    async def on_flush(album):
+        flushed.append(album)
+
+    aggregator = AlbumAggregator(on_flush, _no_release, window_seconds=10, max_items=2)
+    await aggregator.add(10, 777, _event(1))
+    await aggregator.add(10, 777, _event(2))
+
+    assert len(flushed) == 1
+    assert aggregator.pending_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_later_events_of_the_chat_wait_for_the_pending_album():
+    delivered = []
+
+    async def on_flush(album):
+        delivered.append(tuple(m.id for m in album.messages))
+
+    async def on_release(chat_id, event):
+        delivered.append(event.message.id)
+
+    aggregator = AlbumAggregator(on_flush, on_release, window_seconds=0.05)
+    await aggregator.enqueue(10, _event(1))
+    await aggregator.add(10, 777, _event(2))
+    await aggregator.add(10, 777, _event(3))
+    await aggregator.enqueue(10, _event(4))
+    await aggregator.enqueue(20, _event(5))   # Otro chat: no espera
+    await aggregator.add(10, 888, _event(6))
+    await aggregator.enqueue(10, _event(7))
+
+    assert delivered == [1, 5]
+    await asyncio.sleep(0.15)
+
+    assert delivered == [1, 5, (2, 3), 4, (6,), 7]
+    assert aggregator.get_stats()['events_held'] == 2
@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.album_aggregator import Album
+from app.services.backfill import BackfillItem, BackfillManager, FloodWaitError
+from app.services.outbox import ReplicationOutbox
+
+
+def _submitted_ids(submitted):
+    ids = []
+    for item in submitted:
+        if isinstance(item, Album):
+            ids.append(tuple(m.id for m in item.messages))
+        else:
+            assert isinstance(item, BackfillItem)
+            ids.append(item.message.id)
+    return ids
+
+
+class FakeClient:
+    def __init__(self, messages, flood_after=None):
+        self.messages = messages
+        self.flood_after = flood_after
+        self.calls = []
+
+    async def get_messages(self, chat_id, limit=1):
+        return [max(self.messages, key=lambda m: m.id)]
+
+    async def iter_messages(self, chat_id, limit, min_id, max_id, reverse):
+        self.calls.append(min_id)
+        batch = [m for m in sorted(self.messages, key=lambda m: m.id) if min_id < m.id < max_id][:limit]
+        for message in batch:
+            if self.flood_after is not None and message.id > self.flood_after:
+                self.flood_after = None
+                raise FloodWaitError(request=None, capture=0)
+            yield message
+
+
+@pytest.mark.asyncio
+async def test_backfill_fills_the_gap_in_order_and_groups_albums():
+    messages = [SimpleNamespace(id=i, grouped_id=None) for i in range(1, 11)]
+    messages[5].grouped_id = messages[6].grouped_id = 99
+    client = FakeClient(messages, flood_after=4)
+
+    submitted = []
+
+    async def submit(chat_id, item):
+        submitted.append(item)
+
+    manager = BackfillManager(submit, batch_size=3, wait_time=0)
+    await manager.run(client, {1: 3, 2: 0}, [1, 3])
+
+    assert _submitted_ids(submitted) == [4, 5, (6, 7), 8, 9, 10]
+    stats = manager.get_stats()
+    assert stats['flood_waits'] == 1
+    assert stats['chats']['1']['status'] == 'done'
+    assert stats['chats']['1']['percent'] == 100.0
+    assert '3' not in stats['chats']
+
+
+@pytest.mark.asyncio
+async def test_flood_wait_in_the_middle_of_an_album_rereads_its_buffered_parts():
+    messages = [SimpleNamespace(id=i, grouped_id=None) for i in range(1, 11)]
+    for index in (5, 6, 7):
+        messages[index].grouped_id = 99
+    client = FakeClient(messages, flood_after=6)
+
+    submitted = []
+
+    async def submit(chat_id, item):
+        submitted.append(item)
+
+    manager = BackfillManager(submit, batch_size=10, wait_time=0)
+    await manager.run(client, {1: 3}, [1])
+
+    assert _submitted_ids(submitted) == [4, 5, (6, 7, 8), 9, 10]
+    assert client.calls == [3, 5]   # Se retoma desde lo entregado, no desde la parte 6
+    stats = manager.get_stats()
+    assert stats['messages_backfilled'] == 7
+    assert stats['chats']['1']['fetched'] == 7
+
+
+@pytest.mark.asyncio
+async def test_backfill_cut_short_resumes_its_range_after_live_traffic_moved_the_cursor(tmp_path):
+    outbox = ReplicationOutbox(db_path=str(tmp_path / 'outbox.db'))
+    await outbox.start()
+    outbox.advance_cursor(1, 10)
+    client = FakeClient([SimpleNamespace(id=i, grouped_id=None) for i in range(1, 21)])
+    submitted, crashed = [], asyncio.Event()
+
+    async def submit(chat_id, item):
+        if item.message.id == 14:
+            crashed.set()
+            await asyncio.Event().wait()
+        submitted.append(item)
+
+    manager = BackfillManager(submit, batch_size=10, wait_time=0, checkpoint=outbox.save_backfill_run)
+    manager.start(client, await outbox.get_cursors(), [1])
+    await crashed.wait()
+    outbox.advance_cursor(1, 25)   # Entregas en vivo posteriores al inicio del backfill
+    await manager.stop()
+    await outbox.stop()
+
+    outbox = ReplicationOutbox(db_path=str(tmp_path / 'outbox.db'))
+    await outbox.start()
+    try:
+        client.messages += [SimpleNamespace(id=i, grouped_id=None) for i in range(21, 31)]
+        submitted.clear()
+
+        async def submit(chat_id, item):
+            submitted.append(item)
+
+        manager = BackfillManager(submit, batch_size=10, wait_time=0, checkpoint=outbox.save_backfill_run)
+        await manager.run(client, await outbox.get_cursors(), [1], await outbox.get_backfill_runs())
+        runs = await outbox.get_backfill_runs()
+    finally:
+        await outbox.stop()
+
+    assert _submitted_ids(submitted) == [14, 15, 16, 17, 18, 19, 20, 26, 27, 28, 29, 30]
+    assert runs == {}
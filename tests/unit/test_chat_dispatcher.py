@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from app.services.chat_dispatcher import ChatDispatcher
+
+
+@pytest.mark.asyncio
+async def test_order_is_strict_within_a_chat():
+    seen = []
+
+    async def handler(chat_id, payload):
+        await asyncio.sleep(0.001 * (5 - payload % 5))
+        seen.append((chat_id, payload))
+
+    dispatcher = ChatDispatcher(handler, workers=4, max_queue_per_chat=3)
+    await dispatcher.start()
+    for i in range(10):
+        await dispatcher.submit(1, i)
+        await dispatcher.submit(2, i)
+    await dispatcher.stop()
+
+    assert [p for c, p in seen if c == 1] == list(range(10))
+    assert [p for c, p in seen if c == 2] == list(range(10))
+
+
+@pytest.mark.asyncio
+async def test_chats_run_in_parallel_and_stats_are_reported():
+    release = asyncio.Event()
+    running = set()
+
+    async def handler(chat_id, payload):
+        running.add(chat_id)
+        await release.wait()
+
+    dispatcher = ChatDispatcher(handler, workers=2)
+    await dispatcher.start()
+    await dispatcher.submit(1, "a")
+    await dispatcher.submit(1, "b")
+    await dispatcher.submit(2, "a")
+    await asyncio.sleep(0.05)
+
+    assert running == {1, 2}
+    stats = dispatcher.get_stats()
+    assert stats['busy_workers'] == 2
+    assert stats['queue_depth'] == 1
+    assert "1" in stats['chat_lag']
+
+    release.set()
+    await dispatcher.stop()
+    assert dispatcher.get_stats()['processed'] == 3
+
+
+@pytest.mark.asyncio
+async def test_latency_percentiles_cover_queue_and_processing_time():
+    async def handler(chat_id, payload):
+        await asyncio.sleep(0.01)
+
+    dispatcher = ChatDispatcher(handler, workers=1)
+    await dispatcher.start()
+    for i in range(5):
+        await dispatcher.submit(1, i)
+    await dispatcher.stop()
+
+    latency = dispatcher.get_stats()['latency']
+    assert latency['p50_ms'] >= 10
+    assert latency['p50_ms'] <= latency['p95_ms'] <= latency['p99_ms']
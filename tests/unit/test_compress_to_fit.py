@@ -0,0 +1,58 @@
+import io
+
+import pytest
+from PIL import Image, ImageFilter
+
+from app.services.media_compute import MediaComputeExecutor
+from app.tasks.workers.media_kernels import EncodedImage, compress_to_fit
+
+
+def _photo(size=(2400, 1600), fmt='JPEG') -> bytes:
+    """Gradiente + ruido suavizado: se comprime como una foto, no como ruido puro"""
+    noise = Image.effect_noise(size, 48).filter(ImageFilter.GaussianBlur(1))
+    img = Image.merge('RGB', (noise, Image.linear_gradient('L').resize(size), noise))
+    output = io.BytesIO()
+    img.save(output, format=fmt, quality=95)
+    return output.getvalue()
+
+
+def test_lands_just_under_target_in_few_iterations():
+    data = _photo()
+    target = len(data) // 3
+
+    fitted = compress_to_fit(data, target, tolerance=0.1)
+
+    assert fitted.fits and fitted.format == 'JPEG' and fitted.extension == 'jpg'
+    assert target * 0.9 <= len(fitted.data) <= target
+    assert fitted.iterations <= 4 and fitted.encode_seconds > 0
+    with Image.open(io.BytesIO(fitted.data)) as img:
+        assert img.size == fitted.size
+
+
+def test_tiny_target_downscales_and_webp_is_supported():
+    data = _photo()
+
+    fitted = compress_to_fit(data, 40_000, 'webp', max_iterations=8)
+
+    assert fitted.fits and fitted.format == 'WEBP' and fitted.scale < 1.0
+    with Image.open(io.BytesIO(fitted.data)) as img:
+        assert img.format == 'WEBP'
+        assert img.size == fitted.size
+        assert img.size[0] < 2400
+
+
+@pytest.mark.asyncio
+async def test_pool_returns_encoded_image_through_shared_memory():
+    executor = MediaComputeExecutor(max_workers=1, shm_threshold_mb=0.01)
+    data = _photo(fmt='PNG')
+    try:
+        fitted = await executor.run(compress_to_fit, data, len(data) // 4)
+    finally:
+        executor.shutdown()
+
+    assert isinstance(fitted, EncodedImage) and isinstance(fitted.data, bytes)
+    assert fitted.fits
+    stats = executor.get_stats()
+    assert stats['shm_outputs'] == 1
+    kernel = stats['kernels']['compress_to_fit']
+    assert kernel['avg_iterations'] == fitted.iterations and kernel['misses'] == 0
@@ -0,0 +1,51 @@
+import aiohttp
+import pytest
+
+from tools.discord_emulator import DiscordWebhookEmulator, EmulatorConfig
+from tools.sender_benchmark import BenchmarkConfig, run_benchmark
+
+
+@pytest.mark.asyncio
+async def test_emulator_rate_limits_per_webhook_and_per_channel():
+    emulator = DiscordWebhookEmulator(EmulatorConfig(
+        webhook_limit=2, webhook_window=5, channel_limit=3, channels={'11': 'c', '12': 'c'}
+    ))
+    await emulator.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            statuses = []
+            for webhook_id in ('11', '11', '11', '12', '12'):
+                async with session.post(emulator.webhook_url(webhook_id), json={'content': 'hi'}) as response:
+                    statuses.append((response.status, response.headers.get('X-RateLimit-Scope')))
+                    if response.status == 204:
+                        assert response.headers['X-RateLimit-Bucket'] == emulator.BUCKET_HASH
+                    else:
+                        assert float(response.headers['Retry-After']) > 0
+                        assert (await response.json())['retry_after'] > 0
+
+            async with session.post(emulator.webhook_url('13') + '?wait=true', json={'content': 'x'}) as response:
+                message = await response.json()
+                assert response.status == 200 and message['content'] == 'x'
+            async with session.post(emulator.webhook_url('13'), json={'content': 'y' * 2001}) as response:
+                assert response.status == 400
+    finally:
+        await emulator.stop()
+
+    assert statuses == [(204, None), (204, None), (429, 'user'), (204, None), (429, 'shared')]
+    assert emulator.stats['shared_rate_limited'] == 1
+
+
+@pytest.mark.asyncio
+async def test_benchmark_reports_throughput_latency_and_429_rate():
+    report = await run_benchmark(BenchmarkConfig(
+        messages=24, concurrency=4, chats=2, image_kb=16, album_size=2,
+        emulator=EmulatorConfig(webhook_limit=50, webhook_window=1, channel_limit=None, seed=3)
+    ))
+
+    assert report['delivered'] == 24 and report['failed'] == 0
+    assert sum(report['mix'].values()) == 24
+    assert report['throughput_msg_per_s'] > 0
+    assert 0 < report['latency_ms']['p50'] <= report['latency_ms']['p99']
+    assert report['rate_limited'] == 0
+    assert report['requests_per_message'] >= 1
+    assert report['memory']['rss_peak_mb'] > 0
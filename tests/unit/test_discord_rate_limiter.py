@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.discord_rate_limiter import BucketRateLimiter, route_key
+
+URL_A = "https://discord.com/api/webhooks/111111111111111111/token-a?wait=true"
+URL_B = "https://discord.com/api/webhooks/222222222222222222/token-b"
+
+
+def _headers(remaining, reset_after, bucket="abc", limit=2):
+    return {
+        'X-RateLimit-Bucket': bucket,
+        'X-RateLimit-Limit': str(limit),
+        'X-RateLimit-Remaining': str(remaining),
+        'X-RateLimit-Reset-After': str(reset_after)
+    }
+
+
+def test_route_key_ignores_query_and_message_ids():
+    assert route_key(URL_A) == ("POST /webhooks/111111111111111111/:token", "111111111111111111")
+    route, _ = route_key(URL_B + "/messages/1234567890123456789", "patch")
+    assert route == "PATCH /webhooks/222222222222222222/:token/messages/:id"
+
+
+@pytest.mark.asyncio
+async def test_learns_bucket_and_delays_before_exhausting_it():
+    limiter = BucketRateLimiter(safety_margin_seconds=0.01)
+
+    # First request on an unknown route goes alone and teaches the bucket
+    await limiter.wait_if_needed(URL_A)
+    await limiter.update_limits(URL_A, _headers(1, 0.3), 204)
+    assert "abc:111111111111111111" in limiter.buckets
+
+    await limiter.wait_if_needed(URL_A)
+    await limiter.update_limits(URL_A, _headers(0, 0.25), 204)
+
+    started = time.monotonic()
+    await limiter.wait_if_needed(URL_A)
+    assert time.monotonic() - started >= 0.2
+
+    # Another webhook sharing the bucket hash keeps its own budget
+    started = time.monotonic()
+    await limiter.wait_if_needed(URL_B)
+    assert time.monotonic() - started < 0.1
+
+    stats = limiter.get_stats()
+    assert stats['rate_limited'] == 0
+    assert stats['delayed_requests'] == 1
+
+
+@pytest.mark.asyncio
+async def test_global_429_pauses_every_bucket_and_is_counted_per_1000():
+    limiter = BucketRateLimiter(safety_margin_seconds=0)
+    await limiter.wait_if_needed(URL_A)
+    await limiter.update_limits(URL_A, {'Retry-After': '0.2', 'X-RateLimit-Global': 'true'}, 429)
+
+    started = time.monotonic()
+    await asyncio.gather(limiter.wait_if_needed(URL_A), limiter.wait_if_needed(URL_B))
+    assert time.monotonic() - started >= 0.15
+
+    stats = limiter.get_stats()
+    assert stats['global_rate_limited'] == 1
+    assert stats['rate_limited_per_1000'] == pytest.approx(1 / 3 * 1000)
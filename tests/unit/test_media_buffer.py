@@ -0,0 +1,30 @@
+import os
+
+from app.services.media_buffer import MediaBuffer, media_bytes, open_media_stream
+
+
+def test_small_buffer_stays_in_memory_and_large_spills(tmp_path):
+    small = MediaBuffer(max_memory_mb=1, temp_dir=tmp_path)
+    small.write(b"x" * 1024)
+    assert small.in_memory
+
+    large = MediaBuffer(max_memory_mb=0.01, temp_dir=tmp_path)
+    data = os.urandom(64 * 1024)
+    large.write(data)
+    assert not large.in_memory
+    assert len(large) == len(data)
+    assert media_bytes(large) == data
+
+
+def test_readers_are_independent_and_do_not_close_the_buffer(tmp_path):
+    buffer = MediaBuffer.from_bytes(b"0123456789", temp_dir=tmp_path)
+
+    first = open_media_stream(buffer)
+    second = open_media_stream(buffer)
+    assert first.read(4) == b"0123"
+    assert second.read() == b"0123456789"
+    first.close()
+
+    assert first.closed and not buffer.closed
+    assert open_media_stream(buffer).read() == b"0123456789"
+    buffer.close()
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.media_buffer import MediaBuffer
+from app.services.media_cache import MediaCache
+
+
+@pytest.mark.asyncio
+async def test_hits_return_processed_output_and_count_saved_bytes(tmp_path):
+    cache = MediaCache(cache_dir=tmp_path / "media", temp_dir=tmp_path / "tmp")
+    message = SimpleNamespace(media=SimpleNamespace(document=SimpleNamespace(id=42)))
+    key = MediaCache.make_key('video', MediaCache.media_id(message), 'abc')
+
+    assert await cache.get(key) is None
+    source = MediaBuffer.from_bytes(b"v" * 1000, temp_dir=tmp_path / "tmp")
+    assert await cache.put(key, b"processed", source_size=len(source), meta={'watermarked': True})
+
+    buffer, meta = await cache.get(key)
+    with buffer:
+        assert buffer.read_bytes() == b"processed"
+    assert meta == {'watermarked': True}
+
+    stats = cache.get_stats()
+    assert stats['hit_ratio'] == 0.5
+    assert stats['bytes_saved'] == 1000
+
+    # The index survives a restart
+    await cache.close()
+    reloaded = MediaCache(cache_dir=tmp_path / "media", temp_dir=tmp_path / "tmp")
+    assert reloaded.get_stats()['entries'] == 1
+
+
+@pytest.mark.asyncio
+async def test_size_bound_evicts_least_recently_used(tmp_path):
+    cache = MediaCache(cache_dir=tmp_path / "media", max_size_mb=2.5 / 1024, temp_dir=tmp_path / "tmp")
+    for name in ("a", "b"):
+        await cache.put(name, b"x" * 1024)
+
+    hit = await cache.get("a")
+    hit[0].close()
+    await cache.put("c", b"x" * 1024)
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") is not None
+    assert cache.get_stats()['evictions'] == 1
+
+
+@pytest.mark.asyncio
+async def test_index_writes_are_batched_off_the_event_loop(tmp_path):
+    cache = MediaCache(cache_dir=tmp_path / "media", temp_dir=tmp_path / "tmp", index_flush_seconds=60)
+    for name in ("a", "b", "c"):
+        await cache.put(name, b"x" * 10)
+
+    assert cache.stats['index_writes'] == 0
+    assert not (tmp_path / "media" / MediaCache.INDEX_FILE).exists()
+
+    await cache.close()
+    assert cache.stats['index_writes'] == 1
+    assert MediaCache(cache_dir=tmp_path / "media", temp_dir=tmp_path / "tmp").get_stats()['entries'] == 3
@@ -0,0 +1,94 @@
+import asyncio
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from app.services.media_buffer import MediaBuffer
+from app.services.media_compute import MediaComputeExecutor
+from app.tasks.workers.media_kernels import compress_image
+from app.tasks.workers.watermark_renderer import render_watermark
+
+
+def _slow_copy(data, seconds):
+    time.sleep(seconds)
+    return bytes(data)
+
+
+def _shm_segments() -> set:
+    return set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+
+
+def _png(size=(2400, 1600)) -> bytes:
+    output = io.BytesIO()
+    Image.effect_noise(size, 64).convert('RGBA').save(output, format='PNG')
+    return output.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_process_pool_round_trips_large_media_through_shared_memory(tmp_path):
+    executor = MediaComputeExecutor(max_workers=2, shm_threshold_mb=0.01)
+    data = MediaBuffer.from_bytes(_png(), temp_dir=tmp_path)
+    try:
+        result = await executor.run(compress_image, data, (1920, 1080), 70)
+    finally:
+        executor.shutdown()
+        data.close()
+
+    assert isinstance(result, bytes)
+    with Image.open(io.BytesIO(result)) as img:
+        assert img.format == 'JPEG'
+        assert img.size == (1620, 1080)
+
+    stats = executor.get_stats()
+    assert stats['shm_inputs'] == 1 and stats['shm_outputs'] == 1
+    assert stats['thread_fallbacks'] == 0
+    kernel = stats['kernels']['compress_image']
+    assert kernel['jobs'] == 1 and kernel['avg_cpu_ms'] > 0
+
+
+@pytest.mark.asyncio
+async def test_disabled_pool_runs_in_a_thread_and_counts_errors(tmp_path):
+    executor = MediaComputeExecutor(enabled=False)
+    config = {
+        'watermark_type': 'text', 'text_enabled': True, 'text_content': 'replic',
+        'text_position': 'bottom-right', 'text_font_size': 24, 'text_color': '#FFFFFF',
+        'text_stroke_color': '#000000', 'text_stroke_width': 1, 'text_custom_x': 0,
+        'text_custom_y': 0, 'png_enabled': False, 'png_path': ''
+    }
+
+    result = await executor.run(render_watermark, _png((320, 240)), config, str(tmp_path))
+    assert result.data[:2] == b'\xff\xd8'
+
+    with pytest.raises(Exception):
+        await executor.run(compress_image, b'not an image')
+
+    stats = executor.get_stats()
+    assert stats['running'] is False
+    assert stats['thread_fallbacks'] == 2
+    assert stats['errors'] == 1
+    assert stats['kernels']['render_watermark']['jobs'] == 1
+
+
+@pytest.mark.asyncio
+async def test_timed_out_job_keeps_its_slot_and_frees_shared_memory_when_the_worker_finishes():
+    executor = MediaComputeExecutor(max_workers=1, shm_threshold_mb=0.01)
+    data = b'x' * 100_000
+    try:
+        await executor.run(_slow_copy, data, 0)   # Pool ya arrancado
+        before = _shm_segments()
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(executor.run(_slow_copy, data, 0.5), timeout=0.1)
+        assert executor.stats['abandoned'] == 1
+        assert executor.limiter.inflight == 1   # El worker sigue ocupado
+
+        deadline = time.monotonic() + 5
+        while executor.limiter.inflight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        assert executor.limiter.inflight == 0
+        assert _shm_segments() - before == set()
+    finally:
+        executor.shutdown()
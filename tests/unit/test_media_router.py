@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from app.services.media_router import MediaRoute, MediaRouter
+
+MB = 1024 * 1024
+
+
+def _document_message(mime_type, size, duration=None):
+    document = SimpleNamespace(mime_type=mime_type, size=size, attributes=[])
+    file = SimpleNamespace(size=size, mime_type=mime_type, duration=duration,
+                           width=None, height=None, name=None)
+    return SimpleNamespace(media=SimpleNamespace(document=document), file=file)
+
+
+def test_routes_by_size_and_kind_before_download():
+    router = MediaRouter()
+
+    assert router.route(_document_message("video/mp4", 10 * MB)).route == MediaRoute.DIRECT
+    assert router.route(_document_message("video/mp4", 80 * MB, duration=120)).route == MediaRoute.COMPRESS
+    assert router.route(_document_message("video/mp4", 2000 * MB)).route == MediaRoute.REJECT
+    assert router.route(_document_message("application/pdf", 60 * MB)).route == MediaRoute.PREVIEW
+    assert router.route(_document_message("audio/mpeg", 60 * MB)).route == MediaRoute.REJECT
+
+
+def test_long_videos_that_cannot_reach_the_limit_are_rejected():
+    router = MediaRouter()
+    # 3 hours in 25MB would need ~19kbps
+    decision = router.route(_document_message("video/mp4", 400 * MB, duration=3 * 3600))
+    assert decision.route == MediaRoute.REJECT
+
+
+def test_avoided_downloads_are_tracked():
+    router = MediaRouter()
+    decision = router.route(_document_message("video/mp4", 2000 * MB))
+    router.record_avoided_download(decision.info, throughput_bps=10 * MB)
+
+    stats = router.get_stats()
+    assert stats['downloads_avoided'] == 1
+    assert stats['download_mb_avoided'] == 2000
+    assert stats['download_seconds_saved'] == 200
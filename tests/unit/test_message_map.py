@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from app.services.discord_sender import DiscordSenderEnhanced
+from app.services.message_map import MessageMap, MirroredMessage, mirroring
+from tools.discord_emulator import DiscordWebhookEmulator, EmulatorConfig
+
+
+@pytest.mark.asyncio
+async def test_map_persists_and_prunes_least_recently_used(tmp_path):
+    db_path = tmp_path / "map.db"
+    message_map = MessageMap(db_path=str(db_path), max_entries=2, cache_entries=2)
+    await message_map.start()
+    for message_id in (1, 2, 3):
+        message_map.add(-100, message_id, MirroredMessage(discord_id=900 + message_id, webhook_id=7))
+    await message_map.stop()
+
+    reopened = MessageMap(db_path=str(db_path), max_entries=2, cache_entries=2)
+    await reopened.start()
+    try:
+        # Fuera de la caché: se resuelve desde SQLite y pasa a ser el más reciente
+        assert await reopened.lookup(-100, 1) == (MirroredMessage(901, 7),)
+        await reopened.flush()
+        reopened._conn.execute("UPDATE message_map SET used_at = ? WHERE message_id = 1", (int(time.time()) + 5,))
+
+        assert await reopened.prune() == 1
+        assert await reopened.lookup(-100, 2) == ()
+        assert await reopened.lookup(-100, 1) != ()
+        assert reopened.get_stats()['pruned_by_size'] == 1
+    finally:
+        await reopened.stop()
+
+
+@pytest.mark.asyncio
+async def test_edits_and_deletes_follow_the_mirrored_messages(tmp_path):
+    emulator = DiscordWebhookEmulator(EmulatorConfig(webhook_limit=50, webhook_window=1, channel_limit=None))
+    await emulator.start()
+    url = emulator.webhook_url("4242")
+
+    message_map = MessageMap(db_path=str(tmp_path / "map.db"))
+    await message_map.start()
+    sender = DiscordSenderEnhanced()
+    sender.retry_scheduler.dead_letter_dir = tmp_path / "dead"
+    sender.attach_message_map(message_map)
+    await sender.initialize()
+    try:
+        with mirroring(-100, [10]):
+            assert await sender.send_message(url, "hola")
+        with mirroring(-100, [20, 21], media=True):
+            assert await sender.send_message_with_files(
+                url, "📚 **Álbum** (2 archivos)\n\ncaption", [(b"a" * 10, "a.jpg"), (b"b" * 10, "b.jpg")]
+            )
+        await sender.send_message(url, "sin mapear")
+        # Sólo los envíos espejados piden ?wait=true (y el emulador guarda el mensaje)
+        assert emulator.stats['delivered'] == 3 and len(emulator.messages) == 2
+
+        text_id = (await message_map.lookup(-100, 10))[0].discord_id
+        album_id = (await message_map.lookup(-100, 21))[0].discord_id
+
+        assert await sender.edit_mirrored([url], -100, 10, "hola editado")
+        assert await sender.edit_mirrored([url], -100, 20, "nuevo caption", keep_header=True)
+        assert emulator.messages[str(text_id)]['content'] == "hola editado"
+        assert emulator.messages[str(album_id)]['content'] == "📚 **Álbum** (2 archivos)\n\nnuevo caption"
+
+        # Una parte del álbum sola no borra el mensaje compartido; las dos sí
+        assert await sender.delete_mirrored([url], -100, [21]) == 0
+        assert await sender.delete_mirrored([url], -100, [10, 20, 21]) == 2
+        assert str(text_id) not in emulator.messages
+        assert await sender.edit_mirrored([url], -100, 10, "ya no existe") is False
+    finally:
+        await sender.close()
+        await message_map.stop()
+        await emulator.stop()
+
+    assert sender.stats['mirrored_posts'] == 2
+    assert sender.stats['edits_propagated'] == 2
+    assert sender.stats['deletes_propagated'] == 2
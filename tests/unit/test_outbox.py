@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from app.services.outbox import ReplicationOutbox
+
+
+@pytest.mark.asyncio
+async def test_unfinished_entries_survive_restart(tmp_path):
+    db_path = tmp_path / "outbox.db"
+
+    outbox = ReplicationOutbox(db_path=str(db_path))
+    await outbox.start()
+    await asyncio.gather(*(outbox.record_accepted(1, i) for i in range(5)))
+    outbox.mark_processed(1, 1, {'type': 'text', 'content': 'hola'})
+    outbox.mark_delivered(1, 0)
+    outbox.mark_abandoned(1, 4, "chat no longer configured")
+    await outbox.stop()
+
+    restarted = ReplicationOutbox(db_path=str(db_path))
+    await restarted.start()
+    entries = await restarted.pending_entries()
+    await restarted.stop()
+
+    assert [e.message_id for e in entries] == [1, 2, 3]
+    assert entries[0].payload_ref == {'type': 'text', 'content': 'hola'}
+    assert entries[1].state == 'accepted'
+
+
+@pytest.mark.asyncio
+async def test_writes_are_group_committed_and_attempts_bound_replay(tmp_path):
+    outbox = ReplicationOutbox(db_path=str(tmp_path / "outbox.db"), flush_interval_ms=20)
+    await outbox.start()
+
+    await asyncio.gather(*(outbox.record_accepted(7, i) for i in range(200)))
+    stats = outbox.get_stats()
+    assert stats['writes'] == 200
+    assert stats['batches_committed'] < 10
+
+    for _ in range(3):
+        await outbox.record_accepted(7, 0)
+    entries = await outbox.pending_entries(max_attempts=3)
+    await outbox.stop()
+
+    assert 0 not in {e.message_id for e in entries}
+    assert len(entries) == 199
+
+
+@pytest.mark.asyncio
+async def test_failed_deliveries_are_replayed_until_attempts_run_out(tmp_path):
+    outbox = ReplicationOutbox(db_path=str(tmp_path / "outbox.db"))
+    await outbox.start()
+    await outbox.record_accepted(1, 10)
+    outbox.mark_processed(1, 10, {'type': 'text', 'content': 'hola'})
+    outbox.mark_failed(1, 10, "webhook 500")
+
+    entries = await outbox.pending_entries(max_attempts=2)
+    assert [(e.message_id, e.state) for e in entries] == [(10, 'failed')]
+    assert entries[0].payload_ref == {'type': 'text', 'content': 'hola'}
+    assert await outbox.purge(older_than_seconds=-1, max_attempts=2) == 0
+
+    # Reenvío tras reiniciar que vuelve a fallar: se agota el último intento
+    await outbox.record_accepted(1, 10)
+    outbox.mark_failed(1, 10, "webhook 500")
+    assert [e.message_id for e in await outbox.pending_entries(max_attempts=2)] == [10]
+    await outbox.record_accepted(1, 10)
+    outbox.mark_failed(1, 10, "webhook 500")
+
+    assert await outbox.pending_entries(max_attempts=2) == []
+    await outbox.pending_entries()   # Vuelca las escrituras antes de purgar
+    assert await outbox.purge(older_than_seconds=-1, max_attempts=2) == 1
+    await outbox.stop()
+
+
+@pytest.mark.asyncio
+async def test_partial_failures_keep_only_the_missing_destinations(tmp_path):
+    outbox = ReplicationOutbox(db_path=str(tmp_path / "outbox.db"))
+    await outbox.start()
+    await asyncio.gather(*(outbox.record_accepted(1, i) for i in (1, 2)))
+    outbox.mark_failed(1, 1, "webhook 500", destinations={"https://hook/b", "https://hook/c"})
+    outbox.mark_failed(1, 2, "download error")
+    outbox.mark_failed(1, 1, "webhook 500", destinations={"https://hook/c"})
+
+    entries = await outbox.pending_entries()
+    outbox.mark_delivered(1, 1)
+    after_delivery = await outbox.pending_entries()
+    await outbox.stop()
+
+    assert [(e.message_id, e.destinations) for e in entries] == [(1, ("https://hook/c",)), (2, ())]
+    assert [(e.message_id, e.destinations) for e in after_delivery] == [(2, ())]
+
+
+@pytest.mark.asyncio
+async def test_destination_delivered_elsewhere_settles_the_entry_once_none_is_left(tmp_path):
+    outbox = ReplicationOutbox(db_path=str(tmp_path / "outbox.db"))
+    await outbox.start()
+    await asyncio.gather(*(outbox.record_accepted(1, i) for i in (1, 2)))
+    outbox.mark_failed(1, 1, "webhook 500", destinations={"https://hook/b", "https://hook/c"})
+    outbox.mark_failed(1, 2, "download error")
+
+    outbox.mark_destination_delivered(1, 1, "https://hook/b")
+    outbox.mark_destination_delivered(1, 2, "https://hook/b")   # Sin pendientes conocidos: no se toca
+    assert [(e.message_id, e.destinations) for e in await outbox.pending_entries()] == [
+        (1, ("https://hook/c",)), (2, ())
+    ]
+
+    outbox.mark_destination_delivered(1, 1, "https://hook/c")
+    entries = await outbox.pending_entries()
+    await outbox.stop()
+
+    assert [e.message_id for e in entries] == [2]
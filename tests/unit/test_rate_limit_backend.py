@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from app.services.rate_limit_backend import (
+    GLOBAL_KEY, LocalRateLimitBackend, SQLiteRateLimitBackend, create_rate_limit_backend
+)
+
+
+@pytest.mark.asyncio
+async def test_sqlite_reservations_are_atomic_across_connections(tmp_path):
+    db_path = tmp_path / "ratelimit.db"
+    replicas = [SQLiteRateLimitBackend(db_path) for _ in range(4)]
+    for backend in replicas:
+        await backend.start()
+
+    # 4 "processes" x 5 attempts against a shared bucket of 10 tokens
+    results = await asyncio.gather(*(
+        backend.reserve("bucket:1", 10, 60.0) for backend in replicas for _ in range(5)
+    ))
+    assert sum(1 for wait in results if wait == 0) == 10
+    assert all(0 < wait <= 60 for wait in results if wait != 0)
+
+    # A global 429 seen by one replica pauses the others
+    await replicas[0].block(GLOBAL_KEY, 30)
+    assert await replicas[3].reserve("bucket:2", 5, 1.0) > 29
+    assert await replicas[2].blocked_for(GLOBAL_KEY) > 29
+
+    for backend in replicas:
+        await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_observe_trusts_new_windows_and_keeps_the_lower_count_inside_one():
+    backend = LocalRateLimitBackend()
+    await backend.observe("b", remaining=4, reset_after=2.0)
+    await backend.observe("b", remaining=1, reset_after=1.9)
+    await backend.observe("b", remaining=3, reset_after=1.8)
+
+    assert await backend.reserve("b", 5, 2.0) == 0
+    assert await backend.reserve("b", 5, 2.0) > 1.5
+    assert isinstance(create_rate_limit_backend("unknown"), LocalRateLimitBackend)
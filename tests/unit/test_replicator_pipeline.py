@@ -0,0 +1,261 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.enhanced_replicator_service import EnhancedReplicatorService
+from app.services.media_buffer import MediaBuffer
+from app.services.message_map import MirrorRef
+from app.services.outbox import OutboxEntry, ReplicationOutbox
+from app.services.retry_scheduler import DeadLetter, RetryItem
+from app.services.routing import Destination, FanOutSender, RoutingTable
+
+CHAT_ID = -100
+MB = 1024 * 1024
+
+
+class FakeFanOut:
+    def __init__(self, ok=True):
+        self.ok = ok
+        self.sent = []
+
+    async def send_message(self, target, content, chat_id=None):
+        self.sent.append(('text', content))
+        return self.ok
+
+    async def send_message_with_file(self, target, content, file_bytes, filename):
+        self.sent.append(('file', filename))
+        return self.ok
+
+    async def send_message_with_files(self, target, content, files):
+        self.sent.append(('files', [name for _, name in files]))
+        return self.ok
+
+
+class RecordingOutbox:
+    def __init__(self):
+        self.delivered, self.failed, self.cursors, self.missing = [], [], {}, {}
+        self.stats = {'entries_replayed': 0}
+
+    def mark_processed(self, chat_id, message_id, payload_ref):
+        pass
+
+    def mark_delivered(self, chat_id, message_id):
+        self.delivered.append(message_id)
+
+    def mark_failed(self, chat_id, message_id, error, destinations=None):
+        self.failed.append(message_id)
+        self.missing[message_id] = destinations
+
+    def advance_cursor(self, chat_id, message_id):
+        self.cursors[chat_id] = message_id
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    service = EnhancedReplicatorService()
+    service.routing = RoutingTable({CHAT_ID: [Destination('https://discord.com/api/webhooks/1/a')]})
+    service.fanout = FakeFanOut()
+    service.outbox = RecordingOutbox()
+    service.watermark_service.create_group_config(CHAT_ID, enabled=False)
+    return service
+
+
+def _text(message_id, text='hola'):
+    return SimpleNamespace(message=SimpleNamespace(id=message_id, text=text, media=None, grouped_id=None))
+
+
+@pytest.mark.asyncio
+async def test_failed_send_leaves_the_outbox_entry_pending(service):
+    await service._handle_dispatched_event(CHAT_ID, _text(1))
+    service.fanout.ok = False
+    await service._handle_dispatched_event(CHAT_ID, _text(2))
+
+    assert service.outbox.delivered == [1]
+    assert service.outbox.failed == [2]
+    assert service.outbox.cursors == {CHAT_ID: 1}
+
+
+@pytest.mark.asyncio
+async def test_failed_send_is_replayed_from_the_sqlite_outbox(service, tmp_path):
+    service.outbox = ReplicationOutbox(db_path=str(tmp_path / 'outbox.db'))
+    await service.outbox.start()
+    try:
+        for message_id in (1, 2):
+            await service.outbox.record_accepted(CHAT_ID, message_id)
+        await service._handle_dispatched_event(CHAT_ID, _text(1))
+        service.fanout.ok = False
+        await service._handle_dispatched_event(CHAT_ID, _text(2))
+
+        entries = await service.outbox.pending_entries()
+    finally:
+        await service.outbox.stop()
+
+    assert [(entry.message_id, entry.state) for entry in entries] == [(2, 'failed')]
+    assert entries[0].payload_ref['type'] == 'text'
+
+
+def _media_message(message_id, mime_type, size, file_name=None):
+    attributes = [SimpleNamespace(file_name=file_name)] if file_name else []
+    document = SimpleNamespace(mime_type=mime_type, size=size, attributes=attributes, id=message_id)
+    file = SimpleNamespace(size=size, mime_type=mime_type, duration=None, width=None, height=None, name=file_name)
+    return SimpleNamespace(id=message_id, text='', grouped_id=None, file=file,
+                           media=SimpleNamespace(document=document))
+
+
+@pytest.mark.asyncio
+async def test_pre_download_route_picks_the_preview_and_compress_paths(service, tmp_path, monkeypatch):
+    async def download(message, timeout):
+        # Lo descargado es pequeño: sólo la decisión previa puede elegir el camino
+        return MediaBuffer.from_bytes(b'%PDF' + b'0' * 1024, temp_dir=tmp_path)
+
+    previews, compressed = [], []
+
+    async def process_pdf(data, chat_id, filename):
+        previews.append(filename)
+        return {'success': True, 'size_mb': 60.0, 'download_url': 'https://files/x.pdf'}
+
+    async def compress(image_bytes):
+        compressed.append(len(image_bytes))
+        return None
+
+    monkeypatch.setattr(service, '_download_media', download)
+    monkeypatch.setattr(service.file_processor, 'process_pdf', process_pdf)
+    monkeypatch.setattr(service, '_compress_image_if_needed', compress)
+
+    await service._handle_dispatched_event(
+        CHAT_ID, SimpleNamespace(message=_media_message(1, 'application/pdf', 60 * MB, 'big.pdf'))
+    )
+    await service._handle_dispatched_event(
+        CHAT_ID, SimpleNamespace(message=_media_message(2, 'image/png', 40 * MB, 'huge.png'))
+    )
+
+    assert previews == ['big.pdf']
+    assert compressed == [1028]
+    assert [kind for kind, _ in service.fanout.sent] == ['text', 'text']   # Link del PDF y aviso de imagen
+    assert service.outbox.delivered == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_messages_are_counted_once_across_watermark_groups(service):
+    service.routing = RoutingTable({CHAT_ID: [
+        Destination('https://discord.com/api/webhooks/1/a', watermark_group=-1),
+        Destination('https://discord.com/api/webhooks/2/b', watermark_group=-2),
+    ]})
+    service.watermark_service.create_group_config(-1, enabled=False)
+    service.watermark_service.create_group_config(-2, text_enabled=True, text_content='otro')
+
+    await service._handle_dispatched_event(CHAT_ID, _text(1))
+    await service._handle_dispatched_event(CHAT_ID, _text(2))
+
+    assert len(service.fanout.sent) == 4
+    assert service.stats['messages_replicated'] == 2
+    assert service.stats['target_deliveries'] == 4
+
+
+@pytest.mark.asyncio
+async def test_media_is_routed_once_across_watermark_groups(service):
+    service.routing = RoutingTable({CHAT_ID: [
+        Destination('https://discord.com/api/webhooks/1/a', watermark_group=-1),
+        Destination('https://discord.com/api/webhooks/2/b', watermark_group=-2),
+    ]})
+    service.watermark_service.create_group_config(-1, enabled=False)
+    service.watermark_service.create_group_config(-2, text_enabled=True, text_content='otro')
+
+    await service._handle_dispatched_event(
+        CHAT_ID, SimpleNamespace(message=_media_message(1, 'application/zip', 900 * MB, 'huge.zip'))
+    )
+
+    assert [kind for kind, _ in service.fanout.sent] == ['text', 'text']   # Un aviso por destino
+    assert service.media_router.stats['routed']['reject'] == 1
+    assert service.media_router.stats['downloads_avoided'] == 1
+    assert service.media_router.stats['download_bytes_avoided'] == 900 * MB
+    assert service.stats['large_files_rejected'] == 1
+
+
+@pytest.mark.asyncio
+async def test_delete_waits_for_media_still_queued_on_the_heavy_lane(service, monkeypatch):
+    order = []
+    release = asyncio.Event()
+
+    async def process(chat_id, message):
+        if message.media:
+            await release.wait()
+        order.append(('post', message.id))
+
+    async def propagate(chat_id, update):
+        order.append(('delete', tuple(update.message_ids)))
+
+    monkeypatch.setattr(service, '_process_message_enterprise', process)
+    monkeypatch.setattr(service, '_propagate_mirror_update', propagate)
+    for dispatcher in service.lanes.values():
+        await dispatcher.start()
+    try:
+        video = SimpleNamespace(message=SimpleNamespace(id=1, text='', media=object(), grouped_id=None))
+        await service.lanes['heavy'].submit(CHAT_ID, video)
+        await service.lanes['fast'].submit(CHAT_ID, _text(2))
+        await service._dispatch_delete(CHAT_ID, [1])
+        await service.lanes['fast'].join()
+        assert order == [('post', 2)]
+
+        release.set()
+        await service.lanes['heavy'].join()
+    finally:
+        for dispatcher in service.lanes.values():
+            await dispatcher.stop()
+
+    assert order == [('post', 2), ('post', 1), ('delete', (1,))]
+
+
+@pytest.mark.asyncio
+async def test_replay_only_goes_to_the_destinations_that_missed_the_message(service):
+    class FlakySender:
+        def __init__(self):
+            self.down, self.calls = {'https://hook/b'}, []
+
+        async def send_message(self, webhook_url, content, chat_id=None):
+            self.calls.append(webhook_url)
+            return webhook_url not in self.down
+
+    sender = FlakySender()
+    service.fanout = FanOutSender(sender)
+    service.routing = RoutingTable({CHAT_ID: [Destination('https://hook/a'), Destination('https://hook/b')]})
+
+    await service._handle_dispatched_event(CHAT_ID, _text(1))
+    assert service.outbox.failed == [1]
+    assert service.outbox.missing == {1: {'https://hook/b'}}
+    assert service.stats['messages_replicated'] == 0
+
+    sender.down.clear()
+    entry = OutboxEntry(CHAT_ID, 1, 'failed', {'type': 'text', 'content': 'hola'}, 2, 0.0,
+                        destinations=('https://hook/b',))
+    await service._handle_dispatched_event(CHAT_ID, entry)
+
+    assert sender.calls == ['https://hook/a', 'https://hook/b', 'https://hook/b']
+    assert service.outbox.delivered == [1]
+
+
+@pytest.mark.asyncio
+async def test_replayed_dead_letter_is_not_sent_again_by_the_outbox(service, tmp_path, monkeypatch):
+    url = 'https://hook/b'
+    service.outbox = ReplicationOutbox(db_path=str(tmp_path / 'outbox.db'))
+    await service.outbox.start()
+    letters = service.discord_sender.retry_scheduler.dead_letters
+    letters[7] = DeadLetter(7, RetryItem(url, payload={'content': 'hola'}, sources=[MirrorRef(CHAT_ID, (1,))]),
+                            "retries exhausted")
+
+    async def replay(letter_id):
+        return None if letters.pop(letter_id, None) is None else True
+
+    monkeypatch.setattr(service.discord_sender, 'replay_dead_letter', replay)
+    try:
+        await service.outbox.record_accepted(CHAT_ID, 1)
+        service.outbox.mark_failed(CHAT_ID, 1, "webhook 500", destinations={url})
+        assert [entry.destinations for entry in await service.outbox.pending_entries()] == [(url,)]
+
+        assert await service.replay_dead_letter(7) is True
+        assert await service.replay_dead_letter(7) is None
+        assert await service.outbox.pending_entries() == []
+    finally:
+        await service.outbox.stop()
@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.chat_dispatcher import ChatDispatcher
+from app.services.retry_scheduler import RetryItem, RetryScheduler
+
+URL = "https://discord.com/api/webhooks/1/token"
+
+
+def _result(status):
+    return SimpleNamespace(success=status == 204, status_code=status, error_message=f"HTTP {status}")
+
+
+@pytest.mark.asyncio
+async def test_backoff_releases_the_worker_but_keeps_chat_order():
+    calls = []
+
+    async def execute(item):
+        calls.append(item.payload['content'])
+        failed_once = item.payload['content'] == 'a1' and item.attempts == 1
+        return _result(500 if failed_once else 204)
+
+    scheduler = RetryScheduler(execute, base_delay=0.2)
+    order = []
+
+    async def handler(chat_id, text):
+        result = await scheduler.deliver(RetryItem(URL, payload={'content': text}))
+        order.append((text, result.success))
+
+    dispatcher = ChatDispatcher(handler, workers=1)
+    await dispatcher.start()
+    try:
+        await dispatcher.submit(1, 'a1')
+        await dispatcher.submit(1, 'a2')
+        await dispatcher.submit(2, 'b1')
+        await asyncio.wait_for(dispatcher.join(), timeout=2)
+    finally:
+        await dispatcher.stop()
+        await scheduler.stop()
+
+    # b1 used the only worker while a1 was backing off; a2 still waited for a1
+    assert order == [('b1', True), ('a1', True), ('a2', True)]
+    assert calls == ['a1', 'b1', 'a1', 'a2']
+    assert dispatcher.get_stats()['processed'] == 3
+    assert dispatcher.stats['slots_released'] == 1
+    assert scheduler.stats['recovered'] == 1
+
+
+@pytest.mark.asyncio
+async def test_budget_exhaustion_dead_letters_and_replay_streams_the_spooled_file(tmp_path):
+    status = {'code': 503}
+    sent = []
+
+    async def execute(item):
+        sent.append([path.read_bytes() if hasattr(path, 'read_bytes') else bytes(path)
+                     for path, _ in item.files])
+        return _result(status['code'])
+
+    scheduler = RetryScheduler(execute, base_delay=0.01, retry_budget=1,
+                               dead_letter_dir=str(tmp_path / "dead"))
+    try:
+        result = await scheduler.deliver(RetryItem(URL, content="x", files=[(b"payload", "a.png")]))
+        assert not result.success
+        assert scheduler.stats['budget_denied'] == 1
+
+        [letter] = scheduler.list_dead_letters()
+        assert letter['reason'] == "retry budget exhausted"
+        assert letter['attempts'] == 2 and letter['files'] == ["a.png"]
+        assert "token" not in str(letter)
+        assert (tmp_path / "dead" / str(letter['id']) / "0_a.png").read_bytes() == b"payload"
+
+        status['code'] = 204
+        replayed = await scheduler.replay(letter['id'])
+        assert replayed.success
+        assert sent[-1] == [b"payload"]
+        assert not (tmp_path / "dead" / str(letter['id'])).exists()
+        assert await scheduler.replay(letter['id']) is None
+    finally:
+        await scheduler.stop()
+
+    # 4xx is final: dead-lettered without retrying
+    status['code'] = 404
+    await scheduler.deliver(RetryItem(URL, payload={'content': 'gone'}))
+    assert scheduler.list_dead_letters()[-1]['reason'] == "HTTP 404"
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from app.services.message_map import mirroring
+from app.services.routing import (
+    DeliveryLedger, DeliveryTarget, Destination, FanOutSender, RoutingTable, recording_deliveries
+)
+
+
+def test_routes_file_adds_destinations_grouped_by_watermark(tmp_path):
+    routes_file = tmp_path / "routes.json"
+    routes_file.write_text(json.dumps({
+        "-100": [
+            {"webhook_url": "https://hook/b", "name": "mirror"},
+            {"webhook_url": "https://hook/c", "watermark_group": -200},
+            {"webhook_url": "https://hook/a"}
+        ]
+    }))
+
+    table = RoutingTable.from_settings({-100: "https://hook/a", -300: ""}, routes_file=routes_file)
+
+    assert -100 in table and -300 not in table
+    assert table.destination_count() == 3
+    groups = table.groups(-100)
+    assert [d.webhook_url for d in groups[-100]] == ["https://hook/a", "https://hook/b"]
+    assert [d.webhook_url for d in groups[-200]] == ["https://hook/c"]
+
+
+@pytest.mark.asyncio
+async def test_fan_out_sends_concurrently_and_accounts_per_destination():
+    calls = []
+
+    class FakeSender:
+        async def send_message_with_file(self, webhook_url, content, file_bytes, filename):
+            calls.append(webhook_url)
+            if webhook_url.endswith("down"):
+                raise ConnectionError("boom")
+            return True
+
+    fanout = FanOutSender(FakeSender())
+    target = DeliveryTarget(-100, [
+        Destination("https://hook/ok", name="ok"),
+        Destination("https://hook/down", name="down")
+    ])
+
+    assert await fanout.send_message_with_file(target, "hi", b"data", "a.jpg") is False
+    assert sorted(calls) == ["https://hook/down", "https://hook/ok"]
+
+    stats = fanout.get_stats()
+    assert stats['partial_failures'] == 1
+    assert stats['destinations']['ok']['sent'] == 1
+    assert stats['destinations']['down']['failed'] == 1
+    assert stats['destinations']['down']['last_error'] == "boom"
+
+
+@pytest.mark.asyncio
+async def test_fan_out_records_undelivered_parts_and_skips_failed_destinations():
+    calls = []
+
+    class FakeSender:
+        async def deliver_files(self, webhook_url, content, files):
+            return 1 if webhook_url.endswith("b") else len(files)
+
+        async def send_message(self, webhook_url, content):
+            calls.append(webhook_url)
+            return True
+
+    fanout = FanOutSender(FakeSender())
+    target = DeliveryTarget(-100, [Destination("https://hook/a"), Destination("https://hook/b")])
+    ledger = DeliveryLedger((1, 2, 3, 4))
+
+    with recording_deliveries(ledger):
+        with mirroring(-100, [1, 2, 3]):
+            assert await fanout.send_message_with_files(target, "album", [(b"1", "1.jpg"), (b"2", "2.jpg"), (b"3", "3.jpg")])
+        with mirroring(-100, [4]):
+            assert await fanout.send_message(target, "after")
+
+    # b recibió el primer lote: sólo quedan pendientes las partes siguientes
+    assert ledger.missing == {2: {"https://hook/b"}, 3: {"https://hook/b"}, 4: {"https://hook/b"}}
+    assert calls == ["https://hook/a"]
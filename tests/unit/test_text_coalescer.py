@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from app.services.chat_dispatcher import ChatDispatcher
+from app.services.discord_sender import DiscordSenderEnhanced
+from app.services.text_coalescer import TextCoalescer
+
+URL = "https://discord.com/api/webhooks/1/token"
+OTHER_URL = "https://discord.com/api/webhooks/2/token"
+
+
+@pytest.mark.asyncio
+async def test_burst_from_one_chat_becomes_one_request_in_order():
+    sent = []
+
+    async def send_text(webhook_url, content, username=None, mirrors=None):
+        await asyncio.sleep(0.01)
+        sent.append((webhook_url, content))
+        return True
+
+    sender = DiscordSenderEnhanced()
+    sender.session = object()  # Sin HTTP: _send_text es el fake
+    sender._send_text = sender.text_coalescer.send = send_text
+    sender.configure_text_coalescing(window_ms=50)
+
+    results = []
+
+    async def handler(chat_id, text):
+        url = URL if chat_id == 1 else OTHER_URL
+        results.append((text, await sender.send_message(url, text, chat_id=chat_id)))
+
+    dispatcher = ChatDispatcher(handler, workers=1)
+    await dispatcher.start()
+    try:
+        for i in range(5):
+            await dispatcher.submit(1, f"a{i}")
+        await dispatcher.submit(2, "b0")
+        await asyncio.wait_for(dispatcher.join(), timeout=2)
+    finally:
+        await dispatcher.stop()
+        await sender.text_coalescer.close()
+
+    assert sorted(sent) == [(URL, "a0\na1\na2\na3\na4"), (OTHER_URL, "b0")]
+    assert all(ok for _, ok in results)
+    assert [text for text, _ in results if text.startswith('a')] == [f"a{i}" for i in range(5)]
+    assert sender.stats['messages_sent'] == 6
+    stats = sender.text_coalescer.get_stats()
+    assert stats['requests'] == 2
+    assert stats['requests_per_message'] == pytest.approx(2 / 6)
+
+
+@pytest.mark.asyncio
+async def test_limit_and_chat_change_split_batches_and_flush_keeps_order():
+    sent = []
+
+    async def send(webhook_url, content, username, tags):
+        await asyncio.sleep(0.01 if len(sent) == 0 else 0)
+        sent.append(content)
+        return True
+
+    coalescer = TextCoalescer(send, window_seconds=10, max_chars=20)
+    futures = [
+        coalescer.enqueue(URL, 1, "x" * 8),
+        coalescer.enqueue(URL, 1, "y" * 8),
+        coalescer.enqueue(URL, 1, "z" * 8),   # 8 + 1 + 8 + 1 + 8 > 20
+        coalescer.enqueue(URL, 2, "other"),   # Otro chat cierra el lote
+        coalescer.enqueue(URL, 2, "w" * 30),  # Demasiado largo: va solo
+    ]
+    await coalescer.flush(URL)
+
+    assert all(future.result() for future in futures)
+    assert sent == ["x" * 8 + "\n" + "y" * 8, "z" * 8, "other", "w" * 30]
+    assert all(len(content) <= 20 for content in sent[:3])
+    stats = coalescer.get_stats()
+    assert stats['flushed_by_size'] == 3
+    assert stats['flushed_by_chat_change'] == 1
+    assert stats['pending_messages'] == 0
@@ -0,0 +1,103 @@
+import io
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.services.discord_sender import DiscordSenderEnhanced
+from app.services.media_buffer import MediaBuffer
+from app.services.upload_source import FileSlice, prepare_source, source_size
+
+PAYLOAD = bytes(range(256)) * 1024  # 256 KB: varios trozos por adjunto
+
+
+def test_prepare_source_sizes_every_kind_without_reading(tmp_path):
+    path = tmp_path / "clip.bin"
+    path.write_bytes(PAYLOAD)
+
+    with open(path, "rb") as handle:
+        handle.seek(1000)
+        file_slice = prepare_source(handle)
+        assert isinstance(file_slice, FileSlice)
+        assert source_size(file_slice) == len(PAYLOAD) - 1000
+        assert file_slice.read_at(0, 4) == PAYLOAD[1000:1004]
+        assert handle.tell() == 1000
+
+    assert source_size(str(path)) == len(PAYLOAD)
+    assert source_size(memoryview(PAYLOAD).cast("I")) == len(PAYLOAD)
+    assert source_size(MediaBuffer.from_bytes(PAYLOAD)) == len(PAYLOAD)
+
+    buffer = io.BytesIO(PAYLOAD)
+    buffer.seek(10)
+    view = prepare_source(buffer)
+    assert isinstance(view, memoryview) and view.nbytes == len(PAYLOAD) - 10
+    view.release()
+
+
+@pytest.mark.asyncio
+async def test_retries_reread_paths_and_file_objects(tmp_path):
+    received = []
+
+    async def hook(request):
+        reader = await request.multipart()
+        bodies = []
+        async for part in reader:
+            if part.filename:
+                bodies.append(bytes(await part.read()))
+        received.append(bodies)
+        # El primer intento falla: el reintento tiene que reenviar todo
+        return web.Response(status=500 if len(received) == 1 else 204)
+
+    app = web.Application()
+    app.router.add_post("/api/webhooks/{id}/{token}", hook)
+    server = TestServer(app)
+    await server.start_server()
+
+    path = tmp_path / "video.mp4"
+    path.write_bytes(PAYLOAD)
+    sender = DiscordSenderEnhanced()
+    sender.retry_scheduler.config['base_delay'] = 0.01
+    await sender.initialize()
+    try:
+        url = str(server.make_url("/api/webhooks/123456789012345678/token"))
+        with open(path, "rb") as handle:
+            handle.seek(256)
+            ok = await sender.send_message_with_files(url, "album", [
+                (path, "video.mp4"),
+                (handle, "tail.bin"),
+                (memoryview(PAYLOAD)[:512], "head.bin")
+            ])
+        assert ok
+    finally:
+        await sender.close()
+        await server.close()
+
+    assert len(received) == 2
+    for bodies in received:
+        assert bodies == [PAYLOAD, PAYLOAD[256:], PAYLOAD[:512]]
+
+    stats = (await sender.get_stats())['uploads']
+    assert stats['uploads'] == 2 and stats['in_flight'] == 0
+    assert stats['max_upload_rss_delta_mb'] >= 0.0
+
+
+@pytest.mark.asyncio
+async def test_album_batches_stop_at_the_first_failed_request(monkeypatch):
+    sender = DiscordSenderEnhanced()
+    sender.config['max_attachments_per_message'] = 2
+    batches = []
+
+    async def send_files(webhook_url, content, files):
+        batches.append([filename for _, filename in files])
+        return SimpleNamespace(success=len(batches) != 2)
+
+    monkeypatch.setattr(sender, '_send_files_direct', send_files)
+    files = [(b"x", f"{index}.jpg") for index in range(5)]
+    try:
+        delivered = await sender.deliver_files("https://discord.com/api/webhooks/1/a", "album", files)
+    finally:
+        await sender.close()
+
+    assert delivered == 2
+    assert batches == [["0.jpg", "1.jpg"], ["2.jpg", "3.jpg"]]
@@ -0,0 +1,147 @@
+import io
+
+from PIL import Image
+
+from app.tasks.workers import watermark_renderer
+from app.tasks.workers.watermark_renderer import render_watermark
+from tools.watermark_benchmark import (
+    WatermarkBenchmarkConfig, run_composite_benchmark, run_text_benchmark
+)
+
+
+def _jpeg(size) -> bytes:
+    output = io.BytesIO()
+    Image.new('RGB', size, (0, 0, 255)).save(output, format='JPEG')
+    return output.getvalue()
+
+
+def _config(**overrides) -> dict:
+    config = {
+        'watermark_type': 'png', 'text_enabled': False, 'text_content': '',
+        'png_enabled': True, 'png_path': 'logo.png', 'png_position': 'bottom-right',
+        'png_scale': 0.25, 'png_opacity': 0.5, 'png_custom_x': 0, 'png_custom_y': 0,
+        'version': 'v1'
+    }
+    config.update(overrides)
+    return config
+
+
+def test_png_overlays_are_cached_per_version_and_width_bucket(tmp_path, monkeypatch):
+    Image.new('RGBA', (100, 50), (255, 0, 0, 255)).save(tmp_path / 'logo.png')
+    monkeypatch.setattr(watermark_renderer, '_overlay_cache', type(watermark_renderer._overlay_cache)())
+    monkeypatch.setattr(watermark_renderer, '_overlay_cache_bytes', 0)
+
+    first = render_watermark(_jpeg((800, 600)), _config(), str(tmp_path))
+    # 804px → overlay de 201px, redondeado al mismo ancho de 200px
+    second = render_watermark(_jpeg((804, 600)), _config(), str(tmp_path))
+    other_width = render_watermark(_jpeg((1600, 600)), _config(), str(tmp_path))
+    new_version = render_watermark(_jpeg((800, 600)), _config(version='v2'), str(tmp_path))
+
+    assert [r.overlay_cache_hit for r in (first, second, other_width, new_version)] == [False, True, False, False]
+    assert len(watermark_renderer._overlay_cache) == 3
+
+    with Image.open(io.BytesIO(first.data)) as image:
+        red, _, blue = image.getpixel((800 - 20 - 100, 600 - 20 - 50))
+        # 50% de opacidad sobre azul
+        assert abs(red - 128) < 16 and abs(blue - 128) < 16
+        assert image.getpixel((10, 10))[2] > 240
+
+
+def test_overlay_cache_evicts_least_recently_used_beyond_its_memory_bound(tmp_path, monkeypatch):
+    Image.new('RGBA', (100, 100), (255, 0, 0, 255)).save(tmp_path / 'logo.png')
+    monkeypatch.setattr(watermark_renderer, '_overlay_cache', type(watermark_renderer._overlay_cache)())
+    monkeypatch.setattr(watermark_renderer, '_overlay_cache_bytes', 0)
+    # Caben los overlays de 200×200 y 600×600, pero no además el de 400×400
+    monkeypatch.setattr(watermark_renderer, 'OVERLAY_CACHE_MAX_BYTES', (200 * 200 + 600 * 600) * 4)
+
+    for width in (800, 1600, 800, 2400):
+        render_watermark(_jpeg((width, 100)), _config(png_position='top-left'), str(tmp_path))
+
+    cached_widths = [key[-1] for key in watermark_renderer._overlay_cache]
+    assert cached_widths == [200, 600]
+    assert watermark_renderer._overlay_cache_bytes == (200 * 200 + 600 * 600) * 4
+
+
+def test_text_watermark_is_rasterized_once_into_a_sprite_with_native_stroke(monkeypatch):
+    monkeypatch.setattr(watermark_renderer, '_text_sprite_cache', type(watermark_renderer._text_sprite_cache)())
+    config = _config(
+        watermark_type='text', png_enabled=False, text_enabled=True, text_content='replic',
+        text_position='bottom-right', text_font_size=24, text_color='#FFFFFF',
+        text_stroke_color='#000000', text_stroke_width=2, text_custom_x=0, text_custom_y=0
+    )
+
+    first = render_watermark(_jpeg((320, 240)), config, '.')
+    second = render_watermark(_jpeg((640, 480)), config, '.')
+    assert (first.text_sprite_hit, second.text_sprite_hit) == (False, True)
+    assert first.overlay_cache_hit is None
+
+    with Image.open(io.BytesIO(second.data)) as image:
+        corner = image.crop((640 - 120, 480 - 60, 640, 480)).convert('L')
+        low, high = corner.getextrema()
+        assert low < 40 and high > 215   # Contorno negro y texto blanco sobre azul
+        assert image.getpixel((10, 10))[2] > 240
+
+
+def test_text_benchmark_reports_before_and_after_latency():
+    report = run_text_benchmark(WatermarkBenchmarkConfig(images=3, width=640, height=360))
+
+    assert report['text_draw_calls_before'] == 25
+    assert report['before']['mean_ms'] > 0 and report['after']['mean_ms'] > 0
+    assert report['speedup'] > 1
+
+
+def test_stages_report_what_they_applied_without_comparing_images(tmp_path):
+    both = _config(
+        watermark_type='both', png_path='missing.png', text_enabled=True, text_content='replic',
+        text_position='top-left', text_font_size=24, text_color='#FFFFFF',
+        text_stroke_color='#000000', text_stroke_width=1, text_custom_x=0, text_custom_y=0
+    )
+    transparent = io.BytesIO()
+    Image.new('RGBA', (200, 100), (0, 0, 0, 0)).save(transparent, format='PNG')
+
+    rendered = render_watermark(transparent.getvalue(), both, str(tmp_path))
+    assert rendered.stages == ('text',)
+    assert rendered.overlay_cache_hit is None
+    with Image.open(io.BytesIO(rendered.data)) as image:
+        assert image.mode == 'RGB'
+        assert image.getpixel((199, 99)) == (255, 255, 255)   # Transparente → fondo blanco
+
+    # Sin etapas activas ni siquiera se decodifica la imagen
+    disabled = render_watermark(b'not an image', _config(png_enabled=False), str(tmp_path))
+    assert disabled.data is None and disabled.stages == ()
+
+
+def test_tiled_text_is_identical_on_both_backends_and_reuses_the_mask_per_size_bucket(monkeypatch):
+    monkeypatch.setattr(watermark_renderer, '_tile_cache', type(watermark_renderer._tile_cache)())
+    monkeypatch.setattr(watermark_renderer, '_tile_cache_bytes', 0)
+    config = _config(
+        watermark_type='text', png_enabled=False, text_enabled=True, text_content='replic',
+        text_position='tiled', text_font_size=24, text_color='#FFFFFF',
+        text_stroke_color='#000000', text_stroke_width=2, text_custom_x=0, text_custom_y=0
+    )
+    base = Image.effect_noise((700, 500), 64).convert('RGB')
+
+    outputs = {}
+    for backend in ('pillow', 'numpy'):
+        image = base.copy()
+        watermark_renderer.apply_text_watermark(image, dict(config, composite_backend=backend))
+        outputs[backend] = image
+    assert outputs['pillow'].tobytes() == outputs['numpy'].tobytes()
+    assert outputs['pillow'].tobytes() != base.tobytes()
+
+    # 700×500 y 740×510 caen en el mismo tamaño redondeado (768×512)
+    sprite, _ = watermark_renderer.get_text_sprite(config)
+    _, hit = watermark_renderer.get_tile_mask(sprite.image, (740, 510), 'numpy')
+    assert hit and len(watermark_renderer._tile_cache) == 2
+
+    # Patrón repetido: texto cerca de la esquina opuesta también
+    corner = (350, 250, 700, 500)
+    assert outputs['numpy'].crop(corner).tobytes() != base.crop(corner).tobytes()
+
+
+def test_composite_benchmark_compares_backends_for_fixed_and_tiled_layouts():
+    report = run_composite_benchmark(WatermarkBenchmarkConfig(images=2, width=640, height=360))
+
+    assert set(report['backends']) == {'pillow', 'numpy'}
+    assert report['backends']['numpy']['tiled']['mean_ms'] > 0
+    assert set(report['fastest'].values()) <= {'pillow', 'numpy'}
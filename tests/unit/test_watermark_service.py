@@ -0,0 +1,69 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app.services.watermark_service import Position, WatermarkServiceIntegrated, WatermarkType
+
+
+def _jpeg(size, color=(0, 0, 255)) -> bytes:
+    output = io.BytesIO()
+    Image.new('RGB', size, color).save(output, format='JPEG')
+    return output.getvalue()
+
+
+def _service(tmp_path, **pool) -> WatermarkServiceIntegrated:
+    service = WatermarkServiceIntegrated(config_dir=str(tmp_path / 'config'), watermarks_dir=str(tmp_path / 'wm'))
+    service.configure_pool(**pool)
+    service.create_group_config(
+        -100, watermark_type=WatermarkType.TEXT, text_enabled=True, text_content='replic',
+        text_position=Position.TOP_LEFT, text_font_size=24
+    )
+    return service
+
+
+@pytest.mark.asyncio
+async def test_batch_keeps_input_order_and_skips_disabled_groups(tmp_path):
+    service = _service(tmp_path, max_workers=2)
+    service.create_group_config(-200, enabled=False)
+    sizes = [(320, 240), (640, 480), (200, 100)]
+    try:
+        results = await service.apply_image_watermark_batch([_jpeg(size) for size in sizes], -100)
+        untouched = await service.apply_image_watermark_batch([b'raw'], -200)
+    finally:
+        service.shutdown()
+
+    assert [applied for _, applied in results] == [True, True, True]
+    for (data, _), size in zip(results, sizes):
+        with Image.open(io.BytesIO(data)) as image:
+            assert image.size == size
+    assert untouched == [(b'raw', False)]
+
+    stats = service.get_stats()
+    assert stats['batches'] == 1 and stats['batch_images'] == 3
+    assert stats['watermarks_applied'] == 3
+    assert stats['images_per_second_per_core'] > 0
+    assert stats['pool']['kernels']['render_watermark']['jobs'] == 3
+
+
+@pytest.mark.asyncio
+async def test_images_over_the_job_timeout_are_sent_without_watermark(tmp_path):
+    service = _service(tmp_path, enabled=False, job_timeout_seconds=0.000001)
+    original = _jpeg((1920, 1080))
+
+    results = await service.apply_image_watermark_batch([original, original], -100)
+
+    assert results == [(original, False), (original, False)]
+    assert service.stats['timeouts'] == 2 and service.stats['watermarks_applied'] == 0
+
+
+def test_replacing_the_png_on_disk_changes_the_config_fingerprint(tmp_path):
+    service = _service(tmp_path)
+    logo = tmp_path / 'wm' / 'logo.png'
+    Image.new('RGBA', (40, 20), (255, 0, 0, 255)).save(logo)
+    service.create_group_config(-300, watermark_type=WatermarkType.PNG, png_enabled=True, png_path='logo.png')
+    before = service.get_config_fingerprint(-300)
+
+    Image.new('RGBA', (80, 40), (0, 255, 0, 255)).save(logo)
+
+    assert service.get_config_fingerprint(-300) != before
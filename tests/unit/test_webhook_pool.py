@@ -0,0 +1,50 @@
+import json
+from collections import Counter
+
+from app.services.routing import RoutingTable
+from app.services.webhook_pool import WebhookPool, webhook_label
+
+
+class FakeLimiter:
+    def __init__(self, tokens, resets=None):
+        self.tokens = tokens
+        self.resets = resets or {}
+
+    def available_tokens(self, url):
+        return self.tokens[url]
+
+    def seconds_until_available(self, url):
+        return self.resets.get(url, 1.0)
+
+
+def test_select_is_weighted_by_free_tokens_and_falls_back_to_soonest_reset():
+    pool = WebhookPool("https://a", ["https://b", "https://c", "https://a"])
+    assert pool.urls == ["https://a", "https://b", "https://c"]
+
+    limiter = FakeLimiter({"https://a": 4, "https://b": 2, "https://c": 0})
+    picks = Counter(pool.select(limiter) for _ in range(60))
+    assert picks == {"https://a": 40, "https://b": 20}
+
+    exhausted = FakeLimiter({"https://a": 0, "https://b": 0, "https://c": 0},
+                            resets={"https://a": 0.8, "https://b": 0.1, "https://c": 0.5})
+    assert pool.select(exhausted) == "https://b"
+
+    for status in (204, 204, 429):
+        pool.record("https://b", status)
+    stats = pool.get_stats(limiter)
+    member = stats['members'][webhook_label("https://b")]
+    assert member['requests'] == 3 and member['rate_limited'] == 1
+    assert member['share'] == 100.0 and member['available_tokens'] == 2
+
+
+def test_routes_file_attaches_a_pool_to_the_settings_destination(tmp_path):
+    routes_file = tmp_path / "routes.json"
+    routes_file.write_text(json.dumps({
+        "-100": [{"webhook_url": "https://main", "name": "main", "pool": ["https://extra-1", "https://extra-2"]}]
+    }))
+
+    table = RoutingTable.from_settings({-100: "https://main"}, routes_file=routes_file)
+    assert table.destination_count() == 1
+    [destination] = table.pools()
+    assert destination.label == "main"
+    assert destination.pool == ("https://extra-1", "https://extra-2")
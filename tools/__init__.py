@@ -0,0 +1,5 @@
+"""
+Herramientas de desarrollo: emulador de Discord y drivers de benchmark
+
+No forman parte de la aplicación; las usan ``scripts/benchmark_*.py`` y los tests.
+"""
@@ -0,0 +1,391 @@
+"""
+Discord Webhook Emulator - Local aiohttp server for load tests
+==============================================================
+Archivo: tools/discord_emulator.py
+
+🧪 Emula la semántica de los webhooks de Discord sin salir de la máquina
+✅ 204 (o 200 + mensaje con ``?wait=true``), JSON y multipart con adjuntos
+✅ GET / PATCH / DELETE de los mensajes creados por el webhook
+✅ Headers ``X-RateLimit-*`` con ventana fija por bucket
+✅ Buckets compartidos: límite por canal entre webhooks (429 de scope ``shared``)
+✅ 429 con ``retry_after`` (cuerpo y header), límite global opcional
+✅ 5xx y respuestas lentas aleatorias (reproducibles con ``seed``)
+"""
+
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from aiohttp import web
+
+from app.services.text_coalescer import DISCORD_MAX_CONTENT
+
+try:
+    from app.utils.logger import setup_logger
+    logger = setup_logger(__name__)
+except Exception:
+    import logging
+    logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EmulatorConfig:
+    """Comportamiento del emulador (por defecto, los límites reales de un webhook)"""
+    webhook_limit: int = 5              # Requests por webhook y ventana
+    webhook_window: float = 2.0
+    channel_limit: Optional[int] = 30   # Compartido por los webhooks de un canal (None = sin límite)
+    channel_window: float = 60.0
+    global_limit: Optional[int] = None  # Requests por segundo entre todos los webhooks
+    latency_seconds: float = 0.0        # Latencia base de cada respuesta
+    slow_rate: float = 0.0              # Fracción de respuestas lentas
+    slow_seconds: float = 1.0
+    error_rate: float = 0.0             # Fracción de 5xx aleatorios
+    max_upload_mb: float = 25.0
+    seed: Optional[int] = None
+    channels: Dict[str, str] = field(default_factory=dict)  # webhook_id → canal (defecto: propio)
+
+
+class _Window:
+    """Ventana fija: ``limit`` requests desde el primero, luego reset"""
+
+    __slots__ = ('limit', 'window', 'count', 'reset_at')
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.count = 0
+        self.reset_at = 0.0
+
+    def _roll(self, now: float):
+        if now >= self.reset_at:
+            self.count = 0
+            self.reset_at = now + self.window
+
+    def peek(self, now: float) -> float:
+        """Segundos hasta poder aceptar otro request (0 si hay hueco)"""
+        self._roll(now)
+        return 0.0 if self.count < self.limit else self.reset_at - now
+
+    def take(self, now: float):
+        self._roll(now)
+        self.count += 1
+
+    def remaining(self) -> int:
+        return max(0, self.limit - self.count)
+
+
+class DiscordWebhookEmulator:
+    """
+    🧪 SERVIDOR DE WEBHOOKS FALSOS
+    ==============================
+
+    Uso::
+
+        emulator = DiscordWebhookEmulator(EmulatorConfig(seed=1))
+        await emulator.start()
+        url = emulator.webhook_url("1001")
+        ... enviar con DiscordSenderEnhanced ...
+        await emulator.stop()
+
+    Cada webhook tiene su bucket (``X-RateLimit-Bucket`` igual para todos,
+    como en Discord, que los separa por id de webhook). Los webhooks de un
+    mismo canal (``config.channels``) comparten además el límite del canal;
+    superarlo devuelve 429 con scope ``shared``. Los requests rechazados no
+    consumen tokens.
+    """
+
+    BUCKET_HASH = "emulated-webhook-bucket"
+
+    def __init__(self, config: Optional[EmulatorConfig] = None):
+        self.config = config or EmulatorConfig()
+        self._random = random.Random(self.config.seed)
+        self._webhooks: Dict[str, _Window] = {}
+        self._channels: Dict[str, _Window] = {}
+        self._global = (
+            _Window(self.config.global_limit, 1.0) if self.config.global_limit else None
+        )
+        self._next_id = int(time.time() * 1000) << 22
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        self.base_url = ""
+        self._runner: Optional[web.AppRunner] = None
+
+        self.stats = {
+            'requests': 0,
+            'delivered': 0,
+            'attachments': 0,
+            'bytes_received': 0,
+            'rate_limited': 0,
+            'shared_rate_limited': 0,
+            'global_rate_limited': 0,
+            'server_errors': 0,
+            'slow_responses': 0,
+            'bad_requests': 0,
+            'edited': 0,
+            'deleted': 0
+        }
+
+    # ============== CICLO DE VIDA ==============
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=int(self.config.max_upload_mb * 1024 * 1024) + 1024 * 1024)
+        app.router.add_post('/api/webhooks/{webhook_id}/{token}', self._execute)
+        messages = '/api/webhooks/{webhook_id}/{token}/messages/{message_id}'
+        app.router.add_get(messages, self._get_message)
+        app.router.add_patch(messages, self._edit_message)
+        app.router.add_delete(messages, self._delete_message)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Arrancar en ``host:port`` (0 = puerto libre) y devolver la URL base"""
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{bound_port}"
+        logger.info(f"🧪 Discord emulator escuchando en {self.base_url}")
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def webhook_url(self, webhook_id: str, token: str = "token") -> str:
+        return f"{self.base_url}/api/webhooks/{webhook_id}/{token}"
+
+    # ============== HANDLER ==============
+
+    async def _execute(self, request: web.Request) -> web.StreamResponse:
+        self.stats['requests'] += 1
+        webhook_id = request.match_info['webhook_id']
+
+        # El cuerpo se consume siempre (como Discord, antes de decidir)
+        try:
+            content, attachments, size = await self._read_body(request)
+        except ValueError as e:
+            self.stats['bad_requests'] += 1
+            return web.json_response({'message': str(e), 'code': 50109}, status=400)
+
+        await self._delay()
+
+        if self._random.random() < self.config.error_rate:
+            self.stats['server_errors'] += 1
+            return web.json_response({'message': '500: Internal Server Error', 'code': 0},
+                                     status=self._random.choice((500, 502, 503)))
+
+        now = time.monotonic()
+        limited = self._check_limits(webhook_id, now)
+        if limited is not None:
+            return limited
+
+        if not content and not attachments:
+            self.stats['bad_requests'] += 1
+            return web.json_response({'message': 'Cannot send an empty message', 'code': 50006},
+                                     status=400, headers=self._headers(webhook_id))
+        if len(content) > DISCORD_MAX_CONTENT:
+            self.stats['bad_requests'] += 1
+            return web.json_response(
+                {'message': 'Invalid Form Body', 'code': 50035,
+                 'errors': {'content': {'_errors': [{'code': 'BASE_TYPE_MAX_LENGTH'}]}}},
+                status=400, headers=self._headers(webhook_id)
+            )
+
+        self.stats['delivered'] += 1
+        self.stats['attachments'] += len(attachments)
+        self.stats['bytes_received'] += size
+
+        headers = self._headers(webhook_id)
+        if request.query.get('wait', '').lower() != 'true':
+            return web.Response(status=204, headers=headers)
+
+        message = self._store_message(webhook_id, content, attachments)
+        return web.json_response(message, status=200, headers=headers)
+
+    async def _message_request(self, request: web.Request):
+        """(mensaje, None) o (None, respuesta de error) para las rutas /messages/{id}"""
+        self.stats['requests'] += 1
+        webhook_id = request.match_info['webhook_id']
+        await self._delay()
+
+        limited = self._check_limits(webhook_id, time.monotonic())
+        if limited is not None:
+            return None, limited
+
+        message = self.messages.get(request.match_info['message_id'])
+        if message is None or message['webhook_id'] != webhook_id:
+            return None, web.json_response({'message': 'Unknown Message', 'code': 10008},
+                                           status=404, headers=self._headers(webhook_id))
+        return message, None
+
+    async def _get_message(self, request: web.Request) -> web.Response:
+        message, error = await self._message_request(request)
+        if error is not None:
+            return error
+        return web.json_response(message, headers=self._headers(message['webhook_id']))
+
+    async def _edit_message(self, request: web.Request) -> web.Response:
+        message, error = await self._message_request(request)
+        if error is not None:
+            return error
+        body = await request.json()
+        content = str(body.get('content') or '')
+        if len(content) > DISCORD_MAX_CONTENT:
+            self.stats['bad_requests'] += 1
+            return web.json_response({'message': 'Invalid Form Body', 'code': 50035}, status=400)
+        message['content'] = content
+        message['edited_timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime())
+        self.stats['edited'] += 1
+        return web.json_response(message, headers=self._headers(message['webhook_id']))
+
+    async def _delete_message(self, request: web.Request) -> web.Response:
+        message, error = await self._message_request(request)
+        if error is not None:
+            return error
+        del self.messages[message['id']]
+        self.stats['deleted'] += 1
+        return web.Response(status=204, headers=self._headers(message['webhook_id']))
+
+    async def _read_body(self, request: web.Request) -> Tuple[str, list, int]:
+        """(content, [(filename, bytes)], bytes leídos) de un JSON o multipart"""
+        if request.content_type == 'application/json':
+            raw = await request.read()
+            try:
+                body = json.loads(raw or b'{}')
+            except json.JSONDecodeError:
+                raise ValueError('The request body contains invalid JSON.')
+            return str(body.get('content') or ''), [], len(raw)
+
+        if not request.content_type.startswith('multipart/'):
+            raise ValueError('Unsupported content type')
+
+        content, attachments, size = '', [], 0
+        reader = await request.multipart()
+        async for part in reader:
+            if part.filename:
+                length = 0
+                while True:
+                    chunk = await part.read_chunk()
+                    if not chunk:
+                        break
+                    length += len(chunk)
+                attachments.append((part.filename, length))
+                size += length
+            elif part.name == 'payload_json':
+                body = json.loads(await part.text() or '{}')
+                content = str(body.get('content') or content)
+            elif part.name == 'content':
+                content = await part.text()
+                size += len(content)
+        return content, attachments, size
+
+    async def _delay(self):
+        delay = self.config.latency_seconds
+        if self.config.slow_rate and self._random.random() < self.config.slow_rate:
+            self.stats['slow_responses'] += 1
+            delay += self.config.slow_seconds
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    # ============== RATE LIMITS ==============
+
+    def _webhook_window(self, webhook_id: str) -> _Window:
+        window = self._webhooks.get(webhook_id)
+        if window is None:
+            window = self._webhooks[webhook_id] = _Window(self.config.webhook_limit, self.config.webhook_window)
+        return window
+
+    def _channel_window(self, webhook_id: str) -> Optional[_Window]:
+        if not self.config.channel_limit:
+            return None
+        channel = self.config.channels.get(webhook_id, webhook_id)
+        window = self._channels.get(channel)
+        if window is None:
+            window = self._channels[channel] = _Window(self.config.channel_limit, self.config.channel_window)
+        return window
+
+    def _check_limits(self, webhook_id: str, now: float) -> Optional[web.Response]:
+        """429 si algún límite está agotado; si no, consume un token de cada uno"""
+        if self._global is not None:
+            wait = self._global.peek(now)
+            if wait > 0:
+                self.stats['rate_limited'] += 1
+                self.stats['global_rate_limited'] += 1
+                return self._rate_limited(webhook_id, wait, scope='global')
+
+        webhook = self._webhook_window(webhook_id)
+        wait = webhook.peek(now)
+        if wait > 0:
+            self.stats['rate_limited'] += 1
+            return self._rate_limited(webhook_id, wait, scope='user')
+
+        channel = self._channel_window(webhook_id)
+        if channel is not None:
+            wait = channel.peek(now)
+            if wait > 0:
+                self.stats['rate_limited'] += 1
+                self.stats['shared_rate_limited'] += 1
+                return self._rate_limited(webhook_id, wait, scope='shared')
+            channel.take(now)
+
+        webhook.take(now)
+        if self._global is not None:
+            self._global.take(now)
+        return None
+
+    def _headers(self, webhook_id: str) -> Dict[str, str]:
+        window = self._webhook_window(webhook_id)
+        reset_after = max(0.0, window.reset_at - time.monotonic())
+        return {
+            'X-RateLimit-Limit': str(window.limit),
+            'X-RateLimit-Remaining': str(window.remaining()),
+            'X-RateLimit-Reset': f"{time.time() + reset_after:.3f}",
+            'X-RateLimit-Reset-After': f"{reset_after:.3f}",
+            'X-RateLimit-Bucket': self.BUCKET_HASH
+        }
+
+    def _rate_limited(self, webhook_id: str, retry_after: float, scope: str) -> web.Response:
+        is_global = scope == 'global'
+        headers = {} if is_global else self._headers(webhook_id)
+        headers.update({
+            'Retry-After': f"{retry_after:.3f}",
+            'X-RateLimit-Scope': scope
+        })
+        if is_global:
+            headers['X-RateLimit-Global'] = 'true'
+        return web.json_response(
+            {'message': 'You are being rate limited.', 'retry_after': round(retry_after, 3), 'global': is_global},
+            status=429, headers=headers
+        )
+
+    # ============== MENSAJES ==============
+
+    def _store_message(self, webhook_id: str, content: str, attachments: list) -> Dict[str, Any]:
+        self._next_id += 1
+        message_id = str(self._next_id)
+        message = {
+            'id': message_id,
+            'type': 0,
+            'content': content,
+            'channel_id': self.config.channels.get(webhook_id, webhook_id),
+            'webhook_id': webhook_id,
+            'attachments': [
+                {'id': str(self._next_id + index + 1), 'filename': filename, 'size': length}
+                for index, (filename, length) in enumerate(attachments)
+            ],
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime())
+        }
+        self._next_id += len(attachments)
+        self.messages[message_id] = message
+        return message
+
+    def get_stats(self) -> Dict[str, Any]:
+        requests = self.stats['requests']
+        return {
+            **self.stats,
+            'rate_limited_per_1000': self.stats['rate_limited'] / requests * 1000 if requests else 0.0,
+            'webhooks_seen': len(self._webhooks)
+        }
@@ -0,0 +1,189 @@
+"""
+Sender Benchmark - DiscordSenderEnhanced against the local emulator
+===================================================================
+Archivo: tools/sender_benchmark.py
+
+📊 Carga reproducible sobre ``DiscordWebhookEmulator`` (sin tocar Discord)
+✅ Concurrencia configurable: un ChatDispatcher como en el replicador
+✅ Mezcla de payloads: texto, imagen y álbum con pesos
+✅ Throughput, latencia p50/p95/p99, tasa de 429, requests por mensaje
+✅ Memoria: RSS pico del proceso y crecimiento por upload
+
+CLI: ``python scripts/benchmark_sender.py --help``
+"""
+
+import asyncio
+import random
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.services.chat_dispatcher import ChatDispatcher
+from app.services.discord_sender import DiscordSenderEnhanced
+from app.services.upload_source import current_rss_bytes
+
+from .discord_emulator import DiscordWebhookEmulator, EmulatorConfig
+
+
+@dataclass
+class BenchmarkConfig:
+    """Carga a generar"""
+    messages: int = 200
+    concurrency: int = 8                # Workers del dispatcher
+    chats: int = 4                      # Un destino por chat
+    pool_size: int = 1                  # Webhooks por destino (WebhookPool)
+    mix: Dict[str, float] = field(default_factory=lambda: {'text': 0.7, 'image': 0.2, 'album': 0.1})
+    text_chars: int = 120
+    image_kb: int = 256
+    album_size: int = 4
+    coalesce_window_ms: float = 0.0
+    seed: int = 1
+    emulator: EmulatorConfig = field(default_factory=EmulatorConfig)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Percentil por rango más cercano (misma definición que ChatDispatcher)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_benchmark(config: Optional[BenchmarkConfig] = None) -> Dict[str, Any]:
+    """Levantar el emulador, lanzar la carga y devolver el informe"""
+    config = config or BenchmarkConfig()
+    rng = random.Random(config.seed)
+
+    emulator = DiscordWebhookEmulator(config.emulator)
+    await emulator.start()
+
+    # Chat i → destino con pool_size webhooks del mismo canal
+    destinations: Dict[int, str] = {}
+    sender = DiscordSenderEnhanced()
+    with tempfile.TemporaryDirectory(prefix="sender-bench-") as dead_letters:
+        sender.retry_scheduler.dead_letter_dir = Path(dead_letters)
+        for chat in range(config.chats):
+            ids = [str(1000 + chat * 100 + member) for member in range(config.pool_size)]
+            for webhook_id in ids:
+                config.emulator.channels.setdefault(webhook_id, f"channel-{chat}")
+            urls = [emulator.webhook_url(webhook_id) for webhook_id in ids]
+            destinations[chat] = urls[0]
+            sender.register_webhook_pool(urls[0], urls[1:], name=f"bench-{chat}")
+        if config.coalesce_window_ms > 0:
+            sender.configure_text_coalescing(config.coalesce_window_ms)
+        await sender.initialize()
+
+        # Payloads generados una vez: la memoria medida es la del envío
+        image = memoryview(rng.randbytes(config.image_kb * 1024))
+        kinds = list(config.mix)
+        weights = [config.mix[kind] for kind in kinds]
+        latencies: List[float] = []
+        outcomes = {'ok': 0, 'failed': 0}
+        by_kind = {kind: 0 for kind in kinds}
+
+        async def handler(chat_id: int, job):
+            index, kind = job
+            url = destinations[chat_id]
+            started = time.monotonic()
+            if kind == 'text':
+                text = f"#{index} " + "x" * max(0, config.text_chars - len(str(index)) - 2)
+                ok = await sender.send_message(url, text, chat_id=chat_id)
+            elif kind == 'image':
+                ok = await sender.send_message_with_file(url, f"#{index}", image, f"bench_{index}.jpg")
+            else:
+                files = [(image, f"bench_{index}_{part}.jpg") for part in range(config.album_size)]
+                ok = await sender.send_message_with_files(url, f"#{index}", files)
+            latencies.append(time.monotonic() - started)
+            outcomes['ok' if ok else 'failed'] += 1
+
+        dispatcher = ChatDispatcher(
+            handler, workers=config.concurrency, max_queue_per_chat=config.messages, name="benchmark"
+        )
+
+        rss_start = current_rss_bytes()
+        rss_peak = rss_start
+        sampling = True
+
+        async def sample_rss():
+            nonlocal rss_peak
+            while sampling:
+                rss_peak = max(rss_peak, current_rss_bytes())
+                await asyncio.sleep(0.05)
+
+        sampler = asyncio.create_task(sample_rss())
+        await dispatcher.start()
+        started = time.monotonic()
+        try:
+            for index in range(config.messages):
+                kind = rng.choices(kinds, weights)[0]
+                by_kind[kind] += 1
+                await dispatcher.submit(index % config.chats, (index, kind))
+            await dispatcher.join()
+            await sender.text_coalescer.flush()
+            elapsed = time.monotonic() - started
+        finally:
+            sampling = False
+            await sampler
+            await dispatcher.stop()
+            sender_stats = await sender.get_stats()
+            await sender.close()
+            await emulator.stop()
+
+    server = emulator.get_stats()
+    return {
+        'messages': config.messages,
+        'mix': by_kind,
+        'concurrency': config.concurrency,
+        'elapsed_seconds': elapsed,
+        'throughput_msg_per_s': config.messages / elapsed if elapsed > 0 else 0.0,
+        'delivered': outcomes['ok'],
+        'failed': outcomes['failed'],
+        'latency_ms': {
+            'p50': _percentile(latencies, 50) * 1000,
+            'p95': _percentile(latencies, 95) * 1000,
+            'p99': _percentile(latencies, 99) * 1000,
+            'max': max(latencies, default=0.0) * 1000
+        },
+        'http_requests': server['requests'],
+        'requests_per_message': server['requests'] / max(config.messages, 1),
+        'rate_limited': server['rate_limited'],
+        'rate_limited_pct': server['rate_limited'] / max(server['requests'], 1) * 100,
+        'server_errors': server['server_errors'],
+        'memory': {
+            'rss_start_mb': rss_start / (1024 * 1024),
+            'rss_peak_mb': rss_peak / (1024 * 1024),
+            'rss_growth_mb': max(0, rss_peak - rss_start) / (1024 * 1024),
+            'max_upload_rss_delta_mb': sender_stats['uploads']['max_upload_rss_delta_mb']
+        },
+        'emulator': server,
+        'sender': {
+            'rate_limiter': sender_stats['rate_limiter'],
+            'retries': sender_stats['retries'],
+            'text_coalescing': sender_stats['text_coalescing'],
+            'upload_concurrency': sender_stats['upload_concurrency']
+        }
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Resumen legible del informe de ``run_benchmark``"""
+    latency = report['latency_ms']
+    memory = report['memory']
+    uploads = report['sender']['upload_concurrency']
+    mix = ", ".join(f"{kind}={count}" for kind, count in report['mix'].items())
+    return "\n".join([
+        f"📊 {report['messages']} mensajes ({mix}), concurrencia {report['concurrency']}",
+        f"   Throughput: {report['throughput_msg_per_s']:.1f} msg/s en {report['elapsed_seconds']:.2f}s",
+        f"   Entregados: {report['delivered']}  Fallidos: {report['failed']}",
+        f"   Latencia ms: p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  "
+        f"p99 {latency['p99']:.1f}  max {latency['max']:.1f}",
+        f"   Requests: {report['http_requests']} ({report['requests_per_message']:.2f}/mensaje)  "
+        f"429: {report['rate_limited']} ({report['rate_limited_pct']:.2f}%)  5xx: {report['server_errors']}",
+        f"   Uploads en vuelo: límite final {uploads['limit']} (pico {uploads['peak_inflight']}, "
+        f"{uploads['decreases']} reducciones)",
+        f"   Memoria: RSS pico {memory['rss_peak_mb']:.1f}MB (+{memory['rss_growth_mb']:.1f}MB), "
+        f"máx por upload +{memory['max_upload_rss_delta_mb']:.1f}MB"
+    ])
@@ -0,0 +1,183 @@
+"""
+Watermark Benchmark - Per-image watermark rendering latency
+===========================================================
+Archivo: tools/watermark_benchmark.py
+
+📊 Latencia por imagen del render de watermarks, en el proceso actual
+✅ Texto: render de referencia (fuente por llamada + contorno a base de
+   (2w+1)²−1 ``draw.text``) contra el sprite cacheado con stroke nativo
+✅ Misma imagen y misma configuración para ambas variantes
+✅ Media, p50, p95 y aceleración
+✅ Composición: backend Pillow contra NumPy, con el texto en una posición
+   fija y en mosaico (``tiled``), sobre imágenes RGB
+
+CLI: ``python scripts/benchmark_watermark.py --help``
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+from app.tasks.workers import watermark_renderer
+from app.tasks.workers.watermark_renderer import (
+    COMPOSITE_BACKENDS, NUMPY_AVAILABLE, apply_text_watermark, calculate_position
+)
+
+from .sender_benchmark import _percentile
+
+
+@dataclass
+class WatermarkBenchmarkConfig:
+    """Imágenes y watermark a medir"""
+    images: int = 50
+    width: int = 1920
+    height: int = 1080
+    text: str = "Replicated via Zero Cost"
+    font_size: int = 24
+    stroke_width: int = 2
+    position: str = 'bottom-right'
+
+
+def legacy_text_watermark(image: Image.Image, config: Dict[str, Any]) -> bool:
+    """Render de texto anterior al sprite cache (sólo como referencia del benchmark)"""
+    font = None
+    for font_name in ("arial.ttf", "/System/Library/Fonts/Helvetica.ttc"):
+        try:
+            font = ImageFont.truetype(font_name, config['text_font_size'])
+            break
+        except OSError:
+            continue
+    font = font or ImageFont.load_default()
+
+    text = config['text_content']
+    draw = ImageDraw.Draw(image)
+    bbox = draw.textbbox((0, 0), text, font=font)
+    x, y = calculate_position(
+        image.size, (bbox[2] - bbox[0], bbox[3] - bbox[1]),
+        config['text_position'], config['text_custom_x'], config['text_custom_y']
+    )
+
+    stroke_width = config['text_stroke_width']
+    for adj_x in range(-stroke_width, stroke_width + 1):
+        for adj_y in range(-stroke_width, stroke_width + 1):
+            if adj_x != 0 or adj_y != 0:
+                draw.text((x + adj_x, y + adj_y), text, font=font, fill=config['text_stroke_color'])
+    draw.text((x, y), text, font=font, fill=config['text_color'])
+    return True
+
+
+def _text_config(config: WatermarkBenchmarkConfig, **overrides) -> Dict[str, Any]:
+    watermark = {
+        'text_content': config.text, 'text_font_size': config.font_size,
+        'text_color': '#FFFFFF', 'text_stroke_color': '#000000',
+        'text_stroke_width': config.stroke_width, 'text_position': config.position,
+        'text_custom_x': 0, 'text_custom_y': 0
+    }
+    watermark.update(overrides)
+    return watermark
+
+
+def _time_per_image(render: Callable[[Image.Image, Dict[str, Any]], Any], base: Image.Image,
+                    config: Dict[str, Any], images: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(images):
+        image = base.copy()  # Fuera de la medida: mismo coste para ambas variantes
+        started = time.perf_counter()
+        render(image, config)
+        samples.append(time.perf_counter() - started)
+    return {
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'p50_ms': _percentile(samples, 50) * 1000,
+        'p95_ms': _percentile(samples, 95) * 1000,
+        'first_ms': samples[0] * 1000
+    }
+
+
+def run_text_benchmark(config: Optional[WatermarkBenchmarkConfig] = None) -> Dict[str, Any]:
+    """Medir el watermark de texto antes (referencia) y después (sprite cacheado)"""
+    config = config or WatermarkBenchmarkConfig()
+    base = Image.effect_noise((config.width, config.height), 64).convert('RGBA')
+    watermark = _text_config(config)
+
+    # Caches frías: la primera imagen del "después" paga la rasterización del sprite
+    watermark_renderer._text_sprite_cache.clear()
+    watermark_renderer._load_font.cache_clear()
+
+    before = _time_per_image(legacy_text_watermark, base, watermark, config.images)
+    after = _time_per_image(apply_text_watermark, base, watermark, config.images)
+    return {
+        'images': config.images,
+        'size': [config.width, config.height],
+        'stroke_width': config.stroke_width,
+        'text_draw_calls_before': (2 * config.stroke_width + 1) ** 2 if config.stroke_width > 0 else 1,
+        'before': before,
+        'after': after,
+        'speedup': before['mean_ms'] / after['mean_ms'] if after['mean_ms'] > 0 else 0.0
+    }
+
+
+def format_text_report(report: Dict[str, Any]) -> str:
+    """Resumen legible del informe de ``run_text_benchmark``"""
+    before, after = report['before'], report['after']
+    width, height = report['size']
+    return "\n".join([
+        f"📊 Watermark de texto: {report['images']} imágenes {width}x{height}, contorno {report['stroke_width']}px",
+        f"   Antes:   media {before['mean_ms']:.2f}ms  p50 {before['p50_ms']:.2f}  p95 {before['p95_ms']:.2f}  "
+        f"({report['text_draw_calls_before']} draw.text por imagen)",
+        f"   Después: media {after['mean_ms']:.2f}ms  p50 {after['p50_ms']:.2f}  p95 {after['p95_ms']:.2f}  "
+        f"(primera {after['first_ms']:.2f}ms, con rasterización del sprite)",
+        f"   Aceleración: {report['speedup']:.1f}x"
+    ])
+
+
+def run_composite_benchmark(config: Optional[WatermarkBenchmarkConfig] = None) -> Dict[str, Any]:
+    """
+    Medir cada backend de composición con el texto en ``config.position`` y en mosaico
+
+    Sprite y máscara del mosaico se calculan en la primera imagen (``first_ms``);
+    el resto mide sólo la composición. Sin NumPy sólo se mide Pillow.
+    """
+    config = config or WatermarkBenchmarkConfig()
+    base = Image.effect_noise((config.width, config.height), 64).convert('RGB')
+    backends = [backend for backend in COMPOSITE_BACKENDS if backend != 'numpy' or NUMPY_AVAILABLE]
+
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for backend in backends:
+        results[backend] = {}
+        for layout, position in (('single', config.position), ('tiled', 'tiled')):
+            watermark_renderer._tile_cache.clear()
+            watermark_renderer._tile_cache_bytes = 0
+            watermark = _text_config(config, text_position=position, composite_backend=backend)
+            results[backend][layout] = _time_per_image(apply_text_watermark, base, watermark, config.images)
+
+    return {
+        'images': config.images,
+        'size': [config.width, config.height],
+        'numpy_available': NUMPY_AVAILABLE,
+        'backends': results,
+        'fastest': {
+            # p50: régimen estable, sin la primera imagen que rellena las caches
+            layout: min(results, key=lambda backend: results[backend][layout]['p50_ms'])
+            for layout in ('single', 'tiled')
+        }
+    }
+
+
+def format_composite_report(report: Dict[str, Any]) -> str:
+    """Resumen legible del informe de ``run_composite_benchmark``"""
+    width, height = report['size']
+    lines = [f"📊 Composición del watermark: {report['images']} imágenes {width}x{height}"]
+    for backend, layouts in report['backends'].items():
+        for layout, stats in layouts.items():
+            lines.append(
+                f"   {backend:<7} {layout:<7} media {stats['mean_ms']:.2f}ms  p50 {stats['p50_ms']:.2f}  "
+                f"p95 {stats['p95_ms']:.2f}  (primera {stats['first_ms']:.2f}ms)"
+            )
+    if not report['numpy_available']:
+        lines.append("   ⚠️ NumPy no está instalado: sólo se midió Pillow")
+    lines.append(
+        f"   Más rápido: fijo {report['fastest']['single']}, mosaico {report['fastest']['tiled']}"
+    )
+    return "\n".join(lines)